@@ -0,0 +1,277 @@
+"""
+Actualización incremental del arancel por ``item_no``.
+
+``calcular_diff`` compara las filas de un arancel nuevo con la tabla de
+partidas usando una huella por fila (descripción y tasas) y devuelve las
+partidas nuevas, las eliminadas y las que cambiaron. ``aplicar_diff`` las
+escribe en una sola transacción con ``bulk_create``/``bulk_update``, así que
+las partidas sin cambios conservan su id, sus keywords, sus embeddings y las
+referencias de los artículos y del historial de mapeos.
+
+Solo las partidas tocadas pasan a los trabajos posteriores:
+
+- keywords: una descripción nueva deja ``search_keywords`` vacío, que es lo
+  que seleccionan ``generate_llm_keywords`` y ``regenerate_empty_keywords``;
+- embeddings: se borra el embedding de la descripción anterior;
+- Elasticsearch: se reindexan o borran solo esos documentos al confirmar.
+
+Las partidas eliminadas del arancel que todavía tienen artículos no se
+borran (el borrado en cascada se llevaría los artículos); se informan para
+revisarlas.
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Articulo, PartidaArancelaria, PartidaArancelariaEmbedding
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_TASAS = ("impuesto_dai", "impuesto_isc", "impuesto_ispc", "impuesto_isv")
+CAMPOS_TARIFA = ("descripcion",) + CAMPOS_TASAS
+
+CENTAVO = Decimal("0.01")
+
+
+def normalizar_fila(fila: Dict[str, Any]) -> Dict[str, Any]:
+    """Descripción sin espacios sobrantes y tasas con los 2 decimales del modelo."""
+    normalizada = {"descripcion": " ".join(str(fila["descripcion"] or "").split())}
+    for campo in CAMPOS_TASAS:
+        normalizada[campo] = Decimal(str(fila.get(campo) or 0)).quantize(CENTAVO)
+    return normalizada
+
+
+def huella_fila(fila: Dict[str, Any]) -> str:
+    """Hash de los campos de tarifa de una fila ya normalizada."""
+    crudo = json.dumps(
+        [fila["descripcion"]] + [str(fila[campo]) for campo in CAMPOS_TASAS],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(crudo.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CambioPartida:
+    pk: int
+    item_no: str
+    # Campo -> (valor actual, valor nuevo)
+    campos: Dict[str, Tuple[Any, Any]]
+
+    @property
+    def cambia_descripcion(self) -> bool:
+        return "descripcion" in self.campos
+
+
+@dataclass
+class DiffArancel:
+    nuevas: List[Dict[str, Any]] = field(default_factory=list)
+    # (pk, item_no)
+    eliminadas: List[Tuple[int, str]] = field(default_factory=list)
+    cambiadas: List[CambioPartida] = field(default_factory=list)
+    sin_cambios: int = 0
+    # item_no repetidos en la base (se comparan solo contra el de menor id)
+    duplicadas: List[str] = field(default_factory=list)
+
+    @property
+    def vacio(self) -> bool:
+        return not (self.nuevas or self.eliminadas or self.cambiadas)
+
+
+@dataclass
+class ResultadoAplicacion:
+    insertadas: List[int] = field(default_factory=list)
+    actualizadas: List[int] = field(default_factory=list)
+    eliminadas: List[int] = field(default_factory=list)
+    # Eliminadas del arancel pero con artículos: (pk, item_no, artículos)
+    conservadas: List[Tuple[int, str, int]] = field(default_factory=list)
+    # Partidas que deben pasar por cada trabajo posterior
+    keywords: List[int] = field(default_factory=list)
+    embeddings: List[int] = field(default_factory=list)
+    reindexar: List[int] = field(default_factory=list)
+    # "ok", "omitido" o el error de Elasticsearch
+    elasticsearch: str = "omitido"
+
+
+def calcular_diff(filas: Iterable[Dict[str, Any]]) -> DiffArancel:
+    """
+    Compara las filas del arancel nuevo (``item_no``, ``descripcion`` y las
+    tasas de ``CAMPOS_TASAS``) con la tabla, leyéndola una sola vez.
+    """
+    diff = DiffArancel()
+    actuales: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+    for pk, item_no, *valores in (
+        PartidaArancelaria.objects.order_by("id")
+        .values_list("id", "item_no", *CAMPOS_TARIFA)
+        .iterator(chunk_size=2000)
+    ):
+        if item_no in actuales:
+            diff.duplicadas.append(item_no)
+            continue
+        actuales[item_no] = (pk, normalizar_fila(dict(zip(CAMPOS_TARIFA, valores))))
+
+    vistos = set()
+    for fila in filas:
+        item_no = str(fila["item_no"]).strip()
+        if not item_no or item_no in vistos:
+            continue
+        vistos.add(item_no)
+        nueva = normalizar_fila(fila)
+        if item_no not in actuales:
+            diff.nuevas.append({"item_no": item_no, **nueva})
+            continue
+        pk, actual = actuales[item_no]
+        if huella_fila(actual) == huella_fila(nueva):
+            diff.sin_cambios += 1
+            continue
+        diff.cambiadas.append(
+            CambioPartida(
+                pk=pk,
+                item_no=item_no,
+                campos={
+                    campo: (actual[campo], nueva[campo])
+                    for campo in CAMPOS_TARIFA
+                    if actual[campo] != nueva[campo]
+                },
+            )
+        )
+
+    diff.eliminadas = [
+        (pk, item_no) for item_no, (pk, _) in actuales.items() if item_no not in vistos
+    ]
+    return diff
+
+
+def aplicar_diff(
+    diff: DiffArancel,
+    datos_nuevas: Optional[Dict[str, Dict[str, Any]]] = None,
+    batch_size: int = 500,
+) -> ResultadoAplicacion:
+    """
+    Aplica el diff en una transacción. ``datos_nuevas`` son campos extra por
+    ``item_no`` para las partidas nuevas (clasificación de courier, etc.).
+    """
+    datos_nuevas = datos_nuevas or {}
+    resultado = ResultadoAplicacion()
+
+    with transaction.atomic():
+        creadas = PartidaArancelaria.objects.bulk_create(
+            [
+                PartidaArancelaria(
+                    **{
+                        "partida_arancelaria": fila["item_no"],
+                        "search_keywords": [],
+                        **datos_nuevas.get(fila["item_no"], {}),
+                        **fila,
+                    }
+                )
+                for fila in diff.nuevas
+            ],
+            batch_size=batch_size,
+        )
+        resultado.insertadas = [p.pk for p in creadas]
+
+        # Un bulk_update por conjunto de campos cambiados
+        por_campos: Dict[Tuple[str, ...], List[PartidaArancelaria]] = {}
+        for cambio in diff.cambiadas:
+            partida = PartidaArancelaria(
+                pk=cambio.pk,
+                item_no=cambio.item_no,
+                **{campo: nuevo for campo, (_, nuevo) in cambio.campos.items()},
+            )
+            campos = tuple(sorted(cambio.campos))
+            if cambio.cambia_descripcion:
+                partida.search_keywords = []
+                campos += ("search_keywords",)
+            por_campos.setdefault(campos, []).append(partida)
+        for campos, partidas in por_campos.items():
+            PartidaArancelaria.objects.bulk_update(
+                partidas, list(campos), batch_size=batch_size
+            )
+        resultado.actualizadas = [c.pk for c in diff.cambiadas]
+
+        # Las eliminadas con artículos se conservan
+        pks_eliminadas = [pk for pk, _ in diff.eliminadas]
+        con_articulos = dict(
+            Articulo.objects.filter(partida_arancelaria_id__in=pks_eliminadas)
+            .order_by()
+            .values_list("partida_arancelaria_id")
+            .annotate(n=Count("id"))
+        )
+        resultado.conservadas = [
+            (pk, item_no, con_articulos[pk])
+            for pk, item_no in diff.eliminadas
+            if pk in con_articulos
+        ]
+        resultado.eliminadas = [pk for pk in pks_eliminadas if pk not in con_articulos]
+        PartidaArancelaria.objects.filter(pk__in=resultado.eliminadas).delete()
+
+        descripcion_nueva = [c.pk for c in diff.cambiadas if c.cambia_descripcion]
+        PartidaArancelariaEmbedding.objects.filter(
+            partida_arancelaria_id__in=descripcion_nueva
+        ).delete()
+        resultado.keywords = resultado.insertadas + descripcion_nueva
+        resultado.embeddings = resultado.insertadas + descripcion_nueva
+        resultado.reindexar = resultado.insertadas + resultado.actualizadas
+
+        transaction.on_commit(lambda: publicar_cambios(resultado))
+
+    return resultado
+
+
+def publicar_cambios(resultado: ResultadoAplicacion) -> None:
+    """
+    Tras confirmar: reindexa en Elasticsearch solo las partidas tocadas y
+    descarta las búsquedas y tarifas en memoria (``bulk_update`` no envía
+    señales).
+    """
+    from .cache_busqueda import cache_busqueda
+    from .indice_local import indice_local
+    from .tarifas import tabla_tarifas
+
+    indice_local.invalidar()
+    cache_busqueda.publicar_cambio()
+    tabla_tarifas.invalidar()
+
+    if not (
+        getattr(settings, "ELASTICSEARCH_DSL_AUTOSYNC", True)
+        and getattr(settings, "PARTIDA_SEARCH_ELASTICSEARCH", True)
+    ):
+        resultado.elasticsearch = "omitido"
+        return
+    try:
+        reindexar_elasticsearch(resultado.reindexar, resultado.eliminadas)
+        resultado.elasticsearch = "ok"
+    except Exception as e:
+        logger.warning(f"Reindexado parcial en Elasticsearch fallido: {e}")
+        resultado.elasticsearch = str(e)
+
+
+def reindexar_elasticsearch(actualizar: List[int], eliminar: List[int]) -> None:
+    from elasticsearch.helpers import bulk
+
+    from .documents import PartidaArancelariaDocument
+
+    document = PartidaArancelariaDocument()
+    indexables = list(document.get_queryset().filter(pk__in=actualizar))
+    if indexables:
+        document.update(indexables)
+    # Eliminadas, o actualizadas que ya no se indexan
+    indexadas = {partida.pk for partida in indexables}
+    borrar = list(eliminar) + [pk for pk in actualizar if pk not in indexadas]
+    if borrar:
+        bulk(
+            document._get_connection(),
+            (
+                {"_op_type": "delete", "_index": document._index._name, "_id": pk}
+                for pk in borrar
+            ),
+            raise_on_error=False,
+        )
@@ -0,0 +1,176 @@
+"""
+Búsqueda de partidas arancelarias en PostgreSQL.
+
+Las consultas usan el índice GIN de ``search_vector`` (texto) y el índice
+``varchar_pattern_ops`` de ``item_no`` (prefijo del código) en lugar de
+``descripcion__icontains``, que obliga a recorrer toda la tabla.
+
+El autocompletado del cotizador se pagina por cursor sobre ``(item_no, id)``
+para que cada página sea una lectura acotada del índice en lugar de un
+``OFFSET`` creciente; las búsquedas de texto libre se ordenan por relevancia.
+"""
+
+import base64
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, Count, F, FloatField, Q, QuerySet, Value, When
+
+from .models import PartidaArancelaria
+
+AUTOCOMPLETE_LIMITE_POR_DEFECTO = 20
+AUTOCOMPLETE_LIMITE_MAXIMO = 50
+
+# Relevancia asignada a las coincidencias por prefijo de código; ts_rank
+# normalmente queda por debajo de 1, así que el código exacto va primero
+RANGO_CODIGO = 1.0
+
+# Campos mínimos que necesita el Select2 del cotizador
+CAMPOS_AUTOCOMPLETE = ("id", "item_no", "descripcion")
+
+# Un código arancelario: dígitos separados opcionalmente por puntos
+PATRON_CODIGO = re.compile(r"^\d[\d.]*$")
+PATRON_TERMINO = re.compile(r"\w+")
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(item_no: str, pk: int) -> str:
+    crudo = json.dumps([item_no, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        item_no, pk = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return str(item_no), int(pk)
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor de paginación inválido.")
+
+
+def consulta_prefijos(q: str) -> Optional[SearchQuery]:
+    """``"cuerdas guit"`` -> ``cuerdas:* & guit:*`` para buscar mientras se escribe."""
+    terminos = PATRON_TERMINO.findall(q.lower())
+    if not terminos:
+        return None
+    return SearchQuery(" & ".join(f"{t}:*" for t in terminos), search_type="raw")
+
+
+def filtro_autocomplete(q: str) -> Q:
+    q = q.strip()
+    if PATRON_CODIGO.match(q):
+        return Q(item_no__startswith=q)
+    filtro = Q(item_no__startswith=q)
+    consulta = consulta_prefijos(q)
+    if consulta is not None:
+        filtro |= Q(search_vector=consulta)
+    return filtro
+
+
+def buscar_partidas_texto(q: str, queryset: Optional[QuerySet] = None) -> QuerySet:
+    """
+    Partidas cuyo código empieza por ``q`` o cuyo ``search_vector`` contiene
+    todos los términos (como prefijo), anotadas con ``rango`` y ordenadas por
+    relevancia. Devuelve un queryset perezoso para que el llamador lo limite o
+    lo pagine.
+    """
+    if queryset is None:
+        queryset = PartidaArancelaria.objects.all()
+    q = q.strip()
+    if not q:
+        return queryset.none()
+
+    consulta = None if PATRON_CODIGO.match(q) else consulta_prefijos(q)
+    if consulta is None:
+        rango = Value(RANGO_CODIGO, output_field=FloatField())
+    else:
+        rango = Case(
+            When(item_no__startswith=q, then=Value(RANGO_CODIGO)),
+            default=SearchRank(F("search_vector"), consulta),
+            output_field=FloatField(),
+        )
+    return (
+        queryset.filter(filtro_autocomplete(q))
+        .annotate(rango=rango)
+        .order_by("-rango", "item_no", "id")
+    )
+
+
+def autocomplete_partidas(
+    q: str,
+    cursor: Optional[str] = None,
+    limite: int = AUTOCOMPLETE_LIMITE_POR_DEFECTO,
+    categoria: str = "ALLOWED",
+) -> Dict[str, Any]:
+    """
+    Devuelve una página ``{"results": [...], "next": <cursor o None>}`` de
+    partidas cuyo código empieza por ``q`` o cuyo texto coincide con ``q``.
+    """
+    limite = max(1, min(limite, AUTOCOMPLETE_LIMITE_MAXIMO))
+    partidas = PartidaArancelaria.objects.filter(courier_category=categoria).filter(
+        filtro_autocomplete(q)
+    )
+    if cursor:
+        item_no, pk = decodificar_cursor(cursor)
+        partidas = partidas.filter(
+            Q(item_no__gt=item_no) | Q(item_no=item_no, id__gt=pk)
+        )
+
+    # Una fila extra para saber si hay otra página
+    filas = list(
+        partidas.order_by("item_no", "id").values_list(*CAMPOS_AUTOCOMPLETE)[
+            : limite + 1
+        ]
+    )
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(filas[-1][1], filas[-1][0])
+
+    results: List[Dict[str, Any]] = [
+        {
+            "id": pk,
+            "text": f"{item_no} - {descripcion}",
+            "codigo": item_no,
+            "descripcion": descripcion,
+        }
+        for pk, item_no, descripcion in filas
+    ]
+    return {"results": results, "next": siguiente}
+
+
+def resultados_partidas(puntajes: Iterable[Tuple[int, float]]) -> List[Dict[str, Any]]:
+    """
+    Resultados de ``buscar_partidas`` (mismo formato que los de Elasticsearch)
+    para pares ``(partida_id, puntaje)`` ya ordenados, con una sola consulta.
+    """
+    puntajes = list(puntajes)
+    partidas = PartidaArancelaria.objects.only(
+        "id", "item_no", "descripcion", "search_keywords"
+    ).in_bulk([pid for pid, _ in puntajes])
+    return [
+        {
+            "id": str(pid),
+            "text": f"{partida.item_no} - {partida.descripcion}",
+            "codigo": partida.item_no,
+            "descripcion": partida.descripcion,
+            "keywords": list(partida.search_keywords or []),
+            "score": round(puntaje, 6),
+        }
+        for pid, puntaje in puntajes
+        if (partida := partidas.get(pid)) is not None
+    ]
+
+
+def conteo_por_categoria() -> Dict[str, int]:
+    """Totales por ``courier_category`` en una sola consulta agregada."""
+    return PartidaArancelaria.objects.aggregate(
+        total_partidas=Count("id", filter=Q(courier_category="ALLOWED")),
+        total_restricted=Count("id", filter=Q(courier_category="RESTRICTED")),
+        total_prohibited=Count("id", filter=Q(courier_category="PROHIBITED")),
+    )
@@ -0,0 +1,187 @@
+"""
+Caché en proceso de los resultados de ``buscar_partidas``.
+
+Las consultas de los clientes se repiten mucho ("iphone", "zapatos",
+"laptop"); la caché guarda la lista de resultados ya formateada para Select2
+bajo la consulta normalizada con ``ItemPartidaMapping.normalize_description``
+(las consultas con dígitos, como códigos o modelos, conservan los dígitos).
+
+El desalojo es LFU con desempate LRU: al llenarse se descarta, entre las
+consultas menos pedidas, la que lleva más tiempo sin pedirse; todas las
+operaciones son O(1). La caché se vacía cuando ``PartidaArancelariaDocument``
+reindexa documentos (señales de guardado/borrado de ``PartidaArancelaria``,
+``search_index --populate``) o cambia el historial de ``ItemPartidaMapping``.
+Entre workers se comparan cada pocos segundos las versiones de las partidas y
+los mapeos que mantiene la base (``MiCasillero.versiones``) y, para las
+reindexaciones que no cambian la base (``reindex_partidas``), un sello
+guardado en el caché de Django (compartido cuando ``REDIS_URL`` configura
+Redis en CACHES).
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .mapeos import normalizar_descripcion
+from .versiones import (
+    MAPEOS,
+    PARTIDAS,
+    VERSION_CHECK_INTERVAL,
+    en_transaccion,
+    leer_versiones,
+)
+
+VERSION_CACHE_KEY = "MiCasillero:buscar_partidas:version"
+
+MAX_ENTRADAS = 2000
+
+PATRON_DIGITO = re.compile(r"\d")
+
+
+def clave_consulta(modo: str, q: str) -> Tuple[str, str]:
+    if PATRON_DIGITO.search(q):
+        normalizada = " ".join(q.lower().split())
+    else:
+        normalizada = normalizar_descripcion(q).strip()
+    return modo, normalizada
+
+
+class CacheResultados:
+    """Mapa acotado clave -> resultados con desalojo LFU/LRU."""
+
+    def __init__(
+        self,
+        max_entradas: int = MAX_ENTRADAS,
+        check_interval: float = VERSION_CHECK_INTERVAL,
+    ):
+        self.max_entradas = max_entradas
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._valores: Dict[Hashable, List[dict]] = {}
+        self._frecuencias: Dict[Hashable, int] = {}
+        # frecuencia -> claves en orden de último uso (la primera es la más vieja)
+        self._por_frecuencia: Dict[int, OrderedDict] = defaultdict(OrderedDict)
+        self._frecuencia_minima = 0
+        self._version: Optional[Tuple] = None
+        self._ultimo_chequeo = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+
+    def __len__(self):
+        return len(self._valores)
+
+    def _version_compartida(self) -> str:
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(VERSION_CACHE_KEY, version, timeout=None)
+            version = cache.get(VERSION_CACHE_KEY, version)
+        return version
+
+    def _version_actual(self) -> Tuple:
+        return (self._version_compartida(),) + leer_versiones(PARTIDAS, MAPEOS)
+
+    def _verificar_version(self) -> None:
+        ahora = time.monotonic()
+        reciente = ahora - self._ultimo_chequeo < self.check_interval
+        if self._version is not None and reciente:
+            return
+        version = self._version_actual()
+        # Dentro de una transacción la versión puede revertirse: se vuelve a
+        # comparar en el siguiente acceso, como en versiones.VersionBD
+        self._ultimo_chequeo = 0.0 if en_transaccion() else ahora
+        if version != self._version:
+            self._vaciar()
+            self._version = version
+
+    def _vaciar(self) -> None:
+        self._valores.clear()
+        self._frecuencias.clear()
+        self._por_frecuencia.clear()
+        self._frecuencia_minima = 0
+
+    def _tocar(self, clave: Hashable) -> None:
+        frecuencia = self._frecuencias[clave]
+        claves = self._por_frecuencia[frecuencia]
+        del claves[clave]
+        if not claves:
+            del self._por_frecuencia[frecuencia]
+            if self._frecuencia_minima == frecuencia:
+                self._frecuencia_minima = frecuencia + 1
+        self._frecuencias[clave] = frecuencia + 1
+        self._por_frecuencia[frecuencia + 1][clave] = None
+
+    def get(self, clave: Hashable) -> Optional[List[dict]]:
+        with self._lock:
+            self._verificar_version()
+            valor = self._valores.get(clave)
+            if valor is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._tocar(clave)
+            return valor
+
+    def set(self, clave: Hashable, valor: List[dict]) -> None:
+        if self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._verificar_version()
+            if clave in self._valores:
+                self._valores[clave] = valor
+                self._tocar(clave)
+                return
+            if len(self._valores) >= self.max_entradas:
+                claves = self._por_frecuencia[self._frecuencia_minima]
+                desalojada, _ = claves.popitem(last=False)
+                if not claves:
+                    del self._por_frecuencia[self._frecuencia_minima]
+                del self._valores[desalojada]
+                del self._frecuencias[desalojada]
+                self.desalojos += 1
+            self._valores[clave] = valor
+            self._frecuencias[clave] = 1
+            self._por_frecuencia[1][clave] = None
+            self._frecuencia_minima = 1
+
+    def estadisticas(self) -> Dict[str, float]:
+        consultas = self.hits + self.misses
+        return {
+            "entradas": len(self._valores),
+            "max_entradas": self.max_entradas,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+            "desalojos": self.desalojos,
+            "invalidaciones": self.invalidaciones,
+        }
+
+    def invalidar(self) -> None:
+        """Vacía la copia local; la siguiente lectura vuelve a consultar."""
+        with self._lock:
+            self._vaciar()
+            self.invalidaciones += 1
+
+    def publicar_cambio(self) -> None:
+        """Vacía la copia local y publica un nuevo sello para otros workers."""
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        with self._lock:
+            self._vaciar()
+            # La próxima lectura toma la nueva versión
+            self._version = None
+            self.invalidaciones += 1
+
+    def on_indice_cambiado(self) -> None:
+        # Los resultados cambian cuando el cambio es visible para otras consultas
+        transaction.on_commit(self.publicar_cambio)
+
+
+cache_busqueda = CacheResultados()
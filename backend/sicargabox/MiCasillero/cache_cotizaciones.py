@@ -0,0 +1,175 @@
+"""
+Memo en proceso de las respuestas de ``cotizar_json``.
+
+El frontend vuelve a enviar la misma cotización al cambiar de unidad o al
+re-renderizar. Sin memo cada POST construye ``ArticuloForm`` (que carga las
+partidas para las opciones del Select2), valida la partida contra la base y
+vuelve a calcular los impuestos.
+
+La clave es la tupla canónica de la cotización: valor, peso en libras y
+dimensiones ya limpiados con los mismos campos del formulario, el id de la
+partida, el costo de flete vigente y los valores de la partida en la tabla de
+tarifas (códigos, categoría de courier y tasas como ``Decimal``). Un cambio
+de tasas o del costo de flete produce otra clave. Además el memo se vacía
+cuando cambia la versión ``partidas`` de la base (``MiCasillero.versiones``),
+que también cubre la descripción incluida en la respuesta. Las entradas
+viejas caducan por TTL o se desalojan (LRU) al llenarse. Solo se memorizan
+respuestas válidas.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Mapping, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+
+from .versiones import PARTIDAS, VersionBD
+
+# 1 kg = 2.20462 lbs (mismo factor que cotizar_json)
+KG_A_LB = 2.20462
+
+TTL_SEGUNDOS = 300.0
+
+MAX_ENTRADAS = 2000
+
+CAMPOS_NUMERICOS = ["valor_articulo", "peso", "largo", "ancho", "alto"]
+
+
+def _campos_formulario():
+    from .forms import ArticuloForm
+
+    # Los campos declarados en la clase: no evalúan el queryset de partidas
+    return {nombre: ArticuloForm.base_fields[nombre] for nombre in CAMPOS_NUMERICOS}
+
+
+def peso_en_libras(data: Mapping[str, Any]):
+    peso = data.get("peso")
+    if data.get("unidad_peso", "lb") == "kg":
+        peso = round(float(peso) * KG_A_LB, 2)
+    return peso
+
+
+def clave_cotizacion(data: Mapping[str, Any]) -> Optional[Tuple]:
+    """
+    Clave del memo para el payload de ``cotizar_json``, o None si la
+    cotización no es válida o la partida no está en la tabla de tarifas (en
+    ese caso la vista sigue el camino normal y devuelve sus errores).
+    """
+    from .forms import ArticuloForm
+    from .tarifas import tabla_tarifas
+    from .totales import obtener_costo_flete_por_lb
+
+    valores = {
+        "valor_articulo": data.get("valor"),
+        "largo": data.get("largo", 1),
+        "ancho": data.get("ancho", 1),
+        "alto": data.get("alto", 1),
+    }
+    try:
+        valores["peso"] = peso_en_libras(data)
+        limpios = tuple(
+            campo.clean(valores[nombre])
+            for nombre, campo in _campos_formulario().items()
+        )
+        ArticuloForm.base_fields["descripcion_original"].clean(
+            data.get("descripcion_original", "")
+        )
+        float(data.get("peso"))
+        partida_id = int(str(data.get("partida_arancelaria")))
+        costo_flete_por_lb = obtener_costo_flete_por_lb()
+    except (ValidationError, TypeError, ValueError):
+        return None
+
+    tarifa = tabla_tarifas.tarifa(partida_id)
+    if tarifa is None:
+        return None
+    return limpios + (
+        partida_id,
+        costo_flete_por_lb,
+        tarifa.item_no,
+        tarifa.partida_arancelaria,
+        tarifa.courier_category,
+        tarifa.impuesto_dai,
+        tarifa.impuesto_isc,
+        tarifa.impuesto_ispc,
+        tarifa.impuesto_isv,
+    )
+
+
+class MemoCotizaciones:
+    """Mapa acotado clave -> respuesta con TTL y desalojo LRU."""
+
+    def __init__(
+        self,
+        max_entradas: int = MAX_ENTRADAS,
+        ttl: float = TTL_SEGUNDOS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        # clave -> (expira_en, valor), en orden de último uso
+        self._valores: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expiradas = 0
+        self.desalojos = 0
+        self._version = VersionBD(PARTIDAS, clock=clock)
+
+    def __len__(self):
+        return len(self._valores)
+
+    def _verificar_version(self) -> None:
+        if self._version.cambio():
+            # Otra versión de las partidas: las respuestas guardadas no valen
+            self._valores.clear()
+            self._version.registrar(self._version.leer())
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._verificar_version()
+            entrada = self._valores.get(clave)
+            if entrada is not None and entrada[0] <= self.clock():
+                del self._valores[clave]
+                self.expiradas += 1
+                entrada = None
+            if entrada is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._valores.move_to_end(clave)
+            return entrada[1]
+
+    def set(self, clave: Hashable, valor: Any) -> None:
+        if self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._verificar_version()
+            self._valores[clave] = (self.clock() + self.ttl, valor)
+            self._valores.move_to_end(clave)
+            while len(self._valores) > self.max_entradas:
+                self._valores.popitem(last=False)
+                self.desalojos += 1
+
+    def estadisticas(self) -> Dict[str, float]:
+        consultas = self.hits + self.misses
+        return {
+            "entradas": len(self._valores),
+            "max_entradas": self.max_entradas,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+            "expiradas": self.expiradas,
+            "desalojos": self.desalojos,
+        }
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._valores.clear()
+            self._version.olvidar()
+
+
+memo_cotizaciones = MemoCotizaciones()
@@ -0,0 +1,183 @@
+"""
+Motor de cotización por lotes.
+
+Calcula flete, CIF, DAI, ISC, ISPC, ISV y totales para muchas líneas a la vez,
+con las tasas de la tabla de tarifas en memoria (``MiCasillero.tarifas``) y
+una sola lectura del costo de flete. Los cálculos se hacen por columnas sobre
+arreglos NumPy de tipo ``object`` que contienen ``Decimal``: así se conserva
+exactamente la aritmética (y el redondeo) de ``Articulo.calcular_impuestos``.
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping, Sequence
+
+import numpy as np
+from django.core.exceptions import ValidationError
+
+from .models import Articulo
+from .tarifas import tabla_tarifas
+from .totales import obtener_costo_flete_por_lb
+
+# 1 kg = 2.20462 lbs (mismo factor que cotizar_json)
+KG_A_LB = 2.20462
+
+CAMPOS_NUMERICOS = ["valor_articulo", "peso", "largo", "ancho", "alto"]
+
+
+def _campos_formulario():
+    # Mismos validadores que ArticuloForm (max_digits / decimal_places del modelo)
+    return {
+        nombre: Articulo._meta.get_field(nombre).formfield()
+        for nombre in CAMPOS_NUMERICOS
+    }
+
+
+def normalizar_linea(linea: Mapping[str, Any]) -> Dict[str, Any]:
+    """Traduce una línea del payload JSON a los nombres de campo del modelo."""
+    peso = linea.get("peso")
+    unidad_peso = linea.get("unidad_peso", "lb")
+    if unidad_peso == "kg" and peso is not None:
+        peso = round(float(peso) * KG_A_LB, 2)
+    return {
+        "valor_articulo": linea.get("valor"),
+        "peso": peso,
+        "largo": linea.get("largo", 1),
+        "ancho": linea.get("ancho", 1),
+        "alto": linea.get("alto", 1),
+        "partida_arancelaria": linea.get("partida_arancelaria"),
+        "descripcion_original": linea.get("descripcion_original", ""),
+    }
+
+
+def cotizar_lote(lineas: Sequence[Mapping[str, Any]]) -> Dict[str, Any]:
+    """
+    Cotiza una lista de líneas ``{valor, peso, largo, ancho, alto,
+    partida_arancelaria, unidad_peso, descripcion_original}``.
+
+    Devuelve ``{"articulos": [...], "totales": {...}}`` con valores ``Decimal``.
+    Lanza ``ValidationError`` con un dict ``{"<indice>": ["campo: mensaje"]}``
+    si alguna línea no es válida.
+    """
+    campos = _campos_formulario()
+    columnas: Dict[str, List[Any]] = {nombre: [] for nombre in CAMPOS_NUMERICOS}
+    partida_ids: List[int] = []
+    descripciones: List[str] = []
+    errores: Dict[str, List[str]] = {}
+
+    for indice, linea in enumerate(lineas):
+        datos = normalizar_linea(linea)
+        errores_linea: List[str] = []
+        for nombre, campo in campos.items():
+            try:
+                columnas[nombre].append(campo.clean(datos[nombre]))
+            except ValidationError as e:
+                errores_linea.extend(f"{nombre}: {mensaje}" for mensaje in e.messages)
+        try:
+            partida_ids.append(int(datos["partida_arancelaria"]))
+        except (TypeError, ValueError):
+            errores_linea.append("partida_arancelaria: Este campo es obligatorio.")
+        descripciones.append(datos["descripcion_original"])
+        if errores_linea:
+            errores[str(indice)] = errores_linea
+
+    if errores:
+        raise ValidationError(errores)
+
+    # Tasas desde la tabla en memoria; a la base solo van las partidas que
+    # todavía no están en ella (p. ej. creadas con bulk_create en otro proceso)
+    partidas = tabla_tarifas.tarifas(partida_ids)
+    faltantes = {
+        str(indice): ["partida_arancelaria: Partida arancelaria no encontrada."]
+        for indice, partida_id in enumerate(partida_ids)
+        if partida_id not in partidas
+    }
+    if faltantes:
+        raise ValidationError(faltantes)
+
+    costo_flete_por_lb = obtener_costo_flete_por_lb()
+
+    def columna(valores):
+        return np.array(valores, dtype=object)
+
+    valor = columna(columnas["valor_articulo"])
+    peso = columna(columnas["peso"])
+    largo = columna(columnas["largo"])
+    ancho = columna(columnas["ancho"])
+    alto = columna(columnas["alto"])
+
+    filas = [partidas[partida_id] for partida_id in partida_ids]
+    porcentaje_dai = columna([t.porcentaje_dai for t in filas])
+    porcentaje_isc = columna([t.porcentaje_isc for t in filas])
+    porcentaje_ispc = columna([t.porcentaje_ispc for t in filas])
+    porcentaje_isv = columna([t.porcentaje_isv for t in filas])
+
+    peso_volumetrico = (largo * ancho * alto) / Decimal(Articulo.FACTOR_VOL)
+    # max(peso, peso_volumetrico) conserva `peso` cuando son iguales
+    peso_a_usar = np.where(peso_volumetrico > peso, peso_volumetrico, peso)
+    costo_transporte = peso_a_usar * costo_flete_por_lb
+
+    valor_cif = valor + costo_transporte
+    impuesto_dai = valor_cif * (porcentaje_dai / 100)
+    impuesto_isc = valor_cif * (porcentaje_isc / 100)
+    impuesto_ispc = valor_cif * (porcentaje_ispc / 100)
+    base_isv = valor_cif + impuesto_dai + impuesto_isc + impuesto_ispc
+    impuesto_isv = base_isv * (porcentaje_isv / 100)
+    impuesto_total = impuesto_dai + impuesto_isc + impuesto_ispc + impuesto_isv
+
+    cargos_totales = impuesto_total + costo_transporte
+    total_incluido_valor = valor + cargos_totales
+
+    articulos = []
+    for i, partida in enumerate(filas):
+        articulos.append(
+            {
+                "descripcion_original": descripciones[i],
+                "partida_arancelaria_id": partida.id,
+                "partida_item_no": partida.item_no,
+                "partida_arancelaria_numero": partida.partida_arancelaria,
+                "valor_declarado": valor[i],
+                "valor_cif": valor_cif[i],
+                "peso": peso[i],
+                "peso_volumetrico": peso_volumetrico[i],
+                "peso_a_usar": peso_a_usar[i],
+                "largo": largo[i],
+                "ancho": ancho[i],
+                "alto": alto[i],
+                "costo_transporte": costo_transporte[i],
+                "impuesto_dai": impuesto_dai[i],
+                "impuesto_isc": impuesto_isc[i],
+                "impuesto_ispc": impuesto_ispc[i],
+                "impuesto_isv": impuesto_isv[i],
+                "impuesto_total": impuesto_total[i],
+                "impuestos_importacion": impuesto_total[i] - impuesto_isv[i],
+                "cargos_totales": cargos_totales[i],
+                "total_incluido_valor": total_incluido_valor[i],
+                "porcentaje_dai": porcentaje_dai[i],
+                "porcentaje_isc": porcentaje_isc[i],
+                "porcentaje_ispc": porcentaje_ispc[i],
+                "porcentaje_isv": porcentaje_isv[i],
+            }
+        )
+
+    def suma(arreglo):
+        return sum(arreglo, Decimal(0))
+
+    totales = {
+        "cantidad_articulos": len(articulos),
+        "valor_declarado": suma(valor),
+        "costo_transporte": suma(costo_transporte),
+        "impuesto_dai": suma(impuesto_dai),
+        "impuesto_isc": suma(impuesto_isc),
+        "impuesto_ispc": suma(impuesto_ispc),
+        "impuesto_isv": suma(impuesto_isv),
+        "impuesto_total": suma(impuesto_total),
+        "cargos_totales": suma(cargos_totales),
+        "total_incluido_valor": suma(total_incluido_valor),
+    }
+
+    return {
+        "costo_por_libra": costo_flete_por_lb,
+        "factor_volumetrico": Articulo.FACTOR_VOL,
+        "articulos": articulos,
+        "totales": totales,
+    }
@@ -1,6 +1,7 @@
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 
+from .cache_busqueda import cache_busqueda
 from .models import PartidaArancelaria
 
 
@@ -44,3 +45,9 @@ class PartidaArancelariaDocument(Document):
     def get_queryset(self):
         # Filtrar para indexar solo las partidas permitidas
         return super().get_queryset().filter(courier_category="ALLOWED")
+
+    def update(self, thing, *args, **kwargs):
+        # Cualquier (re)indexación o borrado deja obsoletos los resultados guardados
+        resultado = super().update(thing, *args, **kwargs)
+        cache_busqueda.on_indice_cambiado()
+        return resultado
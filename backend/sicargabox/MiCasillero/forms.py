@@ -72,9 +72,17 @@ class ArticuloForm(forms.ModelForm):
         help_text="Busca y selecciona la partida arancelaria que mejor se ajuste a tu producto",
     )
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, autocomplete=False, **kwargs):
         super().__init__(*args, **kwargs)
 
+        if autocomplete:
+            # Las opciones se cargan por AJAX; solo se valida contra las permitidas
+            self.fields["partida_arancelaria"].queryset = (
+                models.PartidaArancelaria.objects.filter(courier_category="ALLOWED")
+            )
+            self.fields["partida_arancelaria"].widget.choices = []
+            return
+
         # Agregar los keywords como data attribute
         choices = []
         for partida in self.fields["partida_arancelaria"].queryset:
@@ -0,0 +1,321 @@
+"""
+Motor de búsqueda local de respaldo para cuando Elasticsearch no está.
+
+Índice invertido en memoria sobre ``descripcion``, ``search_keywords`` e
+``item_no`` de las partidas que indexa ``PartidaArancelariaDocument``
+(``courier_category="ALLOWED"``), con la misma ponderación por campo que la
+consulta ``multi_match`` de ``buscar_partidas`` y puntuación BM25. Los
+términos se normalizan sin acentos y con un recorte simple de plurales; el
+último término de la consulta también se busca como prefijo (búsqueda
+mientras se escribe) y los códigos se buscan por prefijo sobre una lista
+ordenada de ``item_no``.
+
+El índice se construye con una sola consulta la primera vez que se usa (o al
+arrancar el worker, ver ``SicargaBox/wsgi.py``). Las partidas guardadas o
+borradas se aplican de forma incremental con las señales de
+``PartidaArancelaria``; cada ``REFRESH_INTERVAL`` segundos se compara la
+versión ``partidas`` de la base (``MiCasillero.versiones``, que cambia con
+cualquier escritura, también de otro worker o con ``QuerySet.update``) y si
+es otra se reconstruye. La reconstrucción se hace fuera del lock y el
+resultado se reemplaza de una vez: mientras tanto las búsquedas siguen
+usando el índice anterior.
+"""
+
+import bisect
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+from django.db import transaction
+
+from .versiones import PARTIDAS, VersionBD
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 60.0
+
+# Pesos por campo, como en ranking.CAMPOS_ELASTICSEARCH
+PESOS_CAMPOS = {"descripcion": 2.0, "search_keywords": 1.0}
+PUNTAJE_CODIGO = 3.0
+
+# Parámetros BM25
+K1 = 1.2
+B = 0.75
+
+# Expansiones como máximo para el prefijo del último término
+MAX_EXPANSIONES = 30
+PESO_PREFIJO = 0.8
+
+STOPWORDS = frozenset(
+    "a al con de del el en la las lo los o para por sin su sus u un una y".split()
+)
+
+PATRON_TOKEN = re.compile(r"[a-z0-9]+")
+PATRON_CODIGO = re.compile(r"^\d[\d.]*$")
+
+# Atributos que reemplaza cada construcción
+ESTADO = (
+    "postings",
+    "terminos_partida",
+    "item_nos",
+    "vocabulario",
+    "codigos",
+    "longitud_media",
+)
+
+
+def _sin_acentos(texto: str) -> str:
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def raiz(token: str) -> str:
+    """Recorte de plurales: ``guitarras`` -> ``guitarra``, ``motores`` -> ``motor``."""
+    if len(token) > 5 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenizar(texto: str) -> List[str]:
+    return [
+        raiz(token)
+        for token in PATRON_TOKEN.findall(_sin_acentos(texto or ""))
+        if token not in STOPWORDS and len(token) > 1
+    ]
+
+
+class IndiceInvertido:
+    """Término -> ``{partida_id: peso BM25 del término en la partida}``."""
+
+    def __init__(
+        self,
+        intervalo: float = REFRESH_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.intervalo = intervalo
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Una sola construcción a la vez
+        self._construccion = threading.Lock()
+        self._construido = False
+        self._version = VersionBD(PARTIDAS, check_interval=intervalo, clock=clock)
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.terminos_partida: Dict[int, List[str]] = {}
+        self.item_nos: Dict[int, str] = {}
+        self.vocabulario: List[str] = []
+        self.codigos: List[Tuple[str, int]] = []
+        self.longitud_media: Dict[str, float] = {}
+
+    def __len__(self):
+        return len(self.terminos_partida)
+
+    # Construcción
+
+    @staticmethod
+    def _queryset():
+        from .models import PartidaArancelaria
+
+        # Las mismas partidas que PartidaArancelariaDocument.get_queryset
+        return PartidaArancelaria.objects.filter(courier_category="ALLOWED")
+
+    @staticmethod
+    def _campos(descripcion: str, keywords) -> Dict[str, List[str]]:
+        return {
+            "descripcion": tokenizar(descripcion),
+            "search_keywords": tokenizar(" ".join(keywords or [])),
+        }
+
+    def construir(self) -> int:
+        with self._construccion:
+            return self._construir()
+
+    def _construir(self) -> int:
+        inicio = time.perf_counter()
+        # La versión se lee antes que las filas: un cambio intermedio deja
+        # el índice con una versión vieja y se reconstruye en el próximo chequeo
+        with self._lock:
+            version = self._version.leer()
+        filas = list(
+            self._queryset().values_list(
+                "id", "item_no", "descripcion", "search_keywords"
+            )
+        )
+        nuevo = IndiceInvertido(self.intervalo, self.clock)
+        nuevo._cargar(filas)
+        with self._lock:
+            for atributo in ESTADO:
+                setattr(self, atributo, getattr(nuevo, atributo))
+            self._construido = True
+            self._version.registrar(version)
+        logger.info(
+            f"Índice local de partidas: {len(filas)} partidas, "
+            f"{len(self.vocabulario)} términos en "
+            f"{(time.perf_counter() - inicio) * 1000:.0f}ms"
+        )
+        return len(filas)
+
+    def _cargar(self, filas) -> None:
+        """Indexa ``filas`` (id, item_no, descripcion, search_keywords), sin lock."""
+        self.item_nos = {pk: item_no for pk, item_no, _, _ in filas}
+        self.codigos = sorted((item_no, pk) for pk, item_no in self.item_nos.items())
+        campos = {pk: self._campos(desc, kw) for pk, _, desc, kw in filas}
+        for campo in PESOS_CAMPOS:
+            total = sum(len(c[campo]) for c in campos.values())
+            self.longitud_media[campo] = total / len(campos) if total else 1.0
+        for pk, tokens in campos.items():
+            self._indexar(pk, tokens)
+        self.vocabulario = sorted(self.postings)
+
+    def _indexar(self, pk: int, campos: Dict[str, List[str]]) -> None:
+        pesos: Dict[str, float] = {}
+        for campo, tokens in campos.items():
+            if not tokens:
+                continue
+            norma = K1 * (1 - B + B * len(tokens) / self.longitud_media[campo])
+            for termino, tf in Counter(tokens).items():
+                pesos[termino] = pesos.get(termino, 0.0) + PESOS_CAMPOS[campo] * (
+                    tf * (K1 + 1) / (tf + norma)
+                )
+        for termino, peso in pesos.items():
+            self.postings.setdefault(termino, {})[pk] = peso
+        self.terminos_partida[pk] = list(pesos)
+
+    def _desindexar(self, pk: int) -> List[str]:
+        terminos = self.terminos_partida.pop(pk, [])
+        for termino in terminos:
+            partidas = self.postings.get(termino)
+            if partidas is not None:
+                partidas.pop(pk, None)
+                if not partidas:
+                    del self.postings[termino]
+        item_no = self.item_nos.pop(pk, None)
+        if item_no is not None:
+            indice = bisect.bisect_left(self.codigos, (item_no, pk))
+            if indice < len(self.codigos) and self.codigos[indice] == (item_no, pk):
+                del self.codigos[indice]
+        return terminos
+
+    def _sincronizar_vocabulario(self, terminos) -> None:
+        for termino in set(terminos):
+            indice = bisect.bisect_left(self.vocabulario, termino)
+            presente = (
+                indice < len(self.vocabulario) and self.vocabulario[indice] == termino
+            )
+            if termino in self.postings and not presente:
+                self.vocabulario.insert(indice, termino)
+            elif termino not in self.postings and presente:
+                del self.vocabulario[indice]
+
+    def _vigente(self) -> None:
+        with self._lock:
+            if self._construido and not self._version.cambio():
+                return
+            construido = self._construido
+        if not construido:
+            # Sin índice hay que esperar: la primera construcción la hace un hilo
+            with self._construccion:
+                with self._lock:
+                    construido = self._construido
+                if not construido:
+                    self._construir()
+        elif self._construccion.acquire(blocking=False):
+            try:
+                self._construir()
+            finally:
+                self._construccion.release()
+        # Si otro hilo ya está reconstruyendo se sigue con el índice actual
+
+    # Cambios incrementales
+
+    def actualizar(self, partida) -> None:
+        with self._lock:
+            if not self._construido:
+                return
+            terminos = self._desindexar(partida.pk)
+            if partida.courier_category == "ALLOWED":
+                self._indexar(
+                    partida.pk,
+                    self._campos(partida.descripcion, partida.search_keywords),
+                )
+                self.item_nos[partida.pk] = partida.item_no
+                bisect.insort(self.codigos, (partida.item_no, partida.pk))
+                terminos = terminos + self.terminos_partida[partida.pk]
+            self._sincronizar_vocabulario(terminos)
+
+    def eliminar(self, pk: int) -> None:
+        with self._lock:
+            if not self._construido:
+                return
+            self._sincronizar_vocabulario(self._desindexar(pk))
+
+    def on_partida_guardada(self, partida) -> None:
+        transaction.on_commit(lambda: self.actualizar(partida))
+
+    def on_partida_borrada(self, pk: int) -> None:
+        transaction.on_commit(lambda: self.eliminar(pk))
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._construido = False
+            self._version.olvidar()
+
+    # Consulta
+
+    def _expandir_prefijo(self, prefijo: str) -> List[str]:
+        inicio = bisect.bisect_left(self.vocabulario, prefijo)
+        expansiones = []
+        for termino in self.vocabulario[inicio : inicio + MAX_EXPANSIONES + 1]:
+            if not termino.startswith(prefijo):
+                break
+            if termino != prefijo:
+                expansiones.append(termino)
+        return expansiones[:MAX_EXPANSIONES]
+
+    def _buscar_codigo(self, q: str, limite: int) -> List[Tuple[int, float]]:
+        inicio = bisect.bisect_left(self.codigos, (q,))
+        resultados = []
+        for item_no, pk in self.codigos[inicio:]:
+            if not item_no.startswith(q) or len(resultados) == limite:
+                break
+            resultados.append((pk, PUNTAJE_CODIGO))
+        return resultados
+
+    def buscar(self, q: str, limite: int = 20) -> List[Tuple[int, float]]:
+        """Top ``limite`` pares ``(partida_id, puntaje)`` de mayor a menor."""
+        q = q.strip()
+        self._vigente()
+        with self._lock:
+            if PATRON_CODIGO.match(q):
+                return self._buscar_codigo(q, limite)
+
+            terminos = [(t, 1.0) for t in tokenizar(q)]
+            ultimo = PATRON_TOKEN.findall(_sin_acentos(q))[-1:]
+            if ultimo and len(ultimo[0]) >= 3:
+                terminos += [
+                    (t, PESO_PREFIJO) for t in self._expandir_prefijo(ultimo[0])
+                ]
+
+            n = len(self.terminos_partida)
+            puntajes: Dict[int, float] = {}
+            for termino, factor in terminos:
+                partidas = self.postings.get(termino)
+                if not partidas:
+                    continue
+                idf = math.log(1 + (n - len(partidas) + 0.5) / (len(partidas) + 0.5))
+                for pk, peso in partidas.items():
+                    puntajes[pk] = puntajes.get(pk, 0.0) + factor * idf * peso
+            for pk, puntaje in self._buscar_codigo(q, limite):
+                puntajes[pk] = puntajes.get(pk, 0.0) + puntaje
+
+        mejores = sorted(puntajes.items(), key=lambda par: (-par[1], par[0]))
+        return mejores[:limite]
+
+
+indice_local = IndiceInvertido()
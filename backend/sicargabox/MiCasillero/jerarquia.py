@@ -0,0 +1,178 @@
+"""
+Índice en memoria de la jerarquía de partidas arancelarias.
+
+Los comandos de generación de keywords necesitan, para cada partida, sus
+partidas "hermanas" y sus descripciones específicas. Consultarlas fila por
+fila cuesta una consulta (y un re-split de todas las descripciones) por
+partida; ``IndiceJerarquia.construir()`` lee la tabla una sola vez y agrupa
+las partidas por cada criterio de hermandad que usan los comandos:
+
+- prefijo de descripción hasta el último ``|`` (``generate_llm_keywords``)
+- ``(chapter_code, hierarchy_level)`` (``generate_search_keywords``)
+- subcadena de la descripción (``regenerate_empty_keywords``), memorizada
+  por texto buscado
+
+Cada nodo guarda además ``terminos_exclusion``: las descripciones específicas
+(en minúsculas) de sus hermanos por prefijo que no son "Los demás", lo
+que ``generate_llm_keywords`` excluye al generar keywords de una partida
+"Los demás".
+
+Todas las listas conservan el orden por ``item_no`` de la base de datos.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .models import PartidaArancelaria
+
+PREFIJOS_LOS_DEMAS = ("los demás", "las demás")
+
+
+class NodoPartida:
+    """Fila de la partida con sus descripciones específicas ya calculadas."""
+
+    __slots__ = (
+        "id",
+        "item_no",
+        "descripcion",
+        "chapter_code",
+        "heading_code",
+        "hierarchy_level",
+        "parent_item_no",
+        "search_keywords",
+        "primera_parte",
+        "ultima_parte",
+        "prefijo",
+        "nivel",
+        "primera_es_los_demas",
+        "ultima_es_los_demas",
+        "terminos_exclusion",
+    )
+
+    def __init__(
+        self,
+        id,
+        item_no,
+        descripcion,
+        chapter_code,
+        heading_code,
+        hierarchy_level,
+        parent_item_no,
+        search_keywords,
+    ):
+        self.id = id
+        self.item_no = item_no
+        self.descripcion = descripcion or ""
+        self.chapter_code = chapter_code
+        self.heading_code = heading_code
+        self.hierarchy_level = hierarchy_level
+        self.parent_item_no = parent_item_no
+        self.search_keywords = search_keywords
+        partes = self.descripcion.split("|")
+        self.primera_parte = partes[0].strip()
+        self.ultima_parte = partes[-1].strip()
+        # Descripción hasta el último "|" (incluido) y cantidad de "|"
+        self.prefijo = self.descripcion[: self.descripcion.rfind("|") + 1]
+        self.nivel = len(partes) - 1
+        self.primera_es_los_demas = self.primera_parte.lower().startswith(
+            PREFIJOS_LOS_DEMAS
+        )
+        self.ultima_es_los_demas = self.ultima_parte.lower().startswith(
+            PREFIJOS_LOS_DEMAS
+        )
+        self.terminos_exclusion = frozenset()
+
+
+class IndiceJerarquia:
+    CAMPOS = (
+        "id",
+        "item_no",
+        "descripcion",
+        "chapter_code",
+        "heading_code",
+        "hierarchy_level",
+        "parent_item_no",
+        "search_keywords",
+    )
+
+    def __init__(self, nodos: List[NodoPartida]):
+        self.nodos = nodos
+        self.por_id: Dict[int, NodoPartida] = {}
+        self.por_prefijo: Dict[Tuple[str, int], List[NodoPartida]] = defaultdict(list)
+        self.por_capitulo_nivel: Dict[Tuple[str, int], List[NodoPartida]] = defaultdict(
+            list
+        )
+        self._contienen: Dict[str, List[NodoPartida]] = {}
+
+        for nodo in nodos:
+            self.por_id[nodo.id] = nodo
+            if nodo.prefijo:
+                self.por_prefijo[(nodo.prefijo, nodo.nivel)].append(nodo)
+            if nodo.chapter_code and nodo.hierarchy_level:
+                self.por_capitulo_nivel[
+                    (nodo.chapter_code, nodo.hierarchy_level)
+                ].append(nodo)
+
+        terminos: Dict[Tuple[str, int], frozenset] = {
+            clave: frozenset(
+                n.ultima_parte.lower()
+                for n in hermanos
+                if n.ultima_parte and not n.ultima_es_los_demas
+            )
+            for clave, hermanos in self.por_prefijo.items()
+        }
+        for nodo in nodos:
+            clave = self._clave_prefijo(nodo.descripcion)
+            if clave in terminos:
+                nodo.terminos_exclusion = terminos[clave]
+
+    @classmethod
+    def construir(cls, queryset=None) -> "IndiceJerarquia":
+        """Construye el índice con una sola lectura de la tabla."""
+        if queryset is None:
+            queryset = PartidaArancelaria.objects.all()
+        filas = queryset.order_by("item_no", "id").values_list(*cls.CAMPOS)
+        return cls([NodoPartida(*fila) for fila in filas.iterator(chunk_size=5000)])
+
+    def __len__(self):
+        return len(self.nodos)
+
+    @staticmethod
+    def _sin(nodos: List[NodoPartida], excluir_id: Optional[int]) -> List[NodoPartida]:
+        return [n for n in nodos if n.id != excluir_id]
+
+    @staticmethod
+    def _clave_prefijo(descripcion: str) -> Optional[Tuple[str, int]]:
+        partes = [p.strip() for p in descripcion.split("|")]
+        if len(partes) < 2:
+            return None
+        return "|".join(partes[:-1]) + "|", len(partes) - 1
+
+    def hermanos_por_prefijo(self, descripcion: str, excluir_id=None):
+        """
+        Partidas cuya descripción empieza por las partes (sin espacios) de
+        ``descripcion`` menos la última, unidas con ``|``, y que tienen el mismo
+        número de ``|``; equivale a ``descripcion__startswith`` + filtro de nivel.
+        """
+        clave = self._clave_prefijo(descripcion)
+        if clave is None:
+            return []
+        return self._sin(self.por_prefijo.get(clave, []), excluir_id)
+
+    def hermanos_por_capitulo(self, chapter_code, hierarchy_level, excluir_id=None):
+        return self._sin(
+            self.por_capitulo_nivel.get((chapter_code, hierarchy_level), []),
+            excluir_id,
+        )
+
+    def que_contienen(self, texto: str, excluir_id=None):
+        """Equivale a ``descripcion__contains=texto``; se memoriza por texto."""
+        if texto not in self._contienen:
+            self._contienen[texto] = [n for n in self.nodos if texto in n.descripcion]
+        return self._sin(self._contienen[texto], excluir_id)
+
+    def actualizar_keywords(self, partida_id: int, keywords):
+        """Refleja keywords recién generadas para los contextos siguientes."""
+        nodo = self.por_id.get(partida_id)
+        if nodo is not None:
+            nodo.search_keywords = keywords
@@ -0,0 +1,337 @@
+"""
+Generación asíncrona de keywords con LLMs compatibles con la API de OpenAI
+(OpenAI, DeepSeek).
+
+Usado por ``generate_llm_keywords --async``: las llamadas a la API se hacen
+concurrentemente en un event loop (con límite de concurrencia y token buckets
+para peticiones y tokens por minuto), mientras el hilo principal escribe los
+resultados en la base de datos por lotes con ``bulk_update`` y registra el
+avance en un archivo de checkpoint para poder reanudar.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "deepseek": "https://api.deepseek.com/v1",
+}
+API_KEY_ENV = {
+    "openai": "OPENAI_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY",
+}
+
+MAX_OUTPUT_TOKENS = 700
+MAX_KEYWORDS = 100
+
+# Códigos HTTP que vale la pena reintentar
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def parse_keywords(response_text: str) -> List[str]:
+    """Extrae el array JSON de keywords de la respuesta del modelo."""
+    start_index = response_text.find("[")
+    end_index = response_text.rfind("]")
+    if start_index == -1 or end_index <= start_index:
+        logger.warning(
+            f"Array JSON '[]' no encontrado en la respuesta: {response_text}"
+        )
+        return []
+    try:
+        keywords_data = json.loads(response_text[start_index : end_index + 1])
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parseando JSON: {e}\nResp: {response_text}")
+        return []
+    if not isinstance(keywords_data, list):
+        logger.warning(f"JSON no es lista: {response_text}")
+        return []
+    keywords = list(
+        set(
+            filter(
+                None,
+                [
+                    str(k).lower().strip()
+                    for k in keywords_data
+                    if isinstance(k, (str, int, float))
+                ],
+            )
+        )
+    )
+    return keywords[:MAX_KEYWORDS]
+
+
+class TokenBucket:
+    """
+    Token bucket con recarga continua: ``rate_per_minute`` unidades por minuto
+    y una ráfaga máxima de ``capacity`` unidades.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute debe ser mayor que cero")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Descuenta ``amount`` y devuelve los segundos a esperar antes de usarlo
+        (0 si había saldo). El saldo puede quedar negativo: las siguientes
+        reservas esperan a que se recargue.
+        """
+        amount = min(amount, self.capacity)
+        self._refill()
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        if amount > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    async def acquire(self, amount: float = 1):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class TransientLLMError(Exception):
+    """Error recuperable (rate limit, timeout, 5xx)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AsyncKeywordClient:
+    """Cliente mínimo de ``/chat/completions`` sobre httpx."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        timeout: float = 60.0,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.http = http_client or httpx.AsyncClient(timeout=timeout)
+
+    async def complete(self, prompt: str):
+        """Devuelve ``(texto, tokens_usados)``; lanza TransientLLMError si se puede reintentar."""
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.6,
+            "max_tokens": MAX_OUTPUT_TOKENS,
+            "response_format": {"type": "json_object"},
+        }
+        try:
+            response = await self.http.post(
+                self.url, json=payload, headers=self.headers
+            )
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            raise TransientLLMError(f"{type(e).__name__}: {e}")
+
+        if response.status_code in RETRYABLE_STATUS:
+            retry_after = response.headers.get("retry-after")
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            raise TransientLLMError(f"HTTP {response.status_code}", retry_after)
+        response.raise_for_status()
+
+        data = response.json()
+        text = data["choices"][0]["message"]["content"].strip()
+        usage = data.get("usage") or {}
+        return text, usage.get("total_tokens")
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+@dataclass
+class KeywordJob:
+    partida_id: int
+    prompt: str
+    estimated_tokens: int = 0
+
+
+@dataclass
+class KeywordResult:
+    partida_id: int
+    keywords: List[str]
+    error: Optional[str] = None
+
+
+class Checkpoint:
+    """Archivo de texto con un id de partida procesada por línea (solo se agrega)."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path else None
+
+    def load(self) -> Set[int]:
+        if not self.path or not self.path.exists():
+            return set()
+        with self.path.open() as f:
+            return {int(line) for line in f if line.strip().isdigit()}
+
+    def add(self, ids: Iterable[int]):
+        if not self.path:
+            return
+        with self.path.open("a") as f:
+            f.writelines(f"{i}\n" for i in ids)
+            f.flush()
+
+
+async def _run_jobs(
+    jobs: List[KeywordJob],
+    client: AsyncKeywordClient,
+    results: "queue.Queue",
+    concurrency: int,
+    requests_bucket: TokenBucket,
+    tokens_bucket: Optional[TokenBucket],
+    max_retries: int,
+    delay: float,
+):
+    pending: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        pending.put_nowait(job)
+
+    async def process(job: KeywordJob) -> KeywordResult:
+        budget = job.estimated_tokens + MAX_OUTPUT_TOKENS
+        for attempt in range(max_retries + 1):
+            await requests_bucket.acquire(1)
+            if tokens_bucket:
+                await tokens_bucket.acquire(budget)
+            try:
+                text, used = await client.complete(job.prompt)
+            except TransientLLMError as e:
+                if tokens_bucket:
+                    tokens_bucket.refund(budget)
+                if attempt >= max_retries:
+                    return KeywordResult(job.partida_id, [], error=str(e))
+                wait = e.retry_after
+                if wait is None:
+                    wait = delay * (2**attempt) * (1 + random.random() * 0.25)
+                logger.warning(
+                    f"ID {job.partida_id}: {e}. Reintentando en {wait:.1f}s..."
+                )
+                await asyncio.sleep(wait)
+                continue
+            except Exception as e:
+                return KeywordResult(job.partida_id, [], error=str(e))
+
+            if tokens_bucket and used is not None:
+                tokens_bucket.refund(budget - used)
+            return KeywordResult(job.partida_id, parse_keywords(text))
+        return KeywordResult(job.partida_id, [], error="sin reintentos")
+
+    async def worker():
+        while True:
+            try:
+                job = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.put(await process(job))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        await client.aclose()
+
+
+def run_keyword_pipeline(
+    jobs: List[KeywordJob],
+    client: AsyncKeywordClient,
+    on_batch: Callable[[List[KeywordResult]], None],
+    concurrency: int = 8,
+    requests_per_minute: float = 500,
+    tokens_per_minute: Optional[float] = None,
+    max_retries: int = 3,
+    delay: float = 2.0,
+    batch_size: int = 50,
+    on_result: Optional[Callable[[KeywordResult], None]] = None,
+):
+    """
+    Ejecuta ``jobs`` contra el LLM en un hilo con su propio event loop y llama a
+    ``on_batch`` en el hilo actual con lotes de hasta ``batch_size`` resultados,
+    de modo que las escrituras en la base de datos siguen siendo síncronas.
+    """
+    results: "queue.Queue" = queue.Queue()
+    requests_bucket = TokenBucket(requests_per_minute, capacity=max(1, concurrency))
+    tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+    failure: List[BaseException] = []
+    done = object()
+
+    def target():
+        try:
+            asyncio.run(
+                _run_jobs(
+                    jobs,
+                    client,
+                    results,
+                    concurrency,
+                    requests_bucket,
+                    tokens_bucket,
+                    max_retries,
+                    delay,
+                )
+            )
+        except BaseException as e:  # se relanza en el hilo principal
+            failure.append(e)
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=target, name="llm-keywords", daemon=True)
+    thread.start()
+
+    batch: List[KeywordResult] = []
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        if on_result:
+            on_result(item)
+        batch.append(item)
+        if len(batch) >= batch_size:
+            on_batch(batch)
+            batch = []
+    if batch:
+        on_batch(batch)
+    thread.join()
+    if failure:
+        raise failure[0]
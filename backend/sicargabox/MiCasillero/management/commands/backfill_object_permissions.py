@@ -0,0 +1,165 @@
+import time
+
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from MiCasillero.models import (
+    OWNER_PERMISSIONS,
+    PERMISSION_GROUPS,
+    Alerta,
+    Articulo,
+    Cliente,
+    Cotizacion,
+    Envio,
+    Factura,
+    get_object_permissions,
+)
+
+# model_name -> (modelo, ruta al usuario dueño)
+MODEL_OWNERS = {
+    "cliente": (Cliente, "user_id"),
+    "cotizacion": (Cotizacion, "cliente__user_id"),
+    "envio": (Envio, "cotizacion__cliente__user_id"),
+    "factura": (Factura, "cliente__user_id"),
+    "alerta": (Alerta, "cliente__user_id"),
+    "articulo": (Articulo, "cotizacion__cliente__user_id"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Asigna en lote los permisos de objeto (dueño + grupos Operadores/"
+        "Administradores) a los registros existentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            nargs="+",
+            choices=sorted(MODEL_OWNERS),
+            default=sorted(MODEL_OWNERS),
+            help="Modelos a procesar (por defecto todos).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Filas leídas e insertadas por lote.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Contar los permisos a asignar sin escribir en la base de datos.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+        if batch_size <= 0:
+            raise CommandError("--batch-size debe ser mayor que cero.")
+
+        groups = list(Group.objects.filter(name__in=PERMISSION_GROUPS))
+        if len(groups) < len(PERMISSION_GROUPS):
+            self.stdout.write(
+                self.style.WARNING(
+                    "No existen todos los grupos "
+                    f"{PERMISSION_GROUPS}; solo se usarán: {[g.name for g in groups]}"
+                )
+            )
+        admin_user_ids = set(
+            User.objects.filter(groups__name="Administradores").values_list(
+                "id", flat=True
+            )
+        )
+
+        for model_name in options["models"]:
+            model, owner_path = MODEL_OWNERS[model_name]
+            start = time.perf_counter()
+            user_rows, group_rows = self.backfill_model(
+                model,
+                model_name,
+                owner_path,
+                groups,
+                admin_user_ids,
+                batch_size,
+                dry_run,
+            )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{model_name}: {user_rows} permisos de usuario y {group_rows} "
+                    f"de grupo {'por asignar' if dry_run else 'procesados'} "
+                    f"en {elapsed:.2f}s"
+                )
+            )
+
+    def backfill_model(
+        self, model, model_name, owner_path, groups, admin_user_ids, batch_size, dry_run
+    ):
+        content_type = ContentType.objects.get_for_model(model)
+        permissions = get_object_permissions(model_name, OWNER_PERMISSIONS)
+        missing = set(OWNER_PERMISSIONS) - set(permissions)
+        if missing:
+            raise CommandError(
+                f"Faltan permisos {sorted(missing)} para {model_name}; ejecute migrate."
+            )
+
+        user_perms = []
+        group_perms = []
+        user_rows = 0
+        group_rows = 0
+
+        def flush():
+            if dry_run:
+                return
+            with transaction.atomic():
+                UserObjectPermission.objects.bulk_create(
+                    user_perms, batch_size=batch_size, ignore_conflicts=True
+                )
+                GroupObjectPermission.objects.bulk_create(
+                    group_perms, batch_size=batch_size, ignore_conflicts=True
+                )
+
+        rows = model.objects.values_list("pk", owner_path).iterator(
+            chunk_size=batch_size
+        )
+        for pk, owner_id in rows:
+            object_pk = str(pk)
+            group_actions = ["view", "change"]
+            if owner_id is not None:
+                for action in OWNER_PERMISSIONS:
+                    user_perms.append(
+                        UserObjectPermission(
+                            user_id=owner_id,
+                            permission=permissions[action],
+                            content_type=content_type,
+                            object_pk=object_pk,
+                        )
+                    )
+                if owner_id in admin_user_ids:
+                    group_actions.append("delete")
+            for group in groups:
+                for action in group_actions:
+                    group_perms.append(
+                        GroupObjectPermission(
+                            group=group,
+                            permission=permissions[action],
+                            content_type=content_type,
+                            object_pk=object_pk,
+                        )
+                    )
+
+            if len(user_perms) + len(group_perms) >= batch_size:
+                user_rows += len(user_perms)
+                group_rows += len(group_perms)
+                flush()
+                user_perms = []
+                group_perms = []
+
+        user_rows += len(user_perms)
+        group_rows += len(group_perms)
+        flush()
+        return user_rows, group_rows
@@ -0,0 +1,157 @@
+"""
+Management command to benchmark the in-memory hierarchy index used by the
+keyword commands.
+
+For a sample of partidas it builds the prompt context of
+``generate_llm_keywords``, ``generate_search_keywords`` and
+``regenerate_empty_keywords`` twice: with the legacy per-row sibling query
+and with ``IndiceJerarquia`` (one table scan). It reports the time and the
+number of queries of each path and checks that both contexts are identical.
+
+If the catalogue has fewer rows than ``--rows``, synthetic partidas are
+inserted inside a transaction that is rolled back at the end.
+
+Usage:
+    python manage.py benchmark_hierarchy_index
+    python manage.py benchmark_hierarchy_index --rows 20000 --sample 500
+"""
+
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from MiCasillero.jerarquia import IndiceJerarquia
+from MiCasillero.management.commands.generate_llm_keywords import (
+    Command as LLMKeywordsCommand,
+)
+from MiCasillero.management.commands.generate_search_keywords import (
+    Command as SearchKeywordsCommand,
+)
+from MiCasillero.management.commands.regenerate_empty_keywords import (
+    Command as RegenerateKeywordsCommand,
+)
+from MiCasillero.models import PartidaArancelaria
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark legacy per-row sibling queries vs the shared hierarchy index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=7000,
+            help="Catalogue size to benchmark (synthetic rows are added if needed)",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=200,
+            help="Number of partidas whose context is built",
+        )
+        parser.add_argument(
+            "--max-siblings-context",
+            type=int,
+            default=25,
+            help="Same option as generate_llm_keywords",
+        )
+
+    def handle(self, *args, **options):
+        if options["sample"] <= 0:
+            raise CommandError("--sample must be greater than zero")
+        try:
+            with transaction.atomic():
+                self.seed(options["rows"])
+                self.run_benchmark(options["sample"], options["max_siblings_context"])
+                raise RollbackBenchmark()
+        except RollbackBenchmark:
+            pass
+
+    def seed(self, rows):
+        existing = PartidaArancelaria.objects.count()
+        missing = rows - existing
+        if missing <= 0:
+            self.stdout.write(f"Using {existing} existing partidas")
+            return
+
+        self.stdout.write(f"Adding {missing} synthetic partidas to {existing} rows")
+        batch = []
+        for i in range(missing):
+            chapter, rest = divmod(i, 400)
+            heading, item = divmod(rest, 20)
+            chapter_code = f"{9000 + chapter:04d}"
+            heading_code = f"{chapter_code}.{heading:02d}"
+            item_no = f"{heading_code}.{item:02d}.99"
+            especifica = "Los demás" if item == 19 else f"Artículo {i}"
+            batch.append(
+                PartidaArancelaria(
+                    item_no=item_no,
+                    descripcion=(
+                        f"Capítulo {chapter}|Encabezado {chapter}-{heading}|{especifica}"
+                    ),
+                    partida_arancelaria=item_no,
+                    impuesto_isv=Decimal("0.15"),
+                    chapter_code=chapter_code,
+                    heading_code=heading_code,
+                    hierarchy_level=4,
+                    parent_item_no=f"{heading_code}.00.00",
+                    search_keywords=[f"kw {i}"],
+                )
+            )
+        PartidaArancelaria.objects.bulk_create(batch, batch_size=2000)
+
+    def run_benchmark(self, sample_size, max_siblings):
+        ids = list(PartidaArancelaria.objects.values_list("id", flat=True))
+        sample_ids = random.Random(42).sample(ids, min(sample_size, len(ids)))
+        sample = list(PartidaArancelaria.objects.filter(id__in=sample_ids))
+
+        llm = LLMKeywordsCommand()
+        search = SearchKeywordsCommand()
+        regenerate = RegenerateKeywordsCommand()
+        builders = {
+            "generate_llm_keywords": lambda p, indice: llm.get_context_for_partida(
+                p, max_siblings, indice
+            ),
+            "generate_search_keywords": search.get_context_for_partida,
+            "regenerate_empty_keywords": regenerate.get_context_for_partida,
+        }
+
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as build_queries:
+            indice = IndiceJerarquia.construir()
+        build_time = time.perf_counter() - start
+        self.stdout.write(
+            f"Index build: {len(indice)} rows in {build_time * 1000:.1f}ms "
+            f"({len(build_queries)} queries)"
+        )
+
+        self.stdout.write(
+            f"{'command':<28}{'legacy ms':>12}{'queries':>9}"
+            f"{'index ms':>12}{'queries':>9}{'speedup':>9}"
+        )
+        for name, build in builders.items():
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as legacy_queries:
+                legacy = [build(p, None) for p in sample]
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as index_queries:
+                indexed = [build(p, indice) for p in sample]
+            index_time = time.perf_counter() - start
+
+            if legacy != indexed:
+                raise CommandError(f"{name}: index context differs from legacy path")
+            speedup = legacy_time / index_time if index_time else float("inf")
+            self.stdout.write(
+                f"{name:<28}{legacy_time * 1000:>12.1f}{len(legacy_queries):>9}"
+                f"{index_time * 1000:>12.1f}{len(index_queries):>9}{speedup:>8.1f}x"
+            )
@@ -0,0 +1,171 @@
+"""
+Management command to benchmark the PostgreSQL partida search.
+
+Compares the legacy ``descripcion__icontains`` scan against the indexed
+search in ``MiCasillero.busqueda`` (search_vector GIN + item_no prefix) and
+reports p50/p95 latency per query.
+
+If the catalogue has fewer rows than ``--rows``, synthetic partidas are
+inserted inside a transaction that is rolled back at the end, so the
+benchmark can simulate 20k+ rows without touching real data.
+
+Usage:
+    python manage.py benchmark_partida_search
+    python manage.py benchmark_partida_search --rows 20000 --iterations 50
+    python manage.py benchmark_partida_search --queries "guitarra" "8471"
+"""
+
+import random
+import statistics
+import time
+from decimal import Decimal
+from typing import Callable, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from MiCasillero.busqueda import AUTOCOMPLETE_LIMITE_POR_DEFECTO, buscar_partidas_texto
+from MiCasillero.models import PartidaArancelaria
+
+DEFAULT_QUERIES = [
+    "guitarra",
+    "cuerdas para guitarra",
+    "computadora portatil",
+    "zapatos de cuero",
+    "8471",
+    "6403.99",
+    "juguetes",
+    "perfume",
+]
+
+# Vocabulary for synthetic descriptions
+VOCABULARY = (
+    "animales vivos carne pescado leche huevos miel plantas flores frutas café té "
+    "cereales harina aceites azúcar cacao bebidas tabaco sal minerales productos "
+    "químicos plástico caucho cuero madera papel libros textiles algodón lana "
+    "calzado zapatos sombreros piedra vidrio joyería hierro acero cobre aluminio "
+    "herramientas máquinas computadoras teléfonos vehículos bicicletas relojes "
+    "instrumentos musicales guitarras juguetes muebles lámparas perfumes"
+).split()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark p50/p95 latency of icontains vs indexed partida search"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=7000,
+            help="Catalogue size to benchmark (synthetic rows are added if needed)",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=30,
+            help="Executions per query and strategy",
+        )
+        parser.add_argument(
+            "--queries",
+            nargs="+",
+            default=DEFAULT_QUERIES,
+            help="Queries to benchmark",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=AUTOCOMPLETE_LIMITE_POR_DEFECTO,
+            help="Result limit for the indexed search",
+        )
+
+    def handle(self, *args, **options):
+        if options["iterations"] <= 0:
+            raise CommandError("--iterations must be greater than zero")
+
+        try:
+            with transaction.atomic():
+                self.seed(options["rows"])
+                self.run_benchmark(
+                    options["queries"], options["iterations"], options["limit"]
+                )
+                raise RollbackBenchmark()
+        except RollbackBenchmark:
+            pass
+
+    def seed(self, rows: int):
+        existing = PartidaArancelaria.objects.count()
+        missing = rows - existing
+        if missing <= 0:
+            self.stdout.write(f"Using {existing} existing partidas")
+            return
+
+        self.stdout.write(f"Adding {missing} synthetic partidas to {existing} rows")
+        rng = random.Random(42)
+        batch = []
+        for i in range(missing):
+            code = f"{rng.randint(1, 97):02d}{rng.randint(1, 99):02d}.{rng.randint(0, 99):02d}.{i % 100:02d}"
+            words = rng.sample(VOCABULARY, 6)
+            batch.append(
+                PartidaArancelaria(
+                    item_no=code,
+                    descripcion=" ".join(words).capitalize(),
+                    partida_arancelaria=code,
+                    impuesto_dai=Decimal("0.10"),
+                    impuesto_isv=Decimal("0.15"),
+                    search_keywords=words[:3],
+                )
+            )
+        # search_vector lo calcula el trigger de la tabla en el mismo INSERT
+        PartidaArancelaria.objects.bulk_create(batch, batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ANALYZE {connection.ops.quote_name(PartidaArancelaria._meta.db_table)}"
+            )
+
+    def run_benchmark(self, queries: List[str], iterations: int, limit: int):
+        strategies: Dict[str, Callable[[str], list]] = {
+            "icontains": lambda q: list(
+                PartidaArancelaria.objects.filter(descripcion__icontains=q)
+                .order_by("descripcion")
+                .values_list("id", flat=True)
+            ),
+            "indexed": lambda q: list(
+                buscar_partidas_texto(q).values_list("id", flat=True)[:limit]
+            ),
+        }
+
+        self.stdout.write(
+            f"{'query':<28}{'strategy':<12}{'hits':>6}{'p50 ms':>10}{'p95 ms':>10}"
+        )
+        overall: Dict[str, List[float]] = {name: [] for name in strategies}
+        for query in queries:
+            for name, run in strategies.items():
+                hits = len(run(query))  # warm-up
+                timings = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    run(query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                overall[name].extend(timings)
+                self.stdout.write(
+                    f"{query[:27]:<28}{name:<12}{hits:>6}"
+                    f"{statistics.median(timings):>10.2f}{percentile(timings, 95):>10.2f}"
+                )
+
+        for name, timings in overall.items():
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: p50={statistics.median(timings):.2f}ms "
+                    f"p95={percentile(timings, 95):.2f}ms"
+                )
+            )
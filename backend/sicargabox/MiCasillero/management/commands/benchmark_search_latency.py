@@ -0,0 +1,566 @@
+"""
+Management command to benchmark the latency of each partida search path.
+
+Replays the queries of test_data/test_queries.json (the same set used by
+``evaluate_search_quality``) and, optionally, a production query log against
+each search path, with ``--concurrency`` searches in flight:
+
+    - elasticsearch: ``buscar_partidas?modo=texto`` (local index if ES is down)
+    - fusion: ``buscar_partidas`` default mode (``ranking.rankear_partidas``)
+    - search_vector: PostgreSQL full-text search (``busqueda.buscar_partidas_texto``)
+    - icontains: legacy ``descripcion__icontains`` scan
+    - local: in-memory fallback index (``indice_local``)
+    - semantico / hibrido: embedding search (needs OPENAI_API_KEY, so only
+      run when listed in ``--paths``)
+
+Reports p50/p95/p99 latency, throughput and database queries per search for
+each path, as an HTML report and optionally JSON (same layout as
+``evaluate_search_quality``). Every path builds the same Select2 payload
+(``busqueda.resultados_partidas``), so the latencies are comparable. The
+result cache of ``buscar_partidas`` is not used, so every sample runs the
+search.
+
+Usage:
+    python manage.py benchmark_search_latency
+    python manage.py benchmark_search_latency --concurrency 8 --iterations 5
+    python manage.py benchmark_search_latency --paths search_vector icontains
+    python manage.py benchmark_search_latency --query-log queries.txt \
+        --json-output latency.json
+"""
+
+import json
+import os
+import queue
+import statistics
+import threading
+import time
+from datetime import datetime
+from html import escape
+from typing import Callable, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from MiCasillero.busqueda import buscar_partidas_texto, resultados_partidas
+from MiCasillero.indice_local import indice_local
+from MiCasillero.management.commands.benchmark_partida_search import percentile
+from MiCasillero.models import PartidaArancelaria
+from MiCasillero.ranking import (
+    ESTADOS_COMPLETOS,
+    buscar_partidas_elasticsearch,
+    rankear_partidas,
+)
+from MiCasillero.vectores import buscar_partidas_hibrido, buscar_partidas_semantico
+
+SEARCH_PATHS = (
+    "elasticsearch",
+    "fusion",
+    "search_vector",
+    "icontains",
+    "local",
+    "semantico",
+    "hibrido",
+)
+
+# The embedding paths error out without OPENAI_API_KEY
+DEFAULT_PATHS = [path for path in SEARCH_PATHS if path not in ("semantico", "hibrido")]
+
+
+def search_paths(limit: int) -> Dict[str, Callable[[str], Tuple[list, bool]]]:
+    """
+    Search path -> function returning ``(results, degraded)`` for a query.
+    Every path returns the ``buscar_partidas`` payload, not bare ids.
+    """
+
+    def elasticsearch(q):
+        results, estado = buscar_partidas_elasticsearch(q, limit)
+        return results, estado not in ESTADOS_COMPLETOS
+
+    def fusion(q):
+        resultado = rankear_partidas(q, limit)
+        return resultado.results, resultado.degradado
+
+    return {
+        "elasticsearch": elasticsearch,
+        "fusion": fusion,
+        "search_vector": lambda q: (
+            resultados_partidas(
+                buscar_partidas_texto(q).values_list("id", "rango")[:limit]
+            ),
+            False,
+        ),
+        "icontains": lambda q: (
+            resultados_partidas(
+                (pk, 1.0)
+                for pk in PartidaArancelaria.objects.filter(descripcion__icontains=q)
+                .order_by("descripcion")
+                .values_list("id", flat=True)[:limit]
+            ),
+            False,
+        ),
+        "local": lambda q: (resultados_partidas(indice_local.buscar(q, limit)), False),
+        "semantico": lambda q: (buscar_partidas_semantico(q, limit), False),
+        "hibrido": lambda q: (buscar_partidas_hibrido(q, limit), False),
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark p50/p95/p99 latency and throughput of each partida search path"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default="search_latency_report.html",
+            help="Output HTML report filename",
+        )
+        parser.add_argument(
+            "--json-output",
+            type=str,
+            default=None,
+            help="Optional JSON output filename for raw results",
+        )
+        parser.add_argument(
+            "--test-file",
+            type=str,
+            default="test_data/test_queries.json",
+            help="Path to test queries JSON file",
+        )
+        parser.add_argument(
+            "--query-log",
+            type=str,
+            default=None,
+            help="Optional file with one logged production query per line",
+        )
+        parser.add_argument(
+            "--paths",
+            nargs="+",
+            choices=SEARCH_PATHS,
+            default=DEFAULT_PATHS,
+            help="Search paths to benchmark (default: all but semantico/hibrido)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Searches in flight (default: 4)",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=3,
+            help="Times each query is replayed per path (default: 3)",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=1,
+            help="Untimed passes over the queries before measuring (default: 1)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Results per search (default: 20)",
+        )
+        parser.add_argument(
+            "--verbose",
+            action="store_true",
+            help="Print detailed output during the benchmark",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] <= 0 or options["iterations"] <= 0:
+            raise CommandError(
+                "--concurrency and --iterations must be greater than zero"
+            )
+        self.verbose = options["verbose"]
+
+        queries = self.load_queries(options["test_file"], options["query_log"])
+        if not queries:
+            raise CommandError("No queries to replay")
+        self.stdout.write(
+            f"Replaying {len(queries)} queries x {options['iterations']} iterations "
+            f"on {len(options['paths'])} paths "
+            f"with concurrency {options['concurrency']}"
+        )
+
+        paths = search_paths(options["limit"])
+        results = []
+        path_metrics = {}
+        for name in options["paths"]:
+            samples, wall = self.run_path(
+                paths[name],
+                queries,
+                options["concurrency"],
+                options["iterations"],
+                options["warmup"],
+            )
+            path_metrics[name] = self.calculate_path_metrics(samples, wall)
+            path_results = self.summarize_queries(name, samples)
+            if self.verbose:
+                for result in path_results:
+                    self.stdout.write(
+                        f"  {result['query'][:40]:<42}{result['hits']:>4} hits"
+                        f"{result['p50_ms']:>10.2f} ms{result['db_queries']:>4} db"
+                    )
+            results += path_results
+            self.print_path(name, path_metrics[name])
+
+        metrics = {
+            "timestamp": datetime.now().isoformat(),
+            "test_file": options["test_file"],
+            "query_log": options["query_log"],
+            "overall": {
+                "total_queries": len(queries),
+                "iterations": options["iterations"],
+                "concurrency": options["concurrency"],
+                "limit": options["limit"],
+                "paths": list(options["paths"]),
+            },
+            "paths": path_metrics,
+        }
+
+        self.generate_html_report(results, metrics, options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(f"\nHTML report saved to: {options['output']}")
+        )
+        if options["json_output"]:
+            self.save_json_results(results, metrics, options["json_output"])
+            self.stdout.write(
+                self.style.SUCCESS(f"JSON results saved to: {options['json_output']}")
+            )
+
+    def load_queries(self, test_file: str, query_log: str = None) -> List[Dict]:
+        """``{"query", "category"}`` for each test query and logged query."""
+        queries = []
+        if test_file:
+            test_file_path = os.path.join(settings.BASE_DIR, test_file)
+            try:
+                with open(test_file_path, "r", encoding="utf-8") as f:
+                    test_data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                raise CommandError(f"Cannot load test file {test_file_path}: {e}")
+            for category_id, category_data in test_data["categories"].items():
+                queries += [
+                    {"query": query, "category": category_id}
+                    for query in category_data["queries"]
+                ]
+        if query_log:
+            try:
+                with open(query_log, "r", encoding="utf-8") as f:
+                    lines = [line.strip() for line in f]
+            except OSError as e:
+                raise CommandError(f"Cannot load query log {query_log}: {e}")
+            # Repeated queries are kept so the mix matches production
+            queries += [
+                {"query": line, "category": "query_log"}
+                for line in lines
+                if line and not line.startswith("#")
+            ]
+        return [q for q in queries if len(q["query"].strip()) >= 3]
+
+    def measure(self, run: Callable, query: Dict) -> Dict:
+        """Run one search and time it, counting its database queries."""
+        sample = {**query, "hits": 0, "degraded": False, "error": None}
+        with CaptureQueriesContext(connection) as db_queries:
+            start = time.perf_counter()
+            try:
+                hits, sample["degraded"] = run(query["query"])
+                sample["hits"] = len(hits)
+            except Exception as e:
+                sample["error"] = f"{type(e).__name__}: {e}"
+            sample["ms"] = (time.perf_counter() - start) * 1000
+        sample["db_queries"] = len(db_queries)
+        return sample
+
+    def run_path(
+        self,
+        run: Callable,
+        queries: List[Dict],
+        concurrency: int,
+        iterations: int,
+        warmup: int,
+    ) -> Tuple[List[Dict], float]:
+        """Samples of every replayed query and the wall time they took."""
+        # Warm-up in this thread: builds in-memory indexes and fills caches
+        for _ in range(warmup):
+            for query in queries:
+                self.measure(run, query)
+
+        jobs = [query for _ in range(iterations) for query in queries]
+        if concurrency == 1:
+            start = time.perf_counter()
+            samples = [self.measure(run, query) for query in jobs]
+            return samples, time.perf_counter() - start
+
+        pending = queue.SimpleQueue()
+        for query in jobs:
+            pending.put(query)
+        samples = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        query = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    sample = self.measure(run, query)
+                    with lock:
+                        samples.append(sample)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - start
+
+    def calculate_path_metrics(self, samples: List[Dict], wall: float) -> Dict:
+        """Latency percentiles, throughput and DB queries of one path."""
+        ok = [s for s in samples if s["error"] is None]
+        timings = [s["ms"] for s in ok]
+        db_queries = sum(s["db_queries"] for s in samples)
+        errors = [s["error"] for s in samples if s["error"] is not None]
+        return {
+            "samples": len(samples),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "degraded": sum(1 for s in ok if s["degraded"]),
+            "zero_results": sum(1 for s in ok if s["hits"] == 0),
+            "p50_ms": statistics.median(timings) if timings else 0.0,
+            "p95_ms": percentile(timings, 95) if timings else 0.0,
+            "p99_ms": percentile(timings, 99) if timings else 0.0,
+            "mean_ms": statistics.fmean(timings) if timings else 0.0,
+            "max_ms": max(timings, default=0.0),
+            "wall_seconds": wall,
+            "throughput_qps": len(samples) / wall if wall else 0.0,
+            "db_queries": db_queries,
+            "db_queries_per_search": db_queries / len(samples) if samples else 0.0,
+        }
+
+    def summarize_queries(self, path: str, samples: List[Dict]) -> List[Dict]:
+        """One result per (path, query) with its median latency."""
+        by_query: Dict[Tuple[str, str], List[Dict]] = {}
+        for sample in samples:
+            by_query.setdefault((sample["category"], sample["query"]), []).append(
+                sample
+            )
+        results = []
+        for (category, query), query_samples in by_query.items():
+            timings = [s["ms"] for s in query_samples]
+            results.append(
+                {
+                    "path": path,
+                    "query": query,
+                    "category": category,
+                    "samples": len(query_samples),
+                    "p50_ms": statistics.median(timings),
+                    "max_ms": max(timings),
+                    "hits": query_samples[-1]["hits"],
+                    "db_queries": query_samples[-1]["db_queries"],
+                    "errors": sum(1 for s in query_samples if s["error"]),
+                }
+            )
+        return results
+
+    def print_path(self, name: str, path_metrics: Dict):
+        line = (
+            f"{name}: p50={path_metrics['p50_ms']:.2f}ms "
+            f"p95={path_metrics['p95_ms']:.2f}ms "
+            f"p99={path_metrics['p99_ms']:.2f}ms "
+            f"{path_metrics['throughput_qps']:.1f} q/s "
+            f"{path_metrics['db_queries_per_search']:.1f} db queries/search"
+        )
+        if path_metrics["errors"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{line} ({path_metrics['errors']} errors: "
+                    f"{path_metrics['first_error']})"
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(line))
+
+    def generate_html_report(
+        self, results: List[Dict], metrics: Dict, output_path: str
+    ):
+        """Generate HTML report with per-path and slowest-query tables."""
+        overall = metrics["overall"]
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        html = f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Search Latency Benchmark Report - {timestamp}</title>
+    <style>
+        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
+        body {{
+            font-family: system-ui, -apple-system, sans-serif;
+            background: #f3f4f6;
+            padding: 2rem;
+        }}
+        .container {{
+            max-width: 1200px;
+            margin: 0 auto;
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+        }}
+        header {{
+            background: #1f2937;
+            color: white;
+            padding: 2rem;
+            border-radius: 8px 8px 0 0;
+        }}
+        header h1 {{ font-size: 2rem; margin-bottom: 0.5rem; }}
+        header p {{ opacity: 0.8; }}
+        .section {{ padding: 2rem; border-bottom: 1px solid #e5e7eb; }}
+        .section h2 {{ font-size: 1.5rem; margin-bottom: 1.5rem; color: #1f2937; }}
+        table {{ width: 100%; border-collapse: collapse; }}
+        th, td {{
+            padding: 0.75rem;
+            text-align: left;
+            border-bottom: 1px solid #e5e7eb;
+        }}
+        th {{ background: #f9fafb; font-weight: 600; color: #374151; }}
+        .good {{ color: #22c55e; }}
+        .warning {{ color: #eab308; }}
+        .error {{ color: #ef4444; }}
+        footer {{
+            padding: 2rem;
+            background: #f9fafb;
+            text-align: center;
+            color: #6b7280;
+            border-radius: 0 0 8px 8px;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <header>
+            <h1>⏱ Search Latency Benchmark Report</h1>
+            <p>Generated: {timestamp}</p>
+            <p>
+                {overall['total_queries']} queries x {overall['iterations']} iterations,
+                concurrency {overall['concurrency']},
+                {overall['limit']} results per search
+            </p>
+        </header>
+
+        <div class="section">
+            <h2>Search Paths</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Path</th>
+                        <th>p50</th>
+                        <th>p95</th>
+                        <th>p99</th>
+                        <th>Throughput</th>
+                        <th>DB Queries / Search</th>
+                        <th>Zero Results</th>
+                        <th>Degraded</th>
+                        <th>Errors</th>
+                    </tr>
+                </thead>
+                <tbody>
+"""
+
+        for name, path_metrics in sorted(
+            metrics["paths"].items(), key=lambda x: x[1]["p95_ms"]
+        ):
+            p95_class = (
+                "good"
+                if path_metrics["p95_ms"] < 100
+                else ("warning" if path_metrics["p95_ms"] < 300 else "error")
+            )
+            errors_class = "error" if path_metrics["errors"] else ""
+            html += f"""
+                    <tr>
+                        <td>{escape(name)}</td>
+                        <td>{path_metrics['p50_ms']:.2f} ms</td>
+                        <td class="{p95_class}">{path_metrics['p95_ms']:.2f} ms</td>
+                        <td>{path_metrics['p99_ms']:.2f} ms</td>
+                        <td>{path_metrics['throughput_qps']:.1f} q/s</td>
+                        <td>{path_metrics['db_queries_per_search']:.1f}</td>
+                        <td>{path_metrics['zero_results']}</td>
+                        <td>{path_metrics['degraded']}</td>
+                        <td class="{errors_class}">{path_metrics['errors']}</td>
+                    </tr>
+"""
+
+        html += """
+                </tbody>
+            </table>
+        </div>
+
+        <div class="section">
+            <h2>Slowest Queries</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Path</th>
+                        <th>Category</th>
+                        <th>Query</th>
+                        <th>p50</th>
+                        <th>Max</th>
+                        <th>Results</th>
+                        <th>DB Queries</th>
+                    </tr>
+                </thead>
+                <tbody>
+"""
+
+        for result in sorted(results, key=lambda r: r["p50_ms"], reverse=True)[:20]:
+            html += f"""
+                    <tr>
+                        <td>{escape(result['path'])}</td>
+                        <td>{escape(result['category'])}</td>
+                        <td>{escape(result['query'])}</td>
+                        <td>{result['p50_ms']:.2f} ms</td>
+                        <td>{result['max_ms']:.2f} ms</td>
+                        <td>{result['hits']}</td>
+                        <td>{result['db_queries']}</td>
+                    </tr>
+"""
+
+        html += """
+                </tbody>
+            </table>
+        </div>
+
+        <footer>
+            <p>Generated by SicargaBox Search Latency Benchmark</p>
+        </footer>
+    </div>
+</body>
+</html>
+"""
+
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(html)
+
+    def save_json_results(self, results: List[Dict], metrics: Dict, output_path: str):
+        """Save per-query results and metrics to JSON file."""
+        output = {
+            "metadata": {
+                "timestamp": metrics["timestamp"],
+                "test_file": metrics["test_file"],
+                "query_log": metrics["query_log"],
+            },
+            "metrics": metrics,
+            "results": results,
+        }
+
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
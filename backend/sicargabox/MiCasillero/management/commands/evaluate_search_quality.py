@@ -4,10 +4,16 @@ Management command to evaluate Elasticsearch search keyword quality.
 This command loads test queries from test_data/test_queries.json, executes
 searches, calculates quality metrics, and generates an HTML report.
 
+Queries are sent in batches with the Elasticsearch multi-search API
+(``--batch-size`` searches per ``_msearch`` request, ``--workers`` requests in
+flight), and each batch of hits is checked against the database with a
+single ``item_no__in`` query, so the whole suite runs in a few round trips.
+
 Usage:
     python manage.py evaluate_search_quality --output=report.html
     python manage.py evaluate_search_quality --json-output=results.json
     python manage.py evaluate_search_quality --verbose
+    python manage.py evaluate_search_quality --batch-size 25 --workers 8
 
 Metrics calculated:
     - Precision@K: Percentage of relevant results in top K results
@@ -18,16 +24,22 @@ Metrics calculated:
 
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from elasticsearch_dsl.query import Q as ES_Q
+from elasticsearch_dsl import MultiSearch
 
 from MiCasillero.documents import PartidaArancelariaDocument
 from MiCasillero.models import PartidaArancelaria
+from MiCasillero.ranking import consulta_multi_match
+
+# Results per query, as in views.buscar_partidas
+RESULTS_PER_QUERY = 20
 
 
 class Command(BaseCommand):
@@ -63,10 +75,24 @@ class Command(BaseCommand):
             default=5,
             help="Number of top results to consider for Precision@K (default: 5)",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Searches per Elasticsearch _msearch request (default: 50)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Concurrent _msearch requests (default: 4)",
+        )
 
     def handle(self, *args, **options):
         self.verbose = options["verbose"]
         self.k = options["k"]
+        self.batch_size = max(1, options["batch_size"])
+        self.workers = max(1, options["workers"])
 
         # Load test queries
         test_file_path = os.path.join(settings.BASE_DIR, options["test_file"])
@@ -92,7 +118,11 @@ class Command(BaseCommand):
         )
 
         # Run evaluation
+        start = time.perf_counter()
         results = self.evaluate_searches(test_data)
+        self.stdout.write(
+            f"Executed {len(results)} queries in {time.perf_counter() - start:.2f}s"
+        )
 
         # Calculate metrics
         metrics = self.calculate_metrics(results, test_data)
@@ -142,6 +172,12 @@ class Command(BaseCommand):
         total_queries = sum(
             len(cat["queries"]) for cat in test_data["categories"].values()
         )
+        queries = [
+            query
+            for category_data in test_data["categories"].values()
+            for query in category_data["queries"]
+        ]
+        search_results_by_query = self.execute_searches(queries)
         current = 0
 
         for category_id, category_data in test_data["categories"].items():
@@ -150,8 +186,7 @@ class Command(BaseCommand):
                 if self.verbose:
                     self.stdout.write(f"[{current}/{total_queries}] Testing: {query}")
 
-                # Execute search using same logic as views.py
-                search_results = self.execute_search(query)
+                search_results = search_results_by_query.get(query, [])
 
                 # Evaluate results
                 result = {
@@ -178,56 +213,95 @@ class Command(BaseCommand):
 
         return results
 
-    def execute_search(self, query: str) -> List[Dict]:
-        """Execute Elasticsearch search (mirrors views.buscar_partidas)."""
-        if len(query) < 3:
-            return []
-
-        try:
-            search = PartidaArancelariaDocument.search()
-
-            # Multi-match query with same weights as production
-            es_query = ES_Q(
-                "multi_match",
-                query=query,
-                fields=[
-                    "item_no^3",
-                    "descripcion^2",
-                    "full_text_search",
-                    "search_keywords",
-                ],
-                fuzziness="AUTO",
+    def build_search(self, query: str):
+        """Search for one query (mirrors views.buscar_partidas)."""
+        search = PartidaArancelariaDocument.search()
+        # Multi-match query with same weights as production
+        search = search.query(consulta_multi_match(query))
+        # Only return ALLOWED category
+        search = search.filter("term", courier_category="ALLOWED")
+        return search[:RESULTS_PER_QUERY]
+
+    def run_msearch(self, queries: List[str]) -> List[List[Dict]]:
+        """
+        Run one _msearch request; returns the hits of each query in order, or
+        ``None`` for a query whose search failed.
+        """
+        multi_search = MultiSearch(index=PartidaArancelariaDocument._index._name)
+        for query in queries:
+            multi_search = multi_search.add(self.build_search(query))
+
+        hits_by_query = []
+        for query, response in zip(queries, multi_search.execute(raise_on_error=False)):
+            if response is None:
+                if self.verbose:
+                    self.stderr.write(f"Search error for '{query}'")
+                hits_by_query.append(None)
+                continue
+            hits_by_query.append(
+                [
+                    {
+                        "item_no": hit.item_no,
+                        "descripcion": hit.descripcion,
+                        "score": hit.meta.score,
+                        "search_keywords": list(getattr(hit, "search_keywords", [])),
+                    }
+                    for hit in response
+                ]
             )
+        return hits_by_query
+
+    def hydrate(self, hits_by_query: List[List[Dict]]) -> List[List[Dict]]:
+        """
+        Add ``courier_category`` from the database to every hit of a batch with
+        one query, dropping hits whose partida no longer exists.
+        """
+        item_nos = {hit["item_no"] for hits in hits_by_query if hits for hit in hits}
+        categories = dict(
+            PartidaArancelaria.objects.filter(item_no__in=item_nos).values_list(
+                "item_no", "courier_category"
+            )
+        )
+        return [
+            [
+                {**hit, "courier_category": categories[hit["item_no"]]}
+                for hit in hits or []
+                if hit["item_no"] in categories
+            ]
+            for hits in hits_by_query
+        ]
 
-            # Only return ALLOWED category
-            search = search.query(es_query)
-            search = search.filter("term", courier_category="ALLOWED")
-            search = search[:20]  # Limit to top 20 results
-
-            response = search.execute()
+    def execute_searches(self, queries: List[str]) -> Dict[str, List[Dict]]:
+        """Execute every query with concurrent _msearch batches."""
+        unique = list(dict.fromkeys(q for q in queries if len(q) >= 3))
+        results: Dict[str, List[Dict]] = {q: [] for q in queries}
+        batches = [
+            unique[i : i + self.batch_size]
+            for i in range(0, len(unique), self.batch_size)
+        ]
 
-            # Convert to list of dicts
-            results = []
-            for hit in response:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.run_msearch, batch): batch for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
                 try:
-                    partida = PartidaArancelaria.objects.get(item_no=hit.item_no)
-                    results.append(
-                        {
-                            "item_no": hit.item_no,
-                            "descripcion": hit.descripcion,
-                            "score": hit.meta.score,
-                            "search_keywords": getattr(hit, "search_keywords", []),
-                            "courier_category": partida.courier_category,
-                        }
-                    )
-                except PartidaArancelaria.DoesNotExist:
+                    hits_by_query = future.result()
+                except Exception as e:
+                    if self.verbose:
+                        self.stderr.write(
+                            f"Search error for batch of {len(batch)} queries: {e}"
+                        )
                     continue
+                # Hydrated in this thread so only its connection is used
+                for query, hits in zip(batch, self.hydrate(hits_by_query)):
+                    results[query] = hits
+        return results
 
-            return results
-        except Exception as e:
-            if self.verbose:
-                self.stderr.write(f"Search error for '{query}': {e}")
-            return []
+    def execute_search(self, query: str) -> List[Dict]:
+        """Execute Elasticsearch search for a single query."""
+        return self.execute_searches([query])[query]
 
     def count_relevant_in_top_k(
         self, results: List[Dict], expected_patterns: List[str], k: int
@@ -0,0 +1,90 @@
+"""
+Management command to export partida embeddings as a float32 matrix.
+
+Writes ``<output>.npy`` (normalized embeddings, one row per partida) and
+``<output>.meta.npz`` (partida ids, versions and model). Point
+``PARTIDA_VECTOR_INDEX_PATH`` at the output so each process memory-maps the
+matrix on startup instead of decoding the JSON embeddings; rows changed after
+the export are picked up incrementally through their ``version``.
+
+Usage:
+    python manage.py export_partida_vectors --output data/partida_vectors
+    python manage.py export_partida_vectors --output data/partida_vectors --benchmark
+"""
+
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from MiCasillero.vectores import MODELO_POR_DEFECTO, IndiceVectorial
+
+
+class Command(BaseCommand):
+    help = "Export PartidaArancelariaEmbedding vectors to a memory-mappable .npy"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=getattr(settings, "PARTIDA_VECTOR_INDEX_PATH", None),
+            help="Output path (defaults to PARTIDA_VECTOR_INDEX_PATH)",
+        )
+        parser.add_argument(
+            "--model",
+            type=str,
+            default=getattr(settings, "PARTIDA_EMBEDDING_MODEL", MODELO_POR_DEFECTO),
+            help="Only export embeddings generated with this model",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Time top-20 queries against the memory-mapped export",
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError(
+                "--output is required (or set PARTIDA_VECTOR_INDEX_PATH)"
+            )
+
+        start = time.perf_counter()
+        indice = IndiceVectorial(options["model"])
+        stats = indice.refrescar()
+        load_time = time.perf_counter() - start
+        if not len(indice):
+            raise CommandError(f"No embeddings found for model {options['model']}")
+
+        ruta = indice.exportar(options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {stats['agregados']} vectors of {indice.dimension} "
+                f"dimensions to {ruta} (loaded from the database in {load_time:.2f}s)"
+            )
+        )
+
+        if options["benchmark"]:
+            self.benchmark(options["output"], options["model"], indice)
+
+    def benchmark(self, ruta, modelo, original):
+        start = time.perf_counter()
+        indice = IndiceVectorial(modelo)
+        indice.cargar_archivo(ruta)
+        self.stdout.write(
+            f"Memory-mapped load: {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+        rng = np.random.default_rng(42)
+        timings = []
+        for fila in rng.integers(0, original.n, size=min(200, original.n)):
+            consulta = original.matriz[fila] + rng.normal(0, 0.01, original.dimension)
+            inicio = time.perf_counter()
+            indice.buscar(consulta, 20)
+            timings.append((time.perf_counter() - inicio) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"top-20 cosine query: p50={statistics.median(timings):.2f}ms "
+            f"p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms"
+        )
@@ -0,0 +1,95 @@
+"""
+Management command to export the partida rate table as a columnar snapshot.
+
+Writes ``<output>.npy`` (a NumPy structured array ordered by id with item_no,
+partida_arancelaria, the four tax rates in hundredths, courier_category and
+the hierarchy codes) and ``<output>.meta.npz`` (format, database ``tarifas``
+version and item_no sort order). Point ``PARTIDA_TARIFAS_PATH`` at the output
+so each worker memory-maps the table on startup instead of querying the
+partidas. The export is only used while the database's ``tarifas`` version is
+still the one it was read at; after any rate change the workers load from the
+database instead. Re-export after ``sync_partidas``/``import_partidas``.
+
+Usage:
+    python manage.py export_tarifas --output data/tarifas
+    python manage.py export_tarifas --output data/tarifas --benchmark
+"""
+
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from MiCasillero.models import PartidaArancelaria
+from MiCasillero.tarifas import CAMPOS_TASAS, TablaTarifas
+
+
+class Command(BaseCommand):
+    help = "Export the PartidaArancelaria rate table to a memory-mappable .npy"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=getattr(settings, "PARTIDA_TARIFAS_PATH", None),
+            help="Output path (defaults to PARTIDA_TARIFAS_PATH)",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Compare lookups in the memory-mapped export with database fetches",
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError("--output is required (or set PARTIDA_TARIFAS_PATH)")
+
+        start = time.perf_counter()
+        tabla = TablaTarifas()
+        tabla.cargar_bd()
+        load_time = time.perf_counter() - start
+        if not len(tabla):
+            raise CommandError("No partidas found")
+
+        ruta = tabla.exportar(options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {len(tabla)} partidas ({tabla.datos.nbytes / 1024:.0f} KiB, "
+                f"version {tabla.version}) to {ruta} "
+                f"(loaded from the database in {load_time:.2f}s)"
+            )
+        )
+
+        if options["benchmark"]:
+            self.benchmark(options["output"], tabla)
+
+    def benchmark(self, ruta, original):
+        start = time.perf_counter()
+        tabla = TablaTarifas()
+        if not tabla.cargar_archivo(ruta):
+            raise CommandError(f"Could not load {ruta}")
+        self.stdout.write(
+            f"Memory-mapped load: {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+        rng = np.random.default_rng(42)
+        ids = original.datos["id"]
+        snapshot, database = [], []
+        for _ in range(200):
+            lote = rng.choice(ids, size=min(10, len(ids))).tolist()
+            inicio = time.perf_counter()
+            tabla.buscar(lote)
+            snapshot.append((time.perf_counter() - inicio) * 1000)
+            inicio = time.perf_counter()
+            PartidaArancelaria.objects.only(
+                "id", "item_no", "partida_arancelaria", *CAMPOS_TASAS
+            ).in_bulk(lote)
+            database.append((time.perf_counter() - inicio) * 1000)
+        for nombre, timings in (("snapshot", snapshot), ("database", database)):
+            timings.sort()
+            self.stdout.write(
+                f"10-partida lookup ({nombre}): p50={statistics.median(timings):.3f}ms "
+                f"p95={timings[int(len(timings) * 0.95) - 1]:.3f}ms"
+            )
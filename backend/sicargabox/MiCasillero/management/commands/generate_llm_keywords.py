@@ -8,6 +8,7 @@
 import json
 import logging
 import os
+import time
 from time import sleep
 
 from django.core.management.base import BaseCommand, CommandError
@@ -17,6 +18,17 @@ from dotenv import load_dotenv
 
 # --- Model Import ---
 try:
+    from MiCasillero.jerarquia import IndiceJerarquia, NodoPartida
+    from MiCasillero.llm_keywords import (
+        API_KEY_ENV,
+        BASE_URLS,
+        AsyncKeywordClient,
+        Checkpoint,
+        KeywordJob,
+        parse_keywords,
+        run_keyword_pipeline,
+    )
+
     # Asume que tu modelo está en MiCasillero.models
     from MiCasillero.models import PartidaArancelaria
 except ImportError:
@@ -151,6 +163,42 @@ class Command(BaseCommand):
             action="store_true",
             help="Saltar conteo/fallback por tamaño.",
         )
+        parser.add_argument(
+            "--async",
+            dest="use_async",
+            action="store_true",
+            help="Llamadas concurrentes (asyncio) con escritura por lotes (solo openai/deepseek).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=8,
+            help="Peticiones simultáneas en modo --async.",
+        )
+        parser.add_argument(
+            "--rpm",
+            type=float,
+            default=500,
+            help="Límite de peticiones por minuto en modo --async.",
+        )
+        parser.add_argument(
+            "--tpm",
+            type=float,
+            default=0,
+            help="Límite de tokens por minuto en modo --async (0 = sin límite).",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help="Archivo de checkpoint para reanudar en modo --async.",
+        )
+        parser.add_argument(
+            "--base-url",
+            type=str,
+            default=None,
+            help="URL base de la API compatible con OpenAI (por defecto la del proveedor).",
+        )
 
     # --- Helper Functions ---
 
@@ -208,7 +256,7 @@ class Command(BaseCommand):
             logger.error(f"Error inicializando cliente {provider}/{model_name}: {e}")
             return None
 
-    def get_context_for_partida(self, partida, max_siblings_context):
+    def get_context_for_partida(self, partida, max_siblings_context, indice=None):
         full_desc = partida.descripcion or ""
         parts = [p.strip() for p in full_desc.split("|")]
         if not parts:
@@ -224,28 +272,33 @@ class Command(BaseCommand):
         ):  # Necesita un padre para buscar hermanos
             required_prefix = "|".join(parts[:-1]) + "|"
             try:
-                potential_siblings = (
-                    PartidaArancelaria.objects.filter(
-                        descripcion__startswith=required_prefix
+                if indice is not None:
+                    # Hermanos precalculados (una sola lectura de la tabla)
+                    hermanos = indice.hermanos_por_prefijo(
+                        full_desc, excluir_id=partida.id
                     )
-                    .exclude(id=partida.id)
-                    .order_by("item_no")
-                    .values_list("id", "descripcion")
-                )  # Optimizar consulta
-
-                # Filtrar por nivel jerárquico exacto (misma cantidad de '|')
-                current_level_count = full_desc.count("|")
-                valid_siblings_data = [
-                    (sid, sdesc)
-                    for sid, sdesc in potential_siblings
-                    if sdesc.count("|") == current_level_count
-                ]
-
-                for _, s_desc in valid_siblings_data:
-                    s_parts = [p.strip() for p in s_desc.split("|")]
-                    if s_parts:
-                        sibling_specific_descs.append(s_parts[-1])
+                    nodo = indice.por_id.get(partida.id)
+                    terminos_hermanos = nodo.terminos_exclusion if nodo else None
+                else:
+                    potential_siblings = (
+                        PartidaArancelaria.objects.filter(
+                            descripcion__startswith=required_prefix
+                        )
+                        .exclude(id=partida.id)
+                        .order_by("item_no")
+                        .values_list(*IndiceJerarquia.CAMPOS)
+                    )  # Optimizar consulta
+
+                    # Filtrar por nivel jerárquico exacto (misma cantidad de '|')
+                    current_level_count = full_desc.count("|")
+                    hermanos = [
+                        s
+                        for s in (NodoPartida(*fila) for fila in potential_siblings)
+                        if s.nivel == current_level_count
+                    ]
+                    terminos_hermanos = None
 
+                sibling_specific_descs = [s.ultima_parte for s in hermanos]
                 limited_sibling_specific_descs = sibling_specific_descs
                 if (
                     max_siblings_context != -1
@@ -268,18 +321,16 @@ class Command(BaseCommand):
                             )
                         except IndexError:
                             pass
-                    excluded_terms = [
-                        desc
-                        for desc in sibling_specific_descs
-                        if not desc.lower().startswith(("los demás", "las demás"))
-                    ]
+                    if terminos_hermanos is None:
+                        terminos_hermanos = {
+                            s.ultima_parte.lower()
+                            for s in hermanos
+                            if not s.ultima_es_los_demas
+                        }
+                    excluded_terms = set(terminos_hermanos)
                     if exception_term:
-                        excluded_terms.append(exception_term)
-                    excluded_terms = sorted(
-                        list(
-                            set(filter(None, [term.lower() for term in excluded_terms]))
-                        )
-                    )
+                        excluded_terms.add(exception_term)
+                    excluded_terms = sorted(filter(None, excluded_terms))
             except Exception as e:
                 logger.error(f"Error buscando hermanos para ID {partida.id}: {e}")
                 # Continuar sin hermanos si falla la búsqueda
@@ -426,54 +477,7 @@ class Command(BaseCommand):
                     response_text = completion_result.content[0].text.strip()
 
                 logger.debug(f"Respuesta cruda de {provider}: {response_text}")
-                try:
-                    start_index = response_text.find("[")
-                    end_index = response_text.rfind("]")
-                    if (
-                        start_index != -1
-                        and end_index != -1
-                        and end_index > start_index
-                    ):
-                        json_str = response_text[start_index : end_index + 1]
-                        keywords_data = json.loads(json_str)
-                        if isinstance(keywords_data, list):
-                            keywords = list(
-                                set(
-                                    filter(
-                                        None,
-                                        [
-                                            str(k).lower().strip()
-                                            for k in keywords_data
-                                            if isinstance(k, (str, int, float))
-                                        ],
-                                    )
-                                )
-                            )
-                            final_keywords = keywords[
-                                :100
-                            ]  # Aumentado límite de keywords
-                            # logger.debug(f"Keywords procesadas: {final_keywords}")
-                            return final_keywords
-                        else:
-                            logger.warning(
-                                f"JSON de {provider} no es lista: {response_text}"
-                            )
-                            return []
-                    else:
-                        logger.warning(
-                            f"Array JSON '[]' no encontrado en resp de {provider}: {response_text}"
-                        )
-                        return []
-                except json.JSONDecodeError as e:
-                    logger.error(
-                        f"Error parseando JSON de {provider}: {e}\nResp: {response_text}"
-                    )
-                    return []
-                except Exception as e:
-                    logger.error(
-                        f"Error procesando resp de {provider}: {e}\nResp: {response_text}"
-                    )
-                    return []
+                return parse_keywords(response_text)
 
             except RETRYABLE_ERRORS as e:
                 if attempt < max_retries:
@@ -498,6 +502,9 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         load_dotenv()
 
+        if options["use_async"]:
+            return self.handle_async(options)
+
         primary_provider = options["provider"]
         primary_model = options["model"]
         limit = options["limit"]
@@ -546,6 +553,9 @@ class Command(BaseCommand):
             logger.info("Nada que procesar.")
             return
 
+        # Hermanos/jerarquía de todas las partidas en una sola lectura
+        indice = IndiceJerarquia.construir()
+
         # --- Processing Loop with tqdm ---
         processed_count = 0
         progress_bar = None
@@ -570,7 +580,9 @@ class Command(BaseCommand):
                     use_fallback = False
 
                     try:  # Manejar errores específicos de procesamiento de una partida
-                        context = self.get_context_for_partida(partida, max_siblings)
+                        context = self.get_context_for_partida(
+                            partida, max_siblings, indice
+                        )
                         if not context.get("current"):
                             logger.error(
                                 f"ID {partida.id}: No se pudo generar contexto (descripción vacía?). SALTANDO."
@@ -704,5 +716,123 @@ class Command(BaseCommand):
         if not dry_run:
             logger.info(f"Keywords guardadas para {processed_count} partidas.")
 
+    # --- Async Mode ---
+    def handle_async(self, options):
+        provider = options["provider"]
+        model = options["model"]
+        dry_run = options["dry_run"]
+        skip_token_check = options["skip_token_check"]
+        max_siblings = options["max_siblings_context"]
+
+        if provider not in BASE_URLS:
+            raise CommandError(
+                f"--async solo soporta proveedores compatibles con OpenAI: {sorted(BASE_URLS)}"
+            )
+        if options["concurrency"] < 1 or options["batch_size"] < 1:
+            raise CommandError(
+                "--concurrency y --batch-size deben ser mayores que cero."
+            )
+        api_key = os.environ.get(API_KEY_ENV[provider])
+        if not api_key and not dry_run:
+            raise CommandError(f"{API_KEY_ENV[provider]} no en .env")
+
+        checkpoint = Checkpoint(options["checkpoint"])
+        already_done = checkpoint.load()
+        if already_done:
+            logger.info(f"Checkpoint: {len(already_done)} partidas ya procesadas.")
+
+        partidas = list(
+            PartidaArancelaria.objects.filter(search_keywords=[])
+            .exclude(id__in=already_done)
+            .order_by("id")[: options["limit"]]
+        )
+        token_limit = self.get_model_token_limit(model)
+        indice = IndiceJerarquia.construir() if partidas else None
+        jobs = []
+        for partida in partidas:
+            context = self.get_context_for_partida(partida, max_siblings, indice)
+            prompt = self.build_prompt(context) if context.get("current") else ""
+            if not prompt:
+                logger.error(f"ID {partida.id}: No se pudo generar prompt. SALTANDO.")
+                continue
+            tokens = self.count_tokens(prompt, skip_token_check)
+            if not skip_token_check and tokens > token_limit:
+                logger.error(
+                    f"ID {partida.id}: Contexto {tokens} excede límite {token_limit} de {model}. SALTANDO."
+                )
+                continue
+            jobs.append(KeywordJob(partida.id, prompt, tokens))
+
+        logger.info(
+            f"Se procesarán {len(jobs)} partidas con {options['concurrency']} "
+            f"peticiones simultáneas (rpm={options['rpm']}, tpm={options['tpm'] or 'sin límite'})."
+        )
+        if not jobs:
+            logger.info("Nada que procesar.")
+            return
+        if dry_run:
+            total_tokens = sum(job.estimated_tokens for job in jobs)
+            logger.info(f"[DRY RUN] Tokens de prompt estimados: {total_tokens}")
+            return
+
+        stats = {"saved": 0, "empty": 0, "failed": 0}
+        progress_bar = (
+            tqdm(total=len(jobs), desc="Generando Keywords", unit="partida", ncols=100)
+            if tqdm
+            else None
+        )
+
+        def save_batch(results):
+            with_keywords = [r for r in results if r.keywords]
+            with transaction.atomic():
+                PartidaArancelaria.objects.bulk_update(
+                    [
+                        PartidaArancelaria(id=r.partida_id, search_keywords=r.keywords)
+                        for r in with_keywords
+                    ],
+                    ["search_keywords"],
+                )
+            # Los errores no se marcan para reintentarlos al reanudar
+            checkpoint.add(r.partida_id for r in results if r.error is None)
+            stats["saved"] += len(with_keywords)
+            stats["failed"] += sum(1 for r in results if r.error is not None)
+            stats["empty"] += sum(
+                1 for r in results if not r.keywords and r.error is None
+            )
+
+        def report(result):
+            if result.error:
+                logger.error(f"ID {result.partida_id}: {result.error}")
+            if progress_bar:
+                progress_bar.update(1)
+
+        client = AsyncKeywordClient(
+            options["base_url"] or BASE_URLS[provider], api_key, model
+        )
+        start = time.perf_counter()
+        try:
+            run_keyword_pipeline(
+                jobs,
+                client,
+                save_batch,
+                concurrency=options["concurrency"],
+                requests_per_minute=options["rpm"],
+                tokens_per_minute=options["tpm"] or None,
+                max_retries=options["max_retries"],
+                delay=options["delay"],
+                batch_size=options["batch_size"],
+                on_result=report,
+            )
+        finally:
+            if progress_bar:
+                progress_bar.close()
+        elapsed = time.perf_counter() - start
+
+        logger.info(f"\n--- Proceso Finalizado ({elapsed:.1f}s) ---")
+        logger.info(
+            f"Keywords guardadas: {stats['saved']}, sin keywords: {stats['empty']}, "
+            f"con error: {stats['failed']} de {len(jobs)} partidas."
+        )
+
 
 # --- Fin del Script ---
@@ -8,6 +8,7 @@ from django.db import transaction
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from MiCasillero.jerarquia import IndiceJerarquia, NodoPartida
 from MiCasillero.models import PartidaArancelaria
 
 # Load environment variables from .env file
@@ -60,8 +61,13 @@ class Command(BaseCommand):
             help="Archivo con lista de item_no (uno por línea) para procesar",
         )
 
-    def get_context_for_partida(self, partida):
-        """Obtiene el contexto relevante de una partida."""
+    def get_context_for_partida(self, partida, indice=None):
+        """
+        Obtiene el contexto relevante de una partida.
+
+        Con ``indice`` (IndiceJerarquia) los hermanos salen de memoria en lugar
+        de una consulta por partida.
+        """
         # Obtener la descripción padre (después del primer |)
         parent_desc = (
             partida.descripcion.split("|")[1].strip()
@@ -86,49 +92,48 @@ class Command(BaseCommand):
         # Usar chapter_code + hierarchy_level para detección precisa
         # Esto encuentra partidas al mismo nivel jerárquico en el mismo capítulo
         if partida.chapter_code and partida.hierarchy_level:
-            siblings = (
-                PartidaArancelaria.objects.filter(
-                    chapter_code=partida.chapter_code,
-                    hierarchy_level=partida.hierarchy_level,
+            if indice is not None:
+                siblings = indice.hermanos_por_capitulo(
+                    partida.chapter_code, partida.hierarchy_level, excluir_id=partida.id
                 )
-                .exclude(id=partida.id)
-                .order_by("item_no")
-            )
+            else:
+                siblings = (
+                    PartidaArancelaria.objects.filter(
+                        chapter_code=partida.chapter_code,
+                        hierarchy_level=partida.hierarchy_level,
+                    )
+                    .exclude(id=partida.id)
+                    .order_by("item_no")
+                    .values_list(*IndiceJerarquia.CAMPOS)
+                )
+                siblings = [NodoPartida(*fila) for fila in siblings]
         elif parent_desc:
             # Fallback: usar descripción (para partidas sin hierarchy fields)
-            siblings = (
-                PartidaArancelaria.objects.filter(descripcion__contains=parent_desc)
-                .exclude(id=partida.id)
-                .order_by("item_no")[:20]
-            )
+            if indice is not None:
+                siblings = indice.que_contienen(parent_desc, excluir_id=partida.id)[:20]
+            else:
+                siblings = [
+                    NodoPartida(*fila)
+                    for fila in PartidaArancelaria.objects.filter(
+                        descripcion__contains=parent_desc
+                    )
+                    .exclude(id=partida.id)
+                    .order_by("item_no")
+                    .values_list(*IndiceJerarquia.CAMPOS)[:20]
+                ]
         else:
             siblings = []
 
         # Obtener las descripciones específicas de las partidas hermanas
-        sibling_specific_descs = [
-            (
-                s.descripcion.split("|")[0].strip()
-                if "|" in s.descripcion
-                else s.descripcion
-            )
-            for s in siblings
-        ]
+        sibling_specific_descs = [s.primera_parte for s in siblings]
 
         # NUEVO: Para "Los demás", recolectar keywords de siblings para excluir
         excluded_keywords = []
         if is_others and siblings:
             for sibling in siblings:
                 # Solo excluir keywords de siblings que NO son "Los demás"
-                sibling_desc = (
-                    sibling.descripcion.split("|")[0].strip()
-                    if "|" in sibling.descripcion
-                    else sibling.descripcion
-                )
-                if not sibling_desc.lower().startswith(
-                    "los demás"
-                ) and not sibling_desc.lower().startswith("las demás"):
-                    if sibling.search_keywords:
-                        excluded_keywords.extend(sibling.search_keywords)
+                if not sibling.primera_es_los_demas and sibling.search_keywords:
+                    excluded_keywords.extend(sibling.search_keywords)
 
             # Deduplicate and normalize
             excluded_keywords = list(
@@ -143,20 +148,14 @@ class Command(BaseCommand):
                 exception_term = specific_desc.lower().split("excepto")[1].strip()
                 # Obtener términos específicos de partidas hermanas que no son "Los demás"
                 excluded_terms = [
-                    desc
-                    for desc in sibling_specific_descs
-                    if not desc.lower().startswith("los demás")
-                    and not desc.lower().startswith("las demás")
+                    s.primera_parte for s in siblings if not s.primera_es_los_demas
                 ]
                 # Agregar el término de excepción a los términos excluidos
                 excluded_terms.append(exception_term)
             else:
                 # Si no hay excepción específica, excluir todos los términos específicos
                 excluded_terms = [
-                    desc
-                    for desc in sibling_specific_descs
-                    if not desc.lower().startswith("los demás")
-                    and not desc.lower().startswith("las demás")
+                    s.primera_parte for s in siblings if not s.primera_es_los_demas
                 ]
         else:
             excluded_terms = []
@@ -182,11 +181,7 @@ class Command(BaseCommand):
                 {
                     "codigo": p.item_no,
                     "description": p.descripcion,
-                    "specific_desc": (
-                        p.descripcion.split("|")[0].strip()
-                        if "|" in p.descripcion
-                        else p.descripcion
-                    ),
+                    "specific_desc": p.primera_parte,
                     "keywords_count": (
                         len(p.search_keywords) if p.search_keywords else 0
                     ),
@@ -549,13 +544,16 @@ class Command(BaseCommand):
         if limit:
             self.stdout.write(f"Límite aplicado: {limit} partidas")
 
+        # Hermanos/jerarquía de todas las partidas en una sola lectura
+        indice = IndiceJerarquia.construir()
+
         # Procesar en lotes
         for i in range(0, total_partidas, batch_size):
             batch = partidas[i : i + batch_size]
             self.stdout.write(f"\nProcesando lote {i//batch_size + 1}...")
 
             for partida in batch:
-                context = self.get_context_for_partida(partida)
+                context = self.get_context_for_partida(partida, indice)
                 keywords = self.generate_keywords_with_ai(context, api_provider)
 
                 # Use ensure_ascii=True to avoid Unicode encoding errors in Windows console
@@ -574,6 +572,7 @@ class Command(BaseCommand):
                     with transaction.atomic():
                         partida.search_keywords = keywords
                         partida.save()  # Esto también actualizará el search_vector
+                    indice.actualizar_keywords(partida.id, keywords)
 
             if options["dry_run"]:
                 self.stdout.write(
@@ -1,10 +1,15 @@
 # MiCasillero/management/commands/import_partidas.py
 
+import hashlib
 import json
 import logging
 import math
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from decimal import Decimal
+from pathlib import Path
 
 import numpy as np
 import openai
@@ -20,6 +25,109 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = (
+    "Eres un experto en aduanas y logística especializado en envíos por courier."
+)
+
+CLASSIFICATION_PROMPT = """
+        Como experto en aduanas y logística, analiza este producto (código: {codigo}) para determinar su idoneidad para envío por courier.
+        Descripción del producto: "{descripcion}"
+        
+        Considera las siguientes restricciones de envío por courier:
+        1. Tamaño/Peso: Debe ser manejable para manipulación por courier
+        2. Valor: Artículos de alto valor pueden necesitar manejo especial
+        3. Regulaciones: Mercancías peligrosas, artículos prohibidos
+        4. Necesidades especiales: Control de temperatura, fragilidad
+        
+        Responde en formato JSON:
+        {{
+            "suitable_for_courier": boolean,
+            "category": "PERMITIDO/RESTRINGIDO/PROHIBIDO",
+            "restrictions": ["lista de restricciones específicas"],
+            "package_type": "CAJA_REGULAR/CAJA_REFORZADA/SOBRE/EMBALAJE_ESPECIAL",
+            "requires_special_handling": boolean,
+            "special_instructions": "instrucciones de manejo",
+            "max_weight_allowed": número o null,
+            "reasoning": "explicación breve de la clasificación"
+        }}
+        """
+
+# Changes whenever the prompt changes, so cached classifications of an older
+# prompt are not reused
+PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + CLASSIFICATION_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
+DEFAULT_CACHE_FILE = (
+    Path(settings.BASE_DIR) / ".cache" / "import_partidas_classifications.jsonl"
+)
+
+CATEGORY_MAPPING = {
+    "PERMITIDO": "ALLOWED",
+    "RESTRINGIDO": "RESTRICTED",
+    "PROHIBIDO": "PROHIBITED",
+}
+
+# Model field -> CSV column (already in percentage, 0-1)
+RATE_COLUMNS = {
+    "impuesto_dai": "dai",
+    "impuesto_isc": "isc",
+    "impuesto_ispc": "ispc",
+    "impuesto_isv": "isv",
+}
+
+
+class ClassificationCache:
+    """
+    On-disk cache of LLM classifications (one JSON object per line, append
+    only), keyed by the hash of (description, model, prompt version).
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry["result"]
+                    except (ValueError, KeyError, TypeError):
+                        # Partially written line from an interrupted run
+                        continue
+
+    @staticmethod
+    def key(descripcion, model_name):
+        raw = json.dumps([descripcion, model_name, PROMPT_VERSION], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, descripcion, model_name):
+        result = self.entries.get(self.key(descripcion, model_name))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, descripcion, model_name, result):
+        key = self.key(descripcion, model_name)
+        with self._lock:
+            self.entries[key] = result
+            if not self.path:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(
+                    json.dumps({"key": key, "result": result}, ensure_ascii=False)
+                    + "\n"
+                )
+
 
 class Command(BaseCommand):
     help = "Import and classify Partidas Arancelarias from CSV"
@@ -42,6 +150,23 @@ class Command(BaseCommand):
             default="deepseek",
             help="API provider to use (openai or deepseek)",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Concurrent classification requests",
+        )
+        parser.add_argument(
+            "--cache-file",
+            type=str,
+            default=str(DEFAULT_CACHE_FILE),
+            help="Classification cache file (JSON lines)",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Classify every description, ignoring and not writing the cache",
+        )
 
     def clean_decimal(self, value):
         """Convert value to Decimal, handling NaN and empty values."""
@@ -53,79 +178,57 @@ class Command(BaseCommand):
             return Decimal("0")
 
     def classify_description(self, client, descripcion, codigo, model_name):
+        try:
+            return self.request_classification(client, descripcion, codigo, model_name)
+        except Exception as e:
+            logger.error(f"Error clasificando {codigo}: {descripcion}")
+            logger.error(str(e))
+            return self._get_default_classification()
+
+    def request_classification(self, client, descripcion, codigo, model_name):
+        """
+        Classify one description with the LLM. Raises on API or parsing
+        errors, so callers can tell a real classification (cacheable) from
+        the default fallback.
+        """
         # Clean the description to prevent JSON issues
         descripcion = descripcion.replace("\n", " ").replace("\r", "")
         descripcion = descripcion.replace('"', '\\"')  # Escape quotes
         descripcion = descripcion.replace("\\", "\\\\")  # Escape backslashes
         descripcion = " ".join(descripcion.split())  # Normalize whitespace
 
-        prompt = f"""
-        Como experto en aduanas y logística, analiza este producto (código: {codigo}) para determinar su idoneidad para envío por courier.
-        Descripción del producto: "{descripcion}"
-        
-        Considera las siguientes restricciones de envío por courier:
-        1. Tamaño/Peso: Debe ser manejable para manipulación por courier
-        2. Valor: Artículos de alto valor pueden necesitar manejo especial
-        3. Regulaciones: Mercancías peligrosas, artículos prohibidos
-        4. Necesidades especiales: Control de temperatura, fragilidad
-        
-        Responde en formato JSON:
-        {{
-            "suitable_for_courier": boolean,
-            "category": "PERMITIDO/RESTRINGIDO/PROHIBIDO",
-            "restrictions": ["lista de restricciones específicas"],
-            "package_type": "CAJA_REGULAR/CAJA_REFORZADA/SOBRE/EMBALAJE_ESPECIAL",
-            "requires_special_handling": boolean,
-            "special_instructions": "instrucciones de manejo",
-            "max_weight_allowed": número o null,
-            "reasoning": "explicación breve de la clasificación"
-        }}
-        """
-
-        try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un experto en aduanas y logística especializado en envíos por courier.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                response_format={"type": "json_object"},
-            )
+        prompt = CLASSIFICATION_PROMPT.format(codigo=codigo, descripcion=descripcion)
 
-            # Get the response content and clean it
-            content = response.choices[0].message.content
-            # Remove any potential BOM or hidden characters
-            content = content.strip().lstrip("\ufeff")
-            # Ensure the content is properly terminated
-            if not content.endswith("}"):
-                content = content + "}"
-
-            try:
-                result = json.loads(content)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON parsing error for {codigo}: {str(e)}")
-                logger.error(f"Raw content: {content}")
-                # Try to fix common JSON issues
-                content = content.replace("\n", " ").replace("\r", "")
-                content = content.replace("\\", "\\\\")  # Escape backslashes
-                content = content.replace('"', '\\"')  # Escape quotes
-                try:
-                    result = json.loads(content)
-                except:
-                    # If still fails, return default result
-                    return self._get_default_classification()
+        response = client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+        )
 
-            # Validate and clean the result
-            result = self._validate_classification_result(result)
-            return result
+        # Get the response content and clean it
+        content = response.choices[0].message.content
+        # Remove any potential BOM or hidden characters
+        content = content.strip().lstrip("\ufeff")
+        # Ensure the content is properly terminated
+        if not content.endswith("}"):
+            content = content + "}"
 
-        except Exception as e:
-            logger.error(f"Error clasificando {codigo}: {descripcion}")
-            logger.error(str(e))
-            return self._get_default_classification()
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON parsing error for {codigo}: {str(e)}")
+            logger.error(f"Raw content: {content}")
+            # Try to fix common JSON issues
+            content = content.replace("\n", " ").replace("\r", "")
+            content = content.replace("\\", "\\\\")  # Escape backslashes
+            content = content.replace('"', '\\"')  # Escape quotes
+            result = json.loads(content)
+
+        # Validate and clean the result
+        return self._validate_classification_result(result)
 
     def _get_default_classification(self):
         """Return a default classification result for error cases"""
@@ -200,81 +303,120 @@ class Command(BaseCommand):
 
         return result
 
-    def process_row(self, row, client, model_name):
-        try:
-            # Use the correct column names from the new CSV format
-            codigo = str(row["Codigo"]).strip()
-            descripcion = str(
-                row["partida"]
-            ).strip()  # Using the extended description from 'partida'
-            dai = self.clean_decimal(row["dai"])  # Already in percentage (0-1)
-            isc = self.clean_decimal(row["isc"])  # Already in percentage (0-1)
-            ispc = self.clean_decimal(row["ispc"])  # Already in percentage (0-1)
-            isv = self.clean_decimal(row["isv"])  # Already in percentage (0-1)
-            parent_code = str(row["padre"]).strip() if "padre" in row else None
-            level = (
-                str(row["nivel"]).strip() if "nivel" in row else "4"
-            )  # Default to level 4 if not specified
-
-            # Get classification from API
-            classification_result = self.classify_description(
-                client, descripcion, codigo, model_name
-            )
+    def prepare_rows(self, df):
+        """
+        Column-wise extraction of the fields stored per partida (instead of
+        reading them row by row with ``iterrows``).
+        """
+        data = pd.DataFrame(
+            {
+                "item_no": df["Codigo"].astype(str).str.strip(),
+                # Using the extended description from 'partida'
+                "descripcion": df["partida"].astype(str).str.strip(),
+            },
+            index=df.index,
+        )
+        for field, column in RATE_COLUMNS.items():
+            data[field] = df[column].map(self.clean_decimal)
+        return data
 
-            # Ensure we have a valid classification result
-            if not classification_result:
-                classification_result = {
-                    "category": "PROHIBIDO",
-                    "restrictions": ["Error en clasificación"],
-                    "package_type": "NO_APLICA",
-                    "requires_special_handling": True,
-                    "special_instructions": "Requiere revisión manual",
-                    "max_weight_allowed": None,
-                }
-
-            # Map category to courier_category choices
-            category_mapping = {
-                "PERMITIDO": "ALLOWED",
-                "RESTRINGIDO": "RESTRICTED",
-                "PROHIBIDO": "PROHIBITED",
-            }
-            courier_category = category_mapping.get(
-                classification_result.get("category", "PROHIBIDO"), "PROHIBITED"
-            )
+    def classify_descriptions(self, client, model_name, descripciones, cache, workers):
+        """
+        Classify each distinct description once, concurrently. Cached
+        descriptions skip the API; new successful classifications are added
+        to the cache as they complete.
+
+        ``descripciones`` maps description -> item code (used in the prompt).
+        Returns a dict description -> classification.
+        """
+        results = {}
+        pending = {}
+        for descripcion, codigo in descripciones.items():
+            cached = cache.get(descripcion, model_name)
+            if cached is not None:
+                results[descripcion] = cached
+            else:
+                pending[descripcion] = codigo
 
-            # Ensure all required fields have values
-            return {
-                "item_no": codigo or "NO_CODE",  # Ensure non-null
-                "descripcion": descripcion or "Sin descripción",  # Ensure non-null
-                "partida_arancelaria": codigo or "NO_CODE",  # Ensure non-null
-                "impuesto_dai": dai,
-                "impuesto_isc": isc,
-                "impuesto_ispc": ispc,
-                "impuesto_isv": isv,
-                "courier_category": courier_category,  # Mapped from classification
-                "restrictions": classification_result.get(
-                    "restrictions", ["Sin clasificación"]
-                ),
-                "package_type": classification_result.get("package_type", "NO_APLICA"),
-                "requires_special_handling": bool(
-                    classification_result.get("requires_special_handling", True)
-                ),
-                "special_instructions": classification_result.get(
-                    "special_instructions", "Requiere revisión manual"
-                ),
-                "max_weight_allowed": classification_result.get("max_weight_allowed"),
-                "search_keywords": f"{descripcion} {codigo}".strip()
-                or "Sin palabras clave",  # Ensure non-null
+        self.stdout.write(
+            f"Classification cache: {len(results)} hits, "
+            f"{len(pending)} descriptions to classify with {workers} workers"
+        )
+        if not pending:
+            return results
+
+        start = time.perf_counter()
+        errors = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    self.request_classification, client, descripcion, codigo, model_name
+                ): (descripcion, codigo)
+                for descripcion, codigo in pending.items()
             }
-        except Exception as e:
-            row_id = row["Codigo"] if "Codigo" in row else "unknown"
-            logger.error(f"Error processing row {row_id}: {str(e)}")
-            logger.error(f"Row contents: {row}")
-            raise
+            for done, future in enumerate(as_completed(futures), start=1):
+                descripcion, codigo = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Not cached, so the next import retries it
+                    errors += 1
+                    logger.error(f"Error clasificando {codigo}: {descripcion}")
+                    logger.error(str(e))
+                    result = self._get_default_classification()
+                else:
+                    cache.set(descripcion, model_name, result)
+                results[descripcion] = result
 
-    def handle(self, *args, **options):
+                if done % 10 == 0:
+                    self.stdout.write(
+                        f"Classified {done}/{len(pending)} descriptions..."
+                    )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Classified {len(pending)} descriptions in {elapsed:.1f}s "
+            f"({len(pending) / elapsed if elapsed else 0:.1f}/s, {errors} errors)"
+        )
+        return results
+
+    def build_item_data(self, record, classification_result):
+        # Ensure we have a valid classification result
+        if not classification_result:
+            classification_result = self._get_default_classification()
+
+        codigo = record["item_no"]
+        descripcion = record["descripcion"]
+        courier_category = CATEGORY_MAPPING.get(
+            classification_result.get("category", "PROHIBIDO"), "PROHIBITED"
+        )
+
+        # Ensure all required fields have values
+        return {
+            "item_no": codigo or "NO_CODE",  # Ensure non-null
+            "descripcion": descripcion or "Sin descripción",  # Ensure non-null
+            "partida_arancelaria": codigo or "NO_CODE",  # Ensure non-null
+            **{field: record[field] for field in RATE_COLUMNS},
+            "courier_category": courier_category,  # Mapped from classification
+            "restrictions": classification_result.get(
+                "restrictions", ["Sin clasificación"]
+            ),
+            "package_type": classification_result.get("package_type", "NO_APLICA"),
+            "requires_special_handling": bool(
+                classification_result.get("requires_special_handling", True)
+            ),
+            "special_instructions": classification_result.get(
+                "special_instructions", "Requiere revisión manual"
+            ),
+            "max_weight_allowed": classification_result.get("max_weight_allowed"),
+            "search_keywords": f"{descripcion} {codigo}".strip()
+            or "Sin palabras clave",  # Ensure non-null
+        }
+
+    def get_client(self, api_provider):
+        """Return ``(client, model_name, base_url)`` for the API provider."""
         # Get API key from environment based on provider
-        if options["api_provider"] == "deepseek":
+        if api_provider == "deepseek":
             api_key = os.getenv("DEEPSEEK_API_KEY")
             if not api_key:
                 raise CommandError(
@@ -286,17 +428,26 @@ class Command(BaseCommand):
             model_name = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
             # Configure DeepSeek client
-            client = openai.OpenAI(api_key=api_key, base_url=base_url)
-        else:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                raise CommandError(
-                    "OPENAI_API_KEY not found in environment variables. Please add it to your .env file."
-                )
+            return (
+                openai.OpenAI(api_key=api_key, base_url=base_url),
+                model_name,
+                base_url,
+            )
 
-            # Configure OpenAI client
-            client = openai.OpenAI(api_key=api_key)
-            model_name = "gpt-4-0125-preview"
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise CommandError(
+                "OPENAI_API_KEY not found in environment variables. Please add it to your .env file."
+            )
+
+        # Configure OpenAI client
+        return openai.OpenAI(api_key=api_key), "gpt-4-0125-preview", None
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        client, model_name, base_url = self.get_client(options["api_provider"])
 
         # Handle CSV file path
         csv_path = options["csv_file"]
@@ -315,13 +466,12 @@ class Command(BaseCommand):
         self.stdout.write(
             f'Using {options["api_provider"]} API with model {model_name}'
         )
-        if options["api_provider"] == "deepseek":
+        if base_url:
             self.stdout.write(f"DeepSeek API URL: {base_url}")
         self.stdout.write(f"Reading CSV file from: {csv_path}")
 
         # Read CSV with specific encoding and separator
         df = pd.read_csv(csv_path, encoding="utf-8", sep=",")
-        total_rows = len(df)
 
         # Print column names for debugging
         self.stdout.write(f"Columns found in CSV: {df.columns.tolist()}")
@@ -333,8 +483,9 @@ class Command(BaseCommand):
         self.stdout.write(f"Found {len(existing_records)} existing records")
 
         # Filter out already processed records
-        df = df[~df["Codigo"].astype(str).isin(existing_records)]
-        remaining_rows = len(df)
+        data = self.prepare_rows(df)
+        data = data[~data["item_no"].isin(existing_records)]
+        remaining_rows = len(data)
 
         if remaining_rows == 0:
             self.stdout.write(
@@ -347,23 +498,35 @@ class Command(BaseCommand):
         self.stdout.write(
             f'Processing {remaining_rows} new items starting from index {options["start_index"]}'
         )
+        records = data.iloc[options["start_index"] :].to_dict("records")
+
+        cache = ClassificationCache(
+            None if options["no_cache"] else options["cache_file"]
+        )
+        if cache.path:
+            self.stdout.write(
+                f"Using classification cache {cache.path} ({len(cache)} entries, "
+                f"prompt version {PROMPT_VERSION})"
+            )
 
         processed = 0
         saved = 0
         batch = []
 
         try:
-            for index, row in df.iloc[options["start_index"] :].iterrows():
-                processed += 1
-
-                # Skip if already processed
-                if str(row["Codigo"]).strip() in existing_records:
-                    continue
+            # Each distinct description is classified once
+            descripciones = {}
+            for record in records:
+                descripciones.setdefault(record["descripcion"], record["item_no"])
+            classifications = self.classify_descriptions(
+                client, model_name, descripciones, cache, options["workers"]
+            )
 
-                # Process the row
-                item_data = self.process_row(row, client, model_name)
-                if not item_data:
-                    continue
+            for record in records:
+                processed += 1
+                item_data = self.build_item_data(
+                    record, classifications.get(record["descripcion"])
+                )
 
                 if not options["dry_run"]:
                     try:
@@ -397,17 +560,14 @@ class Command(BaseCommand):
                     )
                     saved += 1
 
-                # Progress update
-                if processed % 10 == 0:
-                    self.stdout.write(f"Processed {processed} items...")
-
             # Save any remaining items
             if batch and not options["dry_run"]:
                 PartidaArancelaria.objects.bulk_create(batch)
 
             self.stdout.write(
                 self.style.SUCCESS(
-                    f"Finished processing {processed} items. Successfully saved {saved} items."
+                    f"Finished processing {processed} items. Successfully saved {saved} items. "
+                    f"Cache hits: {cache.hits}, misses: {cache.misses}"
                 )
             )
         except Exception as e:
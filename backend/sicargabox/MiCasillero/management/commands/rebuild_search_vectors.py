@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from MiCasillero.models import PartidaArancelaria
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula search_vector de todas las partidas arancelarias con una sola "
+        "sentencia UPDATE (útil tras cargas masivas o cambios de configuración de texto)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only-missing",
+            action="store_true",
+            help="Recalcular solo las partidas con search_vector vacío",
+        )
+
+    def handle(self, *args, **options):
+        partidas = PartidaArancelaria.objects.all()
+        if options["only_missing"]:
+            partidas = partidas.filter(search_vector__isnull=True)
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            updated = partidas.update(
+                search_vector=PartidaArancelaria.search_vector_expression()
+            )
+        elapsed = time.perf_counter() - start
+
+        rate = updated / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"search_vector recalculado para {updated} partidas en "
+                f"{elapsed:.2f}s ({rate:.0f} filas/s)"
+            )
+        )
@@ -0,0 +1,94 @@
+"""
+Management command to recompute the stored totals of Cotizacion.
+
+Articulo keeps subtotal_articulos, total_impuestos, peso_total, volumen_total,
+total_flete and total_estimado up to date incrementally. Writes that bypass
+Articulo.save (QuerySet.update, raw SQL) or a change of the freight cost per
+pound leave them out of date; this command finds the quotes whose stored
+totals differ from their articulos and rewrites them in bulk, one UPDATE per
+batch of ids.
+
+Usage:
+    python manage.py recompute_cotizacion_totals
+    python manage.py recompute_cotizacion_totals --dry-run
+    python manage.py recompute_cotizacion_totals --all --batch-size 5000
+"""
+
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from MiCasillero.models import Cotizacion
+from MiCasillero.totales import (
+    filtro_desviacion,
+    obtener_costo_flete_por_lb,
+    recalcular_totales,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Cotizacion totals whose stored values drifted from their articulos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Cotizaciones checked and updated per UPDATE statement",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rewrite every cotizacion, not only those that drifted",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many cotizaciones drifted",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] <= 0:
+            raise CommandError("--batch-size must be greater than zero")
+        try:
+            costo = obtener_costo_flete_por_lb()
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        ids = list(Cotizacion.objects.order_by("pk").values_list("pk", flat=True))
+        self.stdout.write(f"Checking {len(ids)} cotizaciones (freight ${costo}/lb)")
+
+        start = time.perf_counter()
+        drifted = 0
+        updated = 0
+        for offset in range(0, len(ids), options["batch_size"]):
+            batch = Cotizacion.objects.filter(
+                pk__in=ids[offset : offset + options["batch_size"]]
+            )
+            with transaction.atomic():
+                pendientes = list(
+                    filtro_desviacion(batch, costo).values_list("pk", flat=True)
+                )
+                drifted += len(pendientes)
+                if options["dry_run"]:
+                    continue
+                if not options["all"]:
+                    batch = Cotizacion.objects.filter(pk__in=pendientes)
+                updated += recalcular_totales(batch, costo)
+
+        elapsed = time.perf_counter() - start
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{drifted} cotizaciones have drifted totals ({elapsed:.2f}s)"
+            )
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{drifted} drifted, {updated} updated in {elapsed:.2f}s "
+                f"({len(ids) / elapsed if elapsed else 0:.0f} cotizaciones/s)"
+            )
+        )
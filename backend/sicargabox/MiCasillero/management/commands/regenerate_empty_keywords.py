@@ -7,6 +7,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from openai import OpenAI
 
+from MiCasillero.jerarquia import IndiceJerarquia, NodoPartida
 from MiCasillero.models import PartidaArancelaria
 
 
@@ -50,8 +51,13 @@ class Command(BaseCommand):
         """Retorna el nombre del modelo según el proveedor."""
         return "deepseek-chat" if api_provider == "deepseek" else "gpt-3.5-turbo"
 
-    def get_context_for_partida(self, partida):
-        """Obtiene el contexto relevante de una partida."""
+    def get_context_for_partida(self, partida, indice=None):
+        """
+        Obtiene el contexto relevante de una partida.
+
+        Con ``indice`` (IndiceJerarquia) los hermanos salen de memoria en lugar
+        de una consulta por partida.
+        """
         # Obtener la descripción padre (después del primer |)
         parent_desc = (
             partida.descripcion.split("|")[1].strip()
@@ -75,21 +81,21 @@ class Command(BaseCommand):
         # Obtener partidas relacionadas basadas en la descripción padre
         if parent_desc:
             # Obtener todas las partidas que comparten la misma descripción padre
-            siblings = (
-                PartidaArancelaria.objects.filter(descripcion__contains=parent_desc)
-                .exclude(id=partida.id)
-                .order_by("item_no")
-            )
+            if indice is not None:
+                siblings = indice.que_contienen(parent_desc, excluir_id=partida.id)
+            else:
+                siblings = [
+                    NodoPartida(*fila)
+                    for fila in PartidaArancelaria.objects.filter(
+                        descripcion__contains=parent_desc
+                    )
+                    .exclude(id=partida.id)
+                    .order_by("item_no")
+                    .values_list(*IndiceJerarquia.CAMPOS)
+                ]
 
             # Obtener las descripciones específicas de las partidas hermanas
-            sibling_specific_descs = [
-                (
-                    s.descripcion.split("|")[0].strip()
-                    if "|" in s.descripcion
-                    else s.descripcion
-                )
-                for s in siblings
-            ]
+            sibling_specific_descs = [s.primera_parte for s in siblings]
 
             # Para partidas "Los demás", necesitamos excluir términos específicos
             if is_others:
@@ -99,18 +105,14 @@ class Command(BaseCommand):
                     exception_term = specific_desc.lower().split("excepto")[1].strip()
                     # Obtener términos específicos de partidas hermanas que no son "Los demás"
                     excluded_terms = [
-                        desc
-                        for desc in sibling_specific_descs
-                        if not desc.lower().startswith("los demás")
+                        s.primera_parte for s in siblings if not s.primera_es_los_demas
                     ]
                     # Agregar el término de excepción a los términos excluidos
                     excluded_terms.append(exception_term)
                 else:
                     # Si no hay excepción específica, excluir todos los términos específicos
                     excluded_terms = [
-                        desc
-                        for desc in sibling_specific_descs
-                        if not desc.lower().startswith("los demás")
+                        s.primera_parte for s in siblings if not s.primera_es_los_demas
                     ]
             else:
                 excluded_terms = []
@@ -140,11 +142,7 @@ class Command(BaseCommand):
                 {
                     "codigo": p.item_no,
                     "description": p.descripcion,
-                    "specific_desc": (
-                        p.descripcion.split("|")[0].strip()
-                        if "|" in p.descripcion
-                        else p.descripcion
-                    ),
+                    "specific_desc": p.primera_parte,
                 }
                 for p in siblings
             ],
@@ -345,13 +343,16 @@ class Command(BaseCommand):
             )
             return
 
+        # Hermanos de todas las partidas en una sola lectura
+        indice = IndiceJerarquia.construir()
+
         # Procesar en lotes
         for i in range(0, total_partidas, batch_size):
             batch = partidas[i : i + batch_size]
             self.stdout.write(f"\nProcesando lote {i//batch_size + 1}...")
 
             for partida in batch:
-                context = self.get_context_for_partida(partida)
+                context = self.get_context_for_partida(partida, indice)
                 keywords = self.generate_keywords_with_ai(context, api_provider)
 
                 self.stdout.write(f"\nPartida: {partida.descripcion}")
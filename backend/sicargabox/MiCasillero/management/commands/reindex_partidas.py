@@ -0,0 +1,182 @@
+"""
+Management command to rebuild the partidas Elasticsearch index without downtime.
+
+``search_index --rebuild`` drops ``partidas_arancelarias`` and indexes one
+chunk at a time, so searches fail or return partial results until it
+finishes. This command instead:
+
+1. creates a versioned index (``partidas_arancelarias_<timestamp>``) with the
+   mappings and settings of ``PartidaArancelariaDocument``, with refresh
+   disabled while loading;
+2. streams ``PartidaArancelariaDocument.get_queryset()`` with
+   ``iterator(chunk_size=...)`` into ``parallel_bulk``, ``--threads``
+   concurrent bulk requests of ``--chunk-size`` documents at a time;
+3. refreshes it and checks that its document count matches the queryset;
+4. atomically points the ``partidas_arancelarias`` alias at the new index
+   (replacing a concrete index with that name on the first run) and deletes
+   older versions beyond ``--keep``.
+
+If a bulk item fails or the counts differ, the new index is deleted and the
+alias keeps pointing at the previous version. Searches, the signal-driven
+updates and the result cache keep using the alias name.
+
+Usage:
+    python manage.py reindex_partidas
+    python manage.py reindex_partidas --chunk-size 1000 --threads 8 --keep 2
+"""
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch.helpers import parallel_bulk
+from elasticsearch_dsl.connections import connections
+
+from MiCasillero.cache_busqueda import cache_busqueda
+from MiCasillero.documents import PartidaArancelariaDocument
+
+
+class Command(BaseCommand):
+    help = "Reindex PartidaArancelariaDocument into a new index and swap the alias"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Rows per database fetch and documents per bulk request",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=4,
+            help="Concurrent bulk requests",
+        )
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=1,
+            help="Previous index versions to keep after the swap",
+        )
+        parser.add_argument(
+            "--using",
+            type=str,
+            default="default",
+            help="elasticsearch_dsl connection alias",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] <= 0 or options["threads"] <= 0:
+            raise CommandError("--chunk-size and --threads must be greater than zero")
+        if options["keep"] < 0:
+            raise CommandError("--keep cannot be negative")
+
+        es = connections.get_connection(options["using"])
+        document = PartidaArancelariaDocument()
+        alias = document._index._name
+        nuevo = f"{alias}_{datetime.now():%Y%m%d%H%M%S%f}"
+
+        queryset = document.get_queryset().order_by("pk")
+        esperados = queryset.count()
+        self.stdout.write(f"Indexing {esperados} partidas into {nuevo}")
+
+        document._index.clone(name=nuevo).create(using=es)
+        es.indices.put_settings(index=nuevo, settings={"refresh_interval": "-1"})
+
+        start = time.perf_counter()
+        try:
+            indexados, errores = self.bulk(es, document, queryset, nuevo, options)
+            elapsed = time.perf_counter() - start
+
+            es.indices.put_settings(index=nuevo, settings={"refresh_interval": None})
+            es.indices.refresh(index=nuevo)
+            en_indice = es.count(index=nuevo)["count"]
+            if errores or en_indice != esperados:
+                raise CommandError(
+                    f"{errores} bulk errors, {en_indice} documents in {nuevo} "
+                    f"but {esperados} partidas; alias {alias} left unchanged"
+                )
+        except BaseException:
+            es.indices.delete(index=nuevo, ignore_unavailable=True)
+            raise
+
+        anteriores = self.swap_alias(es, alias, nuevo)
+        borrados = self.delete_old_versions(es, alias, nuevo, options["keep"])
+        # Los resultados de buscar_partidas guardados son del índice anterior
+        cache_busqueda.publicar_cambio()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {indexados} documents in {elapsed:.2f}s "
+                f"({indexados / elapsed if elapsed else 0:.0f} docs/s); "
+                f"{alias} -> {nuevo}"
+            )
+        )
+        if anteriores:
+            self.stdout.write(f"Previous version(s): {', '.join(anteriores)}")
+        if borrados:
+            self.stdout.write(f"Deleted old version(s): {', '.join(borrados)}")
+
+    def bulk(self, es, document, queryset, index, options):
+        # parallel_bulk consume las acciones desde otro hilo, que no vería
+        # la conexión a la base de este; los documentos se preparan aquí y se
+        # envían por ventanas de threads * chunk_size
+        ventana_maxima = options["chunk_size"] * options["threads"]
+
+        def ventanas():
+            ventana = []
+            for partida in queryset.iterator(chunk_size=options["chunk_size"]):
+                ventana.append(
+                    {
+                        "_op_type": "index",
+                        "_index": index,
+                        "_id": partida.pk,
+                        "_source": document.prepare(partida),
+                    }
+                )
+                if len(ventana) == ventana_maxima:
+                    yield ventana
+                    ventana = []
+            if ventana:
+                yield ventana
+
+        indexados = errores = 0
+        for ventana in ventanas():
+            for ok, item in parallel_bulk(
+                es,
+                ventana,
+                thread_count=options["threads"],
+                chunk_size=options["chunk_size"],
+                raise_on_error=False,
+            ):
+                if ok:
+                    indexados += 1
+                else:
+                    errores += 1
+                    if errores <= 5:
+                        self.stderr.write(f"Bulk error: {item}")
+        return indexados, errores
+
+    def swap_alias(self, es, alias, nuevo):
+        acciones = [{"add": {"index": nuevo, "alias": alias}}]
+        anteriores = []
+        if es.indices.exists_alias(name=alias):
+            anteriores = sorted(es.indices.get_alias(name=alias).body)
+            acciones += [
+                {"remove": {"index": index, "alias": alias}} for index in anteriores
+            ]
+        elif es.indices.exists(index=alias):
+            # Primera vez: un índice concreto ocupa el nombre del alias
+            acciones.append({"remove_index": {"index": alias}})
+            anteriores = [alias]
+        es.indices.update_aliases(actions=acciones)
+        return anteriores
+
+    def delete_old_versions(self, es, alias, nuevo, keep):
+        versiones = sorted(
+            index for index in es.indices.get(index=f"{alias}_*").body if index != nuevo
+        )
+        viejas = versiones[: max(0, len(versiones) - keep)]
+        if viejas:
+            es.indices.delete(index=",".join(viejas))
+        return viejas
@@ -0,0 +1,263 @@
+"""
+Management command to apply a new tariff CSV to the partidas incrementally.
+
+Instead of ``clear_partidas`` + ``import_partidas``, which recreate every
+partida (losing keywords, embeddings, mapping history and the partidas
+referenced by Articulos), this command diffs the CSV against the database by
+``item_no`` with a hash of the description and rates per row, and applies
+only the inserted, changed and removed rows in one transaction (see
+``MiCasillero.arancel``).
+
+Only the touched partidas are queued for follow-up work: new or changed
+descriptions get empty ``search_keywords`` (picked up by
+``generate_llm_keywords``) and lose their stale embedding, and only those
+documents are reindexed in Elasticsearch. Removed partidas that still have
+Articulos are kept and listed in the report.
+
+The CSV uses the ``import_partidas`` layout (``Codigo``, ``partida``, ``dai``,
+``isc``, ``ispc``, ``isv``). New partidas get the conservative default
+classification of ``import_partidas`` unless ``--classify`` is given.
+
+Usage:
+    python manage.py sync_partidas ../../tools/pdf_parser/PartidasArancelariasHonduras2022.csv --dry-run
+    python manage.py sync_partidas aranceles_2025.csv --report cambios.json
+    python manage.py sync_partidas aranceles_2025.csv --classify --api-provider openai
+"""
+
+import json
+import os
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from MiCasillero.arancel import aplicar_diff, calcular_diff
+from MiCasillero.management.commands.import_partidas import (
+    DEFAULT_CACHE_FILE,
+    ClassificationCache,
+)
+from MiCasillero.management.commands.import_partidas import Command as ImportCommand
+
+# Fields of import_partidas.build_item_data kept for new partidas
+CLASSIFICATION_FIELDS = (
+    "courier_category",
+    "restrictions",
+    "package_type",
+    "requires_special_handling",
+    "special_instructions",
+    "max_weight_allowed",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Diff a tariff CSV against the partidas by item_no and apply only the changes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file", type=str, help="Path to the CSV file")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the change report",
+        )
+        parser.add_argument(
+            "--report",
+            type=str,
+            default=None,
+            help="Optional JSON file for the full change report",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows per bulk_create/bulk_update statement",
+        )
+        parser.add_argument(
+            "--classify",
+            action="store_true",
+            help="Classify new partidas with the LLM (as import_partidas does)",
+        )
+        parser.add_argument(
+            "--api-provider",
+            type=str,
+            choices=["openai", "deepseek"],
+            default="deepseek",
+            help="API provider for --classify",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Concurrent classification requests for --classify",
+        )
+        parser.add_argument(
+            "--show",
+            type=int,
+            default=20,
+            help="Changes of each kind printed in the summary",
+        )
+
+    def handle(self, *args, **options):
+        csv_path = options["csv_file"]
+        if not os.path.exists(csv_path):
+            raise CommandError(f"CSV file not found: {csv_path}")
+
+        importer = ImportCommand(stdout=self.stdout._out, stderr=self.stderr._out)
+        df = pd.read_csv(csv_path, encoding="utf-8", sep=",")
+        try:
+            records = importer.prepare_rows(df).to_dict("records")
+        except KeyError as e:
+            raise CommandError(f"Column {e} not found in {csv_path}")
+
+        start = time.perf_counter()
+        diff = calcular_diff(records)
+        self.stdout.write(
+            f"Compared {len(records)} CSV rows in {time.perf_counter() - start:.2f}s: "
+            f"{len(diff.nuevas)} new, {len(diff.cambiadas)} changed, "
+            f"{len(diff.eliminadas)} removed, {diff.sin_cambios} unchanged"
+        )
+        if diff.duplicadas:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(diff.duplicadas)} duplicated item_no in the database "
+                    f"(only the lowest id is compared): {', '.join(diff.duplicadas[:10])}"
+                )
+            )
+        self.print_changes(diff, options["show"])
+
+        report = self.build_report(diff)
+        if options["dry_run"] or diff.vacio:
+            if options["report"]:
+                self.save_report(report, options["report"])
+            self.stdout.write(
+                self.style.WARNING("DRY RUN - No changes made")
+                if options["dry_run"]
+                else self.style.SUCCESS("Partidas already up to date")
+            )
+            return
+
+        new_data = self.classify_new(importer, diff, options)
+
+        start = time.perf_counter()
+        resultado = aplicar_diff(diff, new_data, batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - start
+
+        report["applied"] = {
+            "inserted": resultado.insertadas,
+            "updated": resultado.actualizadas,
+            "deleted": resultado.eliminadas,
+            "kept_with_articulos": [
+                {"id": pk, "item_no": item_no, "articulos": n}
+                for pk, item_no, n in resultado.conservadas
+            ],
+            "queued": {
+                "keywords": resultado.keywords,
+                "embeddings": resultado.embeddings,
+                "elasticsearch": resultado.reindexar,
+            },
+            "elasticsearch": resultado.elasticsearch,
+        }
+        if options["report"]:
+            self.save_report(report, options["report"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Applied in {elapsed:.2f}s: {len(resultado.insertadas)} inserted, "
+                f"{len(resultado.actualizadas)} updated, "
+                f"{len(resultado.eliminadas)} deleted"
+            )
+        )
+        for pk, item_no, n in resultado.conservadas:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Kept {item_no} (id {pk}): removed from the tariff but "
+                    f"referenced by {n} articulo(s)"
+                )
+            )
+        self.stdout.write(
+            f"Queued: {len(resultado.keywords)} for keywords "
+            f"(run generate_llm_keywords), {len(resultado.embeddings)} for "
+            f"embeddings, {len(resultado.reindexar)} for Elasticsearch "
+            f"({resultado.elasticsearch})"
+        )
+        if resultado.elasticsearch not in ("ok", "omitido"):
+            self.stdout.write(
+                self.style.WARNING(
+                    "Elasticsearch was not updated; run reindex_partidas"
+                )
+            )
+
+    def classify_new(self, importer, diff, options):
+        """Classification fields per item_no for the new partidas."""
+        classifications = {}
+        if options["classify"] and diff.nuevas:
+            client, model_name, _ = importer.get_client(options["api_provider"])
+            descripciones = {}
+            for fila in diff.nuevas:
+                descripciones.setdefault(fila["descripcion"], fila["item_no"])
+            classifications = importer.classify_descriptions(
+                client,
+                model_name,
+                descripciones,
+                ClassificationCache(DEFAULT_CACHE_FILE),
+                options["workers"],
+            )
+
+        new_data = {}
+        for fila in diff.nuevas:
+            item_data = importer.build_item_data(
+                fila, classifications.get(fila["descripcion"])
+            )
+            new_data[fila["item_no"]] = {
+                field: item_data[field] for field in CLASSIFICATION_FIELDS
+            }
+        return new_data
+
+    def print_changes(self, diff, show):
+        for fila in diff.nuevas[:show]:
+            self.stdout.write(f"+ {fila['item_no']} {fila['descripcion'][:80]}")
+        for pk, item_no in diff.eliminadas[:show]:
+            self.stdout.write(f"- {item_no} (id {pk})")
+        for cambio in diff.cambiadas[:show]:
+            campos = ", ".join(
+                f"{campo}: {antes} -> {despues}"
+                for campo, (antes, despues) in cambio.campos.items()
+                if campo != "descripcion"
+            )
+            if cambio.cambia_descripcion:
+                campos = ", ".join(filter(None, ["descripcion", campos]))
+            self.stdout.write(f"~ {cambio.item_no} {campos}")
+
+    def build_report(self, diff):
+        return {
+            "summary": {
+                "new": len(diff.nuevas),
+                "changed": len(diff.cambiadas),
+                "removed": len(diff.eliminadas),
+                "unchanged": diff.sin_cambios,
+                "duplicated_in_db": diff.duplicadas,
+            },
+            "new": [
+                {key: str(value) for key, value in fila.items()} for fila in diff.nuevas
+            ],
+            "changed": [
+                {
+                    "id": cambio.pk,
+                    "item_no": cambio.item_no,
+                    "fields": {
+                        campo: {"old": str(antes), "new": str(despues)}
+                        for campo, (antes, despues) in cambio.campos.items()
+                    },
+                }
+                for cambio in diff.cambiadas
+            ],
+            "removed": [
+                {"id": pk, "item_no": item_no} for pk, item_no in diff.eliminadas
+            ],
+        }
+
+    def save_report(self, report, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        self.stdout.write(f"Change report saved to: {path}")
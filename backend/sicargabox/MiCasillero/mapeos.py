@@ -0,0 +1,101 @@
+"""
+Índice en memoria de ``ItemPartidaMapping``.
+
+Agrupa por ``item_description_normalized`` las partidas que el personal (o los
+clientes) eligieron para una descripción, de modo que la búsqueda puede
+consultar el historial con un acceso a diccionario en lugar de una consulta
+por petición. Se carga con una sola consulta agregada, se invalida localmente
+con las señales post_save / post_delete de ``ItemPartidaMapping`` y, para ver
+los cambios hechos desde otros workers, se recarga cuando cambia la versión
+``mapeos`` de la base (``MiCasillero.versiones``).
+"""
+
+import re
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from django.db import transaction
+
+from .versiones import MAPEOS, VERSION_CHECK_INTERVAL, VersionBD
+
+PATRON_NO_LETRAS = re.compile(r"[^a-záéíóúñ\s]")
+PATRON_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_descripcion(descripcion: str) -> str:
+    """Misma normalización que ``ItemPartidaMapping.item_description_normalized``."""
+    normalizada = PATRON_NO_LETRAS.sub("", descripcion.lower().strip())
+    return PATRON_ESPACIOS.sub(" ", normalizada)
+
+
+class Mapeo(NamedTuple):
+    """Historial de una partida para una descripción normalizada."""
+
+    partida_id: int
+    selecciones: int
+    verificadas: int
+
+
+class IndiceMapeos:
+    """Mapa descripción normalizada -> partidas elegidas, verificadas primero."""
+
+    def __init__(
+        self,
+        check_interval: float = VERSION_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._lock = threading.Lock()
+        self._mapeos: Optional[Dict[str, List[Mapeo]]] = None
+        self._version = VersionBD(MAPEOS, check_interval=check_interval, clock=clock)
+
+    def _cargar(self) -> Dict[str, List[Mapeo]]:
+        from django.db.models import Count, Q
+
+        from .models import ItemPartidaMapping
+
+        # La versión se lee antes que los datos, como en ``parametros``
+        version = self._version.leer()
+        filas = (
+            ItemPartidaMapping.objects.order_by()
+            .values("item_description_normalized", "partida_arancelaria_id")
+            .annotate(
+                selecciones=Count("id"),
+                verificadas=Count("id", filter=Q(is_staff_verified=True)),
+            )
+        )
+        mapeos: Dict[str, List[Mapeo]] = {}
+        for fila in filas:
+            mapeos.setdefault(fila["item_description_normalized"], []).append(
+                Mapeo(
+                    fila["partida_arancelaria_id"],
+                    fila["selecciones"],
+                    fila["verificadas"],
+                )
+            )
+        for lista in mapeos.values():
+            lista.sort(key=lambda m: (-m.verificadas, -m.selecciones, m.partida_id))
+        self._mapeos = mapeos
+        self._version.registrar(version)
+        return mapeos
+
+    def _obtener(self) -> Dict[str, List[Mapeo]]:
+        with self._lock:
+            if self._mapeos is None or self._version.cambio():
+                return self._cargar()
+            return self._mapeos
+
+    def buscar(self, descripcion: str) -> List[Mapeo]:
+        """Partidas elegidas para ``descripcion``, verificadas y más usadas primero."""
+        return list(self._obtener().get(normalizar_descripcion(descripcion), ()))
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._mapeos = None
+            self._version.olvidar()
+
+    def on_mapeo_cambiado(self) -> None:
+        transaction.on_commit(self.invalidar)
+
+
+indice_mapeos = IndiceMapeos()
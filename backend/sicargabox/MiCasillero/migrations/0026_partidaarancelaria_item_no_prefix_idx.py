@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("MiCasillero", "0025_add_documentacion_pendiente_status"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="partidaarancelaria",
+            index=models.Index(
+                fields=["item_no"],
+                name="partida_item_no_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated manually: mantener search_vector con un trigger en la misma escritura
+
+from django.db import migrations
+
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION micasillero_partida_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector(COALESCE(NEW.descripcion::text, '')), 'A') ||
+        setweight(to_tsvector(COALESCE(NEW.search_keywords::text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS partida_search_vector_trigger ON "MiCasillero_partidaarancelaria";
+CREATE TRIGGER partida_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF descripcion, search_keywords
+    ON "MiCasillero_partidaarancelaria"
+    FOR EACH ROW EXECUTE FUNCTION micasillero_partida_search_vector();
+
+-- Recalcular los vectores que quedaron desactualizados por bulk_create/update
+UPDATE "MiCasillero_partidaarancelaria" SET search_vector =
+    setweight(to_tsvector(COALESCE(descripcion::text, '')), 'A') ||
+    setweight(to_tsvector(COALESCE(search_keywords::text, '')), 'B');
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS partida_search_vector_trigger ON "MiCasillero_partidaarancelaria";
+DROP FUNCTION IF EXISTS micasillero_partida_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("MiCasillero", "0026_partidaarancelaria_item_no_prefix_idx"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+    ]
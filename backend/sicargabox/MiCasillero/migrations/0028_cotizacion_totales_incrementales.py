@@ -0,0 +1,110 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:03
+
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Round
+
+logger = logging.getLogger(__name__)
+
+COSTO_FLETE = "Costo Flete por Libra en USD$"
+# Copia de MiCasillero.totales.FACTOR_VOL: las migraciones no importan el
+# código de la aplicación
+FACTOR_VOL = 166
+
+
+def recalcular_todas(apps, schema_editor):
+    """
+    Totales de las cotizaciones existentes con un solo ``UPDATE``, con el mismo
+    cálculo que ``recompute_cotizacion_totals`` sobre los modelos históricos.
+    """
+    Cotizacion = apps.get_model("MiCasillero", "Cotizacion")
+    Articulo = apps.get_model("MiCasillero", "Articulo")
+    ParametroSistema = apps.get_model("MiCasillero", "ParametroSistema")
+    db_alias = schema_editor.connection.alias
+
+    cotizaciones = Cotizacion.objects.using(db_alias).all()
+    if not cotizaciones.exists():
+        return
+    valor = (
+        ParametroSistema.objects.using(db_alias)
+        .filter(nombre_parametro=COSTO_FLETE)
+        .values_list("valor", flat=True)
+        .first()
+    )
+    try:
+        costo = Decimal(str(valor))
+    except InvalidOperation:
+        # Sin costo de flete no se pueden calcular el flete ni el total
+        logger.warning(
+            f"'{COSTO_FLETE}' no está definido; después de definirlo ejecute "
+            "python manage.py recompute_cotizacion_totals --all"
+        )
+        return
+
+    def suma(expresion):
+        subconsulta = (
+            Articulo.objects.using(db_alias)
+            .filter(cotizacion=OuterRef("pk"))
+            .order_by()
+            .values("cotizacion")
+            .annotate(total=Sum(expresion, output_field=DecimalField()))
+            .values("total")
+        )
+        return Coalesce(
+            Subquery(subconsulta), Value(Decimal("0")), output_field=DecimalField()
+        )
+
+    subtotal = suma("valor_articulo")
+    impuestos = suma("impuesto_total")
+    peso = suma("peso")
+    volumen = suma(F("largo") * F("ancho") * F("alto"))
+    peso_a_usar = Greatest(
+        peso, volumen / Value(Decimal(FACTOR_VOL)), output_field=DecimalField()
+    )
+    flete = Round(
+        peso_a_usar * Value(costo, output_field=DecimalField()),
+        2,
+        output_field=DecimalField(),
+    )
+    cotizaciones.update(
+        subtotal_articulos=subtotal,
+        total_impuestos=impuestos,
+        peso_total=peso,
+        volumen_total=volumen,
+        total_flete=flete,
+        total_estimado=subtotal + impuestos + flete,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("MiCasillero", "0027_partidaarancelaria_search_vector_trigger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cotizacion",
+            name="peso_total",
+            field=models.DecimalField(
+                decimal_places=2, default=0, max_digits=10, verbose_name="Peso Total"
+            ),
+        ),
+        migrations.AddField(
+            model_name="cotizacion",
+            name="volumen_total",
+            field=models.DecimalField(
+                decimal_places=6, default=0, max_digits=18, verbose_name="Volumen Total"
+            ),
+        ),
+        migrations.RunPython(recalcular_todas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="cotizacion",
+            index=models.Index(
+                fields=["total_estimado"], name="cotizacion_total_estimado_idx"
+            ),
+        ),
+    ]
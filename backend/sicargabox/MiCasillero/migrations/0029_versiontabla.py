@@ -0,0 +1,78 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:15
+
+from django.db import migrations, models
+
+# Contadores por tabla incrementados en la misma sentencia que el cambio, así
+# que se confirman o revierten con él (QuerySet.update y SQL directo incluidos)
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION micasillero_incrementar_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "MiCasillero_versiontabla" (nombre, version)
+    VALUES (TG_ARGV[0], 1)
+    ON CONFLICT (nombre) DO UPDATE
+        SET version = "MiCasillero_versiontabla".version + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER parametrosistema_version_trigger
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+    ON "MiCasillero_parametrosistema"
+    FOR EACH STATEMENT EXECUTE FUNCTION micasillero_incrementar_version('parametros');
+
+CREATE TRIGGER partidaarancelaria_version_trigger
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+    ON "MiCasillero_partidaarancelaria"
+    FOR EACH STATEMENT EXECUTE FUNCTION micasillero_incrementar_version('partidas');
+
+-- Solo las columnas de MiCasillero.tarifas.CAMPOS
+CREATE TRIGGER partidaarancelaria_tarifas_version_trigger
+    AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF
+        item_no, partida_arancelaria, impuesto_dai, impuesto_isc, impuesto_ispc,
+        impuesto_isv, courier_category, chapter_code, heading_code,
+        parent_item_no, hierarchy_level
+    ON "MiCasillero_partidaarancelaria"
+    FOR EACH STATEMENT EXECUTE FUNCTION micasillero_incrementar_version('tarifas');
+
+CREATE TRIGGER itempartidamapping_version_trigger
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE
+    ON "MiCasillero_itempartidamapping"
+    FOR EACH STATEMENT EXECUTE FUNCTION micasillero_incrementar_version('mapeos');
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS parametrosistema_version_trigger
+    ON "MiCasillero_parametrosistema";
+DROP TRIGGER IF EXISTS partidaarancelaria_version_trigger
+    ON "MiCasillero_partidaarancelaria";
+DROP TRIGGER IF EXISTS partidaarancelaria_tarifas_version_trigger
+    ON "MiCasillero_partidaarancelaria";
+DROP TRIGGER IF EXISTS itempartidamapping_version_trigger
+    ON "MiCasillero_itempartidamapping";
+DROP FUNCTION IF EXISTS micasillero_incrementar_version();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("MiCasillero", "0028_cotizacion_totales_incrementales"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionTabla",
+            fields=[
+                (
+                    "nombre",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Versión de Tabla",
+                "verbose_name_plural": "Versiones de Tablas",
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
@@ -1,39 +1,51 @@
 from decimal import Decimal
-from typing import Union, Dict
+from typing import Dict
 from typing import TYPE_CHECKING
 import json
+import logging
 from datetime import timedelta
 
-from django.db import models
+from django.db import connection, models, transaction
 from django.core.exceptions import ValidationError
 from django.urls import reverse
-from django.contrib.auth.models import User
-from guardian.shortcuts import assign_perm, remove_perm, get_users_with_perms
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
-from django.db.models import F
 from django.contrib.postgres.search import SearchVector
 from django.utils import timezone
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
 from typing import TYPE_CHECKING
 
+from .cache_busqueda import cache_busqueda
+from .indice_local import indice_local
+from .mapeos import indice_mapeos, normalizar_descripcion
+from .parametros import ValorParametro, parametros_cache
+from .tarifas import Tarifa, tabla_tarifas
+from .totales import (
+    CAMPOS_TOTALES,
+    CONTRIBUCION_CERO,
+    FACTOR_VOL,
+    Contribucion,
+    aplicar_delta,
+    obtener_costo_flete_por_lb,
+    totales_cotizacion,
+)
+
+logger = logging.getLogger(__name__)
+
 
 class ParametroSistemaManager(models.Manager):
     @staticmethod
-    def get_valor(parametro: str) -> Union[str, int, float, bool, None]:
-        try:
-            parametro_obj = ParametroSistema.objects.get(nombre_parametro=parametro)
-            if parametro_obj.tipo_dato == 'STRING':
-                return parametro_obj.valor
-            elif parametro_obj.tipo_dato == 'INTEGER':
-                return int(parametro_obj.valor)
-            elif parametro_obj.tipo_dato == 'FLOAT':
-                return float(parametro_obj.valor)
-            elif parametro_obj.tipo_dato == 'BOOLEAN':
-                return parametro_obj.valor.lower() in ['true', '1']
-            else:
-                raise ValidationError(f"Tipo de dato no soportado: {parametro_obj.tipo_dato}")
-        except ParametroSistema.DoesNotExist:
-            raise ValidationError(f"El parámetro {parametro} no está definido.")
+    def get_valor(parametro: str) -> ValorParametro:
+        return parametros_cache.get(parametro)
+
+    @staticmethod
+    def get_many(*parametros: str) -> Dict[str, ValorParametro]:
+        """Obtiene varios parámetros a la vez desde la caché en proceso."""
+        return parametros_cache.get_many(parametros)
 
 
 class ParametroSistema(models.Model):
@@ -85,13 +97,89 @@ class ParametroSistema(models.Model):
         return reverse("MiCasillero_ParametroSistema_htmx_delete", args=(self.pk,))
 
 
-def assign_permissions_to_groups(instance, permissions, model_name):
-    groups = ['Operadores', 'Administradores']
-    for group in groups:
-        users = User.objects.filter(groups__name=group)
-        for user in users:
-            for permission in permissions:
-                assign_perm(f'{permission}_{model_name}', user, instance)
+@receiver([post_save, post_delete], sender=ParametroSistema)
+def invalidar_cache_parametros(sender, **kwargs):
+    parametros_cache.on_parametro_cambiado()
+
+
+class VersionTabla(models.Model):
+    """
+    Contador de cambios por tabla. Lo incrementan los triggers de la migración
+    0029 en la misma transacción que el cambio (ver MiCasillero.versiones).
+    """
+    nombre = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Versión de Tabla"
+        verbose_name_plural = "Versiones de Tablas"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.version}"
+
+
+PERMISSION_GROUPS = ['Operadores', 'Administradores']
+OWNER_PERMISSIONS = ['view', 'change', 'delete']
+
+
+def get_object_permissions(model_name, actions):
+    """Devuelve {accion: Permission} para el modelo indicado en una sola consulta."""
+    codenames = {f'{action}_{model_name}': action for action in actions}
+    return {
+        codenames[permission.codename]: permission
+        for permission in Permission.objects.filter(
+            content_type__app_label='MiCasillero', codename__in=codenames
+        )
+    }
+
+
+def assign_object_permissions(instance, owner, model_name):
+    """
+    Asigna los permisos de objeto de un registro recién creado.
+
+    El dueño recibe view/change/delete y los grupos Operadores y Administradores
+    reciben view/change (más delete si el dueño es administrador). Los permisos
+    de staff se asignan a nivel de grupo, así que el número de INSERTs no crece
+    con la cantidad de operadores; cada tabla se llena con un solo bulk_create.
+    """
+    permissions = get_object_permissions(model_name, OWNER_PERMISSIONS)
+
+    group_actions = ['view', 'change']
+    if owner is not None:
+        UserObjectPermission.objects.bulk_create(
+            [
+                UserObjectPermission(
+                    user=owner,
+                    permission=permissions[action],
+                    content_type=ContentType.objects.get_for_model(instance),
+                    object_pk=str(instance.pk),
+                )
+                for action in OWNER_PERMISSIONS
+            ],
+            ignore_conflicts=True,
+        )
+        if owner.groups.filter(name='Administradores').exists():
+            group_actions.append('delete')
+
+    assign_permissions_to_groups(instance, group_actions, model_name, permissions)
+
+
+def assign_permissions_to_groups(instance, actions, model_name, permissions=None):
+    if permissions is None:
+        permissions = get_object_permissions(model_name, actions)
+    GroupObjectPermission.objects.bulk_create(
+        [
+            GroupObjectPermission(
+                group=group,
+                permission=permissions[action],
+                content_type=ContentType.objects.get_for_model(instance),
+                object_pk=str(instance.pk),
+            )
+            for group in Group.objects.filter(name__in=PERMISSION_GROUPS)
+            for action in actions
+        ],
+        ignore_conflicts=True,
+    )
 
 
 class PartidaArancelaria(models.Model):
@@ -187,6 +275,7 @@ class PartidaArancelaria(models.Model):
         verbose_name_plural = "Partidas Arancelarias"
         indexes = [
             models.Index(fields=['item_no']),
+            models.Index(fields=['item_no'], name='partida_item_no_prefix_idx', opclasses=['varchar_pattern_ops']),
             models.Index(fields=['descripcion']),
             models.Index(fields=['courier_category']),
             models.Index(fields=['chapter_code'], name='partida_chapter_idx'),
@@ -195,17 +284,16 @@ class PartidaArancelaria(models.Model):
             GinIndex(fields=['search_vector'], name='partida_search_vector_idx'),
         ]
 
+    @staticmethod
+    def search_vector_expression():
+        """Misma expresión que calcula el trigger partida_search_vector_trigger"""
+        return SearchVector('descripcion', weight='A') + SearchVector('search_keywords', weight='B')
+
     def update_search_vector(self):
         """Actualiza el vector de búsqueda combinando descripción y keywords"""
-        # Crear vector con diferentes pesos para cada campo
-        vector = SearchVector('descripcion', weight='A')
-        if self.search_keywords:
-            # Convertir la lista de keywords a texto
-            keywords_text = ' '.join(self.search_keywords)
-            vector = vector + SearchVector(F('search_keywords'), weight='B')
-
-        # Actualizar el campo search_vector
-        self.search_vector = vector
+        # El trigger de la base de datos lo recalcula en cada INSERT/UPDATE de
+        # descripcion o search_keywords; esto solo sirve para un UPDATE explícito
+        self.search_vector = self.search_vector_expression()
 
     def save(self, *args, **kwargs):
         # Asegurarse de que search_keywords sea una lista válida
@@ -219,19 +307,13 @@ class PartidaArancelaria(models.Model):
                 # Si no es JSON válido, convertirlo a lista de un elemento
                 self.search_keywords = [self.search_keywords] if self.search_keywords.strip() else []
 
-        # Set search_vector to None on insert (will be updated later with a query)
-        # F() expressions can only be used for updates, not inserts
+        # search_vector lo calcula el trigger partida_search_vector_trigger en la
+        # misma escritura (ver migración 0027), también para bulk_create y update()
         if not self.pk:
             self.search_vector = None
 
         super().save(*args, **kwargs)
 
-        # Update search_vector after insert using an UPDATE query
-        if not kwargs.get('update_fields'):
-            PartidaArancelaria.objects.filter(pk=self.pk).update(
-                search_vector=SearchVector('descripcion', weight='A') + SearchVector('search_keywords', weight='B')
-            )
-
     def generate_search_keywords(self):
         """Generate additional search keywords for the item"""
         # This could be enhanced with AI-generated keywords
@@ -274,6 +356,20 @@ class PartidaArancelaria(models.Model):
         return reverse("MiCasillero_PartidaArancelaria_htmx_delete", args=(self.pk,))
 
 
+@receiver(post_save, sender=PartidaArancelaria)
+def actualizar_indice_local(sender, instance, **kwargs):
+    indice_local.on_partida_guardada(instance)
+    cache_busqueda.on_indice_cambiado()
+    tabla_tarifas.on_partida_cambiada()
+
+
+@receiver(post_delete, sender=PartidaArancelaria)
+def quitar_del_indice_local(sender, instance, **kwargs):
+    indice_local.on_partida_borrada(instance.pk)
+    cache_busqueda.on_indice_cambiado()
+    tabla_tarifas.on_partida_cambiada()
+
+
 class Cliente(models.Model):
     if TYPE_CHECKING:
         id: int
@@ -291,6 +387,47 @@ class Cliente(models.Model):
     codigo_cliente = models.CharField(max_length=13, unique=True, verbose_name="Código de Cliente")
     fecha_registro = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Registro")
 
+    # Campos de Cliente que se copian al User asociado
+    USER_SYNC_FIELDS = {
+        'correo_electronico': 'email',
+        'nombres': 'first_name',
+        'apellidos': 'last_name',
+    }
+    TRACKED_FIELDS = ['user_id', 'codigo_cliente', 'nombre_corto', *USER_SYNC_FIELDS]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance.get_tracked_values()
+        return instance
+
+    def get_tracked_values(self):
+        return {
+            field: self.__dict__[field]
+            for field in self.TRACKED_FIELDS
+            if field in self.__dict__
+        }
+
+    def get_changed_fields(self):
+        """Campos rastreados que cambiaron desde que se cargó (o guardó) la instancia."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return set(self.TRACKED_FIELDS)
+        return {
+            field
+            for field, value in self.get_tracked_values().items()
+            if field not in loaded or loaded[field] != value
+        }
+
+    def reserve_id(self):
+        """Obtiene el siguiente id de la secuencia de la tabla sin insertar."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id'))",
+                [connection.ops.quote_name(self._meta.db_table)],
+            )
+            return cursor.fetchone()[0]
+
     def save(self, *args, **kwargs):
         # Generar nombre_corto
         if not self.nombre_corto:
@@ -305,54 +442,51 @@ class Cliente(models.Model):
             else:
                 self.nombre_corto = ''
 
-        # Generar codigo_cliente
-        needs_second_save = False
+        is_new = self._state.adding
+        changed_fields = self.get_changed_fields()
+
+        # Generar codigo_cliente a partir del siguiente valor de la secuencia del id,
+        # de modo que el registro se inserta una sola vez con su código definitivo
         if not self.codigo_cliente:
-            # Remove force_insert for the first save since we'll need to update the codigo_cliente
-            kwargs_first_save = kwargs.copy()
-            kwargs_first_save.pop('force_insert', None)
-            super().save(*args, **kwargs_first_save)  # Guardar primero para obtener el ID
             prefijo_any = ParametroSistema.objects.get_valor("Prefijo del Código de Cliente")
             if prefijo_any is None:
                 raise ValidationError("El parámetro 'Prefijo del Código de Cliente' no está definido.")
-            prefijo = str(prefijo_any)
-            self.codigo_cliente = f"{prefijo}-{str(self.id).zfill(6)}"
-            needs_second_save = True
-
-        # Llenar los campos de User email first_name y last_name
-        self.user.email = self.correo_electronico
-        self.user.first_name = self.nombres
-        self.user.last_name = self.apellidos
-        self.user.save()
-
-        # Only save again if we haven't already saved or if codigo_cliente was updated
-        if needs_second_save or not self.pk:
-            # Remove force_insert for the second save since the record already exists
-            kwargs_second_save = kwargs.copy()
-            kwargs_second_save.pop('force_insert', None)
-            super().save(*args, **kwargs_second_save)
-        elif kwargs.get('update_fields') or not needs_second_save:
-            # Normal update path - respects force_insert if provided
-            super().save(*args, **kwargs)
+            if self.pk is None:
+                self.id = self.reserve_id()
+                kwargs['force_insert'] = True
+            self.codigo_cliente = f"{prefijo_any}-{str(self.id).zfill(6)}"
+            changed_fields.add('codigo_cliente')
+
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | (
+                changed_fields & {'codigo_cliente', 'nombre_corto'}
+            )
 
-        # Asignar permisos de objeto al usuario
-        assign_perm('view_cliente', self.user, self)
-        assign_perm('change_cliente', self.user, self)
-        assign_perm('delete_cliente', self.user, self)
-
-        # Asignar permisos de objeto a los operadores y administradores
-        permissions = ['view', 'change']
-        if 'Administradores' in [group.name for group in self.user.groups.all()]:
-            permissions.append('delete')
-        assign_permissions_to_groups(self, permissions, 'cliente')
-
-        # Remover permisos de objeto a los usuarios que no sean el creador
-        users_with_perms = get_users_with_perms(self, with_group_users=False)
-        for user in users_with_perms:
-            if user != self.user:
-                remove_perm('view_cliente', user, self)
-                remove_perm('change_cliente', user, self)
-                remove_perm('delete_cliente', user, self)
+        super().save(*args, **kwargs)
+
+        # Llenar los campos de User email first_name y last_name solo si cambiaron
+        user_fields = []
+        for field, user_field in self.USER_SYNC_FIELDS.items():
+            if not (is_new or field in changed_fields or 'user_id' in changed_fields):
+                continue
+            if getattr(self.user, user_field) != getattr(self, field):
+                setattr(self.user, user_field, getattr(self, field))
+                user_fields.append(user_field)
+        if user_fields:
+            self.user.save(update_fields=user_fields)
+
+        # Asignar permisos de objeto al usuario, a los operadores y administradores
+        if is_new:
+            assign_object_permissions(self, self.user, 'cliente')
+        elif 'user_id' in changed_fields:
+            # Remover permisos de objeto a los usuarios que no sean el dueño actual
+            UserObjectPermission.objects.filter(
+                content_type=ContentType.objects.get_for_model(self),
+                object_pk=str(self.pk),
+            ).exclude(user_id=self.user_id).delete()
+            assign_object_permissions(self, self.user, 'cliente')
+
+        self._loaded_values = self.get_tracked_values()
 
     def __str__(self):
         return f"{self.nombre_corto} ({self.user.username}) - {self.codigo_cliente}"
@@ -393,12 +527,18 @@ class Cotizacion(models.Model):
     total_flete = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Total Flete")
     total_impuestos = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Total Impuestos")
     total_estimado = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Total Estimado")
+    # Totales de los artículos usados para calcular el flete (mayor entre peso real y volumétrico)
+    peso_total = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Peso Total")
+    volumen_total = models.DecimalField(max_digits=18, decimal_places=6, default=0, verbose_name="Volumen Total")
     session_key = models.CharField(max_length=40, blank=True, verbose_name="Session Key")
 
     class Meta:
         ordering = ['-fecha_creacion']
         verbose_name = "Cotización"
         verbose_name_plural = "Cotizaciones"
+        indexes = [
+            models.Index(fields=['total_estimado'], name='cotizacion_total_estimado_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.fecha_creacion is None:
@@ -414,16 +554,18 @@ class Cotizacion(models.Model):
 
         self.fecha_expiracion = self.fecha_creacion + timedelta(days=dias_validez)
 
+        is_new = self._state.adding
+        # Los totales los mantienen los artículos con UPDATE incrementales; una
+        # instancia cargada antes de esos cambios no debe sobrescribirlos
+        if not is_new and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in CAMPOS_TOTALES
+            ]
         super().save(*args, **kwargs)
-        assign_perm('view_cotizacion', self.cliente.user, self)
-        assign_perm('change_cotizacion', self.cliente.user, self)
-        assign_perm('delete_cotizacion', self.cliente.user, self)
-
-        # Asignar permisos de objeto a los operadores y administradores
-        permissions = ['view', 'change']
-        if 'Administradores' in [group.name for group in self.cliente.user.groups.all()]:
-            permissions.append('delete')
-        assign_permissions_to_groups(self, permissions, 'cotizacion')
+        # Asignar permisos de objeto al usuario, a los operadores y administradores
+        if is_new:
+            assign_object_permissions(self, self.cliente.user if self.cliente_id else None, 'cotizacion')
 
     def __str__(self):
         return f"Cotización {self.id} - Cliente {self.cliente.codigo_cliente}"
@@ -488,42 +630,17 @@ class Envio(models.Model):
 
 
     def save(self, *args, **kwargs):
-        # Calcular el volumen total de los artículos
-        volumen_total = sum(
-            articulo.largo * articulo.ancho * articulo.alto
-            for articulo in self.cotizacion.articulos.all()
-        )
-        peso_volumetrico_total: Decimal | float = volumen_total / Articulo.FACTOR_VOL
-
-        # Calcular el peso total
-        peso_total = sum(articulo.peso for articulo in self.cotizacion.articulos.all())
-
-        # Seleccionar el mayor peso entre el real y el volumétrico total
-        peso_a_usar = max(Decimal(peso_total), Decimal(peso_volumetrico_total))
-
-        # Obtener el costo por libra desde ParametroSistema
-        costo_por_libra = ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$")
-
-        if costo_por_libra is None:
-            raise ValidationError("El parámetro 'Costo Flete por Libra en USD$' no está definido.")
-        try:
-            costo_decimal = Decimal(str(costo_por_libra))
-        except Exception:
-            raise ValidationError("El parámetro 'Costo Flete por Libra en USD$' no es convertible a Decimal.")
+        # Volumen, peso y mayor peso (real o volumétrico) en una sola consulta
+        totales = totales_cotizacion(self.cotizacion)
 
-        # Calcular el flete
-        self.flete = peso_a_usar * costo_decimal
+        # Calcular el flete con el costo por libra de ParametroSistema
+        self.flete = totales.flete(obtener_costo_flete_por_lb())
 
+        is_new = self._state.adding
         super().save(*args, **kwargs)
-        # Asignar permisos de objeto al usuario
-        assign_perm('view_envio', self.cotizacion.cliente.user, self)
-        assign_perm('change_envio', self.cotizacion.cliente.user, self)
-        assign_perm('delete_envio', self.cotizacion.cliente.user, self)
-        # Asignar permisos de objeto a los operadores y administradores
-        permissions = ['view', 'change']
-        if 'Administradores' in [group.name for group in self.cotizacion.cliente.user.groups.all()]:
-            permissions.append('delete')
-        assign_permissions_to_groups(self, permissions, 'envio')
+        # Asignar permisos de objeto al usuario, a los operadores y administradores
+        if is_new:
+            assign_object_permissions(self, self.cotizacion.cliente.user, 'envio')
 
     def __str__(self):
         return f"Envío {self.id} - Cliente {self.cliente.codigo_cliente}"
@@ -585,29 +702,27 @@ class Factura(models.Model):
         verbose_name_plural = "Facturas"
 
     def save(self, *args, **kwargs):
-        # Obtener los valores de la cotización asociada
-        articulos = self.envio.cotizacion.articulos.all()
-
-        self.flete = self.envio.flete
-        self.total_impuesto_dai = sum(articulo.impuesto_dai for articulo in articulos)
-        self.total_impuesto_isc = sum(articulo.impuesto_isc for articulo in articulos)
-        self.total_impuesto_ispc = sum(articulo.impuesto_ispc for articulo in articulos)
-        self.total_impuesto_isv = sum(articulo.impuesto_isv for articulo in articulos)
-        self.total_impuesto = sum(articulo.impuesto_total for articulo in articulos)
+        # Obtener los totales de la cotización asociada en una sola consulta
+        totales = totales_cotizacion(self.envio.cotizacion)
+
+        # Envio.flete solo existe en la instancia que se acaba de guardar
+        self.flete = getattr(self.envio, 'flete', None)
+        if self.flete is None:
+            self.flete = totales.flete(obtener_costo_flete_por_lb())
+        self.total_impuesto_dai = totales.total_impuesto_dai
+        self.total_impuesto_isc = totales.total_impuesto_isc
+        self.total_impuesto_ispc = totales.total_impuesto_ispc
+        self.total_impuesto_isv = totales.total_impuesto_isv
+        self.total_impuesto = totales.total_impuesto
 
         # Calcular el monto total
         self.monto_total = self.flete + self.total_impuesto
 
+        is_new = self._state.adding
         super().save(*args, **kwargs)
-        # Asignar permisos de objeto al usuario
-        assign_perm('view_factura', self.cliente.user, self)
-        assign_perm('change_factura', self.cliente.user, self)
-        assign_perm('delete_factura', self.cliente.user, self)
-        # Asignar permisos de objeto a los operadores y administradores
-        permissions = ['view', 'change']
-        if 'Administradores' in [group.name for group in self.cliente.user.groups.all()]:
-            permissions.append('delete')
-        assign_permissions_to_groups(self, permissions, 'factura')
+        # Asignar permisos de objeto al usuario, a los operadores y administradores
+        if is_new:
+            assign_object_permissions(self, self.cliente.user, 'factura')
 
     def __str__(self):
         return f"Factura {self.id} - Envío {self.envio.id}"
@@ -653,16 +768,11 @@ class Alerta(models.Model):
         verbose_name_plural = "Alertas"
 
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
         super().save(*args, **kwargs)
-        # Asignar permisos de objeto al usuario
-        assign_perm('view_alerta', self.cliente.user, self)
-        assign_perm('change_alerta', self.cliente.user, self)
-        assign_perm('delete_alerta', self.cliente.user, self)
-        # Asignar permisos de objeto a los operadores y administradores
-        permissions = ['view', 'change']
-        if 'Administradores' in [group.name for group in self.cliente.user.groups.all()]:
-            permissions.append('delete')
-        assign_permissions_to_groups(self, permissions, 'alerta')
+        # Asignar permisos de objeto al usuario, a los operadores y administradores
+        if is_new:
+            assign_object_permissions(self, self.cliente.user, 'alerta')
 
     def __str__(self):
         return f"Alerta {self.id} - Envío {self.envio.id}"
@@ -728,11 +838,63 @@ class Articulo(models.Model):
         verbose_name = "Artículo"
         verbose_name_plural = "Artículos"
 
-    FACTOR_VOL = 166  # Factor de volumen estándar en pulgadas cúbicas por libra
+    FACTOR_VOL = FACTOR_VOL  # Factor de volumen estándar en pulgadas cúbicas por libra
+
+    # Campos que determinan el aporte del artículo a los totales de su cotización
+    TOTALES_FIELDS = ['cotizacion_id', 'valor_articulo', 'impuesto_total', 'peso', 'largo', 'ancho', 'alto']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_totales = instance.get_totales_values()
+        return instance
+
+    def get_totales_values(self):
+        return {
+            field: self.__dict__[field]
+            for field in self.TOTALES_FIELDS
+            if field in self.__dict__
+        }
+
+    def get_loaded_totales(self):
+        """Valores guardados que aportan a los totales (None si el artículo es nuevo)."""
+        if self._state.adding:
+            return None
+        loaded = getattr(self, '_loaded_totales', None) or {}
+        if len(loaded) < len(self.TOTALES_FIELDS):
+            # Instancia sin cargar desde la base o con campos diferidos
+            loaded = Articulo.objects.filter(pk=self.pk).values(*self.TOTALES_FIELDS).first()
+        return loaded
+
+    @staticmethod
+    def contribucion(values):
+        if values is None:
+            return CONTRIBUCION_CERO
+        return Contribucion.de_valores(
+            values['valor_articulo'],
+            values['impuesto_total'],
+            values['peso'],
+            values['largo'],
+            values['ancho'],
+            values['alto'],
+        )
+
+    @property
+    def tarifa(self):
+        """Tasas de la partida desde la tabla de tarifas del proceso, sin leer la FK."""
+        return self.obtener_tarifa()
+
+    def obtener_tarifa(self, verificar=False):
+        # Con verificar se compara la versión de la tabla con la base ya mismo
+        tarifa = tabla_tarifas.tarifa(self.partida_arancelaria_id, verificar=verificar)
+        if tarifa is None:
+            # Partida sin guardar
+            tarifa = Tarifa.de_partida(self.partida_arancelaria)
+        return tarifa
 
     @property
     def partida_item_no(self):
-        return self.partida_arancelaria.item_no
+        return self.tarifa.item_no
 
     @property
     def partida_descripcion(self):
@@ -740,23 +902,23 @@ class Articulo(models.Model):
 
     @property
     def partida_numero(self):
-        return self.partida_arancelaria.partida_arancelaria
+        return self.tarifa.partida_arancelaria
 
     @property
     def porcentaje_dai(self):
-        return self.partida_arancelaria.impuesto_dai * 100
+        return self.tarifa.porcentaje_dai
 
     @property
     def porcentaje_isc(self):
-        return self.partida_arancelaria.impuesto_isc * 100
+        return self.tarifa.porcentaje_isc
 
     @property
     def porcentaje_ispc(self):
-        return self.partida_arancelaria.impuesto_ispc * 100
+        return self.tarifa.porcentaje_ispc
 
     @property
     def porcentaje_isv(self):
-        return self.partida_arancelaria.impuesto_isv * 100
+        return self.tarifa.porcentaje_isv
 
     @property
     def peso_volumetrico(self):
@@ -771,30 +933,25 @@ class Articulo(models.Model):
 
     @property
     def costo_flete_por_lb(self):
-        costo_any = ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$")
-        if costo_any is None:
-            raise ValidationError("El parámetro 'Costo Flete por Libra en USD$' no está definido.")
-        try:
-            return Decimal(str(costo_any))
-        except Exception:
-            raise ValidationError("El parámetro 'Costo Flete por Libra en USD$' no es convertible a Decimal.")
+        return obtener_costo_flete_por_lb()
 
     @property
     def costo_transporte(self):
         return self.peso_a_usar * self.costo_flete_por_lb
 
-    def calcular_impuestos(self):
+    def calcular_impuestos(self, verificar=False):
         # Valor CIF = Valor del artículo + Costo de transporte
         valor_cif = self.valor_articulo + self.costo_transporte
+        tarifa = self.obtener_tarifa(verificar)
 
         # DAI, ISC, ISPC se calculan sobre el valor CIF
-        impuesto_dai = valor_cif * (self.porcentaje_dai / 100)
-        impuesto_isc = valor_cif * (self.porcentaje_isc / 100)
-        impuesto_ispc = valor_cif * (self.porcentaje_ispc / 100)
+        impuesto_dai = valor_cif * (tarifa.porcentaje_dai / 100)
+        impuesto_isc = valor_cif * (tarifa.porcentaje_isc / 100)
+        impuesto_ispc = valor_cif * (tarifa.porcentaje_ispc / 100)
 
         # Base imponible para ISV = CIF + DAI + ISC + ISPC
         base_isv = valor_cif + impuesto_dai + impuesto_isc + impuesto_ispc
-        impuesto_isv = base_isv * (self.porcentaje_isv / 100)
+        impuesto_isv = base_isv * (tarifa.porcentaje_isv / 100)
 
         impuesto_total = (
                 impuesto_dai +
@@ -810,20 +967,38 @@ class Articulo(models.Model):
         self.impuesto_total = impuesto_total
 
     def save(self, *args, **kwargs):
-        self.calcular_impuestos()
-
-        super().save(*args, **kwargs)
-
-        # Asignar permisos de objeto al usuario
-        assign_perm('view_articulo', self.cotizacion.cliente.user, self)
-        assign_perm('change_articulo', self.cotizacion.cliente.user, self)
-        assign_perm('delete_articulo', self.cotizacion.cliente.user, self)
+        is_new = self._state.adding
+        with transaction.atomic():
+            # Lo que se guarda usa la versión vigente de las tarifas, también
+            # la de un cambio hecho antes en esta misma transacción
+            self.calcular_impuestos(verificar=True)
+            loaded = self.get_loaded_totales()
+            super().save(*args, **kwargs)
+            current = self.get_totales_values()
+            self.actualizar_totales_cotizacion(loaded, current)
+        self._loaded_totales = current
+        # Asignar permisos de objeto al usuario, a los operadores y administradores
+        if is_new:
+            assign_object_permissions(self, self.cotizacion.cliente.user, 'articulo')
 
-        # Asignar permisos de objeto a los operadores y administradores
-        permissions = ['view', 'change']
-        if 'Administradores' in [group.name for group in self.cotizacion.cliente.user.groups.all()]:
-            permissions.append('delete')
-        assign_permissions_to_groups(self, permissions, 'articulo')
+    @staticmethod
+    def actualizar_totales_cotizacion(anterior, actual):
+        """Aplica a las cotizaciones afectadas la diferencia del aporte del artículo."""
+        aporte_anterior = Articulo.contribucion(anterior)
+        aporte_actual = Articulo.contribucion(actual)
+        cotizacion_anterior = anterior['cotizacion_id'] if anterior else None
+        cotizacion_actual = actual['cotizacion_id'] if actual else None
+
+        if cotizacion_anterior == cotizacion_actual:
+            delta = aporte_actual.menos(aporte_anterior)
+            if not delta.es_cero():
+                aplicar_delta(Cotizacion.objects.filter(pk=cotizacion_actual), delta)
+            return
+        # El artículo se movió de cotización (o se creó / borró)
+        if cotizacion_anterior is not None:
+            aplicar_delta(Cotizacion.objects.filter(pk=cotizacion_anterior), CONTRIBUCION_CERO.menos(aporte_anterior))
+        if cotizacion_actual is not None:
+            aplicar_delta(Cotizacion.objects.filter(pk=cotizacion_actual), aporte_actual)
 
     def __str__(self):
         return f"Artículo {self.id} - Cotización {self.cotizacion.id}"
@@ -842,6 +1017,31 @@ class Articulo(models.Model):
         return reverse("MiCasillero_Articulo_htmx_delete", args=(self.pk,))
 
 
+@receiver(pre_delete, sender=Cotizacion)
+def marcar_cotizacion_borrada(sender, instance, origin=None, **kwargs):
+    # Sus artículos se borran en cascada en el mismo delete(): se anota en el
+    # objeto que lo originó para no actualizar totales de una fila que se borra
+    if origin is not None:
+        if not hasattr(origin, '_cotizaciones_borradas'):
+            origin._cotizaciones_borradas = set()
+        origin._cotizaciones_borradas.add(instance.pk)
+
+
+@receiver(post_delete, sender=Articulo)
+def restar_articulo_de_cotizacion(sender, instance, origin=None, **kwargs):
+    if instance.cotizacion_id in getattr(origin, '_cotizaciones_borradas', ()):
+        return
+    # post_delete se emite dentro de la transacción del borrado
+    anterior = getattr(instance, '_loaded_totales', None)
+    if not anterior or len(anterior) < len(Articulo.TOTALES_FIELDS):
+        anterior = instance.get_totales_values()
+    try:
+        Articulo.actualizar_totales_cotizacion(anterior, None)
+    except ValidationError as e:
+        # Sin costo de flete no se puede recalcular; recompute_cotizacion_totals lo corrige
+        logger.warning(f"No se actualizaron los totales de la cotización {anterior.get('cotizacion_id')}: {e}")
+
+
 class ItemPartidaMapping(models.Model):
     """
     Records historical mappings between item descriptions and tariff classifications.
@@ -958,14 +1158,7 @@ class ItemPartidaMapping(models.Model):
 
     def normalize_description(self, description):
         """Normaliza la descripción del item para comparación."""
-        import re
-        # Convertir a minúsculas y eliminar espacios extras
-        normalized = description.lower().strip()
-        # Eliminar caracteres especiales, mantener solo letras y espacios
-        normalized = re.sub(r'[^a-záéíóúñ\s]', '', normalized)
-        # Eliminar espacios múltiples
-        normalized = re.sub(r'\s+', ' ', normalized)
-        return normalized
+        return normalizar_descripcion(description)
 
     def save(self, *args, **kwargs):
         if not self.item_description_normalized:
@@ -978,6 +1171,12 @@ class ItemPartidaMapping(models.Model):
         return f"{self.item_description_original[:50]} → {self.partida_arancelaria.item_no}"
 
 
+@receiver([post_save, post_delete], sender=ItemPartidaMapping)
+def invalidar_indice_mapeos(sender, **kwargs):
+    indice_mapeos.on_mapeo_cambiado()
+    cache_busqueda.on_indice_cambiado()
+
+
 class PartidaArancelariaEmbedding(models.Model):
     """
     Almacena los embeddings semánticos para las partidas arancelarias.
@@ -0,0 +1,114 @@
+"""
+Caché en proceso para ParametroSistema.
+
+Todos los parámetros se cargan con una sola consulta y se mantienen en memoria
+por proceso. La caché se invalida localmente con las señales post_save /
+post_delete de ParametroSistema, y entre workers comparando la versión de la
+tabla que mantiene la base (``MiCasillero.versiones``) cada pocos segundos.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .versiones import PARAMETROS, VERSION_CHECK_INTERVAL, VersionBD
+
+ValorParametro = Union[str, int, float, bool, None]
+
+
+def convertir_valor(valor: str, tipo_dato: str) -> ValorParametro:
+    """Convierte el valor almacenado como texto al tipo declarado."""
+    if tipo_dato == "STRING":
+        return valor
+    elif tipo_dato == "INTEGER":
+        return int(valor)
+    elif tipo_dato == "FLOAT":
+        return float(valor)
+    elif tipo_dato == "BOOLEAN":
+        return valor.lower() in ["true", "1"]
+    else:
+        raise ValidationError(f"Tipo de dato no soportado: {tipo_dato}")
+
+
+class ParametroSistemaCache:
+    """Mapa nombre_parametro -> (valor, tipo_dato) cargado de una sola vez."""
+
+    def __init__(
+        self,
+        check_interval: float = VERSION_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._lock = threading.Lock()
+        self._parametros: Optional[Dict[str, Tuple[str, str]]] = None
+        self._version = VersionBD(
+            PARAMETROS, check_interval=check_interval, clock=clock
+        )
+
+    @property
+    def check_interval(self) -> float:
+        return self._version.check_interval
+
+    @check_interval.setter
+    def check_interval(self, valor: float) -> None:
+        self._version.check_interval = valor
+
+    def _cargar(self) -> Dict[str, Tuple[str, str]]:
+        from .models import ParametroSistema
+
+        # La versión se lee antes que los datos: un cambio confirmado entre
+        # las dos lecturas provoca otra recarga, nunca datos viejos
+        version = self._version.leer()
+        parametros = {
+            nombre: (valor, tipo_dato)
+            for nombre, valor, tipo_dato in ParametroSistema.objects.values_list(
+                "nombre_parametro", "valor", "tipo_dato"
+            )
+        }
+        self._parametros = parametros
+        self._version.registrar(version)
+        return parametros
+
+    def _obtener_parametros(self) -> Dict[str, Tuple[str, str]]:
+        with self._lock:
+            if self._parametros is None or self._version.cambio():
+                return self._cargar()
+            return self._parametros
+
+    def get(self, parametro: str) -> ValorParametro:
+        try:
+            valor, tipo_dato = self._obtener_parametros()[parametro]
+        except KeyError:
+            raise ValidationError(f"El parámetro {parametro} no está definido.")
+        return convertir_valor(valor, tipo_dato)
+
+    def get_many(self, parametros: Iterable[str]) -> Dict[str, ValorParametro]:
+        cargados = self._obtener_parametros()
+        resultado: Dict[str, ValorParametro] = {}
+        for parametro in parametros:
+            try:
+                valor, tipo_dato = cargados[parametro]
+            except KeyError:
+                raise ValidationError(f"El parámetro {parametro} no está definido.")
+            resultado[parametro] = convertir_valor(valor, tipo_dato)
+        return resultado
+
+    @property
+    def version(self) -> Optional[Tuple[int, ...]]:
+        return self._version.version
+
+    def invalidar(self) -> None:
+        """Descarta la copia local; la siguiente lectura recarga desde la BD."""
+        with self._lock:
+            self._parametros = None
+            self._version.olvidar()
+
+    def on_parametro_cambiado(self) -> None:
+        # Los demás workers ven la nueva versión de la tabla al confirmarse
+        self.invalidar()
+        transaction.on_commit(self.invalidar)
+
+
+parametros_cache = ParametroSistemaCache()
@@ -0,0 +1,311 @@
+"""
+Ranking híbrido de partidas para ``buscar_partidas``.
+
+Fusiona tres listas ordenadas con *reciprocal rank fusion* (RRF):
+
+- Elasticsearch (``multi_match`` BM25 con fuzziness), consultado en un hilo
+  con un presupuesto de latencia;
+- la búsqueda de texto de PostgreSQL (``search_vector``, índice GIN);
+- el historial de ``ItemPartidaMapping`` para la descripción normalizada,
+  servido desde ``indice_mapeos`` en memoria.
+
+Cada lista aporta ``peso / (K_RRF + posición)`` a las partidas que contiene;
+las partidas del historial confirmadas por el personal
+(``is_staff_verified``) multiplican su aporte por ``FACTOR_VERIFICADO``.
+
+Las llamadas a Elasticsearch pasan por ``breaker_elasticsearch``: tras
+``UMBRAL_FALLOS`` errores o timeouts seguidos se dejan de intentar durante
+``ESPERA_BREAKER`` segundos. Las consultas corren en un pool de
+``PARTIDA_SEARCH_THREADS`` hilos; si el presupuesto se agota antes de que una
+consulta empiece (pool local ocupado) se cuenta como ``timeout_local`` y no
+como fallo de Elasticsearch. Mientras Elasticsearch falla, está abierto el
+circuito o está deshabilitado (``PARTIDA_SEARCH_ELASTICSEARCH = False``), su
+lugar lo ocupa el índice invertido en memoria de ``indice_local``.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from elasticsearch_dsl import Q as ES_Q
+from elasticsearch_dsl.connections import connections
+
+from .busqueda import buscar_partidas_texto, resultados_partidas
+from .documents import PartidaArancelariaDocument
+from .indice_local import indice_local
+from .mapeos import indice_mapeos
+
+logger = logging.getLogger(__name__)
+
+# Constante de RRF; 60 es el valor habitual de la literatura
+K_RRF = 60
+
+# "local" reemplaza a Elasticsearch cuando este no está disponible
+PESOS_FUENTES = {
+    "elasticsearch": 1.0,
+    "local": 1.0,
+    "postgres": 1.0,
+    "historial": 1.0,
+}
+
+FACTOR_VERIFICADO = 3.0
+
+# Candidatos pedidos a cada fuente antes de fusionar
+CANDIDATOS_POR_FUENTE = 50
+
+# Milisegundos que se espera a Elasticsearch (settings.PARTIDA_SEARCH_BUDGET_MS)
+PRESUPUESTO_MS = 300
+
+# Hilos del pool de consultas a Elasticsearch (settings.PARTIDA_SEARCH_THREADS)
+HILOS_ELASTICSEARCH = 4
+
+# Errores seguidos que abren el circuito y segundos hasta volver a probar
+UMBRAL_FALLOS = 3
+ESPERA_BREAKER = 30.0
+
+# Estados de la consulta a Elasticsearch que no degradan el resultado
+ESTADOS_COMPLETOS = ("ok", "deshabilitado")
+
+CAMPOS_ELASTICSEARCH = [
+    "item_no^3",  # Dar más peso al código
+    "descripcion^2",  # Peso medio a la descripción
+    "full_text_search",  # Búsqueda general en texto combinado
+    "search_keywords",  # Búsqueda en keywords
+]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    """Pool de consultas a Elasticsearch, creado con el primer uso."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(
+                    settings, "PARTIDA_SEARCH_THREADS", HILOS_ELASTICSEARCH
+                ),
+                thread_name_prefix="buscar-partidas",
+            )
+        return _executor
+
+
+def consulta_multi_match(q: str):
+    """Consulta ``multi_match`` de Elasticsearch usada por ``buscar_partidas``."""
+    return ES_Q("multi_match", query=q, fields=CAMPOS_ELASTICSEARCH, fuzziness="AUTO")
+
+
+def buscar_elasticsearch(
+    q: str, limite: int, timeout: Optional[float] = None
+) -> List[Tuple[int, float]]:
+    """Pares ``(partida_id, score)`` de Elasticsearch, de mayor a menor score."""
+    search = PartidaArancelariaDocument.search().query(consulta_multi_match(q))
+    if timeout is not None:
+        search = search.using(
+            connections.get_connection().options(request_timeout=timeout)
+        )
+    response = search.source(False)[:limite].execute()
+    return [(int(hit.meta.id), hit.meta.score) for hit in response]
+
+
+class CircuitBreaker:
+    """
+    Cerrado: se consulta normalmente. Abierto (tras ``umbral`` fallos
+    seguidos): no se consulta durante ``espera`` segundos. Semiabierto: pasada
+    la espera se deja pasar una sola consulta de prueba; si funciona se cierra
+    y si falla se vuelve a abrir.
+    """
+
+    def __init__(
+        self,
+        umbral: int = UMBRAL_FALLOS,
+        espera: float = ESPERA_BREAKER,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.umbral = umbral
+        self.espera = espera
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.fallos = 0
+        self._abierto_en: Optional[float] = None
+        self._probando = False
+
+    @property
+    def estado(self) -> str:
+        if self._abierto_en is None:
+            return "cerrado"
+        if self._probando or self.clock() - self._abierto_en >= self.espera:
+            return "semiabierto"
+        return "abierto"
+
+    def permite(self) -> bool:
+        with self._lock:
+            if self._abierto_en is None:
+                return True
+            if self._probando or self.clock() - self._abierto_en < self.espera:
+                return False
+            self._probando = True
+            return True
+
+    def registrar_exito(self) -> None:
+        with self._lock:
+            self.fallos = 0
+            self._abierto_en = None
+            self._probando = False
+
+    def registrar_fallo(self) -> None:
+        with self._lock:
+            self.fallos += 1
+            if self._probando or self.fallos >= self.umbral:
+                if self._abierto_en is None or self._probando:
+                    logger.warning(
+                        f"Elasticsearch: circuito abierto por {self.espera:.0f}s "
+                        f"tras {self.fallos} fallos"
+                    )
+                self._abierto_en = self.clock()
+                self._probando = False
+
+    def liberar_prueba(self) -> None:
+        """La consulta de prueba no llegó a hacerse: se permite otra."""
+        with self._lock:
+            self._probando = False
+
+    def reiniciar(self) -> None:
+        self.registrar_exito()
+
+
+breaker_elasticsearch = CircuitBreaker()
+
+
+def presupuesto_por_defecto() -> float:
+    return getattr(settings, "PARTIDA_SEARCH_BUDGET_MS", PRESUPUESTO_MS)
+
+
+def enviar_elasticsearch(
+    q: str, limite: int, presupuesto: float
+) -> Tuple[Optional[Future], str]:
+    """Lanza la consulta en otro hilo si está habilitada y el circuito lo permite."""
+    if not getattr(settings, "PARTIDA_SEARCH_ELASTICSEARCH", True):
+        return None, "deshabilitado"
+    if not breaker_elasticsearch.permite():
+        return None, "abierto"
+    return executor().submit(buscar_elasticsearch, q, limite, presupuesto), "ok"
+
+
+def esperar_elasticsearch(
+    futuro: Optional[Future], estado: str, restante: float
+) -> Tuple[List[Tuple[int, float]], str]:
+    if futuro is None:
+        return [], estado
+    try:
+        puntajes = futuro.result(timeout=restante)
+    except FuturesTimeout:
+        if futuro.cancel():
+            # Seguía en la cola del pool: no es un fallo de Elasticsearch
+            breaker_elasticsearch.liberar_prueba()
+            logger.warning(
+                f"Sin hilos libres para consultar Elasticsearch ({restante:.3f}s)"
+            )
+            return [], "timeout_local"
+        breaker_elasticsearch.registrar_fallo()
+        logger.warning(f"Elasticsearch no respondió a tiempo ({restante:.3f}s)")
+        return [], "timeout"
+    except Exception as e:
+        breaker_elasticsearch.registrar_fallo()
+        logger.warning(f"Error searching Elasticsearch: {e}")
+        return [], "error"
+    breaker_elasticsearch.registrar_exito()
+    return puntajes, "ok"
+
+
+def buscar_partidas_elasticsearch(q: str, limite: int = 20) -> Tuple[List[dict], str]:
+    """
+    Resultados de Elasticsearch para ``modo=texto``, o del índice local si
+    Elasticsearch no está disponible. Devuelve también el estado de la
+    consulta a Elasticsearch.
+    """
+    presupuesto = presupuesto_por_defecto() / 1000
+    futuro, estado = enviar_elasticsearch(q, limite, presupuesto)
+    puntajes, estado = esperar_elasticsearch(futuro, estado, presupuesto)
+    if estado != "ok":
+        puntajes = indice_local.buscar(q, limite)
+    return resultados_partidas(puntajes), estado
+
+
+@dataclass
+class ResultadoFusion:
+    results: List[dict]
+    # Cantidad de candidatos por fuente
+    fuentes: Dict[str, int] = field(default_factory=dict)
+    # "ok", "timeout", "timeout_local", "error", "abierto" o "deshabilitado"
+    elasticsearch: str = "ok"
+    milisegundos: float = 0.0
+
+    @property
+    def degradado(self) -> bool:
+        return self.elasticsearch not in ESTADOS_COMPLETOS
+
+
+def fusionar(
+    listas: Dict[str, Sequence[int]],
+    verificados: Sequence[int] = (),
+    pesos: Optional[Dict[str, float]] = None,
+) -> List[Tuple[int, float]]:
+    """
+    Reciprocal rank fusion de listas de ids ordenadas. ``verificados`` son
+    las partidas del historial confirmadas por el personal.
+    """
+    pesos = pesos or PESOS_FUENTES
+    verificados = set(verificados)
+    puntajes: Dict[int, float] = {}
+    for fuente, ids in listas.items():
+        for posicion, pid in enumerate(ids, start=1):
+            aporte = pesos.get(fuente, 1.0) / (K_RRF + posicion)
+            if fuente == "historial" and pid in verificados:
+                aporte *= FACTOR_VERIFICADO
+            puntajes[pid] = puntajes.get(pid, 0.0) + aporte
+    return sorted(puntajes.items(), key=lambda par: (-par[1], par[0]))
+
+
+def rankear_partidas(
+    q: str, limite: int = 20, presupuesto_ms: Optional[float] = None
+) -> ResultadoFusion:
+    if presupuesto_ms is None:
+        presupuesto_ms = presupuesto_por_defecto()
+    inicio = time.perf_counter()
+    presupuesto = presupuesto_ms / 1000
+
+    # Elasticsearch en otro hilo mientras se consultan las fuentes locales
+    futuro, estado = enviar_elasticsearch(q, CANDIDATOS_POR_FUENTE, presupuesto)
+    historial = indice_mapeos.buscar(q)
+    postgres = list(
+        buscar_partidas_texto(q).values_list("id", flat=True)[:CANDIDATOS_POR_FUENTE]
+    )
+
+    restante = max(0.0, presupuesto - (time.perf_counter() - inicio))
+    puntajes, estado = esperar_elasticsearch(futuro, estado, restante)
+
+    listas = {
+        "elasticsearch": [pid for pid, _ in puntajes],
+        "postgres": postgres,
+        "historial": [m.partida_id for m in historial],
+    }
+    if estado != "ok":
+        listas["local"] = [
+            pid for pid, _ in indice_local.buscar(q, CANDIDATOS_POR_FUENTE)
+        ]
+    mejores = fusionar(
+        listas, verificados=[m.partida_id for m in historial if m.verificadas]
+    )[:limite]
+    return ResultadoFusion(
+        results=resultados_partidas(mejores),
+        fuentes={fuente: len(ids) for fuente, ids in listas.items()},
+        elasticsearch=estado,
+        milisegundos=(time.perf_counter() - inicio) * 1000,
+    )
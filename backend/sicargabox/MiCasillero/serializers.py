@@ -33,6 +33,10 @@ class ArticuloSerializer(serializers.ModelSerializer):
             "impuesto_ispc",
             "impuesto_isv",
             "impuesto_total",
+            "porcentaje_dai",
+            "porcentaje_isc",
+            "porcentaje_ispc",
+            "porcentaje_isv",
         ]
 
 
@@ -0,0 +1,367 @@
+"""
+Tabla de tarifas por partida para el cotizador.
+
+Las tasas (DAI, ISC, ISPC, ISV), la categoría de courier y los códigos de
+jerarquía de todas las partidas se guardan en un arreglo estructurado de
+NumPy ordenado por ``id``. Buscar una partida por ``id`` (o por ``item_no``,
+con un orden precalculado) es un ``searchsorted`` que devuelve una vista de
+la fila, sin copiar ni consultar la base de datos.
+
+El arreglo puede exportarse a un ``.npy`` (``export_tarifas``) que cada
+worker abre con ``mmap_mode="r"``: el arranque no consulta la tabla de
+partidas y los workers comparten las mismas páginas. Las tasas se guardan
+como enteros en centésimas, así que el ``Decimal`` reconstruido es idéntico
+al de la base y los cálculos no cambian.
+
+Sobre el arreglo, ``tarifas``/``tarifa`` devuelven registros ``Tarifa``
+(``__slots__``) con las tasas como ``Decimal`` y los porcentajes ya
+calculados; cada uno se crea una sola vez por versión de la tabla. Son la
+fuente de las tasas de ``Articulo.calcular_impuestos``, del cotizador y de
+las vistas y serializadores de artículos. ``Articulo.save`` las pide con
+``verificar=True``: la versión se compara con la base dentro de la
+transacción del guardado, así que lo que se guarda nunca usa una tabla
+vencida.
+
+La tabla se invalida localmente con las señales de ``PartidaArancelaria`` y
+entre workers con la versión ``tarifas`` de la base (``MiCasillero.versiones``),
+que los triggers incrementan al cambiar cualquiera de sus columnas. La
+exportación guarda la versión con la que se leyó y solo se abre mientras la
+base sigue en esa versión. Después la tabla se recarga desde la base con una
+sola consulta.
+"""
+
+import logging
+import threading
+import time
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .versiones import TARIFAS, VERSION_CHECK_INTERVAL, VersionBD, leer_versiones
+
+logger = logging.getLogger(__name__)
+
+# Cambia si cambian las columnas del archivo
+FORMATO = 2
+
+CAMPOS_TASAS = ("impuesto_dai", "impuesto_isc", "impuesto_ispc", "impuesto_isv")
+CAMPOS_TEXTO = (
+    "item_no",
+    "partida_arancelaria",
+    "courier_category",
+    "chapter_code",
+    "heading_code",
+    "parent_item_no",
+)
+CAMPOS = (
+    ("id",) + CAMPOS_TEXTO[:2] + CAMPOS_TASAS + CAMPOS_TEXTO[2:] + ("hierarchy_level",)
+)
+
+
+@lru_cache(maxsize=1024)
+def tasa_decimal(centesimas: int) -> Decimal:
+    """Tasa guardada en centésimas como el ``Decimal`` de 2 decimales del modelo."""
+    return Decimal(int(centesimas)).scaleb(-2)
+
+
+def tasas(fila) -> Tuple[Decimal, Decimal, Decimal, Decimal]:
+    """(DAI, ISC, ISPC, ISV) de una fila de la tabla."""
+    return tuple(tasa_decimal(fila[campo]) for campo in CAMPOS_TASAS)
+
+
+class Tarifa:
+    """
+    Tasas de una partida con los porcentajes (tasa * 100) ya calculados, como
+    los usan ``Articulo.calcular_impuestos`` y las vistas de cotización.
+    """
+
+    __slots__ = (
+        "id",
+        "item_no",
+        "partida_arancelaria",
+        "courier_category",
+        "impuesto_dai",
+        "impuesto_isc",
+        "impuesto_ispc",
+        "impuesto_isv",
+        "porcentaje_dai",
+        "porcentaje_isc",
+        "porcentaje_ispc",
+        "porcentaje_isv",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        item_no: str,
+        partida_arancelaria: str,
+        courier_category: str,
+        dai: Decimal,
+        isc: Decimal,
+        ispc: Decimal,
+        isv: Decimal,
+    ):
+        self.id = id
+        self.item_no = item_no
+        self.partida_arancelaria = partida_arancelaria
+        self.courier_category = courier_category
+        self.impuesto_dai = dai
+        self.impuesto_isc = isc
+        self.impuesto_ispc = ispc
+        self.impuesto_isv = isv
+        self.porcentaje_dai = dai * 100
+        self.porcentaje_isc = isc * 100
+        self.porcentaje_ispc = ispc * 100
+        self.porcentaje_isv = isv * 100
+
+    @classmethod
+    def de_fila(cls, fila) -> "Tarifa":
+        return cls(
+            int(fila["id"]),
+            str(fila["item_no"]),
+            str(fila["partida_arancelaria"]),
+            str(fila["courier_category"]),
+            *tasas(fila),
+        )
+
+    @classmethod
+    def de_partida(cls, partida) -> "Tarifa":
+        """Desde una instancia del modelo (p. ej. una partida sin guardar)."""
+        return cls(
+            partida.id,
+            partida.item_no,
+            partida.partida_arancelaria,
+            partida.courier_category,
+            *(getattr(partida, campo) for campo in CAMPOS_TASAS),
+        )
+
+    def __repr__(self):
+        return f"<Tarifa {self.id} {self.item_no}>"
+
+
+def construir_arreglo(filas: Sequence[Tuple]) -> np.ndarray:
+    """Arreglo estructurado ordenado por ``id`` a partir de tuplas en ``CAMPOS``."""
+    columnas = list(zip(*filas)) if filas else [()] * len(CAMPOS)
+    valores = dict(zip(CAMPOS, columnas))
+
+    tipos = [("id", np.int64)]
+    for campo in CAMPOS_TEXTO[:2]:
+        tipos.append((campo, _tipo_texto(valores[campo])))
+    tipos.extend((campo, np.int32) for campo in CAMPOS_TASAS)
+    for campo in CAMPOS_TEXTO[2:]:
+        tipos.append((campo, _tipo_texto(valores[campo])))
+    tipos.append(("hierarchy_level", np.int8))
+
+    arreglo = np.empty(len(filas), dtype=tipos)
+    arreglo["id"] = valores["id"]
+    for campo in CAMPOS_TEXTO:
+        arreglo[campo] = [v or "" for v in valores[campo]]
+    for campo in CAMPOS_TASAS:
+        arreglo[campo] = [int(v.scaleb(2)) for v in valores[campo]]
+    arreglo["hierarchy_level"] = valores["hierarchy_level"]
+    return np.sort(arreglo, order="id", kind="stable")
+
+
+def _tipo_texto(valores: Iterable[Optional[str]]) -> str:
+    return f"U{max((len(v) for v in valores if v), default=1)}"
+
+
+class TablaTarifas:
+    """Tarifas de todas las partidas en un arreglo estructurado ordenado por id."""
+
+    def __init__(
+        self,
+        ruta=None,
+        check_interval: float = VERSION_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # Sin ruta se usa PARTIDA_TARIFAS_PATH
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.datos: Optional[np.ndarray] = None
+        self._orden_item_no: Optional[np.ndarray] = None
+        self._version = VersionBD(TARIFAS, check_interval=check_interval, clock=clock)
+        self._probar_archivo = True
+        # id -> Tarifa de las filas ya pedidas; se reemplaza con cada carga
+        self._tarifas: Dict[int, Tarifa] = {}
+        self.origen: Optional[str] = None
+
+    def __len__(self):
+        return 0 if self.datos is None else len(self.datos)
+
+    @property
+    def version(self) -> Optional[Tuple[int, ...]]:
+        return self._version.version
+
+    # Carga
+
+    @staticmethod
+    def leer_bd(pks: Optional[Iterable[int]] = None) -> np.ndarray:
+        """Filas de la base (todas, o las de ``pks``) en el formato de la tabla."""
+        from .models import PartidaArancelaria
+
+        queryset = PartidaArancelaria.objects.order_by()
+        if pks is not None:
+            queryset = queryset.filter(pk__in=list(pks))
+        return construir_arreglo(list(queryset.values_list(*CAMPOS)))
+
+    def _asignar(
+        self,
+        datos: np.ndarray,
+        orden_item_no: np.ndarray,
+        version: Tuple[int, ...],
+        origen: str,
+    ) -> None:
+        self.datos = datos
+        self._orden_item_no = orden_item_no
+        self._tarifas = {}
+        self._version.registrar(version)
+        self.origen = origen
+
+    def cargar_bd(self) -> None:
+        # La versión se lee antes que las filas: un cambio intermedio deja
+        # la tabla con una versión vieja y se recarga en el próximo chequeo
+        with self._lock:
+            version = self._version.leer()
+        datos = self.leer_bd()
+        orden = np.argsort(datos["item_no"], kind="stable")
+        with self._lock:
+            self._asignar(datos, orden, version, "bd")
+
+    @staticmethod
+    def rutas(ruta) -> Tuple[Path, Path]:
+        ruta = Path(ruta)
+        base = ruta.with_suffix("") if ruta.suffix in (".npy", ".npz") else ruta
+        return base.with_suffix(".npy"), base.with_name(base.name + ".meta.npz")
+
+    def exportar(self, ruta) -> Path:
+        """
+        Escribe las filas (``.npy``) y, en ``.meta.npz``, la versión ``tarifas``
+        con la que se leyeron y el orden por item_no.
+        """
+        if self.datos is None:
+            self.cargar_bd()
+        ruta_datos, ruta_meta = self.rutas(ruta)
+        ruta_datos.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            np.save(ruta_datos, self.datos)
+            np.savez(
+                ruta_meta,
+                formato=np.array(FORMATO),
+                version=np.array(self._version.version),
+                orden_item_no=self._orden_item_no,
+            )
+        return ruta_datos
+
+    def cargar_archivo(self, ruta) -> bool:
+        """
+        Abre una exportación con ``mmap_mode="r"`` si la versión ``tarifas``
+        de la base sigue siendo la de la exportación.
+        """
+        ruta_datos, ruta_meta = self.rutas(ruta)
+        if not ruta_datos.exists() or not ruta_meta.exists():
+            return False
+        meta = np.load(ruta_meta)
+        if int(meta["formato"]) != FORMATO:
+            logger.warning(f"{ruta_datos} tiene el formato {meta['formato']}")
+            return False
+        version = tuple(int(v) for v in meta["version"])
+        if version != leer_versiones(TARIFAS):
+            logger.info(f"{ruta_datos} es de una versión anterior del arancel")
+            return False
+        datos = np.load(ruta_datos, mmap_mode="r")
+        with self._lock:
+            self._asignar(datos, meta["orden_item_no"], version, "archivo")
+        return True
+
+    def _vigentes(
+        self, verificar: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray, Dict[int, Tarifa]]:
+        with self._lock:
+            if self.datos is not None and not self._version.cambio(verificar):
+                return self.datos, self._orden_item_no, self._tarifas
+            probar_archivo, self._probar_archivo = self._probar_archivo, False
+
+        # La exportación solo sirve para el primer arranque
+        ruta = self.ruta or getattr(settings, "PARTIDA_TARIFAS_PATH", None)
+        if not (probar_archivo and ruta and self.cargar_archivo(ruta)):
+            self.cargar_bd()
+        with self._lock:
+            return self.datos, self._orden_item_no, self._tarifas
+
+    # Consultas
+
+    def buscar(self, pks: Iterable[int]) -> Dict[int, np.void]:
+        """Filas por id (vistas sobre el arreglo); los ids ausentes se omiten."""
+        datos, _, _ = self._vigentes()
+        pks = np.fromiter(pks, dtype=np.int64)
+        posiciones = np.searchsorted(datos["id"], pks)
+        encontradas = {}
+        for pk, posicion in zip(pks.tolist(), posiciones.tolist()):
+            if posicion < len(datos) and datos["id"][posicion] == pk:
+                encontradas[pk] = datos[posicion]
+        return encontradas
+
+    def por_item_no(self, item_no: str) -> Optional[np.void]:
+        """Fila de ``item_no`` (la de menor id si está repetido)."""
+        datos, orden, _ = self._vigentes()
+        posicion = int(np.searchsorted(datos["item_no"], item_no, sorter=orden))
+        if posicion < len(orden):
+            fila = datos[orden[posicion]]
+            if fila["item_no"] == item_no:
+                return fila
+        return None
+
+    def tarifas(self, pks: Iterable[int], verificar: bool = False) -> Dict[int, Tarifa]:
+        """
+        ``Tarifa`` por id. Cada una se crea una vez por versión de la tabla;
+        los ids que la tabla aún no tiene se leen de la base en una consulta.
+        Con ``verificar`` la versión se compara con la base sin esperar el
+        intervalo (lo que se guarda no puede salir de una tabla vencida).
+        """
+        pks = set(pks)
+        datos, _, registro = self._vigentes(verificar)
+        encontradas = {pk: registro[pk] for pk in pks if pk in registro}
+        pendientes = pks - set(encontradas)
+        if pendientes:
+            filas = self.buscar(pendientes)
+            ausentes = pendientes - set(filas)
+            if ausentes:
+                filas.update((int(f["id"]), f) for f in self.leer_bd(ausentes))
+            for pk, fila in filas.items():
+                encontradas[pk] = registro[pk] = Tarifa.de_fila(fila)
+        return encontradas
+
+    def tarifa(self, pk: Optional[int], verificar: bool = False) -> Optional[Tarifa]:
+        if pk is None:
+            return None
+        return self.tarifas([pk], verificar).get(pk)
+
+    # Invalidación
+
+    def invalidar(self) -> None:
+        """Descarta la tabla local; la siguiente lectura recarga desde la BD."""
+        with self._lock:
+            self.datos = None
+            self._orden_item_no = None
+            self._tarifas = {}
+            self._version.olvidar()
+
+    def reiniciar(self) -> None:
+        """Como recién creada: la siguiente lectura vuelve a probar la exportación."""
+        self.invalidar()
+        with self._lock:
+            self._probar_archivo = True
+
+    def on_partida_cambiada(self) -> None:
+        # Los demás workers lo ven por la versión de la base
+        self.invalidar()
+        transaction.on_commit(self.invalidar)
+
+
+tabla_tarifas = TablaTarifas()
@@ -0,0 +1,254 @@
+"""
+Totales de una cotización calculados en la base de datos.
+
+``agregar_articulos`` obtiene en una sola consulta ``aggregate()`` el volumen,
+el peso, el valor y cada suma de impuestos de los artículos de una
+cotización. ``Envio.save``, ``Factura.save`` y ``actualizar_cotizacion`` usan
+estos totales en lugar de recorrer los artículos en Python una vez por
+total. Las sumas de ``Decimal`` en PostgreSQL son exactas, así que los
+resultados coinciden con los de las sumas en Python.
+
+Los totales guardados en ``Cotizacion`` (subtotal, impuestos, peso, volumen,
+flete y total estimado) se mantienen de forma incremental: ``Articulo`` aplica
+con ``aplicar_delta`` la diferencia de su aporte al crearse, modificarse o
+borrarse, dentro de la misma transacción. ``recalcular_totales`` los vuelve a
+calcular desde los artículos (comando ``recompute_cotizacion_totals``).
+"""
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import NamedTuple, Optional
+
+from django.core.exceptions import ValidationError
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Round
+
+from .parametros import parametros_cache
+
+# Factor de volumen estándar en pulgadas cúbicas por libra
+FACTOR_VOL = 166
+
+CERO = Decimal("0")
+
+
+def obtener_costo_flete_por_lb() -> Decimal:
+    costo_any = parametros_cache.get("Costo Flete por Libra en USD$")
+    if costo_any is None:
+        raise ValidationError(
+            "El parámetro 'Costo Flete por Libra en USD$' no está definido."
+        )
+    try:
+        return Decimal(str(costo_any))
+    except Exception:
+        raise ValidationError(
+            "El parámetro 'Costo Flete por Libra en USD$' no es convertible a Decimal."
+        )
+
+
+@dataclass(frozen=True)
+class TotalesCotizacion:
+    cantidad_articulos: int
+    volumen_total: Decimal
+    peso_total: Decimal
+    subtotal_articulos: Decimal
+    total_impuesto_dai: Decimal
+    total_impuesto_isc: Decimal
+    total_impuesto_ispc: Decimal
+    total_impuesto_isv: Decimal
+    total_impuesto: Decimal
+
+    @property
+    def peso_volumetrico_total(self) -> Decimal:
+        return self.volumen_total / FACTOR_VOL
+
+    @property
+    def peso_a_usar(self) -> Decimal:
+        """El mayor entre el peso real y el volumétrico de todo el envío."""
+        return max(self.peso_total, self.peso_volumetrico_total)
+
+    def flete(self, costo_por_libra: Decimal) -> Decimal:
+        return self.peso_a_usar * costo_por_libra
+
+
+def _suma(expresion) -> Coalesce:
+    return Coalesce(
+        Sum(expresion, output_field=DecimalField()),
+        Value(CERO),
+        output_field=DecimalField(),
+    )
+
+
+def agregar_articulos(articulos: QuerySet) -> TotalesCotizacion:
+    """Totales de un queryset de ``Articulo`` con una sola consulta."""
+    return TotalesCotizacion(
+        **articulos.order_by().aggregate(
+            cantidad_articulos=Count("id"),
+            volumen_total=_suma(F("largo") * F("ancho") * F("alto")),
+            peso_total=_suma("peso"),
+            subtotal_articulos=_suma("valor_articulo"),
+            total_impuesto_dai=_suma("impuesto_dai"),
+            total_impuesto_isc=_suma("impuesto_isc"),
+            total_impuesto_ispc=_suma("impuesto_ispc"),
+            total_impuesto_isv=_suma("impuesto_isv"),
+            total_impuesto=_suma("impuesto_total"),
+        )
+    )
+
+
+def totales_cotizacion(cotizacion) -> TotalesCotizacion:
+    return agregar_articulos(cotizacion.articulos.all())
+
+
+def redondear_como_bd(valor, decimales: int = 2) -> Decimal:
+    """Valor tal como lo guarda una columna ``numeric(_, decimales)``."""
+    return Decimal(valor).quantize(
+        Decimal(1).scaleb(-decimales), rounding=ROUND_HALF_UP
+    )
+
+
+class Contribucion(NamedTuple):
+    """Lo que un artículo aporta a los totales guardados de su cotización."""
+
+    subtotal: Decimal
+    impuestos: Decimal
+    peso: Decimal
+    volumen: Decimal
+
+    @classmethod
+    def de_valores(
+        cls, valor_articulo, impuesto_total, peso, largo, ancho, alto
+    ) -> "Contribucion":
+        # Redondeados como en sus columnas, para que la suma de deltas
+        # coincida con la suma de los valores guardados
+        largo, ancho, alto = (redondear_como_bd(v) for v in (largo, ancho, alto))
+        return cls(
+            redondear_como_bd(valor_articulo),
+            redondear_como_bd(impuesto_total or CERO),
+            redondear_como_bd(peso),
+            largo * ancho * alto,
+        )
+
+    def menos(self, otra: "Contribucion") -> "Contribucion":
+        return Contribucion(*(a - b for a, b in zip(self, otra)))
+
+    def es_cero(self) -> bool:
+        return not any(self)
+
+
+CONTRIBUCION_CERO = Contribucion(CERO, CERO, CERO, CERO)
+
+# Campos de Cotizacion mantenidos a partir de sus artículos
+CAMPOS_TOTALES = (
+    "subtotal_articulos",
+    "total_impuestos",
+    "peso_total",
+    "volumen_total",
+    "total_flete",
+    "total_estimado",
+)
+
+
+def _expresion_flete(peso, volumen, costo: Decimal):
+    peso_a_usar = Greatest(
+        peso, volumen / Value(Decimal(FACTOR_VOL)), output_field=DecimalField()
+    )
+    return Round(
+        peso_a_usar * Value(costo, output_field=DecimalField()),
+        2,
+        output_field=DecimalField(),
+    )
+
+
+def _valores_totales(subtotal, impuestos, peso, volumen, costo: Decimal):
+    flete = _expresion_flete(peso, volumen, costo)
+    return {
+        "subtotal_articulos": subtotal,
+        "total_impuestos": impuestos,
+        "peso_total": peso,
+        "volumen_total": volumen,
+        "total_flete": flete,
+        "total_estimado": subtotal + impuestos + flete,
+    }
+
+
+def aplicar_delta(
+    cotizaciones: QuerySet, delta: Contribucion, costo: Optional[Decimal] = None
+) -> int:
+    """
+    Suma ``delta`` a los totales guardados con un solo ``UPDATE`` atómico
+    (las expresiones usan los valores actuales de la fila) y recalcula el
+    flete y el total estimado con los nuevos peso y volumen.
+    """
+    if costo is None:
+        costo = obtener_costo_flete_por_lb()
+    return cotizaciones.update(
+        **_valores_totales(
+            F("subtotal_articulos") + Value(delta.subtotal),
+            F("total_impuestos") + Value(delta.impuestos),
+            F("peso_total") + Value(delta.peso),
+            F("volumen_total") + Value(delta.volumen),
+            costo,
+        )
+    )
+
+
+def expresiones_recalculo(cotizaciones: QuerySet, costo: Decimal) -> dict:
+    """Totales calculados desde los artículos con subconsultas correlacionadas."""
+    Articulo = cotizaciones.model._meta.get_field("articulos").related_model
+
+    def suma(expresion):
+        subconsulta = (
+            Articulo.objects.filter(cotizacion=OuterRef("pk"))
+            .order_by()
+            .values("cotizacion")
+            .annotate(total=Sum(expresion, output_field=DecimalField()))
+            .values("total")
+        )
+        return Coalesce(Subquery(subconsulta), Value(CERO), output_field=DecimalField())
+
+    return _valores_totales(
+        suma("valor_articulo"),
+        suma("impuesto_total"),
+        suma("peso"),
+        suma(F("largo") * F("ancho") * F("alto")),
+        costo,
+    )
+
+
+def filtro_desviacion(cotizaciones: QuerySet, costo: Decimal) -> QuerySet:
+    """Cotizaciones cuyos totales guardados no coinciden con sus artículos."""
+    anotaciones = {
+        f"calculado_{campo}": expresion
+        for campo, expresion in expresiones_recalculo(cotizaciones, costo).items()
+    }
+    desviada = Q()
+    for campo in CAMPOS_TOTALES:
+        desviada |= ~Q(**{campo: F(f"calculado_{campo}")})
+    return cotizaciones.annotate(**anotaciones).filter(desviada)
+
+
+def recalcular_totales(cotizaciones: QuerySet, costo: Optional[Decimal] = None) -> int:
+    """Recalcula los totales guardados de ``cotizaciones`` con un solo ``UPDATE``."""
+    if costo is None:
+        costo = obtener_costo_flete_por_lb()
+    return cotizaciones.update(**expresiones_recalculo(cotizaciones, costo))
+
+
+def actualizar_totales(cotizacion) -> TotalesCotizacion:
+    """
+    Recalcula y guarda los totales de una cotización a partir de sus
+    artículos; devuelve el agregado de sus artículos.
+    """
+    recalcular_totales(type(cotizacion).objects.filter(pk=cotizacion.pk))
+    cotizacion.refresh_from_db(fields=CAMPOS_TOTALES)
+    return totales_cotizacion(cotizacion)
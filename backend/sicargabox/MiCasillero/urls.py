@@ -212,10 +212,26 @@ urlpatterns = (
         views.partida_arancelaria_autocomplete,
         name="partida_arancelaria_autocomplete",
     ),
+    path(
+        "partidas/autocomplete/",
+        views.partidas_autocomplete,
+        name="partidas_autocomplete",
+    ),
     path("cotizador/", views.cotizador_view, name="cotizador"),
     path("cotizar/", views.cotizar, name="cotizar"),
     path("cotizar-json/", views.cotizar_json, name="cotizar_json"),
+    path("cotizar-batch/", views.cotizar_batch, name="cotizar_batch"),
     path("buscar-partidas/", views.buscar_partidas, name="buscar_partidas"),
+    path(
+        "buscar-partidas/cache/",
+        views.buscar_partidas_cache_stats,
+        name="buscar_partidas_cache_stats",
+    ),
+    path(
+        "cotizar-json/cache/",
+        views.cotizar_json_cache_stats,
+        name="cotizar_json_cache_stats",
+    ),
     path("accept-quote/", views.accept_quote, name="accept_quote"),
     path(
         "htmx/Alerta/",
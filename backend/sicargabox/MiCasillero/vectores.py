@@ -0,0 +1,350 @@
+"""
+Búsqueda semántica de partidas sobre ``PartidaArancelariaEmbedding``.
+
+Los embeddings (1536 floats por fila en un JSONField) se cargan en una matriz
+NumPy ``float32`` contigua con las filas normalizadas, de modo que una
+consulta top-k por similitud coseno es un producto matriz-vector más un
+``argpartition`` (milisegundos para todo el arancel).
+
+La matriz puede exportarse a un ``.npy`` (``export_partida_vectors``) que se
+abre con ``mmap_mode="r"``: varios workers comparten las mismas páginas y el
+arranque no tiene que decodificar el JSON. Después de cargar, el índice se
+actualiza de forma incremental con el campo ``version``: se leen solo los
+pares ``(partida_id, version)`` y se piden los vectores de las filas nuevas o
+cuya versión cambió; las borradas se marcan como inactivas.
+
+``buscar_partidas_semantico`` y ``buscar_partidas_hibrido`` son los modos
+``semantico`` e ``hibrido`` de la vista ``buscar_partidas``.
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+from django.conf import settings
+
+from .busqueda import buscar_partidas_texto, resultados_partidas
+from .llm_keywords import API_KEY_ENV, BASE_URLS
+from .models import PartidaArancelariaEmbedding
+
+logger = logging.getLogger(__name__)
+
+MODELO_POR_DEFECTO = "text-embedding-3-small"
+
+# Segundos entre comprobaciones de versiones nuevas en la base de datos
+REFRESH_INTERVAL = 30.0
+
+# Vectores pedidos por consulta al refrescar
+LOTE_REFRESCO = 500
+
+# Se compacta la matriz cuando las filas inactivas superan esta fracción
+FRACCION_COMPACTAR = 0.25
+
+# Peso del coseno frente a la relevancia de texto en el modo híbrido
+PESO_SEMANTICO = 0.6
+
+CANDIDATOS_HIBRIDO = 50
+
+
+class EmbeddingNoDisponible(Exception):
+    """No se pudo obtener el embedding de la consulta."""
+
+
+def _normalizar(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1
+    return matriz / normas
+
+
+class IndiceVectorial:
+    """Matriz de embeddings normalizados con sus ids de partida y versiones."""
+
+    def __init__(
+        self,
+        modelo: str = MODELO_POR_DEFECTO,
+        intervalo: float = REFRESH_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.modelo = modelo
+        self.intervalo = intervalo
+        self.clock = clock
+        self._lock = threading.RLock()
+        self.dimension: Optional[int] = None
+        self.matriz = np.empty((0, 0), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.activos = np.empty(0, dtype=bool)
+        self.n = 0
+        self.filas: Dict[int, int] = {}
+        self.versiones: Dict[int, int] = {}
+        self._ultimo_refresco: Optional[float] = None
+
+    def __len__(self):
+        return len(self.filas)
+
+    # Carga y exportación
+
+    @staticmethod
+    def rutas(ruta) -> Tuple[Path, Path]:
+        ruta = Path(ruta)
+        base = ruta.with_suffix("") if ruta.suffix in (".npy", ".npz") else ruta
+        return base.with_suffix(".npy"), base.with_name(base.name + ".meta.npz")
+
+    def exportar(self, ruta) -> Path:
+        """Escribe la matriz compacta (``.npy``) y sus ids/versiones (``.meta.npz``)."""
+        ruta_matriz, ruta_meta = self.rutas(ruta)
+        ruta_matriz.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            activos = self.activos[: self.n]
+            ids = self.ids[: self.n][activos]
+            np.save(ruta_matriz, np.ascontiguousarray(self.matriz[: self.n][activos]))
+            np.savez(
+                ruta_meta,
+                ids=ids,
+                versiones=np.array([self.versiones[i] for i in ids], dtype=np.int64),
+                modelo=np.array(self.modelo),
+            )
+        return ruta_matriz
+
+    def cargar_archivo(self, ruta) -> bool:
+        """
+        Abre una matriz exportada con ``mmap_mode="r"``; las filas se copian a
+        memoria solo si un refresco necesita modificarlas.
+        """
+        ruta_matriz, ruta_meta = self.rutas(ruta)
+        if not ruta_matriz.exists() or not ruta_meta.exists():
+            return False
+        meta = np.load(ruta_meta)
+        if str(meta["modelo"]) != self.modelo:
+            logger.warning(
+                f"{ruta_matriz} es del modelo {meta['modelo']}, no de {self.modelo}"
+            )
+            return False
+        matriz = np.load(ruta_matriz, mmap_mode="r")
+        ids = meta["ids"].astype(np.int64)
+        with self._lock:
+            self.matriz = matriz
+            self.dimension = matriz.shape[1] if matriz.ndim == 2 else None
+            self.ids = ids
+            self.activos = np.ones(len(ids), dtype=bool)
+            self.n = len(ids)
+            self.filas = {int(pid): fila for fila, pid in enumerate(ids)}
+            self.versiones = {
+                int(pid): int(v) for pid, v in zip(ids, meta["versiones"])
+            }
+        return True
+
+    # Refresco incremental
+
+    def refrescar(self, forzar: bool = True) -> Dict[str, int]:
+        """
+        Sincroniza con la base de datos comparando versiones. Con
+        ``forzar=False`` no hace nada si el último refresco fue hace menos de
+        ``intervalo`` segundos.
+        """
+        ahora = self.clock()
+        if (
+            not forzar
+            and self._ultimo_refresco is not None
+            and ahora - self._ultimo_refresco < self.intervalo
+        ):
+            return {"agregados": 0, "actualizados": 0, "eliminados": 0}
+
+        with self._lock:
+            actuales = dict(
+                PartidaArancelariaEmbedding.objects.filter(
+                    embedding_model=self.modelo
+                ).values_list("partida_arancelaria_id", "version")
+            )
+            cambiados = [
+                pid
+                for pid, version in actuales.items()
+                if self.versiones.get(pid) != version
+            ]
+            eliminados = [pid for pid in self.versiones if pid not in actuales]
+            stats = {
+                "agregados": sum(1 for pid in cambiados if pid not in self.filas),
+                "actualizados": sum(1 for pid in cambiados if pid in self.filas),
+                "eliminados": len(eliminados),
+            }
+
+            for pid in eliminados:
+                self._eliminar(pid)
+            for inicio in range(0, len(cambiados), LOTE_REFRESCO):
+                lote = cambiados[inicio : inicio + LOTE_REFRESCO]
+                filas = PartidaArancelariaEmbedding.objects.filter(
+                    embedding_model=self.modelo, partida_arancelaria_id__in=lote
+                ).values_list("partida_arancelaria_id", "version", "embedding_vector")
+                for pid, version, vector in filas:
+                    self._asignar(pid, version, vector)
+
+            if self.n and (self.n - len(self.filas)) > FRACCION_COMPACTAR * self.n:
+                self._compactar()
+            self._ultimo_refresco = ahora
+        if any(stats.values()):
+            logger.info(f"Índice vectorial actualizado: {stats}")
+        return stats
+
+    def _escribible(self):
+        # Una matriz abierta con mmap es de solo lectura: copiarla antes de escribir
+        if not self.matriz.flags.writeable:
+            self.matriz = np.array(self.matriz, dtype=np.float32)
+
+    def _asignar(self, pid: int, version: int, vector: Sequence[float]):
+        fila_vector = np.asarray(vector, dtype=np.float32)
+        if fila_vector.ndim != 1 or not len(fila_vector):
+            logger.warning(f"Embedding inválido para la partida {pid}")
+            return
+        if self.dimension is None:
+            self.dimension = len(fila_vector)
+            self.matriz = np.zeros((0, self.dimension), dtype=np.float32)
+        if len(fila_vector) != self.dimension:
+            logger.warning(
+                f"Embedding de la partida {pid} tiene {len(fila_vector)} "
+                f"dimensiones, se esperaban {self.dimension}"
+            )
+            return
+        self._escribible()
+
+        fila = self.filas.get(pid)
+        if fila is None:
+            if self.n == len(self.matriz):
+                self._crecer(max(16, 2 * self.n))
+            fila = self.n
+            self.n += 1
+            self.ids[fila] = pid
+            self.activos[fila] = True
+            self.filas[pid] = fila
+        self.matriz[fila] = _normalizar(fila_vector)
+        self.versiones[pid] = version
+
+    def _crecer(self, capacidad: int):
+        matriz = np.zeros((capacidad, self.dimension), dtype=np.float32)
+        matriz[: self.n] = self.matriz[: self.n]
+        ids = np.zeros(capacidad, dtype=np.int64)
+        ids[: self.n] = self.ids[: self.n]
+        activos = np.zeros(capacidad, dtype=bool)
+        activos[: self.n] = self.activos[: self.n]
+        self.matriz, self.ids, self.activos = matriz, ids, activos
+
+    def _eliminar(self, pid: int):
+        fila = self.filas.pop(pid, None)
+        self.versiones.pop(pid, None)
+        if fila is not None:
+            self.activos[fila] = False
+
+    def _compactar(self):
+        activos = self.activos[: self.n]
+        self.matriz = np.ascontiguousarray(self.matriz[: self.n][activos])
+        self.ids = self.ids[: self.n][activos].copy()
+        self.n = len(self.ids)
+        self.activos = np.ones(self.n, dtype=bool)
+        self.filas = {int(pid): fila for fila, pid in enumerate(self.ids)}
+
+    # Consulta
+
+    def buscar(self, vector: Sequence[float], k: int = 20) -> List[Tuple[int, float]]:
+        """Top-k ``(partida_id, similitud_coseno)`` ordenado de mayor a menor."""
+        consulta = _normalizar(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            if not self.filas or len(consulta) != self.dimension:
+                return []
+            puntajes = self.matriz[: self.n] @ consulta
+            puntajes[~self.activos[: self.n]] = -np.inf
+            k = min(k, len(self.filas))
+            if k < self.n:
+                candidatos = np.argpartition(-puntajes, k - 1)[:k]
+            else:
+                candidatos = np.arange(self.n)
+            candidatos = candidatos[np.argsort(-puntajes[candidatos], kind="stable")]
+            return [
+                (int(self.ids[i]), float(puntajes[i]))
+                for i in candidatos[:k]
+                if self.activos[i]
+            ]
+
+
+_indice_lock = threading.Lock()
+indice_vectorial: Optional[IndiceVectorial] = None
+
+
+def obtener_indice() -> IndiceVectorial:
+    """
+    Índice del proceso: se abre desde ``PARTIDA_VECTOR_INDEX_PATH`` si existe
+    la exportación y se refresca por versión como máximo cada
+    ``REFRESH_INTERVAL`` segundos.
+    """
+    global indice_vectorial
+    with _indice_lock:
+        if indice_vectorial is None:
+            indice = IndiceVectorial(
+                getattr(settings, "PARTIDA_EMBEDDING_MODEL", MODELO_POR_DEFECTO)
+            )
+            ruta = getattr(settings, "PARTIDA_VECTOR_INDEX_PATH", None)
+            if ruta:
+                indice.cargar_archivo(ruta)
+            indice_vectorial = indice
+    indice_vectorial.refrescar(forzar=False)
+    return indice_vectorial
+
+
+@lru_cache(maxsize=512)
+def _embedding_consulta(texto: str, modelo: str) -> Tuple[float, ...]:
+    api_key = os.getenv(API_KEY_ENV["openai"])
+    if not api_key:
+        raise EmbeddingNoDisponible(f"{API_KEY_ENV['openai']} no está configurada")
+    try:
+        response = httpx.post(
+            f"{BASE_URLS['openai']}/embeddings",
+            json={"model": modelo, "input": texto},
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=10.0,
+        )
+        response.raise_for_status()
+        return tuple(response.json()["data"][0]["embedding"])
+    except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+        raise EmbeddingNoDisponible(str(e))
+
+
+def embed_texto(texto: str, modelo: str = MODELO_POR_DEFECTO) -> Tuple[float, ...]:
+    """Embedding de la consulta (memorizado por texto normalizado y modelo)."""
+    return _embedding_consulta(" ".join(texto.lower().split()), modelo)
+
+
+def buscar_partidas_semantico(q: str, limite: int = 20) -> List[dict]:
+    indice = obtener_indice()
+    vector = embed_texto(q, indice.modelo)
+    return resultados_partidas(indice.buscar(vector, limite))
+
+
+def buscar_partidas_hibrido(q: str, limite: int = 20) -> List[dict]:
+    """
+    Une los candidatos de la búsqueda de texto (``search_vector``) y los de la
+    semántica; cada uno se puntúa con
+    ``PESO_SEMANTICO * coseno + (1 - PESO_SEMANTICO) * rango_texto_normalizado``.
+    """
+    texto = dict(
+        buscar_partidas_texto(q).values_list("id", "rango")[:CANDIDATOS_HIBRIDO]
+    )
+    try:
+        indice = obtener_indice()
+        semantico = dict(
+            indice.buscar(embed_texto(q, indice.modelo), CANDIDATOS_HIBRIDO)
+        )
+    except EmbeddingNoDisponible as e:
+        logger.warning(f"Búsqueda híbrida sin embeddings: {e}")
+        semantico = {}
+
+    maximo_texto = max(texto.values(), default=0) or 1
+    puntajes = {
+        pid: PESO_SEMANTICO * semantico.get(pid, 0.0)
+        + (1 - PESO_SEMANTICO) * (texto.get(pid, 0.0) / maximo_texto)
+        for pid in set(texto) | set(semantico)
+    }
+    mejores = sorted(puntajes.items(), key=lambda par: (-par[1], par[0]))[:limite]
+    return resultados_partidas(mejores)
@@ -0,0 +1,114 @@
+"""
+Versiones por tabla mantenidas por la base de datos.
+
+Los triggers de la migración 0029 incrementan el contador de
+``VersionTabla`` en la misma sentencia que modifica ParametroSistema,
+PartidaArancelaria o ItemPartidaMapping (también con ``QuerySet.update``,
+``bulk_create``/``bulk_update`` o SQL directo). El nuevo valor se hace
+visible para todos los workers exactamente cuando se confirma el cambio y se
+revierte con un rollback, sin depender de que CACHES sea compartido.
+
+Las cachés en proceso (``parametros_cache``, ``tabla_tarifas``,
+``indice_local``, ``indice_mapeos``, ``cache_busqueda``) guardan la versión
+con la que cargaron y la comparan con la de la base cada
+``VERSION_CHECK_INTERVAL`` segundos.
+"""
+
+import time
+from typing import Callable, Optional, Tuple
+
+from django.db import transaction
+
+PARAMETROS = "parametros"
+# Cualquier cambio en las partidas (descripción, keywords, tasas...)
+PARTIDAS = "partidas"
+# Solo las columnas de la tabla de tarifas (MiCasillero.tarifas.CAMPOS)
+TARIFAS = "tarifas"
+MAPEOS = "mapeos"
+
+# Segundos entre consultas a la versión de la base
+VERSION_CHECK_INTERVAL = 5.0
+
+
+def leer_versiones(*tablas: str) -> Tuple[int, ...]:
+    """Versión actual de cada tabla, en una sola consulta (0 si no cambió nunca)."""
+    from .models import VersionTabla
+
+    versiones = dict(
+        VersionTabla.objects.filter(nombre__in=tablas).values_list("nombre", "version")
+    )
+    return tuple(versiones.get(tabla, 0) for tabla in tablas)
+
+
+def en_transaccion(using: Optional[str] = None) -> bool:
+    """
+    True dentro de un ``transaction.atomic`` de la aplicación; no cuenta el
+    bloque con el que los tests envuelven cada caso.
+    """
+    conexion = transaction.get_connection(using)
+    return any(
+        not getattr(bloque, "_from_testcase", False)
+        for bloque in conexion.atomic_blocks
+    )
+
+
+class VersionBD:
+    """
+    Versión de ``tablas`` con la que cargó una caché. No es thread-safe: la
+    usa la caché bajo su propio lock.
+    """
+
+    def __init__(
+        self,
+        *tablas: str,
+        check_interval: float = VERSION_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.tablas = tablas
+        self.check_interval = check_interval
+        self.clock = clock
+        self.version: Optional[Tuple[int, ...]] = None
+        self._verificada: Optional[float] = None
+        # Versión distinta encontrada por ``cambio``, para la carga que sigue
+        self._nueva: Optional[Tuple[int, ...]] = None
+
+    def leer(self) -> Tuple[int, ...]:
+        """Versión para la carga que sigue; se lee antes que los datos."""
+        version, self._nueva = self._nueva, None
+        return version if version is not None else leer_versiones(*self.tablas)
+
+    def _marcar_verificada(self) -> None:
+        # Lo leído dentro de una transacción puede revertirse: se vuelve a
+        # comparar en la siguiente lectura en lugar de esperar el intervalo
+        self._verificada = None if en_transaccion() else self.clock()
+
+    def registrar(self, version: Tuple[int, ...]) -> None:
+        """Versión leída (con ``leer``) antes de cargar los datos."""
+        self.version = version
+        self._marcar_verificada()
+
+    def cambio(self, forzar: bool = False) -> bool:
+        """
+        True si no hay versión registrada o la de la base ya es otra. Consulta
+        la base como mucho cada ``check_interval`` segundos, o siempre con
+        ``forzar``.
+        """
+        if self.version is None:
+            return True
+        if (
+            not forzar
+            and self._verificada is not None
+            and self.clock() - self._verificada < self.check_interval
+        ):
+            return False
+        version = leer_versiones(*self.tablas)
+        if version != self.version:
+            self._nueva = version
+            return True
+        self._marcar_verificada()
+        return False
+
+    def olvidar(self) -> None:
+        self.version = None
+        self._verificada = None
+        self._nueva = None
@@ -1,21 +1,37 @@
 import json
+from decimal import Decimal
 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm as LoginForm
 from django.contrib.auth.forms import UserCreationForm as UserRegisterForm
 from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    set_response_etag,
+)
 from django.views import generic
 from django.views.decorators.csrf import csrf_exempt
-from elasticsearch_dsl import Q as ES_Q
 from guardian.decorators import permission_required_or_403
 from guardian.mixins import PermissionRequiredMixin
-from guardian.shortcuts import assign_perm
 
-from .documents import PartidaArancelariaDocument
+from .busqueda import (
+    AUTOCOMPLETE_LIMITE_MAXIMO,
+    AUTOCOMPLETE_LIMITE_POR_DEFECTO,
+    CursorInvalido,
+    autocomplete_partidas,
+    buscar_partidas_texto,
+    conteo_por_categoria,
+)
+from .cache_busqueda import cache_busqueda, clave_consulta
+from .cache_cotizaciones import clave_cotizacion, memo_cotizaciones, peso_en_libras
+from .cotizador import cotizar_lote
 from .forms import (
     AlertaForm,
     ArticuloForm,
@@ -36,6 +52,13 @@ from .models import (
     ParametroSistema,
     PartidaArancelaria,
 )
+from .ranking import ESTADOS_COMPLETOS, buscar_partidas_elasticsearch, rankear_partidas
+from .totales import actualizar_totales
+from .vectores import (
+    EmbeddingNoDisponible,
+    buscar_partidas_hibrido,
+    buscar_partidas_semantico,
+)
 
 
 def home(request):
@@ -119,15 +142,13 @@ def create_cotizacion(request):
     cliente = request.user.cliente
     if request.method == "POST":
         cotizacion = Cotizacion.objects.create(cliente=cliente)
-        assign_perm("change_cotizacion", request.user, cotizacion)
-        assign_perm("delete_cotizacion", request.user, cotizacion)
-        assign_perm("view_cotizacion", request.user, cotizacion)
         return redirect("add_articulo", cotizacion_id=cotizacion.id)
     return render(request, "create_cotizacion.html")
 
 
 def actualizar_cotizacion(cotizacion):
-    pass
+    """Recalcula los totales guardados de la cotización a partir de sus artículos."""
+    return actualizar_totales(cotizacion)
 
 
 def formatear_numero(valor, decimales=2, dolar=False, porcentaje=False):
@@ -146,6 +167,8 @@ def cotizar(request):
         if form.is_valid():
             articulo = form.save(commit=False)
             articulo.calcular_impuestos()
+            # Tasas y códigos de la tabla de tarifas en memoria
+            tarifa = articulo.tarifa
             valor_cif = articulo.valor_articulo + articulo.costo_transporte
 
             cargos_totales = articulo.impuesto_total + articulo.costo_transporte
@@ -194,20 +217,20 @@ def cotizar(request):
                 "cargos_totales": cargos_totales,
                 "total_incluido_valor": total_incluido_valor,
                 "porcentaje_dai": formatear_numero(
-                    articulo.porcentaje_dai, 2, False, True
+                    tarifa.porcentaje_dai, 2, False, True
                 ),
                 "porcentaje_isc": formatear_numero(
-                    articulo.porcentaje_isc, 2, False, True
+                    tarifa.porcentaje_isc, 2, False, True
                 ),
                 "porcentaje_ispc": formatear_numero(
-                    articulo.porcentaje_ispc, 2, False, True
+                    tarifa.porcentaje_ispc, 2, False, True
                 ),
                 "porcentaje_isv": formatear_numero(
-                    articulo.porcentaje_isv, 2, False, True
+                    tarifa.porcentaje_isv, 2, False, True
                 ),
-                "partida_item_no": articulo.partida_item_no,
+                "partida_item_no": tarifa.item_no,
                 "partida_descripcion": articulo.partida_arancelaria,
-                "partida_arancelaria_numero": articulo.partida_numero,
+                "partida_arancelaria_numero": tarifa.partida_arancelaria,
                 "descripcion_original": articulo.descripcion_original,
                 "articulo": articulo,
                 "is_authenticated": request.user.is_authenticated,
@@ -220,22 +243,57 @@ def cotizar(request):
         return render(request, "partials/noget-error.html", {"error": error})
 
 
+def respuesta_cotizacion(request, data, response_data, quote_data):
+    """
+    Respuesta de ``cotizar_json`` para ``data``: los campos que dependen solo
+    de la solicitud (peso y unidad enviados, descripción) se copian sobre la
+    cotización, que puede venir del memo.
+    """
+    campo = ArticuloForm.base_fields["descripcion_original"]
+    descripcion = campo.clean(data.get("descripcion_original", ""))
+    unidad_peso = data.get("unidad_peso", "lb")
+
+    request.session["current_quote"] = dict(
+        quote_data, unidad_peso=unidad_peso, descripcion_original=descripcion
+    )
+    request.session.modified = True
+    return JsonResponse(
+        dict(
+            response_data,
+            data=dict(
+                response_data["data"],
+                peso_original=float(data.get("peso")),
+                unidad_peso=unidad_peso,
+                descripcion_original=descripcion,
+            ),
+        )
+    )
+
+
 @csrf_exempt
 def cotizar_json(request):
     """
     JSON API endpoint for quote calculation (for Next.js frontend)
+
+    Identical quotes are answered from ``memo_cotizaciones``; the ``X-Cache``
+    header says HIT or MISS.
     """
     if request.method == "POST":
         try:
             # Parse JSON body
             data = json.loads(request.body)
 
-            # Convert peso to lbs if unit is kg
-            peso = data.get("peso")
+            # Same quote already answered by this worker
+            clave = clave_cotizacion(data)
+            memorizada = memo_cotizaciones.get(clave) if clave else None
+            if memorizada is not None:
+                response = respuesta_cotizacion(request, data, *memorizada)
+                response["X-Cache"] = "HIT"
+                return response
+
+            # Convert peso to lbs if unit is kg (1 kg = 2.20462 lbs)
+            peso = peso_en_libras(data)
             unidad_peso = data.get("unidad_peso", "lb")
-            if unidad_peso == "kg":
-                # Convert kg to lbs (1 kg = 2.20462 lbs)
-                peso = round(float(peso) * 2.20462, 2)
 
             # Create form data with defaults for optional fields
             form_data = {
@@ -254,6 +312,7 @@ def cotizar_json(request):
             if form.is_valid():
                 articulo = form.save(commit=False)
                 articulo.calcular_impuestos()
+                tarifa = articulo.tarifa
 
                 valor_cif = articulo.valor_articulo + articulo.costo_transporte
                 cargos_totales = articulo.impuesto_total + articulo.costo_transporte
@@ -283,8 +342,6 @@ def cotizar_json(request):
                     "costo_transporte": float(articulo.costo_transporte),
                     "total": float(total_incluido_valor),
                 }
-                request.session["current_quote"] = quote_data
-                request.session.modified = True
 
                 # Return JSON response
                 response_data = {
@@ -314,17 +371,24 @@ def cotizar_json(request):
                         "costo_transporte": float(articulo.costo_transporte),
                         "cargos_totales": float(cargos_totales),
                         "total_incluido_valor": float(total_incluido_valor),
-                        "porcentaje_dai": str(articulo.porcentaje_dai),
-                        "porcentaje_isc": str(articulo.porcentaje_isc),
-                        "porcentaje_ispc": str(articulo.porcentaje_ispc),
-                        "porcentaje_isv": str(articulo.porcentaje_isv),
-                        "partida_item_no": articulo.partida_item_no,
+                        "porcentaje_dai": str(tarifa.porcentaje_dai),
+                        "porcentaje_isc": str(tarifa.porcentaje_isc),
+                        "porcentaje_ispc": str(tarifa.porcentaje_ispc),
+                        "porcentaje_isv": str(tarifa.porcentaje_isv),
+                        "partida_item_no": tarifa.item_no,
                         "partida_descripcion": str(articulo.partida_arancelaria),
-                        "partida_arancelaria_numero": articulo.partida_numero,
+                        "partida_arancelaria_numero": tarifa.partida_arancelaria,
                         "descripcion_original": articulo.descripcion_original,
                     },
                 }
-                return JsonResponse(response_data)
+                if clave:
+                    memo_cotizaciones.set(clave, (response_data, quote_data))
+                response = respuesta_cotizacion(
+                    request, data, response_data, quote_data
+                )
+                if clave:
+                    response["X-Cache"] = "MISS"
+                return response
             else:
                 return JsonResponse(
                     {"success": False, "errors": form.errors}, status=400
@@ -340,6 +404,81 @@ def cotizar_json(request):
         )
 
 
+# Máximo de líneas aceptadas por solicitud en cotizar_batch
+MAX_LINEAS_LOTE = 1000
+
+
+@csrf_exempt
+def cotizar_batch(request):
+    """
+    JSON API endpoint for quoting many articles at once (reseller invoices).
+
+    Expects ``{"articulos": [{"valor", "peso", "unidad_peso", "largo", "ancho",
+    "alto", "partida_arancelaria", "descripcion_original"}, ...]}``.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"success": False, "error": "Only POST method allowed"}, status=405
+        )
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
+
+    lineas = data.get("articulos") if isinstance(data, dict) else None
+    if not isinstance(lineas, list) or not lineas:
+        return JsonResponse(
+            {"success": False, "error": "Se requiere una lista 'articulos'"},
+            status=400,
+        )
+    if len(lineas) > MAX_LINEAS_LOTE:
+        return JsonResponse(
+            {
+                "success": False,
+                "error": f"Máximo {MAX_LINEAS_LOTE} artículos por solicitud",
+            },
+            status=400,
+        )
+
+    try:
+        resultado = cotizar_lote(lineas)
+    except ValidationError as e:
+        errores = e.message_dict if hasattr(e, "error_dict") else e.messages
+        return JsonResponse({"success": False, "errors": errores}, status=400)
+    except Exception as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=500)
+
+    articulos = []
+    for articulo in resultado["articulos"]:
+        fila = {}
+        for clave, valor in articulo.items():
+            if clave.startswith("porcentaje_"):
+                fila[clave] = str(valor)
+            elif isinstance(valor, Decimal):
+                fila[clave] = float(valor)
+            else:
+                fila[clave] = valor
+        articulos.append(fila)
+
+    totales = {
+        clave: float(valor) if isinstance(valor, Decimal) else valor
+        for clave, valor in resultado["totales"].items()
+    }
+
+    return JsonResponse(
+        {
+            "success": True,
+            "data": {
+                "costo_por_libra": str(resultado["costo_por_libra"]),
+                "factor_volumetrico": float(resultado["factor_volumetrico"]),
+                "articulos": articulos,
+                "totales": totales,
+            },
+        }
+    )
+
+
 @login_required
 @permission_required_or_403("change_cotizacion", (Cotizacion, "id", "cotizacion_id"))
 def add_articulo(request, cotizacion_id):
@@ -396,54 +535,28 @@ def view_cotizacion(request, cotizacion_id):
 def partida_arancelaria_autocomplete(request):
     if "q" in request.GET:
         q = request.GET["q"]
-        partidas = PartidaArancelaria.objects.filter(descripcion__icontains=q).order_by(
-            "descripcion"
-        )
-        results = [{"id": partida.id, "text": partida} for partida in partidas]
+        try:
+            limite = int(request.GET.get("limit", AUTOCOMPLETE_LIMITE_POR_DEFECTO))
+        except ValueError:
+            limite = AUTOCOMPLETE_LIMITE_POR_DEFECTO
+        limite = max(1, min(limite, AUTOCOMPLETE_LIMITE_MAXIMO))
+        partidas = buscar_partidas_texto(q)[:limite]
+        results = [{"id": partida.id, "text": str(partida)} for partida in partidas]
         return JsonResponse({"results": results})
     return JsonResponse({"results": []})
 
 
 def cotizador_view(request):
-    # Filtrar partidas arancelarias permitidas
-    partidas = PartidaArancelaria.objects.filter(courier_category="ALLOWED").order_by(
-        "descripcion"
-    )
-
-    # Crear el formulario con las partidas filtradas
-    form = ArticuloForm()
-    form.fields["partida_arancelaria"].queryset = partidas
-
-    # Agregar información de contexto
-    context = {
-        "form": form,
-        "total_partidas": partidas.count(),
-        "total_restricted": PartidaArancelaria.objects.filter(
-            courier_category="RESTRICTED"
-        ).count(),
-        "total_prohibited": PartidaArancelaria.objects.filter(
-            courier_category="PROHIBITED"
-        ).count(),
-    }
+    # Las opciones de partida se cargan bajo demanda desde partidas_autocomplete
+    form = ArticuloForm(autocomplete=True)
 
-    # Preparar datos para el select2
-    partidas_data = []
-    for p in partidas:
-        partidas_data.append(
-            {
-                "id": p.id,
-                "codigo": p.item_no,
-                "descripcion": p.descripcion,
-                "keywords": p.search_keywords,
-                "search_text": f"{p.item_no} {p.descripcion} {' '.join(p.search_keywords if p.search_keywords else [])}",
-            }
-        )
+    # Totales por categoría en una sola consulta
+    context = {"form": form, **conteo_por_categoria()}
 
-    # Modificar las opciones del select para incluir los datos de búsqueda
     form.fields["partida_arancelaria"].widget.attrs.update(
         {
             "class": "select2",
-            "data-partidas": json.dumps(partidas_data),
+            "data-autocomplete-url": reverse("partidas_autocomplete"),
             "placeholder": "Busque o seleccione una partida arancelaria",
             "aria-label": "Seleccione la partida arancelaria que mejor corresponda a su producto",
         }
@@ -460,57 +573,124 @@ def cotizador_view(request):
     return render(request, "cotizador.html", context)
 
 
+# Segundos que el navegador puede reutilizar una página de autocompletado
+AUTOCOMPLETE_MAX_AGE = 300
+
+
+def partidas_autocomplete(request):
+    """
+    Autocompletado paginado por cursor de partidas permitidas.
+
+    Parámetros: ``q`` (código o texto, mínimo 2 caracteres), ``cursor`` (valor
+    ``next`` de la página anterior) y ``limit``. Responde con ``ETag`` para que
+    las búsquedas repetidas se resuelvan con ``304 Not Modified``.
+    """
+    q = request.GET.get("q", "").strip()
+    try:
+        limite = int(request.GET.get("limit", AUTOCOMPLETE_LIMITE_POR_DEFECTO))
+    except ValueError:
+        return JsonResponse({"error": "limit debe ser un entero"}, status=400)
+
+    if len(q) < 2:
+        pagina = {"results": [], "next": None}
+    else:
+        try:
+            pagina = autocomplete_partidas(
+                q, cursor=request.GET.get("cursor"), limite=limite
+            )
+        except CursorInvalido as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    response = JsonResponse(pagina)
+    patch_cache_control(response, public=True, max_age=AUTOCOMPLETE_MAX_AGE)
+    set_response_etag(response)
+    return get_conditional_response(
+        request, etag=response.headers["ETag"], response=response
+    )
+
+
+MODOS_BUSQUEDA = ("fusion", "texto", "semantico", "hibrido")
+
+# Modos cuyos resultados se guardan en cache_busqueda
+MODOS_CACHEADOS = ("fusion", "texto")
+
+
 def buscar_partidas(request):
-    """Vista para búsqueda de partidas usando Elasticsearch"""
+    """
+    Vista para búsqueda de partidas.
+
+    Por defecto (``modo=fusion``) fusiona Elasticsearch, la búsqueda de texto
+    de PostgreSQL y el historial de ``ItemPartidaMapping`` (ver
+    ``ranking.rankear_partidas``). ``modo=texto`` usa solo Elasticsearch,
+    ``modo=semantico`` busca por similitud de embeddings y ``modo=hibrido``
+    combina la similitud con la relevancia de texto de PostgreSQL. Si
+    Elasticsearch no está disponible, ``fusion`` y ``texto`` usan el índice
+    local en memoria (``indice_local``).
+
+    Los resultados de ``fusion`` y ``texto`` se guardan en ``cache_busqueda``
+    por consulta normalizada; la cabecera ``X-Cache`` indica HIT o MISS.
+    """
     q = request.GET.get("q", "")
+    modo = request.GET.get("modo", "fusion")
     results = []
 
-    if len(q) >= 3:  # Mínimo 3 caracteres para buscar
-        try:
-            # Construir la consulta Elasticsearch
-            search = PartidaArancelariaDocument.search()
-
-            # Usar multi_match para buscar en campos relevantes con fuzziness
-            query = ES_Q(
-                "multi_match",
-                query=q,
-                fields=[
-                    "item_no^3",  # Dar más peso al código
-                    "descripcion^2",  # Peso medio a la descripción
-                    "full_text_search",  # Búsqueda general en texto combinado
-                    "search_keywords",  # Búsqueda en keywords
-                ],
-                fuzziness="AUTO",  # Permitir errores tipográficos
-            )
+    if modo not in MODOS_BUSQUEDA:
+        return JsonResponse(
+            {"error": f"modo debe ser uno de: {', '.join(MODOS_BUSQUEDA)}"},
+            status=400,
+        )
 
-            search = search.query(query)
+    clave = None
+    if len(q) >= 3 and modo in MODOS_CACHEADOS:
+        clave = clave_consulta(modo, q)
+        cacheados = cache_busqueda.get(clave)
+        if cacheados is not None:
+            data = {"results": cacheados}
+            if modo == "fusion":
+                data["degraded"] = False
+            response = JsonResponse(data)
+            response["X-Cache"] = "HIT"
+            return response
+
+    if len(q) >= 3 and modo == "fusion":
+        fusion = rankear_partidas(q)
+        # Los resultados del respaldo por una falla no se guardan
+        if not fusion.degradado:
+            cache_busqueda.set(clave, fusion.results)
+        response = JsonResponse(
+            {"results": fusion.results, "degraded": fusion.degradado}
+        )
+        response["X-Cache"] = "MISS"
+        return response
+    elif len(q) >= 3 and modo == "semantico":
+        try:
+            results = buscar_partidas_semantico(q)
+        except EmbeddingNoDisponible as e:
+            return JsonResponse({"error": str(e), "results": []}, status=503)
+    elif len(q) >= 3 and modo == "hibrido":
+        results = buscar_partidas_hibrido(q)
+    elif len(q) >= 3:  # Mínimo 3 caracteres para buscar
+        # Elasticsearch, o el índice local si no está disponible
+        results, estado = buscar_partidas_elasticsearch(q)
+        if estado in ESTADOS_COMPLETOS:
+            cache_busqueda.set(clave, results)
 
-            # Limitar resultados (puedes hacerlo configurable o paginar)
-            search = search[:20]
+    response = JsonResponse({"results": results})
+    if clave is not None:
+        response["X-Cache"] = "MISS"
+    return response
 
-            response = search.execute()
 
-            # Formatear resultados para Select2 AJAX
-            results = [
-                {
-                    "id": hit.meta.id,  # Usar el ID del modelo Django original
-                    "text": f"{hit.item_no} - {hit.descripcion}",
-                    "codigo": hit.item_no,
-                    "descripcion": hit.descripcion,
-                    "keywords": list(
-                        getattr(hit, "search_keywords", [])
-                    ),  # Convert AttrList to list
-                    "score": hit.meta.score,  # Puntaje de relevancia de ES
-                }
-                for hit in response
-            ]
+@staff_member_required
+def buscar_partidas_cache_stats(request):
+    """Contadores de ``cache_busqueda`` de este worker."""
+    return JsonResponse(cache_busqueda.estadisticas())
 
-        except Exception as e:
-            # Manejo básico de errores (idealmente loggear el error)
-            print(f"Error searching Elasticsearch: {e}")
-            pass  # Devolver lista vacía en caso de error
 
-    return JsonResponse({"results": results})
+@staff_member_required
+def cotizar_json_cache_stats(request):
+    """Contadores de ``memo_cotizaciones`` de este worker."""
+    return JsonResponse(memo_cotizaciones.estadisticas())
 
 
 def accept_quote(request):
@@ -529,9 +709,6 @@ def accept_quote(request):
 
             # Create cotizacion
             cotizacion = Cotizacion.objects.create(cliente=cliente)
-            assign_perm("change_cotizacion", request.user, cotizacion)
-            assign_perm("delete_cotizacion", request.user, cotizacion)
-            assign_perm("view_cotizacion", request.user, cotizacion)
 
             # Create articulo from quote data
             partida = PartidaArancelaria.objects.get(
@@ -1,4 +1,5 @@
 import mimetypes
+import os
 from pathlib import Path
 
 from django.utils.translation import gettext_lazy as _
@@ -226,6 +227,25 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Caché de Django. Las cachés en proceso de MiCasillero se sincronizan entre
+# workers con las versiones de tabla de la base (MiCasillero.versiones); con
+# REDIS_URL el caché es compartido y también propaga las reindexaciones de
+# Elasticsearch (reindex_partidas) a todos los workers.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
 # REST Framework settings
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
@@ -305,6 +325,17 @@ ELASTICSEARCH_DSL = {
     },
 }
 
+# Búsqueda de partidas (MiCasillero.ranking)
+# Con False, buscar_partidas usa solo el índice local en memoria; para nodos
+# sin Elasticsearch desactivar también ELASTICSEARCH_DSL_AUTOSYNC
+PARTIDA_SEARCH_ELASTICSEARCH = True
+# Milisegundos que se espera a Elasticsearch antes de usar el respaldo
+PARTIDA_SEARCH_BUDGET_MS = 300
+# Hilos para consultar Elasticsearch: los mismos que atienden peticiones en
+# cada worker (p. ej. gunicorn --threads), para que ninguna búsqueda espere
+# un hilo libre
+PARTIDA_SEARCH_THREADS = int(os.environ.get("PARTIDA_SEARCH_THREADS", "4"))
+
 # JWT Authentication settings
 from datetime import timedelta
 
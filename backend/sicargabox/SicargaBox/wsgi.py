@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,21 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SicargaBox.settings")
 
 application = get_wsgi_application()
+
+# Construir el índice local de búsqueda al arrancar el worker, para que el
+# respaldo de Elasticsearch no pague la carga en la primera consulta
+from django.conf import settings  # noqa: E402
+from django.db import connections  # noqa: E402
+
+if getattr(settings, "PARTIDA_SEARCH_WARMUP", True):
+    from MiCasillero.indice_local import indice_local
+
+    try:
+        indice_local.construir()
+    except Exception as e:
+        logging.getLogger(__name__).warning(
+            f"No se pudo construir el índice local de partidas: {e}"
+        )
+    finally:
+        # No compartir la conexión con procesos creados a partir de este
+        connections.close_all()
@@ -102,12 +102,31 @@ class CotizacionAPISerializer(serializers.ModelSerializer):
         cliente (int): Customer ID (foreign key to Cliente)
         fecha_creacion (datetime): Creation timestamp (read-only, auto-generated)
         estado (str): Quotation status
+        subtotal_articulos (decimal): Sum of article values (read-only, maintained from its articles)
+        total_flete (decimal): Freight for the whole quotation (read-only)
+        total_impuestos (decimal): Sum of article taxes (read-only)
+        total_estimado (decimal): subtotal_articulos + total_flete + total_impuestos (read-only)
     """
 
     class Meta:
         model = Cotizacion
-        fields = ["id", "cliente", "fecha_creacion", "estado"]
-        read_only_fields = ["fecha_creacion"]
+        fields = [
+            "id",
+            "cliente",
+            "fecha_creacion",
+            "estado",
+            "subtotal_articulos",
+            "total_flete",
+            "total_impuestos",
+            "total_estimado",
+        ]
+        read_only_fields = [
+            "fecha_creacion",
+            "subtotal_articulos",
+            "total_flete",
+            "total_impuestos",
+            "total_estimado",
+        ]
 
 
 class ArticuloAPISerializer(serializers.ModelSerializer):
@@ -133,10 +152,15 @@ class ArticuloAPISerializer(serializers.ModelSerializer):
         impuesto_ispc (decimal): ISPC tax amount (read-only, auto-calculated)
         impuesto_isv (decimal): ISV tax amount (read-only, auto-calculated)
         impuesto_total (decimal): Total tax amount (read-only, auto-calculated)
+        porcentaje_dai (decimal): DAI rate in percent (read-only)
+        porcentaje_isc (decimal): ISC rate in percent (read-only)
+        porcentaje_ispc (decimal): ISPC rate in percent (read-only)
+        porcentaje_isv (decimal): ISV rate in percent (read-only)
 
     Note:
         All tax fields are automatically calculated upon creation based on the
-        associated partida arancelaria's tax rates.
+        associated partida arancelaria's tax rates. The rates are read from the
+        in-process tariff table (MiCasillero.tarifas), not from the FK.
     """
 
     peso_volumetrico = serializers.DecimalField(
@@ -145,6 +169,18 @@ class ArticuloAPISerializer(serializers.ModelSerializer):
     peso_a_usar = serializers.DecimalField(
         max_digits=10, decimal_places=2, read_only=True
     )
+    porcentaje_dai = serializers.DecimalField(
+        max_digits=7, decimal_places=2, read_only=True
+    )
+    porcentaje_isc = serializers.DecimalField(
+        max_digits=7, decimal_places=2, read_only=True
+    )
+    porcentaje_ispc = serializers.DecimalField(
+        max_digits=7, decimal_places=2, read_only=True
+    )
+    porcentaje_isv = serializers.DecimalField(
+        max_digits=7, decimal_places=2, read_only=True
+    )
 
     class Meta:
         model = Articulo
@@ -164,6 +200,10 @@ class ArticuloAPISerializer(serializers.ModelSerializer):
             "impuesto_ispc",
             "impuesto_isv",
             "impuesto_total",
+            "porcentaje_dai",
+            "porcentaje_isc",
+            "porcentaje_ispc",
+            "porcentaje_isv",
         ]
         read_only_fields = [
             "impuesto_dai",
@@ -6,6 +6,7 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from MiCasillero.busqueda import buscar_partidas_texto
 from MiCasillero.models import Articulo, Cliente, Cotizacion, ParametroSistema, PartidaArancelaria
 
 from .serializers import (
@@ -106,7 +107,8 @@ class PartidaArancelariaViewSet(viewsets.ModelViewSet):
         if not query:
             return Response({"error": "Query parameter is required"}, status=400)
 
-        results = self.queryset.filter(descripcion__icontains=query)
+        # Búsqueda por índice (search_vector / prefijo de código), por relevancia
+        results = buscar_partidas_texto(query, self.queryset)
         page = self.paginate_queryset(results)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -164,6 +166,11 @@ class CotizacionViewSet(viewsets.ModelViewSet):
     **Available filters:**
     - estado: Filter by quotation status
     - cliente: Filter by customer ID
+    - total_estimado__gte / total_estimado__lte: Filter by estimated total
+
+    **Ordering:**
+    - fecha_creacion, total_estimado, total_impuestos, subtotal_articulos
+      (totals are stored on the quotation, so no join with its articles is needed)
 
     **Permissions:**
     - Staff users can view all quotations
@@ -174,8 +181,18 @@ class CotizacionViewSet(viewsets.ModelViewSet):
 
     queryset = Cotizacion.objects.all()
     serializer_class = CotizacionAPISerializer
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = ["estado", "cliente"]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        "estado": ["exact"],
+        "cliente": ["exact"],
+        "total_estimado": ["gte", "lte"],
+    }
+    ordering_fields = [
+        "fecha_creacion",
+        "total_estimado",
+        "total_impuestos",
+        "subtotal_articulos",
+    ]
 
     def get_queryset(self):
         """
@@ -250,12 +267,19 @@ def get_parametros_publicos(request):
     Requires authentication.
     """
     try:
+        valores = ParametroSistema.objects.get_many(
+            'Dirección Consolidador',
+            'Dirección Oficina',
+            'WhatsApp Oficina',
+            'Teléfono Oficina',
+            'Entrega a Domicilio',
+        )
         parametros = {
-            'direccion_consolidador': ParametroSistema.objects.get_valor('Dirección Consolidador'),
-            'direccion_oficina': ParametroSistema.objects.get_valor('Dirección Oficina'),
-            'whatsapp_oficina': ParametroSistema.objects.get_valor('WhatsApp Oficina'),
-            'telefono_oficina': ParametroSistema.objects.get_valor('Teléfono Oficina'),
-            'entrega_a_domicilio': ParametroSistema.objects.get_valor('Entrega a Domicilio'),
+            'direccion_consolidador': valores['Dirección Consolidador'],
+            'direccion_oficina': valores['Dirección Oficina'],
+            'whatsapp_oficina': valores['WhatsApp Oficina'],
+            'telefono_oficina': valores['Teléfono Oficina'],
+            'entrega_a_domicilio': valores['Entrega a Domicilio'],
         }
         return Response({'success': True, 'data': parametros}, status=status.HTTP_200_OK)
     except Exception as e:
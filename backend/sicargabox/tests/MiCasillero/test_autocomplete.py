@@ -0,0 +1,104 @@
+import pytest
+from django.urls import reverse
+
+import test_helpers
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def partidas():
+    creadas = [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=f"9207.90.{i:02d}", descripcion=f"Guitarras eléctricas modelo {i}"
+        )
+        for i in range(5)
+    ]
+    creadas.append(
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no="8471.30.00", descripcion="Computadoras portátiles"
+        )
+    )
+    creadas.append(
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no="9207.10.00",
+            descripcion="Guitarras prohibidas",
+            courier_category="PROHIBITED",
+        )
+    )
+    return creadas
+
+
+def test_autocomplete_por_prefijo_de_codigo_paginado(client, partidas):
+    url = reverse("partidas_autocomplete")
+    vistos = []
+    cursor = None
+    while True:
+        params = {"q": "9207", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get(url, params).json()
+        assert len(data["results"]) <= 2
+        vistos.extend(r["codigo"] for r in data["results"])
+        cursor = data["next"]
+        if not cursor:
+            break
+
+    # Solo partidas permitidas, en orden de código y sin repetidos
+    assert vistos == [f"9207.90.{i:02d}" for i in range(5)]
+    assert set(data["results"][0]) == {"id", "text", "codigo", "descripcion"}
+
+
+def test_autocomplete_por_texto(client, partidas):
+    data = client.get(reverse("partidas_autocomplete"), {"q": "computad"}).json()
+    assert [r["codigo"] for r in data["results"]] == ["8471.30.00"]
+
+
+def test_autocomplete_etag(client, partidas):
+    url = reverse("partidas_autocomplete")
+    response = client.get(url, {"q": "9207"})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(url, {"q": "9207"}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+
+def test_autocomplete_cursor_invalido(client, partidas):
+    response = client.get(
+        reverse("partidas_autocomplete"), {"q": "9207", "cursor": "xx"}
+    )
+    assert response.status_code == 400
+
+
+def test_cotizador_view_sin_catalogo_embebido(client, partidas):
+    response = client.get(reverse("cotizador"))
+    assert response.status_code == 200
+    assert b"data-partidas" not in response.content
+    assert b"Computadoras port" not in response.content
+    assert response.context["total_partidas"] == 6
+    assert response.context["total_prohibited"] == 1
+    assert response.context["total_restricted"] == 0
+
+
+def test_partida_arancelaria_autocomplete_limitado_y_ordenado(client, partidas):
+    url = reverse("partida_arancelaria_autocomplete")
+    data = client.get(url, {"q": "guitarras", "limit": 3}).json()
+    assert len(data["results"]) == 3
+
+    # Las coincidencias por código van antes que las de texto
+    data = client.get(url, {"q": "8471"}).json()
+    assert [r["id"] for r in data["results"]] == [partidas[5].id]
+
+
+def test_buscar_partidas_texto_ordena_por_relevancia(partidas):
+    from MiCasillero.busqueda import buscar_partidas_texto
+
+    exacta = test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="0000.00.01",
+        descripcion="Guitarras",
+        search_keywords=["guitarras", "guitarras electricas"],
+    )
+    resultados = list(buscar_partidas_texto("guitarras"))
+    assert resultados[0] == exacta
+    assert {p.id for p in resultados} >= {p.id for p in partidas[:5]}
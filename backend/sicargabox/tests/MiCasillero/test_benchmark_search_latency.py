@@ -0,0 +1,207 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+import test_helpers
+from MiCasillero.management.commands.benchmark_search_latency import (
+    DEFAULT_PATHS,
+    Command,
+    search_paths,
+)
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture(autouse=True)
+def elasticsearch_deshabilitado(settings):
+    settings.PARTIDA_SEARCH_ELASTICSEARCH = False
+
+
+@pytest.fixture
+def archivos(tmp_path):
+    test_file = tmp_path / "queries.json"
+    test_file.write_text(
+        json.dumps(
+            {
+                "metadata": {"total_queries": 3, "total_categories": 1},
+                "categories": {
+                    "musica": {
+                        "description": "Instrumentos",
+                        "queries": ["guitarra", "arpa", "ab"],
+                    }
+                },
+            }
+        )
+    )
+    query_log = tmp_path / "queries.txt"
+    query_log.write_text("# consultas de produccion\nguitarra\n\nguitarra\nviolin\n")
+    return test_file, query_log
+
+
+@pytest.fixture
+def partidas():
+    test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="9202.10.00.00", descripcion="Guitarra", courier_category="ALLOWED"
+    )
+    test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="9202.90.00.00", descripcion="Arpa", courier_category="ALLOWED"
+    )
+
+
+def test_carga_consultas_y_log(archivos):
+    test_file, query_log = archivos
+    consultas = Command().load_queries(str(test_file), str(query_log))
+    assert [(c["category"], c["query"]) for c in consultas] == [
+        ("musica", "guitarra"),
+        ("musica", "arpa"),
+        ("query_log", "guitarra"),
+        ("query_log", "guitarra"),
+        ("query_log", "violin"),
+    ]
+
+
+def test_reporte_por_ruta(partidas, archivos, tmp_path):
+    test_file, query_log = archivos
+    salida = tmp_path / "latency.json"
+    html = tmp_path / "latency.html"
+    call_command(
+        "benchmark_search_latency",
+        "--test-file",
+        str(test_file),
+        "--query-log",
+        str(query_log),
+        "--paths",
+        "search_vector",
+        "icontains",
+        "local",
+        "elasticsearch",
+        "--concurrency",
+        "1",
+        "--iterations",
+        "2",
+        "--output",
+        str(html),
+        "--json-output",
+        str(salida),
+        stdout=StringIO(),
+    )
+
+    reporte = json.loads(salida.read_text())
+    assert set(reporte) == {"metadata", "metrics", "results"}
+    rutas = reporte["metrics"]["paths"]
+    assert list(rutas) == ["search_vector", "icontains", "local", "elasticsearch"]
+    for metricas in rutas.values():
+        assert metricas["samples"] == 10
+        assert metricas["errors"] == 0
+        assert metricas["p50_ms"] <= metricas["p95_ms"] <= metricas["p99_ms"]
+        assert metricas["throughput_qps"] > 0
+    # Una consulta por búsqueda en PostgreSQL más la de los resultados si
+    # hay alguno (4 de 5 consultas); el índice local ya construido y
+    # "elasticsearch" deshabilitado (que usa el índice local) solo consultan
+    # la base para los resultados
+    assert rutas["search_vector"]["db_queries_per_search"] == 1.8
+    assert rutas["local"]["db_queries_per_search"] == 0.8
+    assert rutas["elasticsearch"]["db_queries_per_search"] == 0.8
+    assert rutas["elasticsearch"]["degraded"] == 0
+    assert rutas["icontains"]["zero_results"] == 2
+
+    guitarra = [
+        r
+        for r in reporte["results"]
+        if r["path"] == "search_vector" and r["query"] == "guitarra"
+    ]
+    assert {r["category"]: r["samples"] for r in guitarra} == {
+        "musica": 2,
+        "query_log": 4,
+    }
+    assert all(r["hits"] == 1 for r in guitarra)
+    assert "Search Latency Benchmark Report" in html.read_text()
+
+
+def test_mismo_formato_en_todas_las_rutas(partidas):
+    assert "semantico" not in DEFAULT_PATHS
+    assert "hibrido" not in DEFAULT_PATHS
+    rutas = search_paths(20)
+    for nombre in DEFAULT_PATHS:
+        resultados, _ = rutas[nombre]("guitarra")
+        assert [(r["codigo"], r["text"]) for r in resultados] == [
+            ("9202.10.00.00", "9202.10.00.00 - Guitarra")
+        ], nombre
+        assert set(resultados[0]) == {
+            "id",
+            "text",
+            "codigo",
+            "descripcion",
+            "keywords",
+            "score",
+        }
+
+
+def test_errores_por_ruta(archivos, tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    test_file, _ = archivos
+    salida = tmp_path / "latency.json"
+    call_command(
+        "benchmark_search_latency",
+        "--test-file",
+        str(test_file),
+        "--paths",
+        "semantico",
+        "--concurrency",
+        "2",
+        "--iterations",
+        "1",
+        "--warmup",
+        "0",
+        "--output",
+        str(tmp_path / "latency.html"),
+        "--json-output",
+        str(salida),
+        stdout=StringIO(),
+    )
+    semantico = json.loads(salida.read_text())["metrics"]["paths"]["semantico"]
+    assert semantico["samples"] == 2
+    assert semantico["errors"] == 2
+    assert "EmbeddingNoDisponible" in semantico["first_error"]
+
+
+def test_concurrencia_invalida(archivos):
+    with pytest.raises(CommandError):
+        call_command(
+            "benchmark_search_latency",
+            "--test-file",
+            str(archivos[0]),
+            "--concurrency",
+            "0",
+        )
+
+
+def test_reporte_html_escapa_consultas(tmp_path):
+    metricas = {
+        "overall": {
+            "total_queries": 1,
+            "iterations": 1,
+            "concurrency": 1,
+            "limit": 20,
+        },
+        "paths": {},
+    }
+    resultado = {
+        "path": "<b>local</b>",
+        "category": "query_log&co",
+        "query": "<script>alert(1)</script>",
+        "p50_ms": 1.0,
+        "max_ms": 2.0,
+        "hits": 0,
+        "db_queries": 0,
+    }
+    salida = tmp_path / "latency.html"
+    Command().generate_html_report([resultado], metricas, str(salida))
+
+    contenido = salida.read_text()
+    assert "<script>" not in contenido
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in contenido
+    assert "&lt;b&gt;local&lt;/b&gt;" in contenido
+    assert "query_log&amp;co" in contenido
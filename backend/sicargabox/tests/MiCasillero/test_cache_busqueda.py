@@ -0,0 +1,152 @@
+import json
+
+import pytest
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import reverse
+
+import test_helpers
+from MiCasillero import ranking, views
+from MiCasillero.cache_busqueda import CacheResultados, cache_busqueda, clave_consulta
+from MiCasillero.documents import PartidaArancelariaDocument
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = CacheResultados(max_entradas=10)
+    monkeypatch.setattr(views, "cache_busqueda", cache)
+    return cache
+
+
+def test_clave_normalizada():
+    assert clave_consulta("fusion", "  iPhone! ") == clave_consulta("fusion", "iphone")
+    assert clave_consulta("fusion", "Zapatos  de cuero") == (
+        "fusion",
+        "zapatos de cuero",
+    )
+    assert clave_consulta("fusion", "iphone 15") != clave_consulta(
+        "fusion", "iphone 14"
+    )
+    assert clave_consulta("fusion", "zapatos") != clave_consulta("texto", "zapatos")
+
+
+def test_desalojo_lfu_con_desempate_lru():
+    cache = CacheResultados(max_entradas=3)
+    for clave in "abc":
+        cache.set(clave, [clave])
+    cache.get("a")
+    cache.get("a")
+    cache.get("c")
+
+    # "b" es la única pedida una sola vez
+    cache.set("d", ["d"])
+    assert cache.get("b") is None
+    # Entre "c" y "d" (dos usos cada una) sale la usada hace más tiempo
+    cache.get("d")
+    cache.set("e", ["e"])
+    assert cache.get("c") is None
+    assert [cache.get(c) for c in "ade"] == [["a"], ["d"], ["e"]]
+    assert cache.estadisticas() == {
+        "entradas": 3,
+        "max_entradas": 3,
+        "hits": 7,
+        "misses": 2,
+        "hit_ratio": 0.7778,
+        "desalojos": 2,
+        "invalidaciones": 0,
+    }
+
+
+def test_el_sello_compartido_invalida_otros_workers():
+    worker_a = CacheResultados(check_interval=0)
+    worker_b = CacheResultados(check_interval=0)
+    worker_b.set("laptop", [{"id": "1"}])
+
+    worker_a.publicar_cambio()
+
+    assert worker_b.get("laptop") is None
+
+
+def test_resultados_de_una_transaccion_revertida():
+    cache = CacheResultados()
+    partida = test_helpers.create_MiCasillero_PartidaArancelaria()
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            PartidaArancelaria.objects.filter(pk=partida.pk).update(
+                descripcion="Sin confirmar"
+            )
+            cache.set("laptop", [{"id": str(partida.pk)}])
+            raise RuntimeError
+
+    # La versión leída dentro de la transacción ya no es la de la base
+    assert cache.get("laptop") is None
+
+
+def elasticsearch_contado(monkeypatch, ids=(), error=None):
+    llamadas = []
+
+    def buscar(q, limite, timeout=None):
+        llamadas.append(q)
+        if error:
+            raise error
+        return [(pid, 1.0) for pid in ids]
+
+    monkeypatch.setattr(ranking, "buscar_elasticsearch", buscar)
+    return llamadas
+
+
+def buscar(q):
+    response = views.buscar_partidas(RequestFactory().get("/", {"q": q}))
+    return response["X-Cache"], json.loads(response.content)
+
+
+def test_consultas_repetidas_usan_la_cache(cache, monkeypatch):
+    partida = test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="8471.30.00.00", descripcion="Laptops"
+    )
+    llamadas = elasticsearch_contado(monkeypatch, ids=[partida.pk])
+
+    estado, primera = buscar("Laptop")
+    assert estado == "MISS"
+    assert primera["results"][0]["codigo"] == "8471.30.00.00"
+
+    estado, segunda = buscar("  LAPTOP! ")
+    assert estado == "HIT"
+    assert segunda == primera
+    assert len(llamadas) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_resultados_degradados_no_se_guardan(cache, monkeypatch):
+    llamadas = elasticsearch_contado(monkeypatch, error=ConnectionError("caído"))
+
+    assert buscar("zapatos")[0] == "MISS"
+    assert buscar("zapatos")[0] == "MISS"
+    assert len(llamadas) == 2
+    assert len(cache) == 0
+
+
+def test_reindexar_partidas_vacia_la_cache(
+    monkeypatch, django_capture_on_commit_callbacks
+):
+    monkeypatch.setattr(PartidaArancelariaDocument, "_bulk", lambda *a, **k: (1, []))
+    partida = test_helpers.create_MiCasillero_PartidaArancelaria()
+    cache_busqueda.set(("fusion", "iphone"), [{"id": str(partida.pk)}])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        PartidaArancelariaDocument().update(partida)
+
+    assert cache_busqueda.get(("fusion", "iphone")) is None
+
+
+def test_estadisticas_solo_para_staff(client):
+    url = reverse("buscar_partidas_cache_stats")
+    assert client.get(url).status_code == 302
+
+    staff = test_helpers.create_User(is_staff=True)
+    client.force_login(staff)
+    data = client.get(url).json()
+    assert set(data) >= {"hits", "misses", "hit_ratio", "desalojos"}
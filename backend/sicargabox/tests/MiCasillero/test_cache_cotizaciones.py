@@ -0,0 +1,164 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+import test_helpers
+from MiCasillero import views
+from MiCasillero.cache_cotizaciones import MemoCotizaciones, clave_cotizacion
+from MiCasillero.models import PartidaArancelaria
+from MiCasillero.tarifas import Tarifa
+from MiCasillero.versiones import VERSION_CHECK_INTERVAL
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def memo(monkeypatch):
+    memo = MemoCotizaciones(max_entradas=10)
+    monkeypatch.setattr(views, "memo_cotizaciones", memo)
+    return memo
+
+
+@pytest.fixture
+def flete():
+    return test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.75",
+        tipo_dato="FLOAT",
+    )
+
+
+@pytest.fixture
+def partida():
+    return test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="8471.30.00.00",
+        impuesto_dai=Decimal("0.10"),
+        impuesto_isc=Decimal("0.00"),
+        impuesto_ispc=Decimal("0.00"),
+        impuesto_isv=Decimal("0.15"),
+    )
+
+
+def cotizar(client, **datos):
+    return client.post(
+        reverse("cotizar_json"), json.dumps(datos), content_type="application/json"
+    )
+
+
+def test_respuesta_memorizada(client, memo, flete, partida, django_assert_num_queries):
+    datos = {
+        "valor": "100.00",
+        "peso": "5",
+        "largo": "10",
+        "ancho": "10",
+        "alto": "10",
+        "partida_arancelaria": partida.id,
+        "descripcion_original": "Laptop",
+    }
+    primera = cotizar(client, **datos)
+    assert primera.status_code == 200
+    assert primera["X-Cache"] == "MISS"
+
+    # Sin formulario, partida ni impuestos: solo la sesión
+    with django_assert_num_queries(4):
+        segunda = cotizar(client, **datos)
+    assert segunda["X-Cache"] == "HIT"
+    assert segunda.json() == primera.json()
+
+    # Misma cotización en kg: se reutiliza, con el peso y la unidad enviados
+    en_kg = cotizar(
+        client,
+        **dict(datos, peso="2.268", unidad_peso="kg", descripcion_original="Otra")
+    )
+    assert en_kg["X-Cache"] == "HIT"
+    assert en_kg.json()["data"]["peso"] == primera.json()["data"]["peso"]
+    assert en_kg.json()["data"]["peso_original"] == 2.268
+    assert en_kg.json()["data"]["unidad_peso"] == "kg"
+    assert client.session["current_quote"]["descripcion_original"] == "Otra"
+
+    assert memo.estadisticas()["hit_ratio"] == round(2 / 3, 4)
+
+
+def test_invalidacion_por_flete_y_tasas(
+    client, memo, flete, partida, django_capture_on_commit_callbacks
+):
+    datos = {
+        "valor": "100.00",
+        "peso": "5",
+        "partida_arancelaria": partida.id,
+        "descripcion_original": "Laptop",
+    }
+    original = cotizar(client, **datos).json()["data"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        flete.valor = "3.00"
+        flete.save()
+    respuesta = cotizar(client, **datos)
+    assert respuesta["X-Cache"] == "MISS"
+    assert respuesta.json()["data"]["costo_por_libra"] == "3.0"
+    assert respuesta.json()["data"]["costo_transporte"] == 15.0
+    assert original["costo_transporte"] == 13.75
+
+    with django_capture_on_commit_callbacks(execute=True):
+        partida.impuesto_dai = Decimal("0.20")
+        partida.save()
+    respuesta = cotizar(client, **datos)
+    assert respuesta["X-Cache"] == "MISS"
+    assert respuesta.json()["data"]["porcentaje_dai"] == "20.00"
+    assert cotizar(client, **datos)["X-Cache"] == "HIT"
+
+
+def test_cambio_de_la_partida_en_otro_worker(client, monkeypatch, flete, partida):
+    reloj = [0.0]
+    memo = MemoCotizaciones(max_entradas=10, clock=lambda: reloj[0])
+    monkeypatch.setattr(views, "memo_cotizaciones", memo)
+    datos = {
+        "valor": "100.00",
+        "peso": "5",
+        "partida_arancelaria": partida.id,
+        "descripcion_original": "Laptop",
+    }
+    cotizar(client, **datos)
+    clave = clave_cotizacion(datos)
+    assert not any(isinstance(valor, Tarifa) for valor in clave)
+    assert Decimal("0.10") in clave
+
+    # Sin señales: solo cambia la versión de las partidas en la base
+    PartidaArancelaria.objects.filter(pk=partida.pk).update(descripcion="Notebooks")
+    assert cotizar(client, **datos)["X-Cache"] == "HIT"
+    reloj[0] += VERSION_CHECK_INTERVAL
+    respuesta = cotizar(client, **datos)
+    assert respuesta["X-Cache"] == "MISS"
+    assert "Notebooks" in respuesta.json()["data"]["partida_descripcion"]
+
+
+def test_solicitudes_invalidas_no_se_memorizan(client, memo, flete, partida):
+    assert clave_cotizacion({"valor": "abc", "peso": "1"}) is None
+    assert (
+        clave_cotizacion({"valor": "1", "peso": "1", "partida_arancelaria": 0}) is None
+    )
+
+    respuesta = cotizar(client, valor="-5", peso="1", partida_arancelaria=partida.id)
+    assert respuesta.status_code == 400
+    assert "X-Cache" not in respuesta
+    assert len(memo) == 0
+
+
+def test_limites_ttl_y_tamano():
+    reloj = [0.0]
+    memo = MemoCotizaciones(max_entradas=2, ttl=10.0, clock=lambda: reloj[0])
+    memo.set("a", 1)
+    memo.set("b", 2)
+    assert memo.get("a") == 1
+
+    # "b" es la usada hace más tiempo
+    memo.set("c", 3)
+    assert memo.get("b") is None
+    assert memo.estadisticas()["desalojos"] == 1
+
+    reloj[0] += 10.0
+    assert memo.get("a") is None
+    assert memo.estadisticas()["expiradas"] == 1
+    assert len(memo) == 1
@@ -0,0 +1,73 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.models import UserObjectPermission
+
+import test_helpers
+from MiCasillero.models import Cliente
+
+pytestmark = [pytest.mark.django_db]
+
+
+def test_create_genera_codigo_con_un_solo_insert():
+    test_helpers.create_MiCasillero_Cliente()
+    user = test_helpers.create_User()
+    with CaptureQueriesContext(connection) as ctx:
+        cliente = Cliente.objects.create(
+            user=user,
+            nombres="Ana María",
+            apellidos="López Pérez",
+            telefono="12345678",
+            direccion="Test Address",
+            correo_electronico="ana@test.com",
+        )
+    inserts = [
+        q
+        for q in ctx.captured_queries
+        if q["sql"].startswith('INSERT INTO "MiCasillero_cliente"')
+    ]
+    updates = [
+        q
+        for q in ctx.captured_queries
+        if q["sql"].startswith('UPDATE "MiCasillero_cliente"')
+    ]
+    assert len(inserts) == 1
+    assert not updates
+    assert cliente.codigo_cliente == f"CLI-{str(cliente.id).zfill(6)}"
+    assert cliente.nombre_corto == "A.M.López P"
+
+    user.refresh_from_db()
+    assert (user.email, user.first_name, user.last_name) == (
+        "ana@test.com",
+        "Ana María",
+        "López Pérez",
+    )
+    assert user.has_perm("change_cliente", cliente)
+
+
+def test_update_de_perfil_no_toca_user_ni_permisos(django_assert_num_queries):
+    cliente = Cliente.objects.get(pk=test_helpers.create_MiCasillero_Cliente().pk)
+    cliente.telefono = "87654321"
+    with django_assert_num_queries(1):
+        cliente.save()
+
+    cliente.nombres = "Otro"
+    with CaptureQueriesContext(connection) as ctx:
+        cliente.save()
+    assert any(q["sql"].startswith('UPDATE "auth_user"') for q in ctx.captured_queries)
+    cliente.user.refresh_from_db()
+    assert cliente.user.first_name == "Otro"
+
+
+def test_cambio_de_usuario_reasigna_permisos():
+    cliente = test_helpers.create_MiCasillero_Cliente()
+    anterior = cliente.user
+    nuevo = test_helpers.create_User()
+
+    cliente.user = nuevo
+    cliente.save()
+
+    assert nuevo.has_perm("view_cliente", cliente)
+    assert not UserObjectPermission.objects.filter(
+        user=anterior, object_pk=str(cliente.pk)
+    ).exists()
@@ -0,0 +1,123 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+import test_helpers
+from MiCasillero.cotizador import cotizar_lote
+from MiCasillero.models import Articulo
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def partidas():
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.75",
+        tipo_dato="FLOAT",
+    )
+    return [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            impuesto_dai=Decimal("0.15"),
+            impuesto_isc=Decimal("0.00"),
+            impuesto_ispc=Decimal("0.00"),
+            impuesto_isv=Decimal("0.15"),
+        ),
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            impuesto_dai=Decimal("0.10"),
+            impuesto_isc=Decimal("0.20"),
+            impuesto_ispc=Decimal("0.05"),
+            impuesto_isv=Decimal("0.18"),
+        ),
+    ]
+
+
+LINEAS = [
+    {"valor": "100.00", "peso": "5.00", "largo": "10", "ancho": "10", "alto": "10"},
+    {"valor": "59.99", "peso": "1.25", "largo": "20", "ancho": "15.5", "alto": "8"},
+    {"valor": "1234.56", "peso": "2", "unidad_peso": "kg"},
+]
+
+
+def test_cotizar_lote_coincide_con_calcular_impuestos(partidas):
+    lineas = [
+        dict(linea, partida_arancelaria=partidas[i % 2].id)
+        for i, linea in enumerate(LINEAS)
+    ]
+    resultado = cotizar_lote(lineas)
+
+    for linea, cotizado in zip(lineas, resultado["articulos"]):
+        peso = linea["peso"]
+        if linea.get("unidad_peso") == "kg":
+            peso = round(float(peso) * 2.20462, 2)
+        articulo = Articulo(
+            valor_articulo=Decimal(str(linea["valor"])),
+            peso=Decimal(str(peso)),
+            largo=Decimal(str(linea.get("largo", 1))),
+            ancho=Decimal(str(linea.get("ancho", 1))),
+            alto=Decimal(str(linea.get("alto", 1))),
+            partida_arancelaria_id=linea["partida_arancelaria"],
+        )
+        articulo.calcular_impuestos()
+
+        assert cotizado["peso_a_usar"] == articulo.peso_a_usar
+        assert cotizado["costo_transporte"] == articulo.costo_transporte
+        assert cotizado["impuesto_dai"] == articulo.impuesto_dai
+        assert cotizado["impuesto_isc"] == articulo.impuesto_isc
+        assert cotizado["impuesto_ispc"] == articulo.impuesto_ispc
+        assert cotizado["impuesto_isv"] == articulo.impuesto_isv
+        assert cotizado["impuesto_total"] == articulo.impuesto_total
+
+    assert resultado["totales"]["impuesto_total"] == sum(
+        a["impuesto_total"] for a in resultado["articulos"]
+    )
+
+
+def test_cotizar_lote_una_consulta_de_partidas(partidas, django_assert_num_queries):
+    lineas = [
+        dict(LINEAS[0], partida_arancelaria=partidas[i % 2].id) for i in range(200)
+    ]
+    # Versión y filas de las tarifas + versión y valores de los parámetros
+    with django_assert_num_queries(4):
+        resultado = cotizar_lote(lineas)
+    assert resultado["totales"]["cantidad_articulos"] == 200
+
+
+def test_cotizar_lote_errores_por_linea(partidas):
+    lineas = [
+        {"valor": "10", "peso": "1", "partida_arancelaria": partidas[0].id},
+        {"valor": "abc", "peso": "1", "partida_arancelaria": partidas[0].id},
+        {"valor": "10", "peso": "1", "partida_arancelaria": 999999},
+    ]
+    with pytest.raises(ValidationError) as excinfo:
+        cotizar_lote(lineas)
+    assert "1" in excinfo.value.message_dict
+
+    with pytest.raises(ValidationError) as excinfo:
+        cotizar_lote([lineas[0], lineas[2]])
+    assert "1" in excinfo.value.message_dict
+
+
+def test_cotizar_batch_endpoint(client, partidas):
+    payload = {
+        "articulos": [
+            dict(linea, partida_arancelaria=partidas[0].id) for linea in LINEAS
+        ]
+    }
+    response = client.post(
+        reverse("cotizar_batch"), json.dumps(payload), content_type="application/json"
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data["articulos"]) == 3
+    assert data["costo_por_libra"] == "2.75"
+
+    response = client.post(
+        reverse("cotizar_batch"),
+        json.dumps({"articulos": []}),
+        content_type="application/json",
+    )
+    assert response.status_code == 400
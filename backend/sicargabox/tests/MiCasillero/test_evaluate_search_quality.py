@@ -0,0 +1,112 @@
+from io import StringIO
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import test_helpers
+from MiCasillero.management.commands.evaluate_search_quality import Command
+
+pytestmark = [pytest.mark.django_db]
+
+TEST_DATA = {
+    "metadata": {"total_queries": 6, "total_categories": 2},
+    "categories": {
+        "musica": {
+            "description": "Instrumentos",
+            "queries": ["guitarra", "arpa", "violin"],
+            "expected_partida_patterns": ["9202"],
+        },
+        "calzado": {
+            "description": "Calzado",
+            "queries": ["zapatos", "arpa", "ab"],
+            "expected_partida_patterns": ["6403"],
+        },
+    },
+}
+
+
+@pytest.fixture
+def partidas():
+    test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="9202.10.00.00", descripcion="Guitarras", courier_category="ALLOWED"
+    )
+    test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="9202.90.00.00", descripcion="Arpas", courier_category="ALLOWED"
+    )
+    test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="6403.99.00.00", descripcion="Calzado", courier_category="ALLOWED"
+    )
+
+
+def hit(item_no, score=1.0):
+    return {
+        "item_no": item_no,
+        "descripcion": item_no,
+        "score": score,
+        "search_keywords": [],
+    }
+
+
+HITS = {
+    "guitarra": [hit("9202.10.00.00", 5.0), hit("0000.00.00.00", 4.0)],
+    "arpa": [hit("9202.90.00.00")],
+    "violin": None,
+    "zapatos": [hit("6403.99.00.00"), hit("9202.10.00.00")],
+}
+
+
+@pytest.fixture
+def comando(monkeypatch):
+    comando = Command(stdout=StringIO(), stderr=StringIO())
+    comando.verbose = False
+    comando.k = 5
+    comando.batch_size = 2
+    comando.workers = 2
+    lotes = []
+
+    def run_msearch(queries):
+        lotes.append(list(queries))
+        return [HITS[q] for q in queries]
+
+    monkeypatch.setattr(comando, "run_msearch", run_msearch)
+    comando.lotes = lotes
+    return comando
+
+
+def test_busquedas_por_lotes_sin_repetir_consultas(partidas, comando):
+    comando.evaluate_searches(TEST_DATA)
+    enviadas = sorted(q for lote in comando.lotes for q in lote)
+    # "arpa" se repite y "ab" es demasiado corta
+    assert enviadas == ["arpa", "guitarra", "violin", "zapatos"]
+    assert all(len(lote) <= 2 for lote in comando.lotes)
+
+
+def test_una_consulta_a_la_base_por_lote(partidas, comando):
+    with CaptureQueriesContext(connection) as consultas:
+        comando.evaluate_searches(TEST_DATA)
+    assert len(consultas) == len(comando.lotes) == 2
+    assert all("IN (" in c["sql"] for c in consultas.captured_queries)
+
+
+def test_resultados_hidratados(partidas, comando):
+    resultados = {
+        (r["category"], r["query"]): r for r in comando.evaluate_searches(TEST_DATA)
+    }
+
+    guitarra = resultados[("musica", "guitarra")]
+    # La partida que ya no existe en la base se descarta
+    assert [r["item_no"] for r in guitarra["results"]] == ["9202.10.00.00"]
+    assert guitarra["results"][0]["courier_category"] == "ALLOWED"
+    assert guitarra["results"][0]["score"] == 5.0
+    assert guitarra["relevant_in_top_k"] == 1
+
+    assert resultados[("calzado", "arpa")]["results"] == (
+        resultados[("musica", "arpa")]["results"]
+    )
+    assert resultados[("musica", "violin")]["is_zero_result"]
+    assert resultados[("calzado", "ab")]["is_zero_result"]
+    assert resultados[("calzado", "zapatos")]["first_relevant_position"] == 1
+
+    metricas = comando.calculate_metrics(list(resultados.values()), TEST_DATA)
+    assert metricas["overall"]["total_queries"] == 6
@@ -0,0 +1,127 @@
+import json
+import threading
+from io import StringIO
+from types import SimpleNamespace
+
+import pytest
+from django.core.management import call_command
+
+from MiCasillero.management.commands import import_partidas
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+CSV = """Codigo,partida,dai,isc,ispc,isv
+9202.10.00.00,Guitarras,0.10,-,0,0.15
+9202.90.00.00,Arpas,0.10,,0,0.15
+9202.90.00.10,Guitarras,0.05,0,0,0.15
+"""
+
+
+class ClienteFalso:
+    """Responde como ``client.chat.completions.create`` y cuenta las llamadas."""
+
+    def __init__(self):
+        self.llamadas = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, response_format):
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.llamadas.append(prompt)
+        categoria = "PERMITIDO" if "Guitarras" in prompt else "RESTRINGIDO"
+        content = json.dumps(
+            {
+                "suitable_for_courier": True,
+                "category": categoria,
+                "restrictions": ["fragil"],
+                "package_type": "CAJA_REGULAR",
+                "requires_special_handling": False,
+                "special_instructions": "Ninguna",
+                "max_weight_allowed": None,
+                "reasoning": "Prueba",
+            }
+        )
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+        )
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    cliente = ClienteFalso()
+    monkeypatch.setattr(
+        import_partidas.Command,
+        "get_client",
+        lambda self, provider: (cliente, "modelo-prueba", None),
+    )
+    return cliente
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "partidas.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return str(path)
+
+
+def importar(csv_path, cache_file, **options):
+    call_command(
+        "import_partidas",
+        csv_path,
+        cache_file=str(cache_file),
+        workers=4,
+        stdout=StringIO(),
+        **options,
+    )
+
+
+def test_clasifica_cada_descripcion_una_vez(cliente, csv_path, tmp_path):
+    importar(csv_path, tmp_path / "cache.jsonl")
+
+    assert len(cliente.llamadas) == 2
+    categorias = dict(
+        PartidaArancelaria.objects.values_list("item_no", "courier_category")
+    )
+    assert categorias == {
+        "9202.10.00.00": "ALLOWED",
+        "9202.90.00.00": "RESTRICTED",
+        "9202.90.00.10": "ALLOWED",
+    }
+    partida = PartidaArancelaria.objects.get(item_no="9202.90.00.10")
+    assert str(partida.impuesto_dai) == "0.05"
+
+
+def test_reimportacion_usa_la_cache(cliente, csv_path, tmp_path):
+    cache_file = tmp_path / "cache.jsonl"
+    importar(csv_path, cache_file)
+    PartidaArancelaria.objects.all().delete()
+
+    importar(csv_path, cache_file)
+
+    assert len(cliente.llamadas) == 2
+    assert PartidaArancelaria.objects.count() == 3
+    assert PartidaArancelaria.objects.filter(courier_category="ALLOWED").count() == 2
+
+
+def test_cambio_de_modelo_o_prompt_invalida_la_cache(tmp_path, monkeypatch):
+    cache = import_partidas.ClassificationCache(tmp_path / "cache.jsonl")
+    cache.set("Guitarras", "modelo-a", {"category": "PERMITIDO"})
+
+    recargada = import_partidas.ClassificationCache(tmp_path / "cache.jsonl")
+    assert recargada.get("Guitarras", "modelo-a") == {"category": "PERMITIDO"}
+    assert recargada.get("Guitarras", "modelo-b") is None
+
+    monkeypatch.setattr(import_partidas, "PROMPT_VERSION", "otra-version")
+    assert recargada.get("Guitarras", "modelo-a") is None
+    assert (recargada.hits, recargada.misses) == (1, 2)
+
+
+def test_no_cache_y_dry_run(cliente, csv_path, tmp_path):
+    cache_file = tmp_path / "cache.jsonl"
+    importar(csv_path, cache_file, dry_run=True, no_cache=True)
+
+    assert len(cliente.llamadas) == 2
+    assert not cache_file.exists()
+    assert not PartidaArancelaria.objects.exists()
@@ -0,0 +1,212 @@
+import json
+import time
+
+import pytest
+from django.test import RequestFactory
+
+import test_helpers
+from MiCasillero import ranking
+from MiCasillero.indice_local import IndiceInvertido, indice_local, tokenizar
+from MiCasillero.models import PartidaArancelaria
+from MiCasillero.ranking import CircuitBreaker
+from MiCasillero.views import buscar_partidas
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def partidas():
+    datos = [
+        ("9202.10.00.00", "Guitarras eléctricas", ["guitarra", "instrumento"]),
+        ("9202.90.00.00", "Arpas y demás instrumentos de cuerda", ["arpa"]),
+        ("8517.13.00.00", "Teléfonos inteligentes", ["celular", "iphone"]),
+        ("6403.99.00.00", "Zapatos de cuero", ["calzado"]),
+    ]
+    partidas = {
+        item_no: test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=item_no, descripcion=descripcion, search_keywords=keywords
+        )
+        for item_no, descripcion, keywords in datos
+    }
+    test_helpers.create_MiCasillero_PartidaArancelaria(
+        item_no="9301.10.00.00",
+        descripcion="Armas de guerra",
+        courier_category="PROHIBITED",
+    )
+    return partidas
+
+
+def codigos(puntajes):
+    ids = dict(PartidaArancelaria.objects.values_list("id", "item_no"))
+    return [ids[pid] for pid, _ in puntajes]
+
+
+def test_tokenizar_sin_acentos_ni_plurales():
+    assert tokenizar("Teléfonos  INTELIGENTES de cuero") == [
+        "telefono",
+        "inteligent",
+        "cuero",
+    ]
+
+
+def test_busqueda_por_texto_prefijo_y_codigo(partidas):
+    indice = IndiceInvertido()
+
+    assert codigos(indice.buscar("guitarra electrica")) == ["9202.10.00.00"]
+    # La descripción pesa más que las keywords, como en el multi_match
+    assert codigos(indice.buscar("instrumentos")) == [
+        "9202.90.00.00",
+        "9202.10.00.00",
+    ]
+    # El último término se busca como prefijo mientras se escribe
+    assert codigos(indice.buscar("zapa")) == ["6403.99.00.00"]
+    assert codigos(indice.buscar("iphone")) == ["8517.13.00.00"]
+    assert codigos(indice.buscar("9202")) == ["9202.10.00.00", "9202.90.00.00"]
+    # Solo las partidas que indexa PartidaArancelariaDocument
+    assert indice.buscar("armas guerra") == []
+
+
+def test_cambios_incrementales(partidas, django_capture_on_commit_callbacks):
+    indice_local.buscar("arpas")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        nueva = test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no="9205.10.00.00", descripcion="Trompetas", search_keywords=[]
+        )
+        arpas = partidas["9202.90.00.00"]
+        arpas.descripcion = "Violines"
+        arpas.save()
+        partidas["6403.99.00.00"].delete()
+
+    assert codigos(indice_local.buscar("trompeta")) == ["9205.10.00.00"]
+    assert codigos(indice_local.buscar("violines")) == ["9202.90.00.00"]
+    assert indice_local.buscar("cuerda") == []
+    assert indice_local.buscar("zapatos") == []
+    assert codigos(indice_local.buscar("920")) == [
+        "9202.10.00.00",
+        "9202.90.00.00",
+        "9205.10.00.00",
+    ]
+    assert nueva.pk in indice_local.terminos_partida
+
+
+def test_reconstruye_si_la_base_cambio_sin_señales(partidas):
+    ahora = [0.0]
+    indice = IndiceInvertido(intervalo=60, clock=lambda: ahora[0])
+    indice.buscar("zapatos")
+    PartidaArancelaria.objects.filter(item_no="6403.99.00.00").delete()
+
+    assert indice.buscar("zapatos") != []
+    ahora[0] = 61
+    assert indice.buscar("zapatos") == []
+
+    # Mismo número de partidas y mismo id máximo: solo cambia la versión
+    PartidaArancelaria.objects.filter(item_no="9202.10.00.00").update(
+        descripcion="Bajos eléctricos"
+    )
+    assert indice.buscar("bajos") == []
+    ahora[0] = 122
+    assert codigos(indice.buscar("bajos")) == ["9202.10.00.00"]
+
+
+def test_construye_fuera_del_lock(partidas, monkeypatch):
+    indice = IndiceInvertido()
+    indice.construir()
+    anterior = indice.postings
+    cargar = IndiceInvertido._cargar
+
+    def cargar_y_buscar(nuevo, filas):
+        # Otro hilo puede buscar en el índice anterior durante la construcción
+        assert indice._lock.acquire(blocking=False)
+        indice._lock.release()
+        cargar(nuevo, filas)
+
+    monkeypatch.setattr(IndiceInvertido, "_cargar", cargar_y_buscar)
+    indice.construir()
+    assert indice.postings is not anterior
+    assert codigos(indice.buscar("guitarras")) == ["9202.10.00.00"]
+
+
+# Mide tiempo de reloj: se excluye en CI (pytest -m "not slow"); la latencia
+# por ruta en condiciones reales la mide benchmark_search_latency
+@pytest.mark.slow
+def test_p95_menor_a_20ms():
+    PartidaArancelaria.objects.bulk_create(
+        PartidaArancelaria(
+            item_no=f"{i:04d}.{i % 100:02d}.00.00",
+            descripcion=(
+                f"Producto {i} de material {i % 37} tipo {i % 91} color {i % 13}"
+            ),
+            partida_arancelaria=str(i),
+            search_keywords=[f"clave{i % 53}", f"marca{i % 211}"],
+        )
+        for i in range(8000)
+    )
+    indice = IndiceInvertido()
+    indice.construir()
+
+    tiempos = []
+    for consulta in ["producto material 5", "tipo 12 col", "clave7 marca3", "00"]:
+        for _ in range(25):
+            inicio = time.perf_counter()
+            indice.buscar(consulta)
+            tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    assert tiempos[int(len(tiempos) * 0.95)] < 0.020
+
+
+def test_circuit_breaker():
+    ahora = [0.0]
+    breaker = CircuitBreaker(umbral=2, espera=30, clock=lambda: ahora[0])
+    breaker.registrar_fallo()
+    assert breaker.permite()
+    breaker.registrar_fallo()
+    assert breaker.estado == "abierto"
+    assert not breaker.permite()
+
+    # Pasada la espera se deja pasar una sola prueba
+    ahora[0] = 31
+    assert breaker.permite()
+    assert not breaker.permite()
+    breaker.registrar_fallo()
+    assert breaker.estado == "abierto"
+
+    ahora[0] = 62
+    assert breaker.permite()
+    breaker.registrar_exito()
+    assert breaker.estado == "cerrado"
+
+
+def buscar(**params):
+    response = buscar_partidas(RequestFactory().get("/", params))
+    return json.loads(response.content)
+
+
+def test_el_respaldo_toma_el_lugar_de_elasticsearch(partidas, monkeypatch):
+    llamadas = []
+
+    def caido(q, limite, timeout=None):
+        llamadas.append(q)
+        raise ConnectionError("sin conexión")
+
+    monkeypatch.setattr(ranking, "buscar_elasticsearch", caido)
+
+    for q in ["guitarras", "zapatos", "celulares", "arpas"]:
+        data = buscar(q=q, modo="texto")
+        assert data["results"], q
+    # Tras UMBRAL_FALLOS errores ya no se consulta Elasticsearch
+    assert len(llamadas) == ranking.UMBRAL_FALLOS
+
+    data = buscar(q="iphone")
+    assert data["degraded"] is True
+    assert data["results"][0]["codigo"] == "8517.13.00.00"
+
+
+def test_nodos_sin_elasticsearch(partidas, monkeypatch, settings):
+    settings.PARTIDA_SEARCH_ELASTICSEARCH = False
+    monkeypatch.setattr(ranking, "buscar_elasticsearch", None)
+
+    data = buscar(q="guitarra")
+
+    assert data["degraded"] is False
+    assert data["results"][0]["codigo"] == "9202.10.00.00"
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from MiCasillero.jerarquia import IndiceJerarquia
+from MiCasillero.management.commands.generate_llm_keywords import (
+    Command as LLMKeywordsCommand,
+)
+from MiCasillero.management.commands.generate_search_keywords import (
+    Command as SearchKeywordsCommand,
+)
+from MiCasillero.management.commands.regenerate_empty_keywords import (
+    Command as RegenerateKeywordsCommand,
+)
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def jerarquia():
+    filas = [
+        ("9202.10.00.00", "Instrumentos de cuerda|Guitarras", 3, ["guitarra"]),
+        ("9202.10.00.10", "Instrumentos de cuerda|Violines", 3, ["violin"]),
+        ("9202.10.00.90", "Instrumentos de cuerda|Los demás", 3, None),
+        ("9202.90.00.00", "Instrumentos de cuerda|Arpas|Electricas", 4, ["arpa"]),
+        ("9202.90.00.10", "Instrumentos de cuerda|Arpas|Las demás", 4, []),
+        ("9205.10.00.00", "Instrumentos de viento", 2, ["trompeta"]),
+    ]
+    PartidaArancelaria.objects.bulk_create(
+        [
+            PartidaArancelaria(
+                item_no=item_no,
+                descripcion=descripcion,
+                partida_arancelaria=item_no,
+                impuesto_isv=Decimal("0.15"),
+                chapter_code=item_no[:4],
+                heading_code=item_no[:7],
+                hierarchy_level=nivel,
+                search_keywords=keywords,
+            )
+            for item_no, descripcion, nivel, keywords in filas
+        ]
+    )
+    return list(PartidaArancelaria.objects.order_by("item_no"))
+
+
+def test_indice_se_construye_con_una_consulta(jerarquia, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        indice = IndiceJerarquia.construir()
+    assert len(indice) == len(jerarquia)
+
+    guitarras = jerarquia[0]
+    hermanos = indice.hermanos_por_prefijo(guitarras.descripcion, guitarras.id)
+    assert [n.item_no for n in hermanos] == ["9202.10.00.10", "9202.10.00.90"]
+    assert [n.ultima_parte for n in hermanos] == ["Violines", "Los demás"]
+    assert hermanos[1].ultima_es_los_demas
+    assert hermanos[1].terminos_exclusion == {"guitarras", "violines"}
+    assert indice.por_id[jerarquia[4].id].terminos_exclusion == {"electricas"}
+    assert indice.por_id[jerarquia[5].id].terminos_exclusion == frozenset()
+    assert [n.item_no for n in indice.que_contienen("Arpas")] == [
+        "9202.90.00.00",
+        "9202.90.00.10",
+    ]
+
+
+@pytest.mark.parametrize(
+    "construir_contexto",
+    [
+        lambda p, indice: LLMKeywordsCommand().get_context_for_partida(p, 25, indice),
+        lambda p, indice: SearchKeywordsCommand().get_context_for_partida(p, indice),
+        lambda p, indice: RegenerateKeywordsCommand().get_context_for_partida(
+            p, indice
+        ),
+    ],
+    ids=["llm", "search", "regenerate"],
+)
+def test_contexto_del_indice_igual_al_de_la_consulta(
+    jerarquia, construir_contexto, django_assert_num_queries
+):
+    indice = IndiceJerarquia.construir()
+    for partida in jerarquia:
+        esperado = construir_contexto(partida, None)
+        with django_assert_num_queries(0):
+            assert construir_contexto(partida, indice) == esperado
+
+
+def test_benchmark_verifica_contextos():
+    salida = StringIO()
+    call_command("benchmark_hierarchy_index", rows=300, sample=20, stdout=salida)
+    assert "Index build: 300 rows" in salida.getvalue()
+    assert "regenerate_empty_keywords" in salida.getvalue()
+    assert not PartidaArancelaria.objects.exists()
@@ -0,0 +1,166 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.core.management import call_command
+
+import test_helpers
+from MiCasillero.llm_keywords import TokenBucket, parse_keywords
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+
+class StubLLM(ThreadingHTTPServer):
+    """Imita POST /v1/chat/completions de OpenAI/DeepSeek."""
+
+    daemon_threads = True
+
+    def __init__(self, fail_first=0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.fail_first = fail_first
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            numero = server.requests
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            # Dar tiempo a que se solapen las peticiones concurrentes
+            threading.Event().wait(0.05)
+            if self.path != "/v1/chat/completions" or numero <= server.fail_first:
+                self.send_response(429 if numero <= server.fail_first else 404)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            codigo = body["messages"][0]["content"].split("- Código: ")[1].split()[0]
+            respuesta = {
+                "choices": [
+                    {
+                        "message": {
+                            "role": "assistant",
+                            "content": json.dumps({"keywords": [f"kw {codigo}"]}),
+                        }
+                    }
+                ],
+                "usage": {"total_tokens": 50},
+            }
+            data = json.dumps(respuesta).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@pytest.fixture
+def stub():
+    servidor = StubLLM(fail_first=2)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def generar(stub, tmp_path, *extra):
+    call_command(
+        "generate_llm_keywords",
+        "--provider",
+        "deepseek",
+        "--model",
+        "deepseek-chat",
+        "--async",
+        "--concurrency",
+        "4",
+        "--batch-size",
+        "3",
+        "--delay",
+        "0",
+        "--skip-token-check",
+        "--base-url",
+        stub.base_url,
+        "--checkpoint",
+        str(tmp_path / "checkpoint.txt"),
+        *extra,
+    )
+
+
+def test_generacion_async_contra_stub(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test")
+    partidas = [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=f"8471.30.00.{i:02d}", descripcion=f"Máquinas | Portátiles {i}"
+        )
+        for i in range(10)
+    ]
+
+    generar(stub, tmp_path, "--limit", "10")
+
+    for partida in partidas:
+        partida.refresh_from_db()
+        assert partida.search_keywords == [f"kw {partida.item_no}"]
+    # Los 429 se reintentaron y hubo peticiones simultáneas
+    assert stub.requests == 12
+    assert 1 < stub.max_in_flight <= 4
+
+    ids = (tmp_path / "checkpoint.txt").read_text().split()
+    assert sorted(map(int, ids)) == sorted(p.id for p in partidas)
+
+
+def test_checkpoint_permite_reanudar(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test")
+    hecha, pendiente = [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=f"9207.10.00.0{i}", descripcion="Instrumentos | Guitarras"
+        )
+        for i in range(2)
+    ]
+    (tmp_path / "checkpoint.txt").write_text(f"{hecha.id}\n")
+    stub.fail_first = 0
+
+    generar(stub, tmp_path)
+
+    assert stub.requests == 1
+    assert PartidaArancelaria.objects.get(pk=hecha.pk).search_keywords == []
+    assert PartidaArancelaria.objects.get(pk=pendiente.pk).search_keywords == [
+        f"kw {pendiente.item_no}"
+    ]
+
+
+def test_token_bucket():
+    ahora = [0.0]
+    bucket = TokenBucket(60, capacity=2, clock=lambda: ahora[0])
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    ahora[0] = 3.0
+    assert bucket.reserve(1) == 0
+
+
+def test_parse_keywords():
+    assert sorted(parse_keywords('{"keywords": ["Laptop ", "laptop", "PC"]}')) == [
+        "laptop",
+        "pc",
+    ]
+    assert parse_keywords("sin json") == []
@@ -0,0 +1,121 @@
+import pytest
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+import test_helpers
+from MiCasillero.models import ParametroSistema
+from MiCasillero.parametros import ParametroSistemaCache
+from MiCasillero.versiones import VERSION_CHECK_INTERVAL
+
+pytestmark = [pytest.mark.django_db]
+
+
+def test_get_valor_carga_todos_los_parametros_de_una_vez(
+    django_assert_num_queries,
+):
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.50",
+        tipo_dato="FLOAT",
+    )
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Días Validez Cotización", valor="30", tipo_dato="INTEGER"
+    )
+    # La versión de la tabla y todos los parámetros
+    with django_assert_num_queries(2):
+        assert (
+            ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$") == 2.5
+        )
+        assert ParametroSistema.objects.get_valor("Días Validez Cotización") == 30
+        assert (
+            ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$") == 2.5
+        )
+
+
+def test_get_valor_parametro_inexistente():
+    with pytest.raises(ValidationError):
+        ParametroSistema.objects.get_valor("No existe")
+
+
+def test_get_many():
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Entrega a Domicilio", valor="true", tipo_dato="BOOLEAN"
+    )
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="WhatsApp Oficina", valor="+504 9999-9999", tipo_dato="STRING"
+    )
+    valores = ParametroSistema.objects.get_many(
+        "Entrega a Domicilio", "WhatsApp Oficina"
+    )
+    assert valores == {
+        "Entrega a Domicilio": True,
+        "WhatsApp Oficina": "+504 9999-9999",
+    }
+
+    with pytest.raises(ValidationError):
+        ParametroSistema.objects.get_many("Entrega a Domicilio", "No existe")
+
+
+def test_save_y_delete_invalidan_cache():
+    parametro = test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.50",
+        tipo_dato="FLOAT",
+    )
+    assert ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$") == 2.5
+
+    parametro.valor = "3.75"
+    parametro.save()
+    assert ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$") == 3.75
+
+    parametro.delete()
+    with pytest.raises(ValidationError):
+        ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$")
+
+
+def test_cambio_en_otro_worker_recarga(django_assert_num_queries):
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.50",
+        tipo_dato="FLOAT",
+    )
+    reloj = [0.0]
+    worker = ParametroSistemaCache(clock=lambda: reloj[0])
+    assert worker.get("Costo Flete por Libra en USD$") == 2.5
+
+    # Otro worker (o un QuerySet.update) modifica el parámetro sin pasar por
+    # las señales de este proceso
+    ParametroSistema.objects.filter(
+        nombre_parametro="Costo Flete por Libra en USD$"
+    ).update(valor="4.00")
+    with django_assert_num_queries(0):
+        assert worker.get("Costo Flete por Libra en USD$") == 2.5
+
+    # Al vencer el intervalo se compara la versión de la tabla y se recarga
+    reloj[0] += VERSION_CHECK_INTERVAL
+    with django_assert_num_queries(2):
+        assert worker.get("Costo Flete por Libra en USD$") == 4.0
+    with django_assert_num_queries(0):
+        assert worker.get("Costo Flete por Libra en USD$") == 4.0
+
+
+def test_lectura_en_transaccion_revertida_no_queda_en_cache():
+    parametro = test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.50",
+        tipo_dato="FLOAT",
+    )
+    assert ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$") == 2.5
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            parametro.valor = "4.00"
+            parametro.save()
+            assert (
+                ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$")
+                == 4.0
+            )
+            raise RuntimeError("rollback")
+
+    # La versión de la tabla volvió atrás con el rollback
+    assert ParametroSistema.objects.get_valor("Costo Flete por Libra en USD$") == 2.5
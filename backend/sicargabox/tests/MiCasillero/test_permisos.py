@@ -0,0 +1,76 @@
+import pytest
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+import test_helpers
+
+pytestmark = [pytest.mark.django_db]
+
+
+def crear_operadores(cantidad):
+    operadores = Group.objects.get_or_create(name="Operadores")[0]
+    Group.objects.get_or_create(name="Administradores")
+    usuarios = [test_helpers.create_User() for _ in range(cantidad)]
+    operadores.user_set.add(*usuarios)
+    return usuarios
+
+
+def contar_inserts(func):
+    with CaptureQueriesContext(connection) as ctx:
+        resultado = func()
+    inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+    return resultado, len(inserts)
+
+
+def test_inserts_no_crecen_con_los_operadores():
+    articulo = test_helpers.create_MiCasillero_Articulo()
+    cotizacion = articulo.cotizacion
+    partida = articulo.partida_arancelaria
+    crear_operadores(1)
+    _, inserts_pocos = contar_inserts(
+        lambda: test_helpers.create_MiCasillero_Articulo(
+            cotizacion=cotizacion, partida_arancelaria=partida
+        )
+    )
+
+    usuarios = crear_operadores(30)
+    articulo, inserts_muchos = contar_inserts(
+        lambda: test_helpers.create_MiCasillero_Articulo(
+            cotizacion=cotizacion, partida_arancelaria=partida
+        )
+    )
+
+    assert inserts_muchos == inserts_pocos
+    assert usuarios[0].has_perm("view_articulo", articulo)
+    assert usuarios[0].has_perm("change_articulo", articulo)
+    assert not usuarios[0].has_perm("delete_articulo", articulo)
+    assert cotizacion.cliente.user.has_perm("delete_articulo", articulo)
+
+
+def test_update_no_reasigna_permisos():
+    articulo = test_helpers.create_MiCasillero_Articulo()
+    articulo.valor_articulo = 200
+    _, inserts = contar_inserts(articulo.save)
+    assert inserts == 0
+
+
+def test_backfill_object_permissions():
+    articulo = test_helpers.create_MiCasillero_Articulo()
+    crear_operadores(3)
+    UserObjectPermission.objects.all().delete()
+    GroupObjectPermission.objects.all().delete()
+
+    call_command("backfill_object_permissions", "--models", "articulo")
+
+    dueno = articulo.cotizacion.cliente.user
+    assert dueno.has_perm("delete_articulo", articulo)
+    assert GroupObjectPermission.objects.filter(
+        object_pk=str(articulo.pk), group__name="Operadores"
+    ).count() == len(["view", "change"])
+
+    # Idempotente
+    call_command("backfill_object_permissions", "--models", "articulo")
+    assert UserObjectPermission.objects.filter(object_pk=str(articulo.pk)).count() == 3
@@ -0,0 +1,81 @@
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+import test_helpers
+from MiCasillero.management.commands.populate_hierarchy_fields import extract_hierarchy
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def partidas():
+    codigos = [
+        "0101.21.00.00",
+        "8471.30.00.00",
+        "8471.30.00.00.10",
+        "9202.10.00.90",
+        "9205",
+    ]
+    creadas = [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=item_no, chapter_code=None, heading_code=None
+        )
+        for item_no in codigos
+    ]
+    # Una ya está al día
+    PartidaArancelaria.objects.filter(pk=creadas[1].pk).update(
+        **extract_hierarchy("8471.30.00.00")
+    )
+    return codigos
+
+
+def test_extract_hierarchy():
+    assert extract_hierarchy("9202.10.00.90") == {
+        "chapter_code": "9202",
+        "heading_code": "9202.10",
+        "parent_item_no": "9202.10.00.00",
+        "grandparent_item_no": "9202.00.00.00",
+        "hierarchy_level": 4,
+        "is_leaf_node": True,
+    }
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_actualiza_solo_las_filas_cambiadas(partidas, workers):
+    salida = StringIO()
+    call_command(
+        "populate_hierarchy_fields",
+        "--batch-size",
+        "2",
+        "--workers",
+        workers,
+        stdout=salida,
+    )
+
+    for partida in PartidaArancelaria.objects.all():
+        esperado = extract_hierarchy(partida.item_no)
+        assert {campo: getattr(partida, campo) for campo in esperado} == esperado
+    texto = salida.getvalue()
+    assert "Updated:         4" in texto
+    assert "Skipped:         1" in texto
+    assert "rows/s" in texto
+
+    # Una segunda pasada no escribe nada
+    salida = StringIO()
+    call_command("populate_hierarchy_fields", stdout=salida)
+    assert "Updated:         0" in salida.getvalue()
+
+
+def test_dry_run_no_escribe(partidas):
+    salida = StringIO()
+    call_command("populate_hierarchy_fields", "--dry-run", stdout=salida)
+    assert "Would update:    4" in salida.getvalue()
+    assert PartidaArancelaria.objects.filter(chapter_code__isnull=True).count() == 4
+
+
+def test_opciones_invalidas():
+    with pytest.raises(CommandError):
+        call_command("populate_hierarchy_fields", "--batch-size", "0")
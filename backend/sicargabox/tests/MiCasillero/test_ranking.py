@@ -0,0 +1,161 @@
+import json
+import time
+from concurrent.futures import Future
+
+import pytest
+from django.test import RequestFactory
+
+import test_helpers
+from MiCasillero import ranking
+from MiCasillero.mapeos import IndiceMapeos, indice_mapeos, normalizar_descripcion
+from MiCasillero.models import ItemPartidaMapping
+from MiCasillero.ranking import fusionar, rankear_partidas
+from MiCasillero.versiones import VERSION_CHECK_INTERVAL
+from MiCasillero.views import buscar_partidas
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def partidas():
+    return {
+        descripcion: test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=f"9202.{i:02d}.00.00", descripcion=descripcion
+        )
+        for i, descripcion in enumerate(
+            ["Guitarras eléctricas", "Guitarras acústicas", "Arpas"]
+        )
+    }
+
+
+def mapear(descripcion, partida, verificado=False):
+    return ItemPartidaMapping.objects.create(
+        item_description_original=descripcion,
+        partida_arancelaria=partida,
+        is_staff_verified=verificado,
+    )
+
+
+def elasticsearch_falso(monkeypatch, ids=(), demora=0.0, error=None):
+    def buscar(q, limite, timeout=None):
+        time.sleep(demora)
+        if error:
+            raise error
+        return [(pid, 10.0 - i) for i, pid in enumerate(ids)]
+
+    monkeypatch.setattr(ranking, "buscar_elasticsearch", buscar)
+
+
+def test_fusion_rrf_con_refuerzo_verificado():
+    listas = {"elasticsearch": [1, 2, 3], "postgres": [2, 1], "historial": []}
+    assert [pid for pid, _ in fusionar(listas)] == [1, 2, 3]
+
+    # Una sola coincidencia verificada del historial supera a las demás fuentes
+    listas["historial"] = [3]
+    ranking_final = fusionar(listas, verificados=[3])
+    assert ranking_final[0][0] == 3
+    assert ranking_final[0][1] == pytest.approx(1 / 63 + 3 / 61)
+
+
+def test_historial_verificado_va_primero(partidas, monkeypatch):
+    electricas = partidas["Guitarras eléctricas"]
+    acusticas = partidas["Guitarras acústicas"]
+    elasticsearch_falso(monkeypatch, ids=[electricas.pk, acusticas.pk])
+    mapear("Guitarra Fender", electricas)
+    mapear("guitarra  fender!", acusticas, verificado=True)
+
+    fusion = rankear_partidas("Guitarra Fender")
+
+    assert fusion.elasticsearch == "ok"
+    assert fusion.fuentes == {"elasticsearch": 2, "postgres": 0, "historial": 2}
+    assert [r["codigo"] for r in fusion.results] == [
+        acusticas.item_no,
+        electricas.item_no,
+    ]
+
+
+def test_elasticsearch_lento_usa_el_respaldo(partidas, monkeypatch):
+    elasticsearch_falso(monkeypatch, ids=[partidas["Arpas"].pk], demora=0.5)
+
+    inicio = time.perf_counter()
+    fusion = rankear_partidas("guitarras", presupuesto_ms=50)
+
+    assert time.perf_counter() - inicio < 0.4
+    assert fusion.elasticsearch == "timeout"
+    assert fusion.degradado
+    assert {r["codigo"] for r in fusion.results} == {"9202.00.00.00", "9202.01.00.00"}
+
+
+def test_timeout_sin_empezar_no_es_fallo_de_elasticsearch():
+    breaker = ranking.breaker_elasticsearch
+    # En la cola del pool: nunca llegó a consultar
+    en_cola = Future()
+    assert ranking.esperar_elasticsearch(en_cola, "ok", 0.01) == ([], "timeout_local")
+    assert en_cola.cancelled()
+    assert breaker.fallos == 0
+
+    en_curso = Future()
+    en_curso.set_running_or_notify_cancel()
+    assert ranking.esperar_elasticsearch(en_curso, "ok", 0.01) == ([], "timeout")
+    assert breaker.fallos == 1
+
+
+def test_pool_del_tamano_configurado(settings, monkeypatch):
+    settings.PARTIDA_SEARCH_THREADS = 7
+    monkeypatch.setattr(ranking, "_executor", None)
+    pool = ranking.executor()
+    assert pool._max_workers == 7
+    assert ranking.executor() is pool
+    pool.shutdown()
+
+
+def test_error_de_elasticsearch_y_vista(partidas, monkeypatch):
+    elasticsearch_falso(monkeypatch, error=ConnectionError("sin conexión"))
+
+    respuesta = buscar_partidas(RequestFactory().get("/", {"q": "arpas"}))
+    data = json.loads(respuesta.content)
+
+    assert respuesta.status_code == 200
+    assert data["degraded"] is True
+    assert [r["codigo"] for r in data["results"]] == [partidas["Arpas"].item_no]
+
+
+def test_indice_de_mapeos_se_invalida_al_guardar(
+    partidas, django_capture_on_commit_callbacks
+):
+    arpas = partidas["Arpas"]
+    assert indice_mapeos.buscar("Arpa celta") == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        mapeo = mapear("Arpa celta", arpas)
+    assert [m.partida_id for m in indice_mapeos.buscar("ARPA celta")] == [arpas.pk]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        mapeo.is_staff_verified = True
+        mapeo.save()
+    assert indice_mapeos.buscar("arpa celta")[0].verificadas == 1
+    assert normalizar_descripcion("  ARPA   celta! ") == "arpa celta"
+
+
+def test_indice_de_mapeos_sigue_la_version_de_la_base(
+    partidas, django_assert_num_queries
+):
+    arpas = partidas["Arpas"]
+    mapeo = mapear("Arpa celta", arpas)
+    reloj = [0.0]
+    worker = IndiceMapeos(clock=lambda: reloj[0])
+    assert worker.buscar("arpa celta")[0].verificadas == 0
+
+    # Otro worker (o un QuerySet.update) verifica el mapeo sin señales aquí
+    ItemPartidaMapping.objects.filter(pk=mapeo.pk).update(is_staff_verified=True)
+    with django_assert_num_queries(0):
+        assert worker.buscar("arpa celta")[0].verificadas == 0
+
+    # Al vencer el intervalo se compara la versión de la tabla y se recarga;
+    # si la versión no cambió solo se hace esa consulta
+    reloj[0] += VERSION_CHECK_INTERVAL
+    with django_assert_num_queries(2):
+        assert worker.buscar("arpa celta")[0].verificadas == 1
+    reloj[0] += VERSION_CHECK_INTERVAL
+    with django_assert_num_queries(1):
+        assert worker.buscar("arpa celta")[0].verificadas == 1
@@ -0,0 +1,196 @@
+import fnmatch
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import urlparse
+
+import pytest
+from django.core.management import CommandError, call_command
+from elasticsearch_dsl.connections import connections
+
+import test_helpers
+from MiCasillero.cache_busqueda import cache_busqueda
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+ALIAS = "partidas_arancelarias"
+
+
+class ElasticsearchLocal:
+    """
+    Lo mínimo de la API REST de Elasticsearch que usa reindex_partidas:
+    índices, alias, _bulk, _count, _refresh y _settings.
+    """
+
+    def __init__(self):
+        self.indices = {}
+        self.alias = {}
+        self.bulk_requests = 0
+        self.rechazar_id = None
+        self._lock = threading.Lock()
+
+    def resolver(self, nombre):
+        if nombre in self.alias:
+            return sorted(self.alias[nombre])
+        return [i for i in self.indices if fnmatch.fnmatch(i, nombre)]
+
+    def atender(self, metodo, ruta, cuerpo):
+        partes = [p for p in ruta.split("/") if p]
+        with self._lock:
+            if partes == ["_bulk"]:
+                return 200, self.bulk(cuerpo)
+            if partes == ["_aliases"]:
+                for accion in json.loads(cuerpo)["actions"]:
+                    ((tipo, datos),) = accion.items()
+                    if tipo == "add":
+                        self.alias.setdefault(datos["alias"], set()).add(datos["index"])
+                    elif tipo == "remove":
+                        self.alias[datos["alias"]].discard(datos["index"])
+                    elif tipo == "remove_index":
+                        del self.indices[datos["index"]]
+                return 200, {"acknowledged": True}
+            if partes[0] == "_alias":
+                destinos = sorted(self.alias.get(partes[1], ()))
+                if not destinos:
+                    return 404, {"error": "alias missing", "status": 404}
+                return 200, {i: {"aliases": {partes[1]: {}}} for i in destinos}
+            nombre = partes[0]
+            accion = partes[1] if len(partes) > 1 else None
+            if accion is None and metodo == "PUT":
+                self.indices[nombre] = {"docs": {}, "settings": json.loads(cuerpo)}
+                return 200, {"acknowledged": True, "index": nombre}
+            nombres = self.resolver(nombre)
+            if not nombres and "*" not in nombre:
+                return 404, {"error": "index_not_found_exception", "status": 404}
+            if accion is None and metodo == "DELETE":
+                for i in nombre.split(","):
+                    self.indices.pop(i, None)
+                return 200, {"acknowledged": True}
+            if accion is None:
+                return 200, {i: {"aliases": {}} for i in nombres}
+            if accion == "_count":
+                return 200, {
+                    "count": sum(len(self.indices[i]["docs"]) for i in nombres)
+                }
+            return 200, {"acknowledged": True, "_shards": {"failed": 0}}
+
+    def bulk(self, cuerpo):
+        self.bulk_requests += 1
+        lineas = [json.loads(linea) for linea in cuerpo.splitlines() if linea.strip()]
+        items = []
+        for accion, documento in zip(lineas[::2], lineas[1::2]):
+            datos = accion["index"]
+            if str(datos["_id"]) == str(self.rechazar_id):
+                items.append({"index": {**datos, "status": 400, "error": "rechazado"}})
+                continue
+            self.indices[datos["_index"]]["docs"][str(datos["_id"])] = documento
+            items.append({"index": {**datos, "status": 201}})
+        return {
+            "took": 1,
+            "errors": any(i["index"]["status"] >= 300 for i in items),
+            "items": items,
+        }
+
+
+@pytest.fixture
+def es_local():
+    estado = ElasticsearchLocal()
+
+    class Handler(BaseHTTPRequestHandler):
+        def responder(self):
+            largo = int(self.headers.get("Content-Length") or 0)
+            cuerpo = self.rfile.read(largo).decode() if largo else ""
+            status, data = estado.atender(
+                self.command, urlparse(self.path).path, cuerpo
+            )
+            contenido = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("X-Elastic-Product", "Elasticsearch")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(contenido)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(contenido)
+
+        do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = responder
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    connections.create_connection(
+        alias="pruebas", hosts=[f"http://127.0.0.1:{servidor.server_port}"]
+    )
+    yield estado
+    connections.remove_connection("pruebas")
+    servidor.shutdown()
+
+
+@pytest.fixture
+def partidas(settings):
+    settings.ELASTICSEARCH_DSL_AUTOSYNC = False
+    for i in range(23):
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=f"9202.{i:02d}.00.00",
+            descripcion=f"Instrumento {i}",
+            search_keywords=["cuerda"],
+        )
+    # PartidaArancelariaDocument solo indexa las permitidas
+    test_helpers.create_MiCasillero_PartidaArancelaria(courier_category="PROHIBITED")
+
+
+def reindexar(**options):
+    salida = StringIO()
+    call_command(
+        "reindex_partidas",
+        using="pruebas",
+        chunk_size=5,
+        threads=3,
+        stdout=salida,
+        stderr=StringIO(),
+        **options,
+    )
+    return salida.getvalue()
+
+
+def test_reindexa_en_paralelo_y_cambia_el_alias(es_local, partidas):
+    # Primera ejecución: un índice concreto ocupa el nombre del alias
+    es_local.indices[ALIAS] = {"docs": {"1": {}}, "settings": {}}
+
+    salida = reindexar()
+
+    (version,) = es_local.alias[ALIAS]
+    assert version.startswith(f"{ALIAS}_")
+    assert ALIAS not in es_local.indices
+    assert len(es_local.indices[version]["docs"]) == 23
+    assert es_local.bulk_requests == 5
+    documento = next(iter(es_local.indices[version]["docs"].values()))
+    assert documento["full_text_search"].startswith("9202.")
+    assert "docs/s" in salida
+
+
+def test_conserva_las_versiones_pedidas(es_local, partidas):
+    cache_busqueda.set(("fusion", "cuerda"), [{"id": "1"}])
+    versiones = []
+    for _ in range(3):
+        reindexar(keep=1)
+        versiones.append(next(iter(es_local.alias[ALIAS])))
+
+    assert sorted(es_local.indices) == versiones[1:]
+    assert es_local.alias[ALIAS] == {versiones[-1]}
+    assert cache_busqueda.get(("fusion", "cuerda")) is None
+
+
+def test_errores_no_cambian_el_alias(es_local, partidas):
+    reindexar()
+    anterior = set(es_local.alias[ALIAS])
+    es_local.rechazar_id = PartidaArancelaria.objects.get(item_no="9202.07.00.00").pk
+
+    with pytest.raises(CommandError, match="1 bulk errors, 22 documents"):
+        reindexar()
+
+    assert es_local.alias[ALIAS] == anterior
+    assert sorted(es_local.indices) == sorted(anterior)
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+import test_helpers
+from MiCasillero.busqueda import buscar_partidas_texto
+from MiCasillero.models import PartidaArancelaria
+
+pytestmark = [pytest.mark.django_db]
+
+
+def test_save_escribe_una_sola_vez(django_assert_num_queries):
+    with django_assert_num_queries(1):
+        partida = test_helpers.create_MiCasillero_PartidaArancelaria(
+            descripcion="Guitarras acusticas"
+        )
+    assert list(buscar_partidas_texto("guitarras")) == [partida]
+
+    partida.descripcion = "Violines"
+    with django_assert_num_queries(1):
+        partida.save()
+    assert list(buscar_partidas_texto("violines")) == [partida]
+    assert not buscar_partidas_texto("guitarras").exists()
+
+
+def test_bulk_create_y_update_mantienen_el_vector():
+    PartidaArancelaria.objects.bulk_create(
+        [
+            PartidaArancelaria(
+                item_no=f"9202.10.00.0{i}",
+                descripcion=f"Instrumentos de cuerda {i}",
+                partida_arancelaria=f"9202.10.00.0{i}",
+                impuesto_isv=Decimal("0.15"),
+            )
+            for i in range(3)
+        ]
+    )
+    assert buscar_partidas_texto("instrumentos").count() == 3
+
+    PartidaArancelaria.objects.filter(item_no="9202.10.00.00").update(
+        search_keywords=["ukulele"]
+    )
+    assert [p.item_no for p in buscar_partidas_texto("ukulele")] == ["9202.10.00.00"]
+
+
+def test_rebuild_search_vectors():
+    test_helpers.create_MiCasillero_PartidaArancelaria(descripcion="Bicicletas")
+    PartidaArancelaria.objects.update(search_vector=None)
+    assert not buscar_partidas_texto("bicicletas").exists()
+
+    call_command("rebuild_search_vectors", "--only-missing")
+    assert buscar_partidas_texto("bicicletas").exists()
@@ -0,0 +1,198 @@
+import json
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+import test_helpers
+from MiCasillero.arancel import calcular_diff
+from MiCasillero.management.commands.import_partidas import Command as ImportCommand
+from MiCasillero.models import PartidaArancelaria, PartidaArancelariaEmbedding
+
+pytestmark = [pytest.mark.django_db]
+
+CSV_HEADER = "Codigo,partida,dai,isc,ispc,isv\n"
+
+
+@pytest.fixture
+def partidas():
+    creadas = {
+        item_no: test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=item_no,
+            descripcion=descripcion,
+            search_keywords=["clave"],
+            courier_category="ALLOWED",
+        )
+        for item_no, descripcion in [
+            ("0101.21.00.00", "Caballos reproductores"),
+            ("8471.30.00.00", "Computadoras portatiles"),
+            ("9202.10.00.00", "Guitarras"),
+            ("9205.10.00.00", "Trompetas"),
+            ("9206.00.00.00", "Tambores"),
+        ]
+    }
+    for partida in creadas.values():
+        PartidaArancelariaEmbedding.objects.create(
+            partida_arancelaria=partida,
+            embedding_vector=[0.1, 0.2],
+            embedding_text=partida.descripcion,
+        )
+    # Tambores sale del arancel pero tiene un articulo
+    test_helpers.create_MiCasillero_Articulo(
+        partida_arancelaria=creadas["9206.00.00.00"]
+    )
+    return creadas
+
+
+@pytest.fixture
+def csv_nuevo(tmp_path):
+    ruta = tmp_path / "aranceles.csv"
+    ruta.write_text(
+        CSV_HEADER
+        # Sin cambios (solo espacios y formato de las tasas)
+        + '0101.21.00.00,"Caballos  reproductores ",0.10,0.1,0.05,0.15\n'
+        # Cambia una tasa
+        + "8471.30.00.00,Computadoras portatiles,0.00,0.10,0.05,0.15\n"
+        # Cambia la descripcion
+        + "9202.10.00.00,Guitarras acusticas,0.10,0.10,0.05,0.15\n"
+        # Nueva
+        + "9207.10.00.00,Teclados electronicos,0.15,0,0,0.15\n"
+    )
+    return ruta
+
+
+def test_calcular_diff(partidas):
+    diff = calcular_diff(
+        [
+            {
+                "item_no": "0101.21.00.00",
+                "descripcion": "Caballos reproductores",
+                "impuesto_dai": 0.1,
+                "impuesto_isc": 0.1,
+                "impuesto_ispc": 0.05,
+                "impuesto_isv": 0.15,
+            },
+            {
+                "item_no": "8471.30.00.00",
+                "descripcion": "Computadoras portatiles",
+                "impuesto_dai": 0,
+                "impuesto_isc": 0.1,
+                "impuesto_ispc": 0.05,
+                "impuesto_isv": 0.15,
+            },
+        ]
+    )
+    assert diff.nuevas == []
+    assert diff.sin_cambios == 1
+    assert [(c.item_no, c.campos) for c in diff.cambiadas] == [
+        ("8471.30.00.00", {"impuesto_dai": (Decimal("0.10"), Decimal("0.00"))})
+    ]
+    assert sorted(item_no for _, item_no in diff.eliminadas) == [
+        "9202.10.00.00",
+        "9205.10.00.00",
+        "9206.00.00.00",
+    ]
+
+
+def test_aplica_solo_los_cambios(
+    partidas, csv_nuevo, tmp_path, monkeypatch, django_capture_on_commit_callbacks
+):
+    # La base de pruebas es SQL_ASCII
+    monkeypatch.setattr(
+        ImportCommand,
+        "_get_default_classification",
+        lambda self: {"category": "PROHIBIDO", "restrictions": ["Sin clasificar"]},
+    )
+    reporte = tmp_path / "cambios.json"
+    salida = StringIO()
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command(
+            "sync_partidas", str(csv_nuevo), "--report", str(reporte), stdout=salida
+        )
+
+    actuales = {p.item_no: p for p in PartidaArancelaria.objects.all()}
+    assert set(actuales) == {
+        "0101.21.00.00",
+        "8471.30.00.00",
+        "9202.10.00.00",
+        "9206.00.00.00",
+        "9207.10.00.00",
+    }
+    # Los ids se conservan
+    for item_no in ["0101.21.00.00", "8471.30.00.00", "9202.10.00.00"]:
+        assert actuales[item_no].pk == partidas[item_no].pk
+
+    # Un cambio de tasa conserva keywords y embedding
+    computadoras = actuales["8471.30.00.00"]
+    assert computadoras.impuesto_dai == Decimal("0.00")
+    assert computadoras.search_keywords == ["clave"]
+    assert hasattr(computadoras, "embedding_data")
+
+    # Un cambio de descripcion los deja pendientes
+    guitarras = actuales["9202.10.00.00"]
+    assert guitarras.descripcion == "Guitarras acusticas"
+    assert guitarras.search_keywords == []
+    assert not PartidaArancelariaEmbedding.objects.filter(
+        partida_arancelaria=guitarras
+    ).exists()
+
+    nueva = actuales["9207.10.00.00"]
+    assert nueva.search_keywords == []
+    assert nueva.courier_category == "PROHIBITED"
+    assert nueva.impuesto_dai == Decimal("0.15")
+
+    datos = json.loads(reporte.read_text())
+    assert datos["summary"] == {
+        "new": 1,
+        "changed": 2,
+        "removed": 2,
+        "unchanged": 1,
+        "duplicated_in_db": [],
+    }
+    aplicado = datos["applied"]
+    assert aplicado["deleted"] == [partidas["9205.10.00.00"].pk]
+    assert aplicado["kept_with_articulos"] == [
+        {"id": partidas["9206.00.00.00"].pk, "item_no": "9206.00.00.00", "articulos": 1}
+    ]
+    assert sorted(aplicado["queued"]["keywords"]) == sorted([nueva.pk, guitarras.pk])
+    assert sorted(aplicado["queued"]["elasticsearch"]) == sorted(
+        [nueva.pk, guitarras.pk, computadoras.pk]
+    )
+    assert aplicado["elasticsearch"] == "omitido"
+
+    # Una segunda pasada no encuentra cambios salvo la partida conservada
+    salida = StringIO()
+    call_command("sync_partidas", str(csv_nuevo), "--dry-run", stdout=salida)
+    assert "0 new, 0 changed, 1 removed, 4 unchanged" in salida.getvalue()
+
+
+def test_dry_run_no_escribe(partidas, csv_nuevo):
+    antes = list(
+        PartidaArancelaria.objects.order_by("id").values_list(
+            "id", "descripcion", "impuesto_dai"
+        )
+    )
+    salida = StringIO()
+    call_command("sync_partidas", str(csv_nuevo), "--dry-run", stdout=salida)
+
+    assert "DRY RUN" in salida.getvalue()
+    assert "~ 9202.10.00.00 descripcion" in salida.getvalue()
+    assert (
+        list(
+            PartidaArancelaria.objects.order_by("id").values_list(
+                "id", "descripcion", "impuesto_dai"
+            )
+        )
+        == antes
+    )
+    assert PartidaArancelariaEmbedding.objects.count() == 5
+
+
+def test_csv_invalido(tmp_path):
+    with pytest.raises(CommandError):
+        call_command("sync_partidas", str(tmp_path / "no_existe.csv"))
+    ruta = tmp_path / "sin_columnas.csv"
+    ruta.write_text("Codigo,descripcion\n0101.21.00.00,Caballos\n")
+    with pytest.raises(CommandError):
+        call_command("sync_partidas", str(ruta))
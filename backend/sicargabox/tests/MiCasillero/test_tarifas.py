@@ -0,0 +1,212 @@
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+import test_helpers
+from MiCasillero.cotizador import cotizar_lote
+from MiCasillero.models import Articulo, PartidaArancelaria
+from MiCasillero.tarifas import TablaTarifas, Tarifa, tabla_tarifas, tasas
+from MiCasillero.versiones import VERSION_CHECK_INTERVAL
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def partidas():
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor="2.75",
+        tipo_dato="FLOAT",
+    )
+    return [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no="9202.10.00.00",
+            impuesto_dai=Decimal("0.15"),
+            impuesto_isc=Decimal("0.00"),
+            impuesto_ispc=Decimal("0.00"),
+            impuesto_isv=Decimal("0.15"),
+            courier_category="ALLOWED",
+            chapter_code="9202",
+            heading_code="9202.10",
+        ),
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no="8471.30.00.00",
+            impuesto_dai=Decimal("0.10"),
+            impuesto_isc=Decimal("0.20"),
+            impuesto_ispc=Decimal("0.05"),
+            impuesto_isv=Decimal("0.18"),
+            courier_category="RESTRICTED",
+        ),
+        # item_no repetido: se usa el de menor id
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no="9202.10.00.00", impuesto_dai=Decimal("0.99")
+        ),
+    ]
+
+
+@pytest.fixture
+def exportada(partidas, tmp_path):
+    ruta = tmp_path / "tarifas"
+    call_command("export_tarifas", "--output", str(ruta), stdout=StringIO())
+    return ruta
+
+
+def test_exportacion_mapeada(partidas, exportada):
+    tabla = TablaTarifas()
+    assert tabla.cargar_archivo(exportada)
+    assert tabla.origen == "archivo"
+    assert len(tabla) == 3
+    # Vista de solo lectura sobre el archivo mapeado
+    assert not tabla.datos.flags.writeable
+
+    filas = tabla.buscar([p.id for p in partidas] + [0])
+    assert set(filas) == {p.id for p in partidas}
+    for partida in partidas:
+        assert tasas(filas[partida.id]) == (
+            partida.impuesto_dai,
+            partida.impuesto_isc,
+            partida.impuesto_ispc,
+            partida.impuesto_isv,
+        )
+    fila = filas[partidas[0].id]
+    assert fila["courier_category"] == "ALLOWED"
+    assert fila["heading_code"] == "9202.10"
+
+    assert tabla.por_item_no("9202.10.00.00")["id"] == partidas[0].id
+    assert tabla.por_item_no("8471.30.00.00")["courier_category"] == "RESTRICTED"
+    assert tabla.por_item_no("0000.00.00.00") is None
+
+
+def test_exportacion_vencida_recarga_de_la_base(
+    partidas, exportada, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        partidas[1].impuesto_dai = Decimal("0.00")
+        partidas[1].save()
+
+    tabla = TablaTarifas()
+    assert not tabla.cargar_archivo(exportada)
+    filas = tabla.buscar([partidas[1].id])
+    assert tabla.origen == "bd"
+    assert tasas(filas[partidas[1].id])[0] == Decimal("0.00")
+
+
+def test_exportacion_no_adopta_su_version(partidas, exportada):
+    # Sin señales ni caché compartido: la versión de la base ya es otra
+    PartidaArancelaria.objects.filter(pk=partidas[0].pk).update(
+        impuesto_isv=Decimal("0.18")
+    )
+    cache.clear()
+    assert not TablaTarifas().cargar_archivo(exportada)
+
+    # Los cambios que no tocan la tabla no invalidan la exportación
+    PartidaArancelaria.objects.filter(pk=partidas[1].pk).update(descripcion="Laptops")
+    call_command("export_tarifas", "--output", str(exportada), stdout=StringIO())
+    PartidaArancelaria.objects.filter(pk=partidas[1].pk).update(descripcion="Notebooks")
+    assert TablaTarifas().cargar_archivo(exportada)
+
+
+def test_cotizar_lote_usa_la_exportacion(
+    partidas, exportada, settings, django_assert_num_queries
+):
+    settings.PARTIDA_TARIFAS_PATH = str(exportada)
+    lineas = [
+        {"valor": "100.00", "peso": "5.00", "partida_arancelaria": partidas[0].id},
+        {"valor": "59.99", "peso": "1.25", "partida_arancelaria": partidas[1].id},
+    ]
+    esperado = cotizar_lote(lineas)
+    assert tabla_tarifas.origen == "archivo"
+    assert esperado["articulos"][1]["porcentaje_isc"] == Decimal("20.0000")
+    assert esperado["articulos"][0]["partida_item_no"] == "9202.10.00.00"
+
+    # Con la tabla y los parámetros en memoria no se consulta la base
+    with django_assert_num_queries(0):
+        assert cotizar_lote(lineas) == esperado
+
+    # Una partida creada después se lee de la base
+    nueva = test_helpers.create_MiCasillero_PartidaArancelaria(
+        impuesto_dai=Decimal("0.05")
+    )
+    resultado = cotizar_lote([dict(lineas[0], partida_arancelaria=nueva.id)])
+    assert resultado["articulos"][0]["porcentaje_dai"] == Decimal("5.0000")
+
+
+def test_registro_de_tarifas(partidas):
+    reloj = [0.0]
+    tabla = TablaTarifas(clock=lambda: reloj[0])
+    tarifa = tabla.tarifa(partidas[1].id)
+    assert isinstance(tarifa, Tarifa)
+    assert not hasattr(tarifa, "__dict__")
+    assert tarifa.porcentaje_isc == partidas[1].impuesto_isc * 100
+    assert tarifa.courier_category == "RESTRICTED"
+    # Un registro por id y versión de la tabla
+    assert tabla.tarifa(partidas[1].id) is tarifa
+    assert tabla.tarifa(None) is None
+    assert tabla.tarifa(0) is None
+
+    # Otro worker cambia la tasa: se recarga al vencer el intervalo
+    PartidaArancelaria.objects.filter(pk=partidas[1].pk).update(
+        impuesto_isc=Decimal("0.30")
+    )
+    assert tabla.tarifa(partidas[1].id) is tarifa
+    reloj[0] += VERSION_CHECK_INTERVAL
+    nueva = tabla.tarifa(partidas[1].id)
+    assert nueva is not tarifa
+    assert nueva.porcentaje_isc == Decimal("30.00")
+
+
+def test_calcular_impuestos_sin_leer_la_partida(partidas, django_assert_num_queries):
+    articulo = Articulo(
+        valor_articulo=Decimal("100.00"),
+        peso=Decimal("5.00"),
+        largo=Decimal("10.00"),
+        ancho=Decimal("10.00"),
+        alto=Decimal("10.00"),
+        partida_arancelaria_id=partidas[1].id,
+    )
+    esperado = Articulo(
+        valor_articulo=articulo.valor_articulo,
+        peso=articulo.peso,
+        largo=articulo.largo,
+        ancho=articulo.ancho,
+        alto=articulo.alto,
+        # Partida sin guardar: las tasas salen de la instancia
+        partida_arancelaria=PartidaArancelaria(
+            impuesto_dai=Decimal("0.10"),
+            impuesto_isc=Decimal("0.20"),
+            impuesto_ispc=Decimal("0.05"),
+            impuesto_isv=Decimal("0.18"),
+        ),
+    )
+    esperado.calcular_impuestos()
+    tabla_tarifas.tarifa(partidas[1].id)
+
+    with django_assert_num_queries(0):
+        articulo.calcular_impuestos()
+        assert articulo.porcentaje_isv == Decimal("18.00")
+        assert articulo.partida_item_no == "8471.30.00.00"
+    assert articulo.impuesto_total == esperado.impuesto_total
+
+
+def test_guardar_verifica_la_version_de_las_tarifas(partidas):
+    tabla_tarifas.tarifa(partidas[1].id)
+    # Otro worker cambia la tasa: la tabla del proceso todavía no lo vio
+    PartidaArancelaria.objects.filter(pk=partidas[1].pk).update(
+        impuesto_isv=Decimal("0.25")
+    )
+    assert tabla_tarifas.tarifa(partidas[1].id).porcentaje_isv == Decimal("18.00")
+
+    # La instancia de la partida conserva la tasa vieja: no se lee la FK
+    articulo = test_helpers.create_MiCasillero_Articulo(partida_arancelaria=partidas[1])
+    assert articulo.porcentaje_isv == Decimal("25.00")
+    base_isv = (
+        articulo.valor_articulo
+        + articulo.costo_transporte
+        + articulo.impuesto_dai
+        + articulo.impuesto_isc
+        + articulo.impuesto_ispc
+    )
+    assert articulo.impuesto_isv == base_isv * Decimal("0.25")
@@ -0,0 +1,295 @@
+from decimal import ROUND_HALF_UP, Decimal
+from importlib import import_module
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test.utils import CaptureQueriesContext
+
+import test_helpers
+from MiCasillero.models import Articulo, Cotizacion, Envio
+from MiCasillero.totales import (
+    CAMPOS_TOTALES,
+    filtro_desviacion,
+    recalcular_totales,
+    totales_cotizacion,
+)
+from MiCasillero.views import actualizar_cotizacion
+
+pytestmark = [pytest.mark.django_db]
+
+COSTO_POR_LIBRA = Decimal("2.75")
+
+
+def flete_anterior(cotizacion):
+    """Cálculo de Envio.save antes de usar el agregado."""
+    volumen_total = sum(a.largo * a.ancho * a.alto for a in cotizacion.articulos.all())
+    peso_volumetrico_total = volumen_total / Articulo.FACTOR_VOL
+    peso_total = sum(a.peso for a in cotizacion.articulos.all())
+    peso_a_usar = max(Decimal(peso_total), Decimal(peso_volumetrico_total))
+    return peso_a_usar * COSTO_POR_LIBRA
+
+
+def impuestos_anteriores(cotizacion):
+    """Sumas de Factura.save antes de usar el agregado."""
+    articulos = cotizacion.articulos.all()
+    return {
+        campo: sum(getattr(a, campo) for a in articulos)
+        for campo in (
+            "impuesto_dai",
+            "impuesto_isc",
+            "impuesto_ispc",
+            "impuesto_isv",
+            "impuesto_total",
+        )
+    }
+
+
+def crear_envio(cotizacion):
+    return test_helpers.create_MiCasillero_Envio(
+        cotizacion=cotizacion, cliente=cotizacion.cliente
+    )
+
+
+@pytest.fixture
+def cotizacion():
+    test_helpers.create_MiCasillero_ParametroSistema(
+        nombre_parametro="Costo Flete por Libra en USD$",
+        valor=str(COSTO_POR_LIBRA),
+        tipo_dato="FLOAT",
+    )
+    cotizacion = test_helpers.create_MiCasillero_Cotizacion()
+    partidas = [
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            impuesto_dai=Decimal("0.15"), impuesto_isv=Decimal("0.15")
+        ),
+        test_helpers.create_MiCasillero_PartidaArancelaria(
+            impuesto_dai=Decimal("0.10"),
+            impuesto_isc=Decimal("0.20"),
+            impuesto_ispc=Decimal("0.05"),
+            impuesto_isv=Decimal("0.18"),
+        ),
+    ]
+    medidas = [
+        ("100.00", "5.00", "10.00", "10.00", "10.00"),
+        ("59.99", "1.25", "20.00", "15.50", "8.00"),
+        ("1234.56", "4.41", "3.30", "7.25", "2.10"),
+    ]
+    for i, (valor, peso, largo, ancho, alto) in enumerate(medidas):
+        test_helpers.create_MiCasillero_Articulo(
+            cotizacion=cotizacion,
+            partida_arancelaria=partidas[i % 2],
+            valor_articulo=Decimal(valor),
+            peso=Decimal(peso),
+            largo=Decimal(largo),
+            ancho=Decimal(ancho),
+            alto=Decimal(alto),
+        )
+    return cotizacion
+
+
+def test_totales_en_una_consulta(cotizacion, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        totales = totales_cotizacion(cotizacion)
+
+    articulos = list(cotizacion.articulos.all())
+    assert totales.cantidad_articulos == 3
+    assert totales.peso_total == sum(a.peso for a in articulos)
+    assert totales.volumen_total == sum(a.largo * a.ancho * a.alto for a in articulos)
+    assert totales.subtotal_articulos == sum(a.valor_articulo for a in articulos)
+    assert totales.flete(COSTO_POR_LIBRA) == flete_anterior(cotizacion)
+
+
+def test_envio_y_factura_coinciden_con_el_calculo_anterior(cotizacion):
+    envio = crear_envio(cotizacion)
+    assert envio.flete == flete_anterior(cotizacion)
+
+    factura = test_helpers.create_MiCasillero_Factura(
+        envio=envio, cliente=envio.cliente
+    )
+    anteriores = impuestos_anteriores(cotizacion)
+    assert factura.flete == envio.flete
+    assert factura.total_impuesto_dai == anteriores["impuesto_dai"]
+    assert factura.total_impuesto_isc == anteriores["impuesto_isc"]
+    assert factura.total_impuesto_ispc == anteriores["impuesto_ispc"]
+    assert factura.total_impuesto_isv == anteriores["impuesto_isv"]
+    assert factura.total_impuesto == anteriores["impuesto_total"]
+    assert factura.monto_total == envio.flete + anteriores["impuesto_total"]
+
+
+def test_factura_con_envio_leido_de_la_base(cotizacion):
+    envio = crear_envio(cotizacion)
+    factura = test_helpers.create_MiCasillero_Factura(
+        envio=Envio.objects.get(pk=envio.pk), cliente=envio.cliente
+    )
+    assert factura.flete == flete_anterior(cotizacion)
+
+
+def test_cotizacion_sin_articulos():
+    cotizacion = test_helpers.create_MiCasillero_Cotizacion()
+    envio = crear_envio(cotizacion)
+    assert envio.flete == 0
+
+    actualizar_cotizacion(cotizacion)
+    cotizacion.refresh_from_db()
+    assert cotizacion.subtotal_articulos == 0
+    assert cotizacion.total_estimado == 0
+
+
+def test_actualizar_cotizacion_guarda_los_totales(cotizacion):
+    actualizar_cotizacion(cotizacion)
+
+    guardada = Cotizacion.objects.get(pk=cotizacion.pk)
+    articulos = list(cotizacion.articulos.all())
+    subtotal = sum(a.valor_articulo for a in articulos)
+    impuestos = sum(a.impuesto_total for a in articulos)
+    flete = flete_anterior(cotizacion).quantize(Decimal("0.01"), ROUND_HALF_UP)
+    assert guardada.subtotal_articulos == subtotal
+    assert guardada.total_impuestos == impuestos
+    assert guardada.total_flete == flete
+    assert guardada.total_estimado == (subtotal + flete + impuestos).quantize(
+        Decimal("0.01")
+    )
+
+
+def totales_guardados(cotizacion):
+    cotizacion.refresh_from_db()
+    return {campo: getattr(cotizacion, campo) for campo in CAMPOS_TOTALES}
+
+
+def sin_desviacion(*cotizaciones):
+    ids = [c.pk for c in cotizaciones]
+    return not filtro_desviacion(
+        Cotizacion.objects.filter(pk__in=ids), COSTO_POR_LIBRA
+    ).exists()
+
+
+@pytest.fixture
+def cotizacion_en_cero(cotizacion):
+    # test_helpers crea la cotización con totales de ejemplo
+    recalcular_totales(Cotizacion.objects.filter(pk=cotizacion.pk))
+    return cotizacion
+
+
+def test_crear_articulos_mantiene_los_totales(cotizacion_en_cero):
+    cotizacion = cotizacion_en_cero
+    assert sin_desviacion(cotizacion)
+
+    nueva = test_helpers.create_MiCasillero_Cotizacion(
+        subtotal_articulos=0, total_flete=0, total_impuestos=0, total_estimado=0
+    )
+    articulo = test_helpers.create_MiCasillero_Articulo(
+        cotizacion=nueva,
+        valor_articulo=Decimal("19.99"),
+        peso=Decimal("0.50"),
+        largo=Decimal("12.00"),
+        ancho=Decimal("9.00"),
+        alto=Decimal("4.00"),
+    )
+    totales = totales_guardados(nueva)
+    assert totales["subtotal_articulos"] == Decimal("19.99")
+    assert totales["total_impuestos"] == articulo.impuesto_total.quantize(
+        Decimal("0.01")
+    )
+    assert totales["volumen_total"] == Decimal("432")
+    assert totales["total_flete"] == (Decimal("432") / 166 * COSTO_POR_LIBRA).quantize(
+        Decimal("0.01")
+    )
+    assert sin_desviacion(nueva)
+
+
+def test_modificar_mover_y_borrar_articulos(cotizacion_en_cero):
+    cotizacion = cotizacion_en_cero
+    otra = test_helpers.create_MiCasillero_Cotizacion(
+        cliente=cotizacion.cliente,
+        subtotal_articulos=0,
+        total_flete=0,
+        total_impuestos=0,
+        total_estimado=0,
+    )
+    articulo, segundo, tercero = Articulo.objects.filter(cotizacion=cotizacion)
+
+    articulo.valor_articulo = Decimal("250.00")
+    articulo.peso = Decimal("40.00")
+    articulo.save()
+    assert sin_desviacion(cotizacion)
+
+    segundo.cotizacion = otra
+    segundo.save()
+    assert sin_desviacion(cotizacion, otra)
+    assert totales_guardados(otra)["subtotal_articulos"] == segundo.valor_articulo
+
+    tercero.delete()
+    Articulo.objects.filter(cotizacion=otra).delete()
+    assert sin_desviacion(cotizacion, otra)
+    assert totales_guardados(otra)["total_estimado"] == 0
+
+
+def test_guardar_una_cotizacion_vieja_no_pisa_los_totales(cotizacion_en_cero):
+    vieja = Cotizacion.objects.get(pk=cotizacion_en_cero.pk)
+    test_helpers.create_MiCasillero_Articulo(cotizacion=cotizacion_en_cero)
+
+    vieja.estado = "Aceptada"
+    vieja.save()
+    assert sin_desviacion(vieja)
+    assert Cotizacion.objects.get(pk=vieja.pk).estado == "Aceptada"
+
+
+def test_recompute_cotizacion_totals_corrige_desviaciones(cotizacion_en_cero):
+    Articulo.objects.filter(cotizacion=cotizacion_en_cero).update(
+        valor_articulo=Decimal("1.00")
+    )
+    assert not sin_desviacion(cotizacion_en_cero)
+
+    salida = StringIO()
+    call_command("recompute_cotizacion_totals", dry_run=True, stdout=salida)
+    assert "1 cotizaciones have drifted" in salida.getvalue()
+    assert not sin_desviacion(cotizacion_en_cero)
+
+    salida = StringIO()
+    call_command("recompute_cotizacion_totals", stdout=salida)
+    assert "1 drifted, 1 updated" in salida.getvalue()
+    assert sin_desviacion(cotizacion_en_cero)
+    assert totales_guardados(cotizacion_en_cero)["subtotal_articulos"] == Decimal(
+        "3.00"
+    )
+
+
+def test_migracion_0028_recalcula_todos_los_totales(cotizacion):
+    # test_helpers crea la cotización con totales de ejemplo
+    assert not sin_desviacion(cotizacion)
+    nombre = "0028_cotizacion_totales_incrementales"
+    migracion = import_module(f"MiCasillero.migrations.{nombre}")
+    apps = MigrationLoader(connection).project_state(("MiCasillero", nombre)).apps
+
+    with connection.schema_editor() as schema_editor:
+        migracion.recalcular_todas(apps, schema_editor)
+
+    assert sin_desviacion(cotizacion)
+
+
+def actualizaciones_de_cotizacion(consultas):
+    return [
+        c["sql"]
+        for c in consultas.captured_queries
+        if c["sql"].startswith('UPDATE "MiCasillero_cotizacion"')
+    ]
+
+
+def test_borrar_la_cotizacion_no_resta_sus_articulos(cotizacion_en_cero):
+    with CaptureQueriesContext(connection) as consultas:
+        cotizacion_en_cero.cliente.delete()
+    assert not Cotizacion.objects.filter(pk=cotizacion_en_cero.pk).exists()
+    assert not Articulo.objects.filter(cotizacion=cotizacion_en_cero).exists()
+    assert actualizaciones_de_cotizacion(consultas) == []
+
+
+def test_borrar_la_partida_resta_sus_articulos(cotizacion_en_cero):
+    partida = cotizacion_en_cero.articulos.first().partida_arancelaria
+    with CaptureQueriesContext(connection) as consultas:
+        partida.delete()
+    assert len(actualizaciones_de_cotizacion(consultas)) == 2
+    assert cotizacion_en_cero.articulos.count() == 1
+    assert sin_desviacion(cotizacion_en_cero)
@@ -0,0 +1,159 @@
+import json
+
+import numpy as np
+import pytest
+from django.test import RequestFactory
+
+import test_helpers
+from MiCasillero import vectores
+from MiCasillero.models import PartidaArancelariaEmbedding
+from MiCasillero.vectores import IndiceVectorial
+from MiCasillero.views import buscar_partidas
+
+pytestmark = [pytest.mark.django_db]
+
+MODELO = "modelo-prueba"
+DIMENSION = 8
+
+
+@pytest.fixture(autouse=True)
+def indice_vectorial_limpio(settings):
+    settings.PARTIDA_EMBEDDING_MODEL = MODELO
+    settings.PARTIDA_VECTOR_INDEX_PATH = None
+    vectores.indice_vectorial = None
+    yield
+    vectores.indice_vectorial = None
+
+
+def vector_base(i):
+    vector = [0.0] * DIMENSION
+    vector[i % DIMENSION] = 1.0
+    return vector
+
+
+def crear_embedding(partida, vector, version=1):
+    return PartidaArancelariaEmbedding.objects.create(
+        partida_arancelaria=partida,
+        embedding_vector=vector,
+        embedding_model=MODELO,
+        embedding_text=partida.descripcion,
+        version=version,
+    )
+
+
+@pytest.fixture
+def partidas():
+    partidas = []
+    for i, descripcion in enumerate(["Guitarras", "Arpas", "Violines", "Pianos"]):
+        partida = test_helpers.create_MiCasillero_PartidaArancelaria(
+            item_no=f"9202.{i:02d}.00.00", descripcion=descripcion
+        )
+        crear_embedding(partida, vector_base(i))
+        partidas.append(partida)
+    return partidas
+
+
+def test_top_k_por_coseno(partidas):
+    indice = IndiceVectorial(MODELO)
+    assert indice.refrescar() == {"agregados": 4, "actualizados": 0, "eliminados": 0}
+
+    consulta = np.array(vector_base(1)) + 0.5 * np.array(vector_base(3))
+    resultados = indice.buscar(consulta, k=2)
+
+    assert [pid for pid, _ in resultados] == [partidas[1].pk, partidas[3].pk]
+    assert resultados[0][1] == pytest.approx(1 / np.sqrt(1.25), rel=1e-6)
+    assert len(indice.buscar(consulta, k=50)) == 4
+
+
+def test_refresco_incremental_por_version(partidas, django_assert_num_queries):
+    indice = IndiceVectorial(MODELO)
+    indice.refrescar()
+
+    with django_assert_num_queries(1):
+        assert indice.refrescar() == {
+            "agregados": 0,
+            "actualizados": 0,
+            "eliminados": 0,
+        }
+
+    PartidaArancelariaEmbedding.objects.filter(partida_arancelaria=partidas[0]).update(
+        embedding_vector=vector_base(5), version=2
+    )
+    partidas[1].delete()
+    nueva = test_helpers.create_MiCasillero_PartidaArancelaria(item_no="9202.99.00.00")
+    crear_embedding(nueva, vector_base(6))
+
+    assert indice.refrescar() == {"agregados": 1, "actualizados": 1, "eliminados": 1}
+    assert indice.buscar(vector_base(5), k=1)[0][0] == partidas[0].pk
+    assert indice.buscar(vector_base(6), k=1)[0][0] == nueva.pk
+    assert partidas[1].pk not in {pid for pid, _ in indice.buscar(vector_base(1))}
+
+
+def test_refresco_respeta_el_intervalo(partidas):
+    ahora = [0.0]
+    indice = IndiceVectorial(MODELO, intervalo=30, clock=lambda: ahora[0])
+    indice.refrescar(forzar=False)
+    partidas[2].delete()
+
+    ahora[0] = 10.0
+    assert indice.refrescar(forzar=False)["eliminados"] == 0
+    ahora[0] = 31.0
+    assert indice.refrescar(forzar=False)["eliminados"] == 1
+
+
+def test_exportar_y_abrir_con_mmap(partidas, tmp_path):
+    indice = IndiceVectorial(MODELO)
+    indice.refrescar()
+    indice.exportar(tmp_path / "vectores")
+
+    abierto = IndiceVectorial(MODELO)
+    assert abierto.cargar_archivo(tmp_path / "vectores")
+    assert isinstance(abierto.matriz, np.memmap)
+    assert abierto.refrescar() == {"agregados": 0, "actualizados": 0, "eliminados": 0}
+    assert abierto.buscar(vector_base(2), k=1) == indice.buscar(vector_base(2), k=1)
+
+    # Un cambio posterior a la exportación copia la matriz antes de escribir
+    PartidaArancelariaEmbedding.objects.filter(partida_arancelaria=partidas[3]).update(
+        embedding_vector=vector_base(7), version=2
+    )
+    assert abierto.refrescar()["actualizados"] == 1
+    assert abierto.buscar(vector_base(7), k=1)[0][0] == partidas[3].pk
+
+    assert not IndiceVectorial("otro-modelo").cargar_archivo(tmp_path / "vectores")
+
+
+def buscar(**params):
+    respuesta = buscar_partidas(RequestFactory().get("/buscar_partidas/", params))
+    return respuesta.status_code, json.loads(respuesta.content)
+
+
+def test_vista_modo_semantico(partidas, monkeypatch):
+    monkeypatch.setattr(vectores, "embed_texto", lambda texto, modelo: vector_base(2))
+
+    status, data = buscar(q="instrumento de cuerda", modo="semantico")
+
+    assert status == 200
+    assert data["results"][0]["codigo"] == partidas[2].item_no
+    assert data["results"][0]["id"] == str(partidas[2].pk)
+
+
+def test_vista_modo_hibrido_sin_embedding(partidas, monkeypatch):
+    def sin_embedding(texto, modelo):
+        raise vectores.EmbeddingNoDisponible("sin clave")
+
+    monkeypatch.setattr(vectores, "embed_texto", sin_embedding)
+
+    status, data = buscar(q="guitarras", modo="semantico")
+    assert status == 503
+    assert data["results"] == []
+
+    # El modo híbrido sigue respondiendo con la relevancia de texto
+    status, data = buscar(q="guitarras", modo="hibrido")
+    assert status == 200
+    assert [r["codigo"] for r in data["results"]] == [partidas[0].item_no]
+
+
+def test_vista_modo_invalido():
+    status, data = buscar(q="guitarras", modo="vectorial")
+    assert status == 400
+    assert "modo" in data["error"]
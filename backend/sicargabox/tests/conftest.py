@@ -0,0 +1,28 @@
+import pytest
+
+from MiCasillero import ranking
+from MiCasillero.cache_busqueda import cache_busqueda
+from MiCasillero.cache_cotizaciones import memo_cotizaciones
+from MiCasillero.indice_local import indice_local
+from MiCasillero.mapeos import indice_mapeos
+from MiCasillero.parametros import parametros_cache
+from MiCasillero.tarifas import tabla_tarifas
+
+
+def reiniciar_caches():
+    """Descarta las copias en proceso que comparten los tests del worker."""
+    parametros_cache.invalidar()
+    indice_local.invalidar()
+    indice_mapeos.invalidar()
+    cache_busqueda.invalidar()
+    tabla_tarifas.reiniciar()
+    memo_cotizaciones.invalidar()
+    ranking.breaker_elasticsearch.reiniciar()
+
+
+@pytest.fixture(autouse=True)
+def sin_elasticsearch(settings):
+    settings.ELASTICSEARCH_DSL_AUTOSYNC = False
+    reiniciar_caches()
+    yield
+    reiniciar_caches()
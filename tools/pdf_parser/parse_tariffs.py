@@ -1,167 +1,326 @@
+import argparse
 import os
+import statistics
 import sys
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, Iterator, List, Optional, Tuple
+
 import pdfplumber
-import pandas as pd
-from pdf_utils import TariffItem, get_parent_code, get_code_level, save_to_csv, normalize_code
+from pdf_utils import TariffItem, get_parent_code, normalize_code, write_csv_stream
+
+# Pattern for level 2 sections (e.g., "01.01 CABALLOS, ASNOS...")
+LEVEL2_PATTERN = re.compile(r'^(\d{2}\.\d{2})\s+(.+)$')
+# Pattern for level 3 subpartidas (e.g., "0101.2 Caballos" or "0104.10 Bovinos")
+LEVEL3_PATTERN = re.compile(r'^(\d{4}\.\d{1,2})\s+(.+)$')
+# Pattern for level 4 items (e.g., "0101.21.00.00 Reproductores...")
+LEVEL4_PATTERN = re.compile(
+    r'(\d{4}\.\d{2}\.\d{2}\.\d{2})\s+(.+?)\s+(\d+|-)\s+(-|\d+(?:\.\d+)?)\s+(-|\d+(?:\.\d+)?)\s+(-|\d+(?:\.\d+)?)'
+)
+SEGUN_ART_PATTERN = re.compile(r'\(Según Art\..*$', flags=re.MULTILINE)
+
+# Lines starting with these are never description continuations
+NOT_CONTINUATION = ('01.', '0101.', '0102.', '0103.', '0104.')
+
+DEFAULT_PAGES_PER_SLICE = 20
+
+# (page number, seconds, items started on the page)
+PageTiming = Tuple[int, float, int]
+
 
 def clean_description(desc: str) -> str:
     """
     Clean the description by removing unnecessary parts.
     """
     # Remove "(Según Art." and everything after it
-    desc = re.sub(r'\(Según Art\..*$', '', desc, flags=re.MULTILINE)
+    desc = SEGUN_ART_PATTERN.sub('', desc)
     return desc.strip()
 
-def extract_tariff_items(pdf_path: str) -> list:
+
+def _rate(value: str) -> Optional[float]:
+    return float(value) / 100 if value != '-' else None
+
+
+@dataclass
+class SliceResult:
+    """
+    Items parsed from a range of pages, plus what the next range needs to
+    stitch them to the previous one.
+    """
+    # Continuation lines of each page before its first item, which belong to
+    # the last item of the previous slice
+    leading: List[List[str]] = field(default_factory=list)
+    items: List[TariffItem] = field(default_factory=list)
+    # Level 3 items seen before any level 2 section in this slice; their
+    # parent is the last level 2 section of the previous slice
+    pending_parent: List[int] = field(default_factory=list)
+    last_level2: Optional[str] = None
+    timings: List[PageTiming] = field(default_factory=list)
+
+
+class TariffParser:
+    """
+    Line-by-line parser. The state that crosses page boundaries is the last
+    level 2 section and the last item (which gets the continuation lines).
+    """
+
+    def __init__(self, current_level2: Optional[str] = None):
+        self.current_level2 = current_level2
+        self.last_item: Optional[TariffItem] = None
+
+    def parse_line(self, line: str) -> Optional[TariffItem]:
+        """The item started by ``line``, or None for a continuation line."""
+        level2_match = LEVEL2_PATTERN.match(line)
+        if level2_match:
+            code = level2_match.group(1)
+            # Add level 2 section as a tariff item
+            self.current_level2 = code
+            return TariffItem(
+                codigo=normalize_code(code),
+                descripcion=clean_description(level2_match.group(2)),
+                level=2,
+                parent_code=code.split('.')[0]
+            )
+
+        level3_match = LEVEL3_PATTERN.match(line)
+        if level3_match:
+            # Add level 3 subpartida as a tariff item
+            return TariffItem(
+                codigo=level3_match.group(1),
+                descripcion=clean_description(level3_match.group(2)),
+                level=3,
+                parent_code=self.current_level2.replace('.', '') if self.current_level2 else None
+            )
+
+        level4_match = LEVEL4_PATTERN.match(line)
+        if level4_match:
+            codigo = level4_match.group(1)
+            return TariffItem(
+                codigo=codigo,
+                descripcion=clean_description(level4_match.group(2)),
+                dai=_rate(level4_match.group(3)),
+                isc=_rate(level4_match.group(4)),
+                ispc=_rate(level4_match.group(5)),
+                isv=_rate(level4_match.group(6)),
+                level=4,
+                # Get the level 3 parent code
+                parent_code=get_parent_code(codigo)
+            )
+        return None
+
+    def parse_page(self, lines: List[str]) -> Tuple[List[str], List[TariffItem]]:
+        """
+        Parse the lines of one page. Returns the continuation lines before
+        the first item of the page and the items started on it; later
+        continuation lines are appended to their item here.
+        """
+        leading: List[str] = []
+        items: List[TariffItem] = []
+        current_description: List[str] = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            item = self.parse_line(line)
+            if item is not None:
+                # Accumulated description text belongs to the previous item
+                if current_description and items:
+                    items[-1].descripcion += ' ' + ' '.join(current_description)
+                current_description = []
+                items.append(item)
+                continue
+
+            # If the line doesn't match any pattern it might be a
+            # continuation of the description
+            if not line.startswith(NOT_CONTINUATION):
+                (current_description if items else leading).append(line)
+
+        # Accumulated description text at the end of the page
+        if current_description and items:
+            items[-1].descripcion += ' ' + ' '.join(current_description)
+        if items:
+            self.last_item = items[-1]
+        return leading, items
+
+
+def append_description(item: Optional[TariffItem], lines: List[str]) -> None:
+    if item is not None and lines:
+        item.descripcion += ' ' + ' '.join(lines)
+
+
+def iter_pages(pdf_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, List[str], float]]:
+    """``(page number, lines, extraction seconds)`` for pages ``[start, end)``."""
+    with pdfplumber.open(pdf_path) as pdf:
+        for number, page in enumerate(pdf.pages[start:end], start=start + 1):
+            started = time.perf_counter()
+            text = page.extract_text()
+            elapsed = time.perf_counter() - started
+            # Release the parsed page objects, pdfplumber keeps them cached
+            page.close()
+            yield number, text.split('\n') if text else [], elapsed
+
+
+def count_pages(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def parse_slice(pdf_path: str, start: int, end: int) -> SliceResult:
+    """Parse pages ``[start, end)`` without knowing the previous pages."""
+    result = SliceResult()
+    parser = TariffParser()
+    seen_level2 = False
+    for number, lines, elapsed in iter_pages(pdf_path, start, end):
+        started = time.perf_counter()
+        leading, items = parser.parse_page(lines)
+        if result.items:
+            append_description(result.items[-1], leading)
+        else:
+            result.leading.append(leading)
+        for item in items:
+            if item.level == 2:
+                seen_level2 = True
+            elif item.level == 3 and not seen_level2:
+                result.pending_parent.append(len(result.items))
+            result.items.append(item)
+        result.timings.append((number, elapsed + time.perf_counter() - started, len(items)))
+    result.last_level2 = parser.current_level2
+    return result
+
+
+def _slices(total_pages: int, pages_per_slice: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, total_pages, pages_per_slice):
+        yield start, min(start + pages_per_slice, total_pages)
+
+
+def _parse_serial(pdf_path: str, on_page: Optional[Callable[[PageTiming], None]]) -> Iterator[TariffItem]:
+    parser = TariffParser()
+    pending: Optional[TariffItem] = None
+    for number, lines, elapsed in iter_pages(pdf_path):
+        started = time.perf_counter()
+        leading, items = parser.parse_page(lines)
+        append_description(pending, leading)
+        if on_page:
+            on_page((number, elapsed + time.perf_counter() - started, len(items)))
+        if items:
+            # The last item can still get lines from the next page
+            if pending is not None:
+                yield pending
+            yield from items[:-1]
+            pending = items[-1]
+    if pending is not None:
+        yield pending
+
+
+def _parse_parallel(pdf_path: str, workers: int, pages_per_slice: int,
+                    on_page: Optional[Callable[[PageTiming], None]]) -> Iterator[TariffItem]:
+    slices = _slices(count_pages(pdf_path), pages_per_slice)
+    current_level2: Optional[str] = None
+    pending: Optional[TariffItem] = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # A bounded window of slices in flight keeps memory flat
+        while window := list(islice(slices, workers * 2)):
+            results = executor.map(parse_slice, *zip(*[(pdf_path, s, e) for s, e in window]))
+            for result in results:
+                for leading in result.leading:
+                    append_description(pending, leading)
+                if current_level2:
+                    for index in result.pending_parent:
+                        result.items[index].parent_code = current_level2.replace('.', '')
+                if result.last_level2 is not None:
+                    current_level2 = result.last_level2
+                if on_page:
+                    for timing in result.timings:
+                        on_page(timing)
+                if result.items:
+                    if pending is not None:
+                        yield pending
+                    yield from result.items[:-1]
+                    pending = result.items[-1]
+    if pending is not None:
+        yield pending
+
+
+def extract_tariff_items(pdf_path: str, workers: int = 1,
+                         pages_per_slice: int = DEFAULT_PAGES_PER_SLICE,
+                         on_page: Optional[Callable[[PageTiming], None]] = None) -> Iterator[TariffItem]:
     """
     Extract tariff items from a PDF file.
-    
+
+    Items are yielded in document order as soon as they are complete, so
+    the caller can write them to CSV or the database without holding the
+    whole tariff book. With ``workers > 1`` slices of ``pages_per_slice``
+    pages are parsed in a process pool and stitched back together, so
+    descriptions that continue on the next page are the same as in a
+    serial run.
+
     Args:
         pdf_path (str): Path to the PDF file
-        
+        workers (int): Processes parsing page slices
+        pages_per_slice (int): Pages per slice in worker mode
+        on_page (callable): Called with ``(page, seconds, items)`` per page
+
     Returns:
-        List[TariffItem]: List of tariff items with hierarchical information
+        Iterator[TariffItem]: Tariff items with hierarchical information
     """
-    tariff_items = []
-    current_section = None
-    current_level2 = None
-    
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            # First try to extract text normally
-            text = page.extract_text()
-            if not text:
-                continue
-            
-            lines = text.split('\n')
-            current_description = []
-            
-            for line in lines:
-                if not line.strip():
-                    continue
-                
-                # Pattern for level 2 sections (e.g., "01.01 CABALLOS, ASNOS...")
-                level2_pattern = r'^(\d{2}\.\d{2})\s+(.+)$'
-                level2_match = re.match(level2_pattern, line.strip())
-                
-                if level2_match:
-                    # If we have accumulated description text, add it to the previous item
-                    if current_description and tariff_items:
-                        tariff_items[-1].descripcion += ' ' + ' '.join(current_description)
-                        current_description = []
-                    
-                    current_section = {
-                        'code': level2_match.group(1),
-                        'description': clean_description(level2_match.group(2))
-                    }
-                    # Add level 2 section as a tariff item
-                    current_level2 = current_section['code']
-                    tariff_items.append(TariffItem(
-                        codigo=normalize_code(current_section['code']),
-                        descripcion=current_section['description'],
-                        level=2,
-                        parent_code=current_section['code'].split('.')[0]
-                    ))
-                    continue
-                
-                # Pattern for level 3 subpartidas (e.g., "0101.2 Caballos" or "0104.10 Bovinos")
-                level3_pattern = r'^(\d{4}\.\d{1,2})\s+(.+)$'
-                level3_match = re.match(level3_pattern, line.strip())
-                
-                if level3_match:
-                    # If we have accumulated description text, add it to the previous item
-                    if current_description and tariff_items:
-                        tariff_items[-1].descripcion += ' ' + ' '.join(current_description)
-                        current_description = []
-                    
-                    current_section = {
-                        'code': level3_match.group(1),
-                        'description': clean_description(level3_match.group(2))
-                    }
-                    # Add level 3 subpartida as a tariff item
-                    tariff_items.append(TariffItem(
-                        codigo=current_section['code'],
-                        descripcion=current_section['description'],
-                        level=3,
-                        parent_code=current_level2.replace('.', '') if current_level2 else None
-                    ))
-                    continue
-                
-                # Pattern for level 4 items (e.g., "0101.21.00.00 Reproductores...")
-                level4_pattern = r'(\d{4}\.\d{2}\.\d{2}\.\d{2})\s+(.+?)\s+(\d+|-)\s+(-|\d+(?:\.\d+)?)\s+(-|\d+(?:\.\d+)?)\s+(-|\d+(?:\.\d+)?)'
-                level4_match = re.match(level4_pattern, line.strip())
-                
-                if level4_match:
-                    # If we have accumulated description text, add it to the previous item
-                    if current_description and tariff_items:
-                        tariff_items[-1].descripcion += ' ' + ' '.join(current_description)
-                        current_description = []
-                    
-                    codigo = level4_match.group(1)
-                    descripcion = clean_description(level4_match.group(2))
-                    dai = float(level4_match.group(3))/100 if level4_match.group(3) != '-' else None
-                    isc = float(level4_match.group(4))/100 if level4_match.group(4) != '-' else None
-                    ispc = float(level4_match.group(5))/100 if level4_match.group(5) != '-' else None
-                    isv = float(level4_match.group(6))/100 if level4_match.group(6) != '-' else None
-                    
-                    # Get the level 3 parent code
-                    parent_code = get_parent_code(codigo)
-                    
-                    tariff_items.append(TariffItem(
-                        codigo=codigo,
-                        descripcion=descripcion,
-                        dai=dai,
-                        isc=isc,
-                        ispc=ispc,
-                        isv=isv,
-                        level=4,
-                        parent_code=parent_code
-                    ))
-                    continue
-                
-                # If the line doesn't match any pattern and we have a current item,
-                # it might be a continuation of the description
-                if tariff_items and not line.strip().startswith(('01.', '0101.', '0102.', '0103.', '0104.')):
-                    current_description.append(line.strip())
-            
-            # If we have accumulated description text at the end of the page, add it to the last item
-            if current_description and tariff_items:
-                tariff_items[-1].descripcion += ' ' + ' '.join(current_description)
-    
-    return tariff_items
+    if workers > 1:
+        return _parse_parallel(pdf_path, workers, pages_per_slice, on_page)
+    return _parse_serial(pdf_path, on_page)
+
+
+def print_timing_report(timings: List[PageTiming], elapsed: float) -> None:
+    """Per-page timing summary: slowest pages, median and throughput."""
+    if not timings:
+        return
+    seconds = [t[1] for t in timings]
+    print(f"Pages: {len(timings)} in {elapsed:.2f}s ({len(timings) / elapsed:.1f} pages/s)")
+    print(f"Per page: median {statistics.median(seconds) * 1000:.0f}ms, "
+          f"max {max(seconds) * 1000:.0f}ms, total {sum(seconds):.2f}s of work")
+    print("Slowest pages:")
+    for number, page_seconds, items in sorted(timings, key=lambda t: -t[1])[:10]:
+        print(f"  page {number:>5}: {page_seconds * 1000:8.0f}ms  {items:>4} items")
+
 
 def main():
-    if len(sys.argv) < 2:
-        pdf_path = "GRAVAMEN A LA IMPORTACIÓN 2022.pdf"
-        if os.path.exists(pdf_path):
-            print(f"Usando archivo predeterminado: {pdf_path}")
-        else:
-            print(f"Error: No se encontró el archivo predeterminado {pdf_path}")
-        print("Usage: python parse_tariffs.py <pdf_filename>")
-        sys.exit(1)
-    else:
-    pdf_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Extract tariff items from the arancel PDF to CSV')
+    parser.add_argument('pdf_path', nargs='?', default="GRAVAMEN A LA IMPORTACIÓN 2022.pdf")
+    parser.add_argument('--output', default='aranceles.csv', help='CSV file to write')
+    parser.add_argument('--workers', type=int, default=1, help='Processes parsing page slices')
+    parser.add_argument('--pages-per-slice', type=int, default=DEFAULT_PAGES_PER_SLICE,
+                        help='Pages per slice in worker mode')
+    parser.add_argument('--timings', action='store_true', help='Print the per-page timing report')
+    args = parser.parse_args()
+
+    pdf_path = args.pdf_path
     if not os.path.exists(pdf_path):
         print(f"Error: File {pdf_path} not found")
+        print("Usage: python parse_tariffs.py <pdf_filename> [--workers N] [--output aranceles.csv]")
         sys.exit(1)
-    
+
     try:
         print(f"Processing {pdf_path}...")
-        
-        # Extract items with hierarchical information
-        tariff_items = extract_tariff_items(pdf_path)
-        
-        # Generate output filename
-        output_path = "aranceles.csv"
-        
-        print(f"Found {len(tariff_items)} tariff items")
-        save_to_csv(tariff_items, output_path)
-        print(f"Results saved to {output_path}")
-        
+        timings: List[PageTiming] = []
+        started = time.perf_counter()
+
+        # Extract items with hierarchical information, streamed to the CSV
+        tariff_items = extract_tariff_items(pdf_path, workers=args.workers,
+                                            pages_per_slice=args.pages_per_slice,
+                                            on_page=timings.append)
+        total = write_csv_stream(tariff_items, args.output)
+
+        print(f"Found {total} tariff items")
+        print(f"Results saved to {args.output}")
+        if args.timings:
+            print_timing_report(timings, time.perf_counter() - started)
+
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
         sys.exit(1)
 
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,6 +1,7 @@
+import csv
 import pdfplumber
 import pandas as pd
-from typing import List, Dict, Any
+from typing import Iterable, List, Dict, Any
 import re
 
 class TariffItem:
@@ -158,4 +159,31 @@ def save_to_csv(tariff_items: List[TariffItem], output_path: str) -> None:
     df = df.drop('sort_key', axis=1)
     
     # Save with proper encoding for Spanish characters
-    df.to_csv(output_path, index=False, encoding='utf-8-sig') 
\ No newline at end of file
+    df.to_csv(output_path, index=False, encoding='utf-8-sig') 
+
+
+CSV_COLUMNS = ['código', 'descripción', 'dai', 'isc', 'ispc', 'isv', 'parent_code', 'level']
+
+
+def write_csv_stream(tariff_items: Iterable[TariffItem], output_path: str) -> int:
+    """
+    Write tariff items to a CSV file as they arrive, in document order
+    (already hierarchical), without holding them all in memory.
+
+    Args:
+        tariff_items (Iterable[TariffItem]): Tariff items, e.g. the generator
+            returned by parse_tariffs.extract_tariff_items
+        output_path (str): Path to save the CSV file
+
+    Returns:
+        int: Number of rows written
+    """
+    total = 0
+    # Same columns and encoding as save_to_csv
+    with open(output_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for item in tariff_items:
+            writer.writerow(item.to_dict())
+            total += 1
+    return total
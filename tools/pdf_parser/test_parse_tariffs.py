@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import parse_tariffs
+from parse_tariffs import extract_tariff_items
+
+PAGES = [
+    [
+        '01.01 CABALLOS, ASNOS, MULOS Y BURDEGANOS, VIVOS.',
+        '0101.2 Caballos',
+        '0101.21.00.00 Reproductores de raza 5 - - 15',
+    ],
+    # Continuation of the last item of the previous page
+    ['pura importados', '0101.29.00.00 Los demás 10 - - 15', 'para carreras'],
+    # A page without items
+    ['y exhibiciones'],
+    # Level 3 item whose level 2 section is on an earlier page
+    ['0101.3 Asnos', '0101.30.00.00 Asnos 0 - - 15'],
+    [
+        '01.02 ANIMALES VIVOS DE LA ESPECIE BOVINA.',
+        '0102.2 Bovinos domésticos',
+        '0102.21.00.00 Reproductores de raza pura 0 - - -',
+    ],
+]
+
+
+@pytest.fixture(autouse=True)
+def synthetic_pdf(monkeypatch):
+    def iter_pages(pdf_path, start=0, end=None):
+        for number, lines in enumerate(PAGES[start:end], start=start + 1):
+            yield number, list(lines), 0.0
+
+    monkeypatch.setattr(parse_tariffs, 'iter_pages', iter_pages)
+    monkeypatch.setattr(parse_tariffs, 'count_pages', lambda pdf_path: len(PAGES))
+    # The slices are parsed in threads so they see the synthetic pages
+    monkeypatch.setattr(parse_tariffs, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+
+def parse(**kwargs):
+    return [item.to_dict() for item in extract_tariff_items('aranceles.pdf', **kwargs)]
+
+
+def test_serial_stitches_pages():
+    items = {item['código']: item for item in parse()}
+    assert items['0101.21.00.00']['descripción'] == 'Reproductores de raza pura importados'
+    assert items['0101.29.00.00']['descripción'] == 'Los demás para carreras y exhibiciones'
+    assert items['0101.3']['parent_code'] == '0101'
+    assert items['0102.2']['parent_code'] == '0102'
+
+
+@pytest.mark.parametrize('pages_per_slice', [1, 2, 3, len(PAGES)])
+def test_parallel_matches_serial(pages_per_slice):
+    timings = []
+    parallel = parse(workers=2, pages_per_slice=pages_per_slice, on_page=timings.append)
+    assert parallel == parse()
+    assert [t[0] for t in timings] == list(range(1, len(PAGES) + 1))